@@ -0,0 +1,93 @@
+"""
+Baseline memory benchmark
+
+Compares the memory held by the original dict-of-dicts baseline
+representation against the compact BaselineStore at increasing agent
+counts.
+
+Usage:
+    python -m benchmarks.baseline_memory [--agents 10000 100000 1000000]
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+
+import numpy as np
+
+from src.threat_hunter.baseline_store import BaselineStore
+
+ACTIONS = [f"action-{i}" for i in range(50)]
+RESOURCES = [f"table-{i}" for i in range(50)]
+
+
+def build_legacy(agent_count: int, top_k: int) -> dict:
+    """Baselines as the original establish_baseline stored them"""
+    baselines = {}
+    for i in range(agent_count):
+        # Strings are built per agent, as they would be after decoding each
+        # agent's history from JSON
+        baselines[f"agent-{i}"] = {
+            "avg_api_calls": float(i % 100),
+            "normal_data_access": [f"table-{(i + j) % len(RESOURCES)}" for j in range(top_k)],
+            "typical_actions": [f"action-{(i + j) % len(ACTIONS)}" for j in range(top_k)],
+        }
+    return baselines
+
+
+def build_compact(agent_count: int, top_k: int) -> BaselineStore:
+    """Equivalent baselines in a BaselineStore, filled column-wise"""
+    store = BaselineStore(top_k=top_k, capacity=agent_count)
+    for i in range(agent_count):
+        store.intern(f"agent-{i}")
+    store.update("agent-0", {"api_calls": 0.0, "action": ACTIONS[0], "data_access": [RESOURCES[0]]})
+
+    rows = np.arange(agent_count)
+    store.count[rows, 0] = 10
+    store.mean[rows, 0] = rows % 100
+    store.m2[rows, 0] = 1.0
+    store.ewma[rows, 0] = rows % 100
+    slots = (rows[:, None] + np.arange(top_k)) % len(ACTIONS)
+    for sketch, items in ((store.actions, ACTIONS), (store.data_access, RESOURCES)):
+        for item in items:
+            sketch.load(0, [(item, 1)])
+        sketch.ids[rows] = slots
+        sketch.counts[rows] = 1
+    return store
+
+
+def measure(builder, agent_count: int, top_k: int) -> int:
+    """Bytes still allocated once builder's result is constructed"""
+    gc.collect()
+    tracemalloc.start()
+    result = builder(agent_count, top_k)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    results = []
+    for agent_count in args.agents:
+        legacy = measure(build_legacy, agent_count, args.top_k)
+        compact = measure(build_compact, agent_count, args.top_k)
+        results.append({
+            "agents": agent_count,
+            "legacy_bytes": legacy,
+            "compact_bytes": compact,
+            "legacy_bytes_per_agent": round(legacy / agent_count, 1),
+            "compact_bytes_per_agent": round(compact / agent_count, 1),
+            "reduction": round(legacy / compact, 2),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Import-time budget benchmark
+
+Times cold imports of the package and its entry points in fresh
+interpreters and lists which heavy dependencies each one loads. Checks
+``import src.threat_hunter`` against a budget and fails if it pulls in
+any heavy dependency, so a stray eager import shows up in CI.
+
+Usage:
+    python -m benchmarks.import_time [--runs 5] [--budget 0.05]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+HEAVY_MODULES = ("numpy", "pandas", "sklearn", "sqlalchemy", "fastapi", "yaml", "aiohttp", "joblib")
+
+TARGETS = {
+    "package": "import src.threat_hunter",
+    "detector": "from src.threat_hunter import ThreatDetector",
+    "app": "import src.threat_hunter.main",
+}
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(statement: str, runs: int = 5) -> Dict:
+    """Median cold import time of a statement and the heavy modules it loads"""
+    code = _PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+    samples = []
+    modules: List[str] = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        sample = json.loads(output.stdout.strip().splitlines()[-1])
+        samples.append(sample["seconds"])
+        modules = sample["modules"]
+    return {"seconds": statistics.median(samples), "modules": modules}
+
+
+def check(results: Dict[str, Dict], budget: float) -> List[str]:
+    """Describe every way the bare package import exceeds its budget"""
+    package = results["package"]
+    problems = []
+    if package["seconds"] > budget:
+        problems.append(f"import src.threat_hunter took {package['seconds']:.3f}s, budget {budget:.3f}s")
+    if package["modules"]:
+        problems.append(f"import src.threat_hunter loaded {', '.join(package['modules'])}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.05, help="Seconds allowed for import src.threat_hunter")
+    args = parser.parse_args()
+
+    results = {name: measure(statement, args.runs) for name, statement in TARGETS.items()}
+    print(json.dumps(results, indent=2))
+    problems = check(results, args.budget)
+    for problem in problems:
+        print(f"OVER BUDGET: {problem}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
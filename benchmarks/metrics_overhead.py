@@ -0,0 +1,46 @@
+"""
+Metrics overhead benchmark
+
+Measures the per-call cost the latency histograms add to a hot path, for
+unsampled calls, sampled calls and the default sampling rate.
+
+Usage:
+    python -m benchmarks.metrics_overhead [--calls 1000000]
+"""
+
+import argparse
+import json
+from time import perf_counter_ns
+
+from src.threat_hunter.metrics import Counter, LatencyHistogram
+
+
+def per_call_ns(sample_every: int, calls: int) -> float:
+    """Average nanoseconds for counter increment + start() + observe_since()"""
+    counter = Counter("events_total")
+    histogram = LatencyHistogram("latency", sample_every=sample_every)
+    start = perf_counter_ns()
+    for _ in range(calls):
+        started = histogram.start()
+        counter.inc()
+        histogram.observe_since(started)
+    instrumented = perf_counter_ns() - start
+
+    start = perf_counter_ns()
+    for _ in range(calls):
+        pass
+    empty = perf_counter_ns() - start
+    return (instrumented - empty) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    results = {f"sample_every_{n}_ns": round(per_call_ns(n, args.calls), 1) for n in (1, 16, 64)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
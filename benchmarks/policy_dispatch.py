@@ -0,0 +1,87 @@
+"""
+Response policy dispatch benchmark
+
+Times choosing a threat's response policy for policy sets of growing
+size. Every policy targets its own threat type and half carry a tag
+condition, so an interpreter scanning the policy list would slow down
+linearly; the compiled table should stay flat. Fails if the largest set
+is slower than the smallest by more than the allowed factor.
+
+Usage:
+    python -m benchmarks.policy_dispatch [--sizes 10,100,1000,10000] [--max-growth 3]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from src.threat_hunter.detector import ThreatEvent
+from src.threat_hunter.policies import DEFAULT_POLICIES, PolicyEngine, parse_policies
+
+ACTIONS = ["isolate", "revoke_credentials", "rate_limit", "alert", "monitor"]
+SEVERITIES = ["low", "medium", "high", "critical"]
+
+
+def build(size: int, rng: random.Random) -> PolicyEngine:
+    """An engine with the default table plus size type-specific policies"""
+    policies = []
+    for i in range(size):
+        when = {"threat_type": f"type-{i}", "severity": rng.sample(SEVERITIES, 2)}
+        if i % 2:
+            when["tags"] = ["production"]
+        policies.append({"name": f"policy-{i}", "priority": rng.randrange(3), "when": when,
+                         "actions": rng.sample(ACTIONS, 2)})
+    return PolicyEngine(parse_policies({"policies": policies + DEFAULT_POLICIES["policies"]}))
+
+
+def measure(size: int, lookups: int = 200000, seed: int = 7) -> Dict:
+    """Nanoseconds per policy selection, best of three runs"""
+    rng = random.Random(seed)
+    engine = build(size, rng)
+    events = [
+        ThreatEvent(
+            "agent-1", f"type-{rng.randrange(size)}", 0.5, datetime(2024, 5, 1),
+            {"agent_tags": ["production"] if rng.random() < 0.5 else []}, rng.choice(SEVERITIES)
+        )
+        for _ in range(1024)
+    ]
+    select = engine.select
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for i in range(lookups):
+            select(events[i & 1023])
+        best = min(best, time.perf_counter() - started)
+    return {"policies": size, "ns_per_select": round(best / lookups * 1e9, 1)}
+
+
+def check(results: List[Dict], max_growth: float) -> List[str]:
+    """Describe a dispatch cost that grows with the policy count"""
+    growth = results[-1]["ns_per_select"] / results[0]["ns_per_select"]
+    if growth > max_growth:
+        return [f"{results[-1]['policies']} policies cost {growth:.2f}x {results[0]['policies']}, "
+                f"allowed {max_growth:.2f}x"]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000,10000")
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--max-growth", type=float, default=3.0, help="Allowed slowdown of the largest set")
+    args = parser.parse_args()
+
+    results = [measure(int(size), args.lookups) for size in args.sizes.split(",")]
+    print(json.dumps(results, indent=2))
+    problems = check(results, args.max_growth)
+    for problem in problems:
+        print(f"REGRESSION: {problem}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
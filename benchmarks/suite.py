@@ -0,0 +1,259 @@
+"""
+Throughput and latency benchmark suite
+
+Measures detection throughput, end-to-end detect -> investigate -> respond
+latency, threat store ingest rate, rate-limit checks, memory per tracked
+agent and startup time on a synthetic workload, and writes the results as JSON so runs can be compared.
+
+Usage:
+    python -m benchmarks.suite [--agents 10000] [--events 200000] [--output results.json]
+    python -m benchmarks.suite --compare benchmarks/baseline.json [--tolerance 0.25]
+
+Metrics ending in ``_per_sec`` are better when higher; every other metric
+is better when lower. Comparing exits with status 1 on a regression, and
+every run exits with status 1 when a metric falls below its floor.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.investigator import InvestigationReport, ThreatInvestigator
+from src.threat_hunter.models import ModelEngine
+from src.threat_hunter.ratelimit import RateLimiter
+from src.threat_hunter.responder import ThreatResponder
+from src.threat_hunter.response_executor import FakeAgentPlatform
+from src.threat_hunter.store import ThreatStore
+from .workload import ActivityGenerator
+
+# Absolute minimums, checked on every run whatever the baseline
+FLOORS = {
+    "store_reports_per_sec": 10000,  # Group commit must sustain well over 10k reports per second
+}
+
+
+def bench_detect(detector: ThreatDetector, records: List[Dict]) -> Dict:
+    """Scalar detect_anomaly throughput"""
+    pairs = [(r["agent_id"], {k: v for k, v in r.items() if k != "agent_id"}) for r in records]
+    start = time.perf_counter()
+    for agent_id, activity in pairs:
+        detector.detect_anomaly(agent_id, activity)
+    return {"detect_events_per_sec": len(pairs) / (time.perf_counter() - start)}
+
+
+def bench_detect_batch(detector: ThreatDetector, columns: Dict, batch_size: int = 4096) -> Dict:
+    """Columnar detect_anomalies_batch throughput"""
+    total = len(columns["agent_id"])
+    start = time.perf_counter()
+    for offset in range(0, total, batch_size):
+        detector.detect_anomalies_batch({name: column[offset:offset + batch_size] for name, column in columns.items()})
+    return {"detect_batch_events_per_sec": total / (time.perf_counter() - start)}
+
+
+def bench_feature_detect(detector: ThreatDetector, records: List[Dict], batch_size: int = 256) -> Dict:
+    """Pipeline micro-batches scored through pooled feature extraction (extract_features + detect_features)"""
+    start = time.perf_counter()
+    for offset in range(0, len(records), batch_size):
+        with detector.extract_features(records[offset:offset + batch_size]) as features:
+            detector.detect_features(features)
+    return {"feature_detect_events_per_sec": len(records) / (time.perf_counter() - start)}
+
+
+def bench_model_detect(detector: ThreatDetector, records: List[Dict], batch_size: int = 256) -> Dict:
+    """Micro-batched detect_anomalies throughput with an IsolationForest model trained from the baselines"""
+    models = ModelEngine(features=("api_calls", "unusual_api_calls", "data_access_spike", "privilege_escalation"))
+    models.train_from_baselines(detector.baselines, per_agent=8)
+    scored = ThreatDetector(detector.config, models=models)
+    scored.baselines = detector.baselines
+    pairs = [(r["agent_id"], {k: v for k, v in r.items() if k != "agent_id"}) for r in records]
+    start = time.perf_counter()
+    for offset in range(0, len(pairs), batch_size):
+        scored.detect_anomalies(pairs[offset:offset + batch_size])
+    return {"model_detect_events_per_sec": len(pairs) / (time.perf_counter() - start)}
+
+
+def bench_end_to_end(detector: ThreatDetector, records: List[Dict], samples: int) -> Dict:
+    """Latency percentiles from detection to the last response action"""
+    investigator = ThreatInvestigator({"offload_cpu_bound": False})
+    responder = ThreatResponder(platform=FakeAgentPlatform(), config={"response_batch_window": 0.0})
+
+    async def run() -> List[float]:
+        latencies = []
+        for record in records:
+            start = time.perf_counter()
+            activity = {k: v for k, v in record.items() if k != "agent_id"}
+            threat = detector.detect_anomaly(record["agent_id"], activity)
+            if threat is None:
+                continue
+            investigation = await investigator.investigate(threat)
+            await responder.respond(threat, investigation)
+            latencies.append(time.perf_counter() - start)
+            responder.executor.release(threat.agent_id)
+            if len(latencies) == samples:
+                break
+        return latencies
+
+    latencies = np.array(asyncio.run(run()))
+    if not latencies.size:
+        return {}
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {"e2e_p50_seconds": p50, "e2e_p90_seconds": p90, "e2e_p99_seconds": p99}
+
+
+def bench_store(detector: ThreatDetector, records: List[Dict], reports: int = 50000) -> Dict:
+    """Sustained ThreatStore ingest rate, from record() until the last group commit lands"""
+    template = None
+    for record in records:
+        template = detector.detect_anomaly(record["agent_id"], {k: v for k, v in record.items() if k != "agent_id"})
+        if template is not None:
+            break
+    if template is None:
+        return {}
+    investigation = InvestigationReport(template, "benchmark", [], [], ["Monitor agent"], 0.0)
+    with tempfile.TemporaryDirectory() as directory:
+        store = ThreatStore(f"sqlite:///{os.path.join(directory, 'threats.db')}")
+        start = time.perf_counter()
+        for _ in range(reports):
+            store.record(investigation)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        store.close()
+    return {"store_reports_per_sec": reports / elapsed}
+
+
+def bench_rate_limit(records: List[Dict]) -> Dict:
+    """RateLimiter.allow() checks per second with every tenth agent limited"""
+    limiter = RateLimiter(base_rate=1e9, burst_seconds=1e9)
+    agent_ids = [record["agent_id"] for record in records]
+    for agent_id in sorted(set(agent_ids))[::10]:
+        limiter.limit(agent_id, 0.0)
+    allow = limiter.allow
+    start = time.perf_counter()
+    for agent_id in agent_ids:
+        allow(agent_id)
+    return {"rate_limit_checks_per_sec": len(agent_ids) / (time.perf_counter() - start)}
+
+
+def bench_memory(generator: ActivityGenerator) -> Dict:
+    """Memory held by the baselines, per tracked agent"""
+    tracemalloc.start()
+    detector = ThreatDetector()
+    for agent_id, history in generator.history(records_per_agent=5):
+        detector.establish_baseline(agent_id, history)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "baseline_bytes_per_agent": current / generator.agents,
+        "baseline_column_bytes_per_agent": detector.baselines.nbytes / generator.agents,
+    }
+
+
+def bench_startup() -> Dict:
+    """Cold import time of the package and of the FastAPI app, in a fresh interpreter"""
+    results = {}
+    for name, statement in (("import", "import src.threat_hunter"), ("app", "import src.threat_hunter.main")):
+        code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        results[f"startup_{name}_seconds"] = float(output.stdout.strip().splitlines()[-1])
+    return results
+
+
+def run_suite(agents: int, events: int, anomaly_rate: float, e2e_samples: int, seed: int) -> Dict:
+    generator = ActivityGenerator(agents, anomaly_rate, seed)
+    detector = ThreatDetector()
+    for agent_id, history in generator.history():
+        detector.establish_baseline(agent_id, history)
+    records = generator.records(events)
+
+    results = {}
+    results.update(bench_detect(detector, records))
+    results.update(bench_detect_batch(detector, generator.columns(events)))
+    results.update(bench_feature_detect(detector, records))
+    results.update(bench_model_detect(detector, records))
+    results.update(bench_end_to_end(detector, records, e2e_samples))
+    results.update(bench_store(detector, records))
+    results.update(bench_rate_limit(records))
+    results.update(bench_memory(generator))
+    results.update(bench_startup())
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Describe every metric that regressed by more than tolerance"""
+    regressions = []
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if not isinstance(value, (int, float)) or not reference:
+            continue
+        change = (value - reference) / reference
+        worse = -change if name.endswith("_per_sec") else change
+        if worse > tolerance:
+            regressions.append(f"{name}: {reference:.6g} -> {value:.6g} ({change:+.1%})")
+    return regressions
+
+
+def check_floors(results: Dict, floors: Dict = FLOORS) -> List[str]:
+    """Describe every metric below its absolute floor"""
+    return [
+        f"{name}: {results[name]:.6g} below floor {floor:.6g}"
+        for name, floor in floors.items()
+        if isinstance(results.get(name), (int, float)) and results[name] < floor
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--anomaly-rate", type=float, default=0.01)
+    parser.add_argument("--e2e-samples", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # Keep alert and action logging out of the timings
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "agents": args.agents,
+            "events": args.events,
+            "anomaly_rate": args.anomaly_rate,
+            "seed": args.seed,
+        },
+        "results": run_suite(args.agents, args.events, args.anomaly_rate, args.e2e_samples, args.seed),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+    print(text)
+
+    regressions = check_floors(report["results"])
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            baseline = json.load(handle)["results"]
+        regressions += compare(report["results"], baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Synthetic agent activity for benchmarks
+
+Generates reproducible activity streams with a realistic mix of normal
+and anomalous records across a fleet of agents.
+"""
+
+import random
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+ACTIONS = ["process_request", "read_file", "call_tool", "query_db", "send_email", "write_file"]
+RESOURCES = ["user_data", "orders", "payments", "logs", "models", "embeddings"]
+
+
+class ActivityGenerator:
+    """Seeded generator of agent activity records"""
+
+    def __init__(self, agents: int = 10000, anomaly_rate: float = 0.01, seed: int = 7):
+        self.agents = agents
+        self.anomaly_rate = anomaly_rate
+        self.seed = seed
+        self.agent_ids = [f"agent-{i}" for i in range(agents)]
+
+    def history(self, records_per_agent: int = 20) -> Iterator[tuple]:
+        """(agent_id, history) pairs of normal behaviour for baselining"""
+        rng = random.Random(self.seed)
+        for agent_id in self.agent_ids:
+            typical = rng.randint(5, 50)
+            yield agent_id, [
+                {
+                    "api_calls": max(0, int(rng.gauss(typical, typical / 5))),
+                    "action": rng.choice(ACTIONS),
+                    "data_access": [rng.choice(RESOURCES)],
+                }
+                for _ in range(records_per_agent)
+            ]
+
+    def records(self, count: int) -> List[Dict]:
+        """Activity records, each carrying its agent_id"""
+        rng = random.Random(self.seed + 1)
+        records = []
+        for _ in range(count):
+            anomalous = rng.random() < self.anomaly_rate
+            records.append({
+                "agent_id": self.agent_ids[rng.randrange(self.agents)],
+                "api_calls": rng.randint(200, 500) if anomalous else rng.randint(5, 50),
+                "unusual_api_calls": rng.randint(20, 100) if anomalous else rng.randint(0, 3),
+                "data_access_spike": anomalous and rng.random() < 0.8,
+                "privilege_escalation": anomalous and rng.random() < 0.3,
+            })
+        return records
+
+    def columns(self, count: int) -> Dict[str, np.ndarray]:
+        """The same records as a columnar batch for detect_anomalies_batch"""
+        records = self.records(count)
+        return {name: np.array([record[name] for record in records]) for name in records[0]}
@@ -29,6 +29,7 @@ setup(
         "uvicorn>=0.24.0",
         "pydantic>=2.5.0",
         "aiohttp>=3.9.1",
+        "numpy>=1.26.2",
     ],
     extras_require={
         "dev": [
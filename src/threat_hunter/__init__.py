@@ -3,13 +3,45 @@ Autonomous Threat-Hunting AI Agent
 
 A self-directed security investigation system that continuously monitors,
 analyzes, and responds to threats across AI agent deployments.
+
+Public classes are imported on first access, so ``import threat_hunter``
+stays cheap for CLI tools and short-lived workers that only need part of
+the package (or none of NumPy, scikit-learn, SQLAlchemy and FastAPI).
 """
 
+import importlib
+from typing import TYPE_CHECKING
+
 __version__ = "0.1.0"
 __author__ = "AI Agent Security Platform"
 
-from .detector import ThreatDetector
-from .investigator import ThreatInvestigator
-from .responder import ThreatResponder
+# Public name -> submodule defining it
+_LAZY = {
+    "ThreatDetector": "detector",
+    "ThreatEvent": "detector",
+    "ThreatInvestigator": "investigator",
+    "InvestigationReport": "investigator",
+    "ThreatResponder": "responder",
+    "ResponseAction": "responder",
+    "ResponseResult": "responder",
+}
+
+__all__ = list(_LAZY)
+
+if TYPE_CHECKING:
+    from .detector import ThreatDetector, ThreatEvent
+    from .investigator import InvestigationReport, ThreatInvestigator
+    from .responder import ResponseAction, ResponseResult, ThreatResponder
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
 
-__all__ = ["ThreatDetector", "ThreatInvestigator", "ThreatResponder"]
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,318 @@
+"""
+Alert Aggregation
+
+Groups alerts by (threat_type, severity, root_cause) over a sliding
+window and sends digests through a token-bucket rate limiter, so a
+fleet-wide anomaly produces a handful of alerts instead of thousands.
+Each group keeps its alerts in panes of one slide; a group with new alerts
+sends at most one digest per slide, summarizing the alerts of the trailing
+window. Digests beyond the in-memory buffer overflow to a local file,
+read and written off the event loop. Critical threats bypass aggregation
+and go out immediately.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from .detector import ThreatEvent
+
+logger = logging.getLogger(__name__)
+
+GroupKey = Tuple[str, str, str]
+
+
+class AlertChannel:
+    """Destination for alerts (pager, chat, SIEM, ...)"""
+
+    async def send(self, alert: Dict):
+        raise NotImplementedError
+
+
+class LoggingAlertChannel(AlertChannel):
+    """Channel that writes alerts to the log"""
+
+    async def send(self, alert: Dict):
+        if alert["count"] == 1:
+            logger.warning(f"ALERT: {alert['severity']} threat detected - {alert['threat_type']}")
+        else:
+            logger.warning(
+                f"ALERT DIGEST: {alert['count']} {alert['severity']} {alert['threat_type']} threats "
+                f"across {alert['agent_count']} agents - {alert['root_cause']}"
+            )
+
+
+class TokenBucket:
+    """Token-bucket rate limiter refilled lazily on each check"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+
+class _Pane:
+    """Alerts of a group within one slide"""
+
+    __slots__ = ("index", "count", "agents", "first_seen", "last_seen")
+
+    def __init__(self, index: int, event: ThreatEvent):
+        self.index = index
+        self.count = 0
+        self.agents: Set[str] = set()
+        self.first_seen = event.timestamp
+        self.last_seen = event.timestamp
+
+
+class _AlertGroup:
+    """Alerts sharing a key within the sliding window"""
+
+    __slots__ = ("key", "panes", "new", "due", "agent_overflow")
+
+    def __init__(self, key: GroupKey, max_agents: int):
+        self.key = key
+        self.panes: Deque[_Pane] = deque()
+        self.new = 0  # Alerts since the last digest
+        self.due = 0.0  # When the next digest may go out
+        self.agent_overflow = max_agents
+
+    def add(self, event: ThreatEvent, pane: int = 0):
+        if not self.panes or self.panes[-1].index != pane:
+            self.panes.append(_Pane(pane, event))
+        current = self.panes[-1]
+        current.count += 1
+        current.last_seen = event.timestamp
+        if len(current.agents) < self.agent_overflow:
+            current.agents.add(event.agent_id)
+        self.new += 1
+
+    def expire(self, oldest: int):
+        """Drop the panes before pane index oldest"""
+        while self.panes and self.panes[0].index < oldest:
+            self.panes.popleft()
+
+    def digest(self) -> Dict:
+        threat_type, severity, root_cause = self.key
+        agents = set().union(*(pane.agents for pane in self.panes))
+        truncated = len(agents) >= self.agent_overflow
+        return {
+            "threat_type": threat_type,
+            "severity": severity,
+            "root_cause": root_cause,
+            "count": sum(pane.count for pane in self.panes),
+            "new_count": self.new,
+            "agent_count": min(len(agents), self.agent_overflow),
+            "agents_truncated": truncated,
+            "agents": sorted(agents)[:self.agent_overflow],
+            "first_seen": self.panes[0].first_seen.isoformat(),
+            "last_seen": self.panes[-1].last_seen.isoformat(),
+        }
+
+
+class AlertAggregator:
+    """Windowed alert grouping with rate-limited digests and disk overflow"""
+
+    def __init__(
+        self,
+        channel: Optional[AlertChannel] = None,
+        window: float = 60.0,
+        rate: float = 1.0,
+        burst: int = 10,
+        buffer_size: int = 1000,
+        spill_path: Optional[str] = None,
+        max_agents_per_digest: int = 100,
+        slide: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            channel: Destination of alerts and digests
+            window: Seconds of alerts each digest summarizes
+            rate: Digests per second allowed through
+            burst: Digests that may go out at once
+            buffer_size: Digests held in memory before spilling to disk
+            spill_path: File digests overflow to; dropped without one
+            max_agents_per_digest: Agent IDs listed in a digest
+            slide: Seconds between digests of a group; a quarter of the window
+                by default, and never more than the window
+            clock: Monotonic clock, injectable for tests
+        """
+        self.channel = channel or LoggingAlertChannel()
+        self.window = window
+        self.slide = min(window / 4 if slide is None else slide, window)  # New alerts stay in the window until due
+        self.clock = clock
+        self.limiter = TokenBucket(rate, burst)
+        self.buffer_size = buffer_size
+        self.spill_path = spill_path
+        self.max_agents_per_digest = max_agents_per_digest
+        self.running = False
+        self.stats = {"received": 0, "immediate": 0, "digests": 0, "spilled": 0, "dropped": 0}
+        self._groups: Dict[GroupKey, _AlertGroup] = {}
+        self._outbox: Deque[Dict] = deque()
+        self._flushing = asyncio.Lock()
+        self._spill_offset = 0
+        self._spilled = 0
+        if spill_path and os.path.exists(spill_path):
+            # Digests spilled by a previous run are still owed to the channel
+            with open(spill_path, "r", encoding="utf-8") as handle:
+                self._spilled = sum(1 for _ in handle)
+
+    @property
+    def pending(self) -> int:
+        """Digests waiting to be sent (in memory and on disk)"""
+        return len(self._outbox) + self._spilled
+
+    async def submit(self, event: ThreatEvent, root_cause: str = "") -> str:
+        """
+        Submit an alert for an event
+
+        Returns:
+            Short description of what happened to the alert
+        """
+        self.stats["received"] += 1
+        if event.severity == "critical":
+            self.stats["immediate"] += 1
+            group = _AlertGroup((event.threat_type, event.severity, root_cause), 1)
+            group.add(event)
+            await self.channel.send(group.digest())
+            return "Alert sent to security team"
+
+        now = self.clock()
+        key = (event.threat_type, event.severity, root_cause)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _AlertGroup(key, self.max_agents_per_digest)
+        if not group.new:
+            group.due = max(group.due, now + self.slide)
+        group.add(event, self._pane(now))
+        return "Alert queued for digest"
+
+    def _pane(self, now: float) -> int:
+        return int(now // self.slide) if self.slide > 0 else 0
+
+    async def run(self, interval: float = 0.5):
+        """Digest due groups and send digests until stopped"""
+        self.running = True
+        while self.running:
+            try:
+                await self.flush()
+            except Exception as e:
+                # Digests stay buffered; the next pass retries them
+                logger.error(f"Error flushing alert digests: {e}")
+            await asyncio.sleep(interval)
+
+    async def stop(self):
+        """Stop the flush loop, digesting every group with undigested alerts"""
+        self.running = False
+        await self.flush(close_all=True)
+
+    async def flush(self, close_all: bool = False):
+        """Digest the groups due, then send what the rate limit allows"""
+        async with self._flushing:
+            await self._flush(close_all)
+
+    async def _flush(self, close_all: bool):
+        now = self.clock()
+        due = []
+        for key, group in list(self._groups.items()):
+            if self.slide > 0:
+                # Panes entirely before the trailing window no longer count, unless they hold undigested alerts
+                oldest = self._pane(now - self.window)
+                if group.new:
+                    oldest = min(oldest, self._pane(group.due - self.slide))
+                group.expire(oldest)
+            if group.new and (close_all or now >= group.due):
+                due.append(group.digest())
+                group.new = 0
+            if close_all or self.slide <= 0 or not group.panes:
+                del self._groups[key]
+        await self._enqueue(due)
+
+        await self._refill_from_spill()
+        while self._outbox and self.limiter.try_acquire():
+            digest = self._outbox.popleft()
+            try:
+                await self.channel.send(digest)
+            except Exception as e:
+                logger.error(f"Error sending alert digest: {e}")
+                self._outbox.appendleft(digest)
+                break
+            self.stats["digests"] += 1
+            if not self._outbox:
+                await self._refill_from_spill()
+
+    async def _enqueue(self, digests: List[Dict]):
+        spill = []
+        for digest in digests:
+            if len(self._outbox) < self.buffer_size and not self._spilled and not spill:
+                self._outbox.append(digest)
+            elif self.spill_path:
+                spill.append(digest)
+            else:
+                self.stats["dropped"] += 1
+                logger.error(f"Alert buffer full, dropping digest for {digest['threat_type']}")
+        if spill:
+            await asyncio.to_thread(self._write_spill, spill)
+            self._spilled += len(spill)
+            self.stats["spilled"] += len(spill)
+
+    async def _refill_from_spill(self):
+        """Move spilled digests back into memory, oldest first"""
+        room = self.buffer_size - len(self._outbox)
+        if not self._spilled or room <= 0:
+            return
+        digests, self._spill_offset = await asyncio.to_thread(
+            self._read_spill, self._spill_offset, min(room, self._spilled)
+        )
+        self._outbox.extend(digests)
+        if not digests:  # A truncated or missing file has nothing more to give
+            self.stats["dropped"] += self._spilled
+        self._spilled = self._spilled - len(digests) if digests else 0
+        if not self._spilled:
+            await asyncio.to_thread(self._remove_spill)
+            self._spill_offset = 0
+
+    def _write_spill(self, digests: List[Dict]):
+        """Runs in a worker thread: append digests to the spill file"""
+        with open(self.spill_path, "a", encoding="utf-8") as handle:
+            handle.writelines(json.dumps(digest) + "\n" for digest in digests)
+
+    def _remove_spill(self):
+        """Runs in a worker thread: delete the drained spill file, if it is still there"""
+        try:
+            os.remove(self.spill_path)
+        except FileNotFoundError:
+            pass
+
+    def _read_spill(self, offset: int, limit: int) -> Tuple[List[Dict], int]:
+        """Runs in a worker thread: up to limit spilled digests from offset, and the offset after them"""
+        digests = []
+        try:
+            handle = open(self.spill_path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            logger.error(f"Alert spill file {self.spill_path} is missing, dropping its digests")
+            return digests, 0
+        with handle:
+            handle.seek(offset)
+            while len(digests) < limit:
+                line = handle.readline()
+                if not line:
+                    break
+                digests.append(json.loads(line))
+            return digests, handle.tell()
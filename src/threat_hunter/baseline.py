@@ -0,0 +1,133 @@
+"""
+Behavioral Baselines
+
+Online, constant-memory behavioral baselines for agents. Each baseline is
+updated one event at a time, so history never has to be held in memory.
+"""
+
+import math
+from numbers import Real
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class RunningStat:
+    """Running mean/variance (Welford) with an exponentially weighted mean"""
+
+    __slots__ = ("count", "mean", "m2", "ewma")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = 0.0
+
+    def update(self, value: float, alpha: float):
+        """Fold a single observation into the statistics"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.ewma = value if self.count == 1 else alpha * value + (1 - alpha) * self.ewma
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (0.0 until two observations are seen)"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class TopKSketch:
+    """Bounded heavy-hitter counter (Space-Saving algorithm)"""
+
+    __slots__ = ("k", "counts")
+
+    def __init__(self, k: int = 10):
+        self.k = k
+        self.counts: Dict[Hashable, int] = {}
+
+    def add(self, item: Hashable):
+        """Count one occurrence of item, evicting the rarest item when full"""
+        counts = self.counts
+        if item in counts:
+            counts[item] += 1
+        elif len(counts) < self.k:
+            counts[item] = 1
+        else:
+            # Space-Saving: the newcomer inherits the evicted minimum count,
+            # which bounds its overestimate by that minimum.
+            victim = min(counts, key=counts.get)
+            counts[item] = counts.pop(victim) + 1
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[Hashable, int]]:
+        """Most frequent items with their (over)estimated counts"""
+        return sorted(self.counts.items(), key=lambda pair: pair[1], reverse=True)[:n]
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self.counts
+
+
+class OnlineBaseline:
+    """Constant-memory behavioral baseline for a single agent"""
+
+    __slots__ = ("alpha", "max_metrics", "time_field", "events", "metrics", "actions", "data_access")
+
+    def __init__(self, alpha: float = 0.1, top_k: int = 10, max_metrics: int = 16, time_field: str = "timestamp"):
+        self.alpha = alpha
+        self.max_metrics = max_metrics
+        self.time_field = time_field  # Event time, numeric but never a metric
+        self.events = 0
+        self.metrics: Dict[str, RunningStat] = {}
+        self.actions = TopKSketch(top_k)
+        self.data_access = TopKSketch(top_k)
+
+    def update(self, activity: Dict):
+        """Fold one activity record into the baseline"""
+        self.events += 1
+        for name, value in activity.items():
+            if not is_metric(value) or name == self.time_field:
+                continue
+            stat = self.metrics.get(name)
+            if stat is None:
+                if len(self.metrics) >= self.max_metrics:
+                    continue
+                stat = self.metrics[name] = RunningStat()
+            stat.update(float(value), self.alpha)
+
+        action = activity.get("action")
+        if action is not None:
+            self.actions.add(action)
+        for resource in activity.get("data_access") or ():
+            self.data_access.add(resource)
+
+    def z_score(self, name: str, value: float, min_std: float = 1e-6) -> Optional[float]:
+        """
+        Absolute z-score of value against the running statistics of a metric
+
+        Returns:
+            The deviation in standard deviations, or None if the metric has
+            fewer than two observations
+        """
+        stat = self.metrics.get(name)
+        if stat is None or stat.count < 2:
+            return None
+        return abs(value - stat.mean) / max(stat.std, min_std)
+
+    def max_z_score(self, activity: Dict, min_std: float = 1e-6) -> float:
+        """Largest z-score across the metrics present in activity"""
+        deviation = 0.0
+        for name in self.metrics:
+            value = activity.get(name)
+            if not is_metric(value):
+                continue
+            z = self.z_score(name, float(value), min_std)
+            if z is not None and z > deviation:
+                deviation = z
+        return deviation
+
+
+def is_metric(value) -> bool:
+    """Whether a value is a numeric metric (booleans are flags, not metrics)"""
+    return isinstance(value, Real) and not isinstance(value, bool)
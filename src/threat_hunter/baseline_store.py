@@ -0,0 +1,420 @@
+"""
+Compact Baseline Store
+
+Array-backed storage for millions of agent baselines. Agent IDs are
+interned to integer rows and every numeric baseline field lives in a
+contiguous NumPy column, so per-agent overhead is a few hundred bytes
+instead of a tree of Python dicts and lists.
+"""
+
+import math
+import sys
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .baseline import OnlineBaseline, RunningStat, is_metric
+
+
+def _grow_rows(column: np.ndarray, capacity: int, fill) -> np.ndarray:
+    """Return a copy of column with room for capacity rows"""
+    grown = np.full((capacity,) + column.shape[1:], fill, dtype=column.dtype)
+    grown[:len(column)] = column
+    return grown
+
+
+class CompactTopK:
+    """
+    Space-Saving top-k sketches for every agent, stored as two int columns
+
+    Items are interned to ids shared by all rows. Ids are reference
+    counted and freed once no sketch slot holds them, so the intern table
+    is bounded by the slots in use rather than every item ever seen.
+    """
+
+    def __init__(self, k: int, capacity: int):
+        self.k = k
+        self.ids = np.full((capacity, k), -1, dtype=np.int32)
+        self.counts = np.zeros((capacity, k), dtype=np.uint32)
+        self._item_ids: Dict[Hashable, int] = {}
+        self._items: List[Optional[Hashable]] = []
+        self._refs: List[int] = []  # Sketch slots holding each id
+        self._free_ids: List[int] = []
+
+    @property
+    def items(self) -> List[Optional[Hashable]]:
+        """Interned items, indexed by the ids stored in the sketch columns; None at free ids"""
+        return self._items
+
+    @property
+    def interned(self) -> int:
+        """Items currently held by some sketch slot"""
+        return len(self._item_ids)
+
+    def load_items(self, items: List[Optional[Hashable]]):
+        """Replace the item intern table (used when restoring columns), counting references from the ids"""
+        self._items = list(items)
+        held = self.ids[self.ids >= 0]
+        self._refs = np.bincount(held, minlength=len(self._items)).tolist() if held.size else [0] * len(self._items)
+        self._item_ids = {}
+        self._free_ids = []
+        for item_id, refs in enumerate(self._refs):
+            if refs:
+                self._item_ids[self._items[item_id]] = item_id
+            else:
+                self._items[item_id] = None
+                self._free_ids.append(item_id)
+
+    def grow(self, capacity: int):
+        self.ids = _grow_rows(self.ids, capacity, -1)
+        self.counts = _grow_rows(self.counts, capacity, 0)
+
+    def clear(self, row: int):
+        for item_id in self.ids[row].tolist():
+            if item_id >= 0:
+                self._release(item_id)
+        self.ids[row] = -1
+        self.counts[row] = 0
+
+    def move(self, source: int, target: int):
+        """Move the sketch in source to target, replacing target's; source is left empty"""
+        self.clear(target)
+        self.ids[target] = self.ids[source]
+        self.counts[target] = self.counts[source]
+        self.ids[source] = -1
+        self.counts[source] = 0
+
+    def add(self, row: int, item: Hashable):
+        """Count one occurrence of item for the agent in row"""
+        ids = self.ids[row]
+        counts = self.counts[row]
+        item_id = self._item_ids.get(item)
+        if item_id is not None:
+            slot = np.flatnonzero(ids == item_id)
+            if slot.size:
+                counts[slot[0]] += 1
+                return
+        free = np.flatnonzero(ids == -1)
+        if free.size:
+            ids[free[0]] = self._acquire(item, item_id)
+            counts[free[0]] = 1
+            return
+        victim = int(np.argmin(counts))
+        evicted = int(ids[victim])
+        ids[victim] = self._acquire(item, item_id)
+        counts[victim] += 1
+        self._release(evicted)
+
+    def load(self, row: int, top: List[Tuple[Hashable, int]]):
+        """Replace the sketch in row with (item, count) pairs"""
+        self.clear(row)
+        for slot, (item, count) in enumerate(top[:self.k]):
+            self.ids[row, slot] = self._acquire(item, self._item_ids.get(item))
+            self.counts[row, slot] = count
+
+    def _acquire(self, item: Hashable, item_id: Optional[int]) -> int:
+        """Take a reference to item, interning it under a free id when new"""
+        if item_id is None:
+            if self._free_ids:
+                item_id = self._free_ids.pop()
+                self._items[item_id] = item
+                self._refs[item_id] = 0
+            else:
+                item_id = len(self._items)
+                self._items.append(item)
+                self._refs.append(0)
+            self._item_ids[item] = item_id
+        self._refs[item_id] += 1
+        return item_id
+
+    def _release(self, item_id: int):
+        """Drop a reference to an id, freeing it when no slot holds it any more"""
+        self._refs[item_id] -= 1
+        if not self._refs[item_id]:
+            del self._item_ids[self._items[item_id]]
+            self._items[item_id] = None
+            self._free_ids.append(item_id)
+
+    def top(self, row: int) -> List[Tuple[Hashable, int]]:
+        """Items in row with their counts, most frequent first"""
+        pairs = [
+            (self._items[item_id], int(count))
+            for item_id, count in zip(self.ids[row].tolist(), self.counts[row].tolist())
+            if item_id >= 0
+        ]
+        return sorted(pairs, key=lambda pair: pair[1], reverse=True)
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.counts.nbytes
+
+
+class BaselineView:
+    """Lightweight handle on one agent's row in a BaselineStore"""
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store: "BaselineStore", row: int):
+        self.store = store
+        self.row = row
+
+    def update(self, activity: Dict):
+        self.store._update_row(self.row, activity)
+
+    @property
+    def events(self) -> int:
+        return int(self.store.events[self.row])
+
+    @property
+    def metrics(self) -> Dict[str, RunningStat]:
+        """Snapshot of the running statistics for each tracked metric"""
+        store, row = self.store, self.row
+        metrics = {}
+        for name, col in store.metric_index.items():
+            if store.count[row, col] == 0:
+                continue
+            stat = RunningStat()
+            stat.count = int(store.count[row, col])
+            stat.mean = float(store.mean[row, col])
+            stat.m2 = float(store.m2[row, col])
+            stat.ewma = float(store.ewma[row, col])
+            metrics[name] = stat
+        return metrics
+
+    @property
+    def actions(self) -> List[Tuple[Hashable, int]]:
+        return self.store.actions.top(self.row)
+
+    @property
+    def data_access(self) -> List[Tuple[Hashable, int]]:
+        return self.store.data_access.top(self.row)
+
+    def z_score(self, name: str, value: float, min_std: float = 1e-6) -> Optional[float]:
+        """Absolute z-score of value against a metric, None with fewer than two observations"""
+        store = self.store
+        col = store.metric_index.get(name)
+        if col is None:
+            return None
+        count = int(store.count[self.row, col])
+        if count < 2:
+            return None
+        std = math.sqrt(float(store.m2[self.row, col]) / (count - 1))
+        return abs(value - float(store.mean[self.row, col])) / max(std, min_std)
+
+    def max_z_score(self, activity: Dict, min_std: float = 1e-6) -> float:
+        """Largest z-score across the metrics present in activity"""
+        deviation = 0.0
+        for name in self.store.metric_index:
+            value = activity.get(name)
+            if not is_metric(value):
+                continue
+            z = self.z_score(name, float(value), min_std)
+            if z is not None and z > deviation:
+                deviation = z
+        return deviation
+
+
+class BaselineStore:
+    """Column-oriented store of online baselines keyed by interned agent ID"""
+
+    def __init__(
+        self,
+        alpha: float = 0.1,
+        top_k: int = 10,
+        max_metrics: int = 16,
+        capacity: int = 1024,
+        time_field: str = "timestamp",
+    ):
+        self.alpha = alpha
+        self.max_metrics = max_metrics
+        self.time_field = time_field  # Event time, numeric but never a metric
+        self.metric_index: Dict[str, int] = {}
+        self._rows: Dict[str, int] = {}
+        self._agent_ids: List[str] = []
+
+        self.events = np.zeros(capacity, dtype=np.int64)
+        self.count = np.zeros((capacity, 0), dtype=np.uint32)
+        self.mean = np.zeros((capacity, 0), dtype=np.float64)
+        self.m2 = np.zeros((capacity, 0), dtype=np.float64)
+        self.ewma = np.zeros((capacity, 0), dtype=np.float64)
+        self.actions = CompactTopK(top_k, capacity)
+        self.data_access = CompactTopK(top_k, capacity)
+
+    def __len__(self) -> int:
+        return len(self._agent_ids)
+
+    def __contains__(self, agent_id: str) -> bool:
+        return agent_id in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._agent_ids)
+
+    def __getitem__(self, agent_id: str) -> BaselineView:
+        return BaselineView(self, self._rows[agent_id])
+
+    def __setitem__(self, agent_id: str, baseline: OnlineBaseline):
+        """Replace an agent's baseline with the state of an OnlineBaseline"""
+        row = self.intern(agent_id)
+        self._clear_row(row)
+        self.events[row] = baseline.events
+        for name, stat in baseline.metrics.items():
+            col = self._metric_column(name)
+            if col is None:
+                continue
+            self.count[row, col] = stat.count
+            self.mean[row, col] = stat.mean
+            self.m2[row, col] = stat.m2
+            self.ewma[row, col] = stat.ewma
+        self.actions.load(row, baseline.actions.top())
+        self.data_access.load(row, baseline.data_access.top())
+
+    def load_agent_ids(self, agent_ids: List[str]):
+        """Replace the agent intern table; agent_ids[i] owns row i"""
+        if len(agent_ids) > self.capacity:
+            raise ValueError(f"{len(agent_ids)} agents do not fit in {self.capacity} rows")
+        self._agent_ids = list(agent_ids)
+        self._rows = {agent_id: row for row, agent_id in enumerate(self._agent_ids)}
+
+    def export(self, agent_id: str) -> OnlineBaseline:
+        """Copy an agent's baseline out of the store as an OnlineBaseline"""
+        view = self[agent_id]
+        baseline = OnlineBaseline(
+            alpha=self.alpha, top_k=self.actions.k, max_metrics=self.max_metrics, time_field=self.time_field
+        )
+        baseline.events = view.events
+        baseline.metrics = view.metrics
+        baseline.actions.counts = dict(view.actions)
+        baseline.data_access.counts = dict(view.data_access)
+        return baseline
+
+    def remove(self, agent_id: str):
+        """Drop an agent, moving the last row into its place to keep rows dense"""
+        row = self._rows.pop(agent_id)
+        last = len(self._agent_ids) - 1
+        if row != last:
+            moved = self._agent_ids[last]
+            for column in (self.events, self.count, self.mean, self.m2, self.ewma):
+                column[row] = column[last]
+            for sketch in (self.actions, self.data_access):
+                sketch.move(last, row)
+            self._agent_ids[row] = moved
+            self._rows[moved] = row
+        self._agent_ids.pop()
+        self._clear_row(last)
+
+    def get(self, agent_id: str) -> Optional[BaselineView]:
+        row = self._rows.get(agent_id)
+        return None if row is None else BaselineView(self, row)
+
+    @property
+    def agent_ids(self) -> List[str]:
+        """Agent IDs in row order"""
+        return self._agent_ids
+
+    @property
+    def capacity(self) -> int:
+        return len(self.events)
+
+    def intern(self, agent_id: str) -> int:
+        """Row index for agent_id, allocating a new row on first sight"""
+        row = self._rows.get(agent_id)
+        if row is None:
+            row = len(self._agent_ids)
+            if row == self.capacity:
+                self._grow(max(2 * self.capacity, 1024))
+            agent_id = sys.intern(agent_id)
+            self._rows[agent_id] = row
+            self._agent_ids.append(agent_id)
+        return row
+
+    def rows(self, agent_ids) -> np.ndarray:
+        """Row index for each agent ID, -1 for unknown agents"""
+        get = self._rows.get
+        return np.fromiter((get(agent_id, -1) for agent_id in agent_ids), dtype=np.int64, count=len(agent_ids))
+
+    def update(self, agent_id: str, activity: Dict):
+        """Fold one activity record into an agent's baseline"""
+        self._update_row(self.intern(agent_id), activity)
+
+    def z_scores(self, rows: np.ndarray, name: str, values: np.ndarray, min_std: float = 1e-6) -> np.ndarray:
+        """
+        Vectorized absolute z-scores of values against a metric
+
+        Returns:
+            Array aligned with rows; NaN where the agent is unknown or has
+            fewer than two observations of the metric
+        """
+        z_scores = np.full(len(rows), np.nan)
+        col = self.metric_index.get(name)
+        if col is None:
+            return z_scores
+        known = rows >= 0
+        count = np.zeros(len(rows), dtype=np.float64)
+        count[known] = self.count[rows[known], col]
+        valid = np.flatnonzero(count >= 2)
+        if valid.size:
+            picked = rows[valid]
+            std = np.sqrt(self.m2[picked, col] / (count[valid] - 1))
+            z_scores[valid] = np.abs(values[valid] - self.mean[picked, col]) / np.maximum(std, min_std)
+        return z_scores
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the numeric columns"""
+        columns = (self.events, self.count, self.mean, self.m2, self.ewma)
+        return sum(column.nbytes for column in columns) + self.actions.nbytes + self.data_access.nbytes
+
+    def _update_row(self, row: int, activity: Dict):
+        self.events[row] += 1
+        alpha = self.alpha
+        for name, value in activity.items():
+            if not is_metric(value) or name == self.time_field:
+                continue
+            col = self._metric_column(name)
+            if col is None:
+                continue
+            value = float(value)
+            count = int(self.count[row, col]) + 1
+            mean = float(self.mean[row, col])
+            delta = value - mean
+            mean += delta / count
+            self.count[row, col] = count
+            self.mean[row, col] = mean
+            self.m2[row, col] += delta * (value - mean)
+            self.ewma[row, col] = value if count == 1 else alpha * value + (1 - alpha) * float(self.ewma[row, col])
+
+        action = activity.get("action")
+        if action is not None:
+            self.actions.add(row, action)
+        for resource in activity.get("data_access") or ():
+            self.data_access.add(row, resource)
+
+    def _metric_column(self, name: str) -> Optional[int]:
+        """Column for a metric, widening the metric columns on first sight"""
+        col = self.metric_index.get(name)
+        if col is None and len(self.metric_index) < self.max_metrics:
+            col = self.metric_index[name] = len(self.metric_index)
+            pad = ((0, 0), (0, 1))
+            self.count = np.pad(self.count, pad)
+            self.mean = np.pad(self.mean, pad)
+            self.m2 = np.pad(self.m2, pad)
+            self.ewma = np.pad(self.ewma, pad)
+        return col
+
+    def _clear_row(self, row: int):
+        self.events[row] = 0
+        self.count[row] = 0
+        self.mean[row] = 0.0
+        self.m2[row] = 0.0
+        self.ewma[row] = 0.0
+        self.actions.clear(row)
+        self.data_access.clear(row)
+
+    def _grow(self, capacity: int):
+        self.events = _grow_rows(self.events, capacity, 0)
+        self.count = _grow_rows(self.count, capacity, 0)
+        self.mean = _grow_rows(self.mean, capacity, 0.0)
+        self.m2 = _grow_rows(self.m2, capacity, 0.0)
+        self.ewma = _grow_rows(self.ewma, capacity, 0.0)
+        self.actions.grow(capacity)
+        self.data_access.grow(capacity)
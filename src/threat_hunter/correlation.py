@@ -0,0 +1,436 @@
+"""
+Event-Time Correlation
+
+Streams scored activity through tumbling, sliding and session windows per
+agent (or per agent and threat type) and emits a composite ThreatEvent
+when a window accumulates enough risk, so patterns spread over many
+sub-threshold events (slow exfiltration, sustained probing) still reach
+the investigation playbooks.
+
+Windows are driven by event time. The watermark trails the latest event
+time by the allowed lateness; events older than the watermark are dropped
+as late, and windows are closed from a heap of close times as the
+watermark passes them. Per-key state is capped and the least recently
+active keys are evicted first.
+"""
+
+import heapq
+import itertools
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .detector import ThreatDetector, ThreatEvent
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, ...]
+
+WINDOW_KINDS = ("tumbling", "sliding", "session")
+
+
+@dataclass
+class WindowSpec:
+    """A correlation pattern over one kind of window"""
+    name: str
+    kind: str  # tumbling, sliding or session
+    size: float  # Window length in seconds; the inactivity gap for session windows
+    threat_type: str  # Type of the composite ThreatEvent, selecting its playbook
+    min_events: int = 5
+    min_total_risk: float = 2.0
+    slide: Optional[float] = None  # Step between sliding windows; must divide size
+    key_by: str = "agent"  # "agent" or "agent_threat_type"
+
+    def __post_init__(self):
+        if self.kind not in WINDOW_KINDS:
+            raise ValueError(f"Unknown window kind '{self.kind}'")
+        if self.kind == "sliding":
+            if not self.slide or self.slide <= 0:
+                raise ValueError(f"Sliding window '{self.name}' needs a positive slide")
+            if not math.isclose(self.size / self.slide, round(self.size / self.slide)):
+                raise ValueError(f"Sliding window '{self.name}' size must be a multiple of its slide")
+
+
+DEFAULT_WINDOWS = [
+    WindowSpec("slow_exfiltration", "sliding", 900.0, "data_exfiltration", min_events=5, min_total_risk=2.0, slide=60.0),
+    WindowSpec("activity_burst", "tumbling", 60.0, "behavioral_anomaly", min_events=20, min_total_risk=6.0),
+    WindowSpec(
+        "sustained_anomaly", "session", 300.0, "behavioral_anomaly",
+        min_events=10, min_total_risk=4.0, key_by="agent_threat_type"
+    ),
+]
+
+
+class _Aggregate:
+    """Running summary of the events in a window or pane"""
+
+    __slots__ = ("count", "total_risk", "max_risk", "first_seen", "last_seen", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total_risk = 0.0
+        self.max_risk = 0.0
+        self.first_seen = math.inf
+        self.last_seen = -math.inf
+        self.samples: List[Dict] = []
+
+    def add(self, event_time: float, risk: float, activity: Optional[Mapping], max_samples: int):
+        self.count += 1
+        self.total_risk += risk
+        self.max_risk = max(self.max_risk, risk)
+        self.first_seen = min(self.first_seen, event_time)
+        self.last_seen = max(self.last_seen, event_time)
+        if activity is not None and len(self.samples) < max_samples:
+            self.samples.append(dict(activity))
+
+    def merge(self, other: "_Aggregate", max_samples: int):
+        self.count += other.count
+        self.total_risk += other.total_risk
+        self.max_risk = max(self.max_risk, other.max_risk)
+        self.first_seen = min(self.first_seen, other.first_seen)
+        self.last_seen = max(self.last_seen, other.last_seen)
+        self.samples.extend(other.samples[:max_samples - len(self.samples)])
+
+
+class _WindowState:
+    """Open windows of one spec, keyed by agent (and threat type)"""
+
+    def __init__(self, spec: WindowSpec, engine: "CorrelationEngine"):
+        self.spec = spec
+        self.engine = engine
+        self.keys: "OrderedDict[Key, object]" = OrderedDict()  # Least recently active first
+        self.heap: List[Tuple[float, int, Key, float]] = []  # (close time, seq, key, window start)
+
+    def schedule(self, close: float, key: Key, start: float):
+        heapq.heappush(self.heap, (close, next(self.engine._sequence), key, start))
+
+    def touch(self, key: Key, default):
+        state = self.keys.get(key)
+        if state is None:
+            state = self.keys[key] = default()
+            if len(self.keys) > self.engine.max_keys:
+                self.evict()
+        else:
+            self.keys.move_to_end(key)
+        return state
+
+    def advance(self, watermark: float):
+        heap = self.heap
+        while heap and heap[0][0] <= watermark:
+            close, _, key, start = heapq.heappop(heap)
+            if key in self.keys:
+                self.close(key, start, close, watermark)
+
+    def evict(self):
+        """Drop the least recently active key, emitting whatever its windows hold"""
+        key = next(iter(self.keys))
+        self.finish(key)
+        self.keys.pop(key, None)
+        self.engine.stats["evicted"] += 1
+
+    def add(self, key: Key, event_time: float, risk: float, activity: Optional[Mapping]):
+        raise NotImplementedError
+
+    def close(self, key: Key, start: float, close: float, watermark: float):
+        raise NotImplementedError
+
+    def finish(self, key: Key):
+        """Close every window of a key regardless of the watermark"""
+        raise NotImplementedError
+
+
+class _TumblingState(_WindowState):
+    """Fixed, non-overlapping windows: per key, window start -> aggregate"""
+
+    def add(self, key, event_time, risk, activity):
+        windows = self.touch(key, dict)
+        start = math.floor(event_time / self.spec.size) * self.spec.size
+        aggregate = windows.get(start)
+        if aggregate is None:
+            aggregate = windows[start] = _Aggregate()
+            self.schedule(start + self.spec.size, key, start)
+        aggregate.add(event_time, risk, activity, self.engine.max_samples)
+
+    def close(self, key, start, close, watermark):
+        windows = self.keys[key]
+        aggregate = windows.pop(start, None)
+        if aggregate is not None:
+            self.engine._evaluate(self.spec, key, start, close, aggregate)
+        if not windows:
+            del self.keys[key]
+
+    def finish(self, key):
+        for start, aggregate in sorted(self.keys[key].items()):
+            self.engine._evaluate(self.spec, key, start, start + self.spec.size, aggregate)
+        self.keys[key] = {}
+
+
+class _SlidingPanes:
+    __slots__ = ("panes", "last_emitted_end", "next_close")
+
+    def __init__(self):
+        self.panes: Dict[float, _Aggregate] = {}
+        self.last_emitted_end = -math.inf
+        self.next_close = math.inf
+
+
+class _Session(_Aggregate):
+    __slots__ = ("opened",)
+
+    def __init__(self, opened: float):
+        super().__init__()
+        self.opened = opened  # Identifies the session in scheduled close entries
+
+
+class _SlidingState(_WindowState):
+    """
+    Overlapping windows built from panes of one slide each
+
+    Events are added to a single pane; a window is the merge of the panes
+    it covers. Each key tracks its next close time so superseded heap
+    entries are skipped, and an emitted window suppresses later windows
+    that overlap it.
+    """
+
+    def add(self, key, event_time, risk, activity):
+        state = self.touch(key, _SlidingPanes)
+        slide = self.spec.slide
+        start = math.floor(event_time / slide) * slide
+        pane = state.panes.get(start)
+        if pane is None:
+            pane = state.panes[start] = _Aggregate()
+        pane.add(event_time, risk, activity, self.engine.max_samples)
+        if start + slide < state.next_close:
+            state.next_close = start + slide
+            self.schedule(state.next_close, key, state.next_close - self.spec.size)
+
+    def close(self, key, start, close, watermark):
+        state = self.keys[key]
+        if close != state.next_close:
+            return  # Superseded by an earlier close time
+        self._evaluate_window(key, state, close)
+        # Panes that start before the next window are no longer needed
+        horizon = close + self.spec.slide - self.spec.size
+        for pane_start in [p for p in state.panes if p < horizon]:
+            del state.panes[pane_start]
+        if not state.panes:
+            del self.keys[key]
+            return
+        state.next_close = max(close + self.spec.slide, min(state.panes) + self.spec.slide)
+        self.schedule(state.next_close, key, state.next_close - self.spec.size)
+
+    def finish(self, key):
+        state = self.keys[key]
+        if state.panes:
+            end = max(state.panes) + self.spec.slide
+            while state.panes:
+                self._evaluate_window(key, state, end)
+                horizon = end + self.spec.slide - self.spec.size
+                for pane_start in [p for p in state.panes if p < horizon]:
+                    del state.panes[pane_start]
+                end += self.spec.slide
+        self.keys[key] = _SlidingPanes()
+
+    def _evaluate_window(self, key: Key, state: _SlidingPanes, end: float):
+        start = end - self.spec.size
+        if start < state.last_emitted_end:
+            return
+        window = _Aggregate()
+        for pane_start in sorted(state.panes):
+            if start <= pane_start < end:
+                window.merge(state.panes[pane_start], self.engine.max_samples)
+        if window.count and self.engine._evaluate(self.spec, key, start, end, window):
+            state.last_emitted_end = end
+
+
+class _SessionState(_WindowState):
+    """Windows that stay open while events keep arriving within the gap"""
+
+    def add(self, key, event_time, risk, activity):
+        session = self.keys.get(key)
+        if session is not None and event_time - session.last_seen > self.spec.size:
+            self.engine._evaluate(self.spec, key, session.first_seen, session.last_seen + self.spec.size, session)
+            del self.keys[key]
+            session = None
+        if session is None:
+            session = self.touch(key, lambda: _Session(event_time))
+            session.add(event_time, risk, activity, self.engine.max_samples)
+            self.schedule(event_time + self.spec.size, key, event_time)
+            return
+        self.keys.move_to_end(key)
+        session.add(event_time, risk, activity, self.engine.max_samples)
+
+    def close(self, key, start, close, watermark):
+        session = self.keys[key]
+        if session.opened != start:
+            return  # Entry for an earlier session of this key
+        expires = session.last_seen + self.spec.size
+        if expires > watermark:
+            self.schedule(expires, key, start)  # Extended since scheduling; check again later
+            return
+        del self.keys[key]
+        self.engine._evaluate(self.spec, key, session.first_seen, expires, session)
+
+    def finish(self, key):
+        session = self.keys[key]
+        self.engine._evaluate(self.spec, key, session.first_seen, session.last_seen + self.spec.size, session)
+
+
+_STATES = {"tumbling": _TumblingState, "sliding": _SlidingState, "session": _SessionState}
+
+
+class CorrelationEngine:
+    """Windowed correlation of scored activity into composite ThreatEvents"""
+
+    def __init__(
+        self,
+        windows: Optional[List[WindowSpec]] = None,
+        allowed_lateness: float = 60.0,
+        min_risk: float = 0.2,
+        max_keys: int = 100000,
+        max_samples: int = 10,
+        time_field: str = "timestamp",
+    ):
+        self.windows = list(DEFAULT_WINDOWS if windows is None else windows)
+        self.allowed_lateness = allowed_lateness
+        self.min_risk = min_risk
+        self.max_keys = max_keys
+        self.max_samples = max_samples
+        self.time_field = time_field
+        self.watermark = -math.inf
+        self.stats = {"observed": 0, "late": 0, "emitted": 0, "evicted": 0}
+        self._sequence = itertools.count()
+        self._states = [_STATES[spec.kind](spec, self) for spec in self.windows]
+        self._max_event_time = -math.inf
+        self._outbox: List[ThreatEvent] = []
+
+    @property
+    def open_keys(self) -> int:
+        """Keys with open windows, summed over window specs"""
+        return sum(len(state.keys) for state in self._states)
+
+    def observe(
+        self,
+        agent_id: str,
+        risk_score: float,
+        activity: Optional[Mapping] = None,
+        threat_type: str = "behavioral_anomaly",
+        event_time: Optional[float] = None,
+    ):
+        """
+        Add a scored activity record to every window it falls in
+
+        Records below min_risk are not added to windows but their event
+        time, when they carry one, still advances stream time, so quiet
+        streams keep closing windows.
+
+        Args:
+            agent_id: Agent the activity belongs to
+            risk_score: Detector risk score of the record
+            activity: Activity fields, kept as samples in composite events
+            threat_type: Threat type the record was scored as
+            event_time: Event time in epoch seconds; read from the
+                activity's time field (or the wall clock) when omitted
+        """
+        if risk_score < self.min_risk:
+            if event_time is None:
+                event_time = self._record_time(activity)
+            if event_time is not None:
+                self.observe_time(event_time)
+            return
+        if event_time is None:
+            event_time = self._event_time(activity)
+        if event_time < self.watermark:
+            self.stats["late"] += 1
+            return
+
+        self.stats["observed"] += 1
+        for state in self._states:
+            key = (agent_id,) if state.spec.key_by == "agent" else (agent_id, threat_type)
+            state.add(key, event_time, risk_score, activity)
+        self.observe_time(event_time)
+
+    def observe_time(self, event_time: float):
+        """Advance stream time to an event time without adding a record"""
+        if event_time > self._max_event_time:
+            self._max_event_time = event_time
+            self.advance_watermark(event_time - self.allowed_lateness)
+
+    def observe_times(self, activities: Iterable[Mapping]):
+        """Advance stream time to the latest event time carried by records that are not observed one by one"""
+        times = [event_time for event_time in map(self._record_time, activities) if event_time is not None]
+        if times:
+            self.observe_time(max(times))
+
+    def observe_event(self, event: ThreatEvent):
+        """Correlate an already raised ThreatEvent"""
+        self.observe(event.agent_id, event.risk_score, event.details, event.threat_type)
+
+    def advance_watermark(self, watermark: float):
+        """Close every window that ends at or before the watermark"""
+        if watermark <= self.watermark:
+            return
+        self.watermark = watermark
+        for state in self._states:
+            state.advance(watermark)
+
+    def flush(self):
+        """Close every open window, e.g. at shutdown or the end of a replay"""
+        for state in self._states:
+            for key in list(state.keys):
+                state.finish(key)
+            state.keys.clear()
+            state.heap.clear()
+
+    def drain(self) -> List[ThreatEvent]:
+        """Composite ThreatEvents emitted since the last drain"""
+        events, self._outbox = self._outbox, []
+        return events
+
+    def _event_time(self, activity: Optional[Mapping]) -> float:
+        event_time = self._record_time(activity)
+        return time.time() if event_time is None else event_time
+
+    def _record_time(self, activity: Optional[Mapping]) -> Optional[float]:
+        value = activity.get(self.time_field) if activity is not None else None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if isinstance(value, datetime):
+            return value.timestamp()
+        if isinstance(value, str):
+            try:
+                return datetime.fromisoformat(value).timestamp()
+            except ValueError:
+                pass
+        return None
+
+    def _evaluate(self, spec: WindowSpec, key: Key, start: float, end: float, window: _Aggregate) -> bool:
+        """Emit a composite event if the closed window meets the spec's thresholds"""
+        if window.count < spec.min_events or window.total_risk < spec.min_total_risk:
+            return False
+        risk_score = min(1.0, 0.7 + 0.1 * (window.total_risk - spec.min_total_risk))
+        self._outbox.append(ThreatEvent(
+            agent_id=key[0],
+            threat_type=spec.threat_type,
+            risk_score=risk_score,
+            timestamp=datetime.fromtimestamp(end),
+            details={
+                "correlation": spec.name,
+                "window": spec.kind,
+                "window_start": datetime.fromtimestamp(start).isoformat(),
+                "window_end": datetime.fromtimestamp(end).isoformat(),
+                "event_count": window.count,
+                "total_risk": window.total_risk,
+                "max_risk": window.max_risk,
+                "source_threat_type": key[1] if len(key) > 1 else None,
+                "events": window.samples,
+            },
+            severity=ThreatDetector._determine_severity(risk_score)
+        ))
+        self.stats["emitted"] += 1
+        logger.info(f"Correlated {window.count} events for agent {key[0]} into {spec.threat_type} ({spec.name})")
+        return True
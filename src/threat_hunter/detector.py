@@ -7,16 +7,42 @@ ML-based behavioral analysis.
 
 import asyncio
 import logging
-from typing import Dict, List, Optional
+import os
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 from datetime import datetime
 from dataclasses import dataclass
 
+import numpy as np
+
+from . import metrics
+from .baseline import OnlineBaseline
+from .baseline_store import BaselineStore
+from .features import FeatureBatch, FeaturePool, FeatureSchema
+from .rules import RuleEngine
+
+if TYPE_CHECKING:
+    from .ingestion import IngestionPipeline
+    from .correlation import CorrelationEngine
+    from .fleet import FleetIndex
+    from .models import ModelEngine
+
 logger = logging.getLogger(__name__)
 
+_EVENTS_SCORED = metrics.counter("threat_hunter_detect_events_total", "Activity records scored")
+_THREATS_RAISED = metrics.counter("threat_hunter_detect_threats_total", "Threat events raised")
+_DETECT_LATENCY = metrics.histogram(
+    "threat_hunter_detect_seconds",
+    "detect_anomaly latency (sampled)",
+    sample_every=int(os.getenv("THREAT_HUNTER_METRICS_SAMPLE_EVERY", "16"))
+)
+_BATCH_LATENCY = metrics.histogram("threat_hunter_detect_batch_seconds", "detect_anomalies_batch latency per batch")
+
 
 @dataclass
 class ThreatEvent:
     """Represents a detected threat event"""
+    __slots__ = ("agent_id", "threat_type", "risk_score", "timestamp", "details", "severity")
+
     agent_id: str
     threat_type: str
     risk_score: float
@@ -28,32 +54,66 @@ class ThreatEvent:
 class ThreatDetector:
     """Autonomous threat detection engine"""
     
-    def __init__(self, config: Optional[Dict] = None):
+    def __init__(
+        self,
+        config: Optional[Dict] = None,
+        models: Optional["ModelEngine"] = None,
+        rules: Optional[RuleEngine] = None,
+        correlator: Optional["CorrelationEngine"] = None,
+        clock: Callable[[], datetime] = datetime.now,
+        fleet: Optional["FleetIndex"] = None
+    ):
         self.config = config or {}
-        self.baselines = {}  # Agent behavioral baselines
+        self.clock = clock  # Timestamps threat events; a replay clock when backtesting
+        # Declarative detection rules; the built-in heuristics unless a rules_path is configured
+        self.rules = rules or RuleEngine(path=self.config.get("rules_path"))
+        self.models = models  # Optional anomaly models added on top of the heuristics
+        self.correlator = correlator  # Optional windowed correlation of scored activity
+        self.fleet = fleet  # Optional fleet-wide index of behaviors across agents
+        self.time_field = self.config.get("time_field", "timestamp")  # Event time; never a baseline metric
+        self.baselines = BaselineStore(  # Agent behavioral baselines
+            alpha=self.config.get("baseline_alpha", 0.1),
+            top_k=self.config.get("baseline_top_k", 10),
+            time_field=self.time_field
+        )
+        self.features = FeaturePool()  # Reused matrices for feature-extracted micro-batches
         self.running = False
+        self.pipeline = None  # Ingestion pipeline driving detection
+        self._stopped = None
+        self._schema: Optional[FeatureSchema] = None
+        self._schema_key: Optional[Tuple] = None
         
-    async def start_monitoring(self):
-        """Start continuous threat monitoring"""
+    async def start_monitoring(self, pipeline: Optional["IngestionPipeline"] = None):
+        """
+        Start continuous threat monitoring
+
+        Args:
+            pipeline: Ingestion pipeline that pushes activity into the
+                detector. Without one, the detector only serves direct
+                detect_anomaly calls until stopped.
+        """
+        if pipeline is not None:
+            self.pipeline = pipeline
         self.running = True
+        self._stopped = asyncio.Event()
         logger.info("Starting threat detection monitoring...")
         
-        while self.running:
-            try:
-                # Monitor agent activity
-                await self._monitor_agents()
-                await asyncio.sleep(1)  # Check every second
-            except Exception as e:
-                logger.error(f"Error in monitoring loop: {e}")
+        try:
+            await self._monitor_agents()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in monitoring loop: {e}")
+        finally:
+            self.running = False
                 
     async def _monitor_agents(self):
         """Monitor all registered agents for anomalies"""
-        # Placeholder: In real implementation, this would:
-        # 1. Collect agent activity data
-        # 2. Compare to behavioral baselines
-        # 3. Detect anomalies using ML models
-        # 4. Generate threat events
-        pass
+        if self.pipeline is None:
+            await self._stopped.wait()
+            return
+        # Events are pushed through the pipeline as they arrive
+        await self.pipeline.run()
         
     def detect_anomaly(self, agent_id: str, activity: Dict) -> Optional[ThreatEvent]:
         """
@@ -66,38 +126,200 @@ class ThreatDetector:
         Returns:
             ThreatEvent if anomaly detected, None otherwise
         """
+        started = _DETECT_LATENCY.start()
+        _EVENTS_SCORED.inc()
+        
         # Calculate risk score based on activity patterns
         risk_score = self._calculate_risk_score(agent_id, activity)
+        threat = self._threat_event(agent_id, activity, risk_score)
+        _DETECT_LATENCY.observe_since(started)
+        return threat
+
+    def detect_anomalies(self, activities: Sequence[Tuple[str, Dict]]) -> List[ThreatEvent]:
+        """
+        Detect anomalies in a micro-batch of agent activity
+
+        Heuristics are scored per record while model inference runs once
+        for the whole batch. Results match calling detect_anomaly on each
+        record.
+
+        Args:
+            activities: (agent_id, activity) pairs
+
+        Returns:
+            ThreatEvents for the anomalous records, in batch order
+        """
+        started = _BATCH_LATENCY.start()
+        _EVENTS_SCORED.inc(len(activities))
+        model_risk = None
+        if self.models is not None and activities:
+            agent_ids, records = zip(*activities)
+            model_risk = self.models.score_records(agent_ids, records)
+
+        threats = []
+        for index, (agent_id, activity) in enumerate(activities):
+            risk = self._heuristic_risk(agent_id, activity)
+            if model_risk is not None:
+                risk += float(model_risk[index])
+            threat = self._threat_event(agent_id, activity, min(risk, 1.0))
+            if threat is not None:
+                threats.append(threat)
+        _BATCH_LATENCY.observe_since(started)
+        return threats
+
+    def feature_schema(self) -> FeatureSchema:
+        """
+        Fields the detector reads from activity: model features first,
+        then rule fields and baseline metrics. Rebuilt when rules reload
+        or baselines learn a new metric.
+        """
+        compiled = self.rules.compiled
+        features = self.models.features if self.models is not None else ()
+        key = (compiled, features, len(self.baselines.metric_index))
+        if key != self._schema_key:
+            self._schema = FeatureSchema((
+                *features,
+                *(predicate.field for predicate in compiled.predicates),
+                *self.baselines.metric_index,
+            ))
+            self._schema_key = key
+        return self._schema
+
+    def extract_features(self, records: Sequence[Mapping]) -> FeatureBatch:
+        """Extract records (each with an ``agent_id``) into a pooled feature batch for detect_features"""
+        return self.features.extract(records, self.feature_schema())
+
+    def detect_features(self, batch: FeatureBatch, learn: bool = False) -> List[ThreatEvent]:
+        """
+        Detect anomalies in a feature-extracted micro-batch
+
+        Rules, baseline deviation and models are scored on the batch's
+        columns. Activity dicts are only built for rows handed to the
+        correlator or raised as threats, and the fleet index reads the
+        records themselves. Results match calling detect_anomaly on each
+        record.
+
+        Args:
+            batch: Batch from extract_features; still owned by the caller
+            learn: Fold the records scoring below the high risk threshold
+                into their agents' baselines, after every record is scored
+
+        Returns:
+            ThreatEvents for the anomalous records, in batch order
+        """
+        started = _BATCH_LATENCY.start()
+        rows = len(batch)
+        _EVENTS_SCORED.inc(rows)
+        agent_ids = batch.agent_ids
+        risk = self.rules.score_columns(batch.columns, rows, batch.masks)
+        if self.baselines:
+            risk += self._deviation_risks(self._max_z_scores(agent_ids, batch.metrics, batch.metric_masks))
+        if self.models is not None:
+            risk += self.models.score_matrix(agent_ids, batch.matrix(self.models.features))
+        risk = np.minimum(risk, 1.0)
+
+        if self.correlator is not None:
+            for row in np.flatnonzero(risk >= self.correlator.min_risk).tolist():
+                self.correlator.observe(agent_ids[row], float(risk[row]), batch.activity(row))
+            # Low-risk rows are not correlated but still move event time on
+            self.correlator.observe_times(batch.records)
+        high = risk >= 0.7  # High risk threshold
+        if learn:
+            update = self.baselines.update
+            for row in np.flatnonzero(~high).tolist():
+                update(agent_ids[row], batch.records[row])
+        if self.fleet is not None:
+            observe = self.fleet.observe
+            covered = [observe(agent_id, record) for agent_id, record in zip(agent_ids.tolist(), batch.records)]
+            for row in np.flatnonzero(high).tolist():
+                if covered[row] and self._covered_by_fleet(
+                    agent_ids[row], batch.activity(row), float(risk[row]), covered[row]
+                ):
+                    high[row] = False
+        hits = np.flatnonzero(high)
+        events = []
+        if hits.size:
+            severities = self._determine_severities(risk[hits])
+            timestamp = self.clock()
+            for index, row in enumerate(hits.tolist()):
+                events.append(ThreatEvent(
+                    agent_id=agent_ids[row],
+                    threat_type="behavioral_anomaly",
+                    risk_score=float(risk[row]),
+                    timestamp=timestamp,
+                    details=batch.activity(row),
+                    severity=severities[index]
+                ))
+            _THREATS_RAISED.inc(len(events))
+        _BATCH_LATENCY.observe_since(started)
+        return events
+
+    def _threat_event(self, agent_id: str, activity: Dict, risk_score: float) -> Optional[ThreatEvent]:
+        """ThreatEvent for a scored record, or None below the high risk threshold"""
+        if self.correlator is not None:
+            self.correlator.observe(agent_id, risk_score, activity)
+        covered = self.fleet.observe(agent_id, activity) if self.fleet is not None else ()
+        if risk_score < 0.7:  # High risk threshold
+            return None
+        if covered and self._covered_by_fleet(agent_id, activity, risk_score, covered):
+            return None
+        _THREATS_RAISED.inc()
+        return ThreatEvent(
+            agent_id=agent_id,
+            threat_type="behavioral_anomaly",
+            risk_score=risk_score,
+            timestamp=self.clock(),
+            details=activity,
+            severity=self._determine_severity(risk_score)
+        )
         
-        if risk_score >= 0.7:  # High risk threshold
-            return ThreatEvent(
-                agent_id=agent_id,
-                threat_type="behavioral_anomaly",
-                risk_score=risk_score,
-                timestamp=datetime.now(),
-                details=activity,
-                severity=self._determine_severity(risk_score)
-            )
-        return None
-        
+    def _covered_by_fleet(self, agent_id: str, activity: Mapping, risk_score: float, fields: Sequence[str]) -> bool:
+        """
+        Whether a high-risk record is already reported by a fleet-scoped
+        event: it is not critical, and without the fields of its flagged
+        behaviors it would not be a threat. Anything else it shows is
+        raised as a per-agent threat as usual.
+        """
+        if risk_score >= 0.9:  # Critical threats are always raised
+            return False
+        residual = {name: value for name, value in activity.items() if name not in fields}
+        if self._calculate_risk_score(agent_id, residual) >= 0.7:
+            return False
+        self.fleet.stats["suppressed"] += 1
+        return True
+
     def _calculate_risk_score(self, agent_id: str, activity: Dict) -> float:
         """Calculate risk score for agent activity (0.0 to 1.0)"""
-        # Placeholder: Real implementation would use ML models
-        # to analyze activity patterns against baseline
-        baseline = self.baselines.get(agent_id, {})
-        
-        # Simple heuristic for demo
-        risk = 0.0
-        if activity.get("unusual_api_calls", 0) > 10:
-            risk += 0.4
-        if activity.get("data_access_spike", False):
-            risk += 0.4
-        if activity.get("privilege_escalation", False):
-            risk += 0.5
-            
+        risk = self._heuristic_risk(agent_id, activity)
+        if self.models is not None:
+            risk += self.models.score(agent_id, activity)
         return min(risk, 1.0)
+
+    def _heuristic_risk(self, agent_id: str, activity: Dict) -> float:
+        """Rule and baseline-deviation risk, before model scoring and capping"""
+        baseline = self.baselines.get(agent_id)
+        risk = self.rules.score(activity)
+        if baseline is not None:
+            risk += self._deviation_risk(baseline.max_z_score(activity, self._min_std))
+        return risk
+
+    @property
+    def _z_threshold(self) -> float:
+        return self.config.get("z_score_threshold", 3.0)
+
+    @property
+    def _min_std(self) -> float:
+        return self.config.get("baseline_min_std", 1e-6)
+
+    def _deviation_risk(self, z_score: float) -> float:
+        """Risk contribution of a baseline deviation, scaled up to 0.4"""
+        threshold = self._z_threshold
+        if z_score < threshold:
+            return 0.0
+        return 0.4 * min(z_score / (2 * threshold), 1.0)
         
-    def _determine_severity(self, risk_score: float) -> str:
+    @staticmethod
+    def _determine_severity(risk_score: float) -> str:
         """Determine threat severity from risk score"""
         if risk_score >= 0.9:
             return "critical"
@@ -106,18 +328,181 @@ class ThreatDetector:
         elif risk_score >= 0.5:
             return "medium"
         return "low"
-        
-    def establish_baseline(self, agent_id: str, historical_data: List[Dict]):
-        """Establish behavioral baseline for an agent"""
-        # Analyze historical data to create baseline
-        self.baselines[agent_id] = {
-            "avg_api_calls": sum(d.get("api_calls", 0) for d in historical_data) / len(historical_data),
-            "normal_data_access": historical_data[-1].get("data_access", []),
-            "typical_actions": [d.get("action") for d in historical_data[-10:]]
+
+    def detect_anomalies_batch(self, batch: Union[np.ndarray, Mapping[str, np.ndarray]]) -> List[ThreatEvent]:
+        """
+        Detect anomalies in a columnar batch of agent activity
+
+        Scores every row with vectorized operations and only materializes
+        ThreatEvent objects for rows at or above the high risk threshold.
+        Results match calling detect_anomaly row by row.
+
+        Args:
+            batch: NumPy structured array or mapping of column name to array.
+                Must contain an ``agent_id`` column; every other column is
+                treated as an activity field.
+
+        Returns:
+            ThreatEvents for the anomalous rows, in batch order
+        """
+        started = _BATCH_LATENCY.start()
+        columns = self._batch_columns(batch)
+        agent_ids = columns.pop("agent_id")
+        _EVENTS_SCORED.inc(len(agent_ids))
+
+        risk_scores = self._calculate_risk_scores(agent_ids, columns)
+        if self.correlator is not None:
+            self._correlate_rows(agent_ids, columns, risk_scores)
+        high = risk_scores >= 0.7  # High risk threshold
+        if self.fleet is not None:
+            covered = self._index_fleet_rows(agent_ids, columns)
+            for row in np.flatnonzero(high).tolist():
+                if covered[row]:
+                    activity = {name: column[row:row + 1].tolist()[0] for name, column in columns.items()}
+                    if self._covered_by_fleet(agent_ids[row], activity, float(risk_scores[row]), covered[row]):
+                        high[row] = False
+        hits = np.flatnonzero(high)
+        if hits.size == 0:
+            _BATCH_LATENCY.observe_since(started)
+            return []
+
+        hit_scores = risk_scores[hits]
+        severities = self._determine_severities(hit_scores)
+        hit_columns = {name: column[hits].tolist() for name, column in columns.items()}
+        hit_agents = agent_ids[hits].tolist()
+        timestamp = self.clock()
+
+        events = []
+        for row, agent_id in enumerate(hit_agents):
+            events.append(ThreatEvent(
+                agent_id=agent_id,
+                threat_type="behavioral_anomaly",
+                risk_score=float(hit_scores[row]),
+                timestamp=timestamp,
+                details={name: values[row] for name, values in hit_columns.items()},
+                severity=severities[row]
+            ))
+        _THREATS_RAISED.inc(len(events))
+        _BATCH_LATENCY.observe_since(started)
+        return events
+
+    def _correlate_rows(self, agent_ids: np.ndarray, columns: Dict[str, np.ndarray], risk_scores: np.ndarray):
+        """Feed the rows scoring at least the correlator's minimum risk to it"""
+        rows = np.flatnonzero(risk_scores >= self.correlator.min_risk)
+        if rows.size:
+            selected = {name: column[rows].tolist() for name, column in columns.items()}
+            for index, agent_id in enumerate(agent_ids[rows].tolist()):
+                activity = {name: values[index] for name, values in selected.items()}
+                self.correlator.observe(agent_id, float(risk_scores[rows[index]]), activity)
+        times = columns.get(self.correlator.time_field)
+        if times is not None and times.size and np.issubdtype(times.dtype, np.number):
+            # Low-risk rows are not correlated but still move event time on
+            self.correlator.observe_time(float(times.max()))
+
+    def _index_fleet_rows(self, agent_ids: np.ndarray, columns: Dict[str, np.ndarray]) -> List[Tuple[str, ...]]:
+        """Feed every row to the fleet index; per row, the fields covered by a fleet-scoped event"""
+        selected = {name: column.tolist() for name, column in columns.items()
+                    if name in self.fleet.behavior_fields or name == self.fleet.time_field}
+        observe = self.fleet.observe
+        return [
+            observe(agent_id, {name: values[index] for name, values in selected.items()})
+            for index, agent_id in enumerate(agent_ids.tolist())
+        ]
+
+    def _batch_columns(self, batch: Union[np.ndarray, Mapping[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """Normalize a structured array or dict of arrays into named columns"""
+        if isinstance(batch, np.ndarray):
+            if batch.dtype.names is None:
+                raise ValueError("Batch array must be a structured array with named fields")
+            columns = {name: batch[name] for name in batch.dtype.names}
+        else:
+            columns = {name: np.asarray(values) for name, values in batch.items()}
+
+        if "agent_id" not in columns:
+            raise ValueError("Batch is missing required column 'agent_id'")
+        size = len(columns["agent_id"])
+        for name, column in columns.items():
+            if len(column) != size:
+                raise ValueError(f"Column '{name}' has {len(column)} rows, expected {size}")
+        return columns
+
+    def _calculate_risk_scores(self, agent_ids: np.ndarray, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Vectorized counterpart of _calculate_risk_score (0.0 to 1.0 per row)"""
+        risk = self.rules.score_columns(columns, len(agent_ids))
+        if self.baselines:
+            risk += self._deviation_risks(self._max_z_scores(agent_ids, columns))
+        if self.models is not None:
+            risk += self.models.score_columns(agent_ids.tolist(), columns)
+
+        return np.minimum(risk, 1.0)
+
+    def _deviation_risks(self, z_scores: np.ndarray) -> np.ndarray:
+        """Vectorized counterpart of _deviation_risk"""
+        threshold = self._z_threshold
+        return np.where(z_scores >= threshold, 0.4 * np.minimum(z_scores / (2 * threshold), 1.0), 0.0)
+
+    def _max_z_scores(
+        self,
+        agent_ids: np.ndarray,
+        columns: Mapping[str, np.ndarray],
+        present: Optional[Mapping[str, np.ndarray]] = None
+    ) -> np.ndarray:
+        """Largest per-row z-score of the numeric columns against each agent's baseline"""
+        deviation = np.zeros(len(agent_ids), dtype=np.float64)
+        metric_columns = {
+            name: column for name, column in columns.items()
+            if column.dtype.kind in "iuf" and name in self.baselines.metric_index
         }
+        if not metric_columns:
+            return deviation
+
+        rows = self.baselines.rows(agent_ids.tolist())
+        for name, column in metric_columns.items():
+            if present is not None and name in present:
+                column = np.where(present[name], column, np.nan)  # Rows without the metric are ignored
+            z_scores = self.baselines.z_scores(rows, name, column, self._min_std)
+            deviation = np.fmax(deviation, z_scores)  # Rows without statistics stay NaN and are ignored
+        return deviation
+
+    def _determine_severities(self, risk_scores: np.ndarray) -> List[str]:
+        """Vectorized counterpart of _determine_severity"""
+        return np.select(
+            [risk_scores >= 0.9, risk_scores >= 0.7, risk_scores >= 0.5],
+            ["critical", "high", "medium"],
+            default="low"
+        ).tolist()
+        
+    def establish_baseline(self, agent_id: str, historical_data: Iterable[Dict]):
+        """
+        Establish behavioral baseline for an agent
+
+        Args:
+            agent_id: Unique identifier for the agent
+            historical_data: Activity records, consumed one at a time so
+                arbitrarily long histories can be streamed in
+        """
+        baseline = self._new_baseline()
+        for activity in historical_data:
+            baseline.update(activity)
+        self.baselines[agent_id] = baseline
         logger.info(f"Baseline established for agent {agent_id}")
+
+    def update_baseline(self, agent_id: str, activity: Dict):
+        """Fold a single activity record into an agent's baseline"""
+        self.baselines.update(agent_id, activity)
+
+    def _new_baseline(self) -> OnlineBaseline:
+        return OnlineBaseline(
+            alpha=self.config.get("baseline_alpha", 0.1),
+            top_k=self.config.get("baseline_top_k", 10),
+            time_field=self.time_field
+        )
         
     async def stop_monitoring(self):
         """Stop threat monitoring"""
         self.running = False
+        if self.pipeline is not None:
+            await self.pipeline.stop()
+        if self._stopped is not None:
+            self._stopped.set()
         logger.info("Stopped threat detection monitoring")
@@ -0,0 +1,258 @@
+"""
+Investigation Enrichment
+
+Shared lookups of per-agent context (access logs, permissions, model
+history) for investigation playbooks. Each kind of lookup is backed by a
+source that answers many agents in one call; concurrent requests for the
+same agent share one fetch, and results are kept in a TTL + LRU cache so
+closely spaced events for an agent do not fetch the same data again.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOGS = "access_logs"
+PERMISSIONS = "permissions"
+MODEL_HISTORY = "model_history"
+
+_MISSING = object()
+
+
+class EnrichmentSource:
+    """Backend answering one kind of lookup for many agents at once"""
+
+    async def fetch(self, agent_ids: List[str]) -> Dict[str, Any]:
+        """
+        Look up many agents in one call
+
+        Returns:
+            The data for each agent ID; agents without data may be omitted
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Release connections held by the source"""
+
+
+class HttpEnrichmentSource(EnrichmentSource):
+    """Source POSTing {"agent_ids": [...]} to a URL that answers with a JSON object keyed by agent ID"""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+        self._session = None
+
+    async def fetch(self, agent_ids: List[str]) -> Dict[str, Any]:
+        if self._session is None:
+            import aiohttp  # Only needed when enrichment is served over HTTP
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        async with self._session.post(self.url, json={"agent_ids": agent_ids}) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class FakeEnrichmentSource(EnrichmentSource):
+    """In-memory source for tests that records every batched call"""
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None, latency: float = 0.0):
+        self.data = data or {}
+        self.latency = latency
+        self.calls: List[List[str]] = []
+
+    async def fetch(self, agent_ids: List[str]) -> Dict[str, Any]:
+        self.calls.append(list(agent_ids))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return {agent_id: self.data[agent_id] for agent_id in agent_ids if agent_id in self.data}
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after a fixed time to live"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > self.clock():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+            del self._entries[key]  # Expired entries are dropped lazily on access
+            self.stats["expired"] += 1
+        self.stats["misses"] += 1
+        return default
+
+    def put(self, key: str, value: Any):
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def invalidate(self, key: Optional[str] = None):
+        """Drop one entry, or every entry"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+class BatchedFetcher:
+    """Cached, single-flight, micro-batching front end for one enrichment source"""
+
+    def __init__(
+        self,
+        source: EnrichmentSource,
+        cache: TTLCache,
+        batch_window: float = 0.005,
+        max_batch: int = 200,
+    ):
+        self.source = source
+        self.cache = cache
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.stats = {"fetches": 0, "fetched": 0, "coalesced": 0, "errors": 0}
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._pending: List[str] = []
+        self._flusher: Optional[asyncio.TimerHandle] = None
+        self._in_flight = set()
+
+    async def get(self, agent_id: str) -> Any:
+        """Data for an agent from the cache, an in-flight fetch or the next batch"""
+        value = self.cache.get(agent_id, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        future = self._futures.get(agent_id)
+        if future is not None:
+            self.stats["coalesced"] += 1
+        else:
+            future = self._submit(agent_id)
+        # Shielded: one cancelled waiter must not cancel the fetch other waiters share
+        return await asyncio.shield(future)
+
+    def _submit(self, agent_id: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = self._futures[agent_id] = loop.create_future()
+        self._pending.append(agent_id)
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._flusher is None:
+            self._flusher = loop.call_later(self.batch_window, self._dispatch)
+        return future
+
+    def _dispatch(self):
+        """Detach the pending agents and fetch them as one batch"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._flush(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _flush(self, batch: List[str]):
+        self.stats["fetches"] += 1
+        self.stats["fetched"] += len(batch)
+        try:
+            results = await self.source.fetch(batch)
+        except Exception as e:
+            # Failures are not cached: the next request for these agents fetches again
+            self.stats["errors"] += 1
+            logger.error(f"Error fetching enrichment for {len(batch)} agents: {e}")
+            for agent_id in batch:
+                future = self._futures.pop(agent_id)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for agent_id in batch:
+            value = results.get(agent_id)
+            self.cache.put(agent_id, value)
+            future = self._futures.pop(agent_id)
+            if not future.done():
+                future.set_result(value)
+
+
+class EnrichmentService:
+    """Enrichment lookups shared by every investigation playbook"""
+
+    def __init__(
+        self,
+        sources: Dict[str, EnrichmentSource],
+        ttl: float = 60.0,
+        max_size: int = 10000,
+        batch_window: float = 0.005,
+        max_batch: int = 200,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            sources: Source for each kind of lookup, e.g. {"permissions": ...}
+            ttl: Seconds a looked-up value is served from the cache
+            max_size: Most agents cached per kind
+            batch_window: Seconds to wait for more agents before fetching
+            max_batch: Most agents fetched in one call
+            clock: Monotonic clock, injectable for tests
+        """
+        self.fetchers = {
+            kind: BatchedFetcher(source, TTLCache(max_size, ttl, clock), batch_window, max_batch)
+            for kind, source in sources.items()
+        }
+
+    async def get(self, kind: str, agent_id: str) -> Any:
+        """
+        Look up one kind of enrichment for an agent
+
+        Raises:
+            KeyError: No source is configured for the kind
+        """
+        return await self.fetchers[kind].get(agent_id)
+
+    async def lookup(self, agent_id: str, kinds: Iterable[str]) -> Dict[str, Any]:
+        """
+        Look up several kinds of enrichment for an agent concurrently
+
+        Kinds without a configured source and failed lookups are left out,
+        so an unavailable backend degrades the evidence instead of failing
+        the investigation.
+        """
+        kinds = [kind for kind in kinds if kind in self.fetchers]
+        values = await asyncio.gather(*(self.fetchers[kind].get(agent_id) for kind in kinds), return_exceptions=True)
+        return {kind: value for kind, value in zip(kinds, values) if not isinstance(value, Exception)}
+
+    def invalidate(self, agent_id: Optional[str] = None):
+        """Forget cached enrichment for an agent (or every agent), e.g. after remediation"""
+        for fetcher in self.fetchers.values():
+            fetcher.cache.invalidate(agent_id)
+
+    async def close(self):
+        """Close every source"""
+        for fetcher in self.fetchers.values():
+            await fetcher.source.close()
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Cache and fetch counters for each kind"""
+        return {kind: {**fetcher.cache.stats, **fetcher.stats} for kind, fetcher in self.fetchers.items()}
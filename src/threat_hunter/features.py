@@ -0,0 +1,196 @@
+"""
+Activity Features
+
+Extracts a micro-batch of raw activity records once into a fixed-schema
+feature matrix, so the detection rules, baseline deviation, anomaly
+models and correlation all read the same columns instead of each
+re-reading the records and copying them into per-record dicts. Matrices
+are views of preallocated buffers reused from batch to batch, and an
+activity dict is only built for the few rows that become threats or
+correlation samples.
+"""
+
+import logging
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_NUMERIC = frozenset((int, float, bool, np.int32, np.int64, np.float32, np.float64, np.bool_))
+_FLAGS = frozenset((bool, np.bool_))
+_METRICS = _NUMERIC - _FLAGS  # Baseline metrics, as is_metric: numbers but not flags
+
+
+def model_value(value) -> float:
+    """A field value as the anomaly models see it: numbers and flags as floats, anything else 0"""
+    return float(value) if type(value) in _NUMERIC else 0.0
+
+
+class FeatureSchema:
+    """Ordered activity fields extracted into a feature matrix"""
+    __slots__ = ("fields", "index")
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields: Tuple[str, ...] = tuple(dict.fromkeys(fields))  # Ordered, without duplicates
+        self.index = {name: column for column, name in enumerate(self.fields)}
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FeatureSchema) and self.fields == other.fields
+
+    def __hash__(self) -> int:
+        return hash(self.fields)
+
+
+class FeatureBatch:
+    """
+    A micro-batch of activity as columns of a pooled feature matrix
+
+    Every field is a column of ``values``: numbers and flags as floats, 0
+    where a record lacks the field or holds anything else, which is what
+    the models see. ``present`` marks the records carrying each field.
+    Rules read ``columns``, numeric where every value is a number or flag
+    and object columns otherwise. Baseline deviation reads ``metrics``,
+    with ``metric_masks`` marking the rows whose value is a metric, so one
+    ``null`` or string in a column only drops that row. Views into the
+    matrix are valid until the batch is released back to its pool.
+    """
+
+    def __init__(
+        self,
+        pool: Optional["FeaturePool"],
+        schema: FeatureSchema,
+        records: Sequence[Mapping],
+        buffers: Tuple[np.ndarray, np.ndarray],
+    ):
+        self.pool = pool
+        self.schema = schema
+        self.records = records
+        self.values = buffers[0][:len(records), :len(schema)]
+        self.present = buffers[1][:len(records), :len(schema)]
+        self.agent_ids = np.array([record["agent_id"] for record in records], dtype=object)
+        self.columns: Dict[str, np.ndarray] = {}
+        self.masks: Dict[str, np.ndarray] = {}
+        self.metrics: Dict[str, np.ndarray] = {}
+        self.metric_masks: Dict[str, np.ndarray] = {}
+        self._buffers: Optional[Tuple[np.ndarray, np.ndarray]] = buffers
+        self._extract()
+
+    def _extract(self):
+        records = self.records
+        rows = len(records)
+        for column, name in enumerate(self.schema.fields):
+            raw = [record.get(name, _MISSING) for record in records]
+            mask = self.present[:, column]
+            mask[:] = [value is not _MISSING for value in raw]
+            if not mask.any():
+                self.values[:, column] = 0.0
+                continue
+            self.masks[name] = mask
+            values = self.values[:, column]
+            kinds = {type(value) for value in raw if value is not _MISSING}
+            if kinds <= _NUMERIC:
+                values[:] = [0.0 if value is _MISSING else value for value in raw]
+                if kinds <= _FLAGS:
+                    self.columns[name] = values.astype(bool)  # Flags, never baseline metrics
+                    continue
+                self.columns[name] = values
+            else:
+                # Models see non-numeric values as 0; rules test them one by one
+                values[:] = [model_value(value) for value in raw]
+                self.columns[name] = np.fromiter(
+                    (None if value is _MISSING else value for value in raw), dtype=object, count=rows
+                )
+            if kinds <= _METRICS:
+                self.metric_masks[name] = mask
+            elif kinds & _METRICS:
+                self.metric_masks[name] = np.fromiter((type(value) in _METRICS for value in raw), dtype=bool, count=rows)
+            else:
+                continue
+            self.metrics[name] = values
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def matrix(self, fields: Sequence[str]) -> np.ndarray:
+        """Columns of fields in order; a view when they lead the schema, missing fields are 0"""
+        fields = tuple(fields)
+        if self.schema.fields[:len(fields)] == fields:
+            return self.values[:, :len(fields)]
+        matrix = np.zeros((len(self), len(fields)), dtype=self.values.dtype)
+        for column, name in enumerate(fields):
+            source = self.schema.index.get(name)
+            if source is not None:
+                matrix[:, column] = self.values[:, source]
+        return matrix
+
+    def activity(self, row: int) -> Dict:
+        """The record at row as an activity dict (without agent_id)"""
+        return {key: value for key, value in self.records[row].items() if key != "agent_id"}
+
+    def release(self):
+        """Return the matrix buffers to the pool; the batch's views must no longer be used"""
+        if self.pool is not None and self._buffers is not None:
+            self.pool.release(self._buffers)
+        self._buffers = None
+
+    def __enter__(self) -> "FeatureBatch":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FeaturePool:
+    """Preallocated feature matrices reused across micro-batches"""
+
+    def __init__(self, rows: int = 256, width: int = 32, buffers: int = 4, dtype=np.float64):
+        """
+        Args:
+            rows: Records per buffer; larger batches get a larger buffer
+            width: Fields per buffer; larger schemas get a wider buffer
+            buffers: Buffers kept for reuse
+            dtype: Feature matrix dtype
+        """
+        self.rows = rows
+        self.width = width
+        self.buffers = buffers
+        self.dtype = np.dtype(dtype)
+        self.stats = {"batches": 0, "reused": 0, "allocated": 0}
+        self._free: List[Tuple[np.ndarray, np.ndarray]] = []
+
+    def extract(self, records: Sequence[Mapping], schema: FeatureSchema) -> FeatureBatch:
+        """
+        Extract records into a pooled feature matrix
+
+        Args:
+            records: Activity records, each with an ``agent_id``
+            schema: Fields to extract
+
+        Returns:
+            The batch; release() it (or use it as a context manager) once
+            scoring is done so its buffer is reused
+        """
+        batch = FeatureBatch(self, schema, records, self._acquire(len(records), len(schema)))
+        self.stats["batches"] += 1
+        return batch
+
+    def _acquire(self, rows: int, width: int) -> Tuple[np.ndarray, np.ndarray]:
+        while self._free:
+            values, present = self._free.pop()
+            if values.shape[0] >= rows and values.shape[1] >= width:
+                self.stats["reused"] += 1
+                return values, present
+        # Grow to the batch and schema seen, so later batches of this shape reuse the buffer
+        self.rows = max(self.rows, rows)
+        self.width = max(self.width, width)
+        self.stats["allocated"] += 1
+        return np.zeros((self.rows, self.width), dtype=self.dtype), np.zeros((self.rows, self.width), dtype=bool)
+
+    def release(self, buffers: Tuple[np.ndarray, np.ndarray]):
+        if len(self._free) < self.buffers and buffers[0].shape == (self.rows, self.width):
+            self._free.append(buffers)
@@ -0,0 +1,459 @@
+"""
+Fleet-Level Anomaly Index
+
+Looks across agents instead of at one agent against its own baseline. A
+compromised tool or poisoned upstream input that pushes thousands of
+agents into the same unusual behavior shows up here as one behavior whose
+distinct-agent count spikes, and is reported as a single fleet-scoped
+ThreatEvent rather than thousands of per-agent ones. The detector only
+folds a per-agent threat into that event when the flagged behaviors alone
+explain its risk and it is not critical.
+
+Behaviors are derived from categorical activity fields (``action=read_file``)
+and boolean flags (``data_access_spike``). Over a sliding window of panes
+the index keeps:
+
+- a count-min sketch of events per behavior, for any behavior;
+- a HyperLogLog sketch of distinct agents per tracked behavior, one per
+  pane so the window is the register-wise max of its panes.
+
+Tracked behaviors are capped and the least frequent are replaced by more
+frequent newcomers, so memory is fixed by the configuration and does not
+grow with fleet size or behavior cardinality. Updates are buffered and
+applied to the sketches with vectorized NumPy operations.
+"""
+
+import hashlib
+import logging
+import math
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .detector import ThreatDetector, ThreatEvent
+
+logger = logging.getLogger(__name__)
+
+# agent_id of fleet-scoped ThreatEvents
+FLEET_AGENT_ID = "fleet"
+
+DEFAULT_BEHAVIOR_FIELDS = ("action", "tool", "data_access", "data_access_spike", "privilege_escalation")
+
+
+def _hash64(value: str) -> int:
+    """Stable 64-bit hash, identical across processes (unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+class _HashCache:
+    """Bounded memo of _hash64; agent and behavior IDs repeat heavily"""
+
+    def __init__(self, max_size: int = 1 << 16):
+        self.max_size = max_size
+        self._values: Dict[str, int] = {}
+
+    def __call__(self, value: str) -> int:
+        hashed = self._values.get(value)
+        if hashed is None:
+            if len(self._values) >= self.max_size:
+                self._values.clear()
+            hashed = self._values[value] = _hash64(value)
+        return hashed
+
+
+class FleetIndex:
+    """Streaming count-min and HyperLogLog sketches of behaviors across the fleet"""
+
+    def __init__(
+        self,
+        window: float = 300.0,
+        panes: int = 5,
+        behavior_fields: Sequence[str] = DEFAULT_BEHAVIOR_FIELDS,
+        max_behaviors: int = 512,
+        precision: int = 9,
+        cms_width: int = 2048,
+        cms_depth: int = 4,
+        min_agents: int = 50,
+        spike_factor: float = 5.0,
+        warmup: int = 3,
+        alpha: float = 0.2,
+        max_samples: int = 10,
+        time_field: str = "timestamp",
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            window: Seconds of activity each evaluation covers
+            panes: Panes per window; the window slides by one pane
+            behavior_fields: Activity fields that define behaviors
+            max_behaviors: Behaviors with a distinct-agent sketch
+            precision: HyperLogLog precision p (2**p one-byte registers, ~1.04/sqrt(2**p) error)
+            cms_width: Counters per count-min row
+            cms_depth: Count-min rows (independent hashes)
+            min_agents: Distinct agents a behavior needs before it can be flagged
+            spike_factor: Flag when distinct agents exceed this multiple of the behavior's usual count
+            warmup: Evaluations before any behavior can be flagged
+            alpha: Smoothing factor of each behavior's usual distinct-agent count
+            max_samples: Agent IDs kept per behavior and pane as examples
+            time_field: Activity field holding the event time
+            clock: Wall clock for activity without an event time
+        """
+        if panes < 1 or window <= 0:
+            raise ValueError("window and panes must be positive")
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.window = window
+        self.panes = panes
+        self.pane_seconds = window / panes
+        self.behavior_fields = tuple(behavior_fields)
+        self.max_behaviors = max_behaviors
+        self.precision = precision
+        self.min_agents = min_agents
+        self.spike_factor = spike_factor
+        self.warmup = warmup
+        self.alpha = alpha
+        self.max_samples = max_samples
+        self.time_field = time_field
+        self.clock = clock
+        self.stats = {
+            "observed": 0, "late": 0, "evaluations": 0, "flagged": 0, "emitted": 0, "suppressed": 0, "evicted": 0
+        }
+
+        registers = 1 << precision
+        self._registers = registers
+        self._cms = np.zeros((panes, cms_depth, cms_width), dtype=np.int32)
+        self._hll = np.zeros((max_behaviors, panes, registers), dtype=np.uint8)
+        self._counts = np.zeros((max_behaviors, panes), dtype=np.int64)  # Exact events of tracked behaviors
+        self._usual = np.zeros(max_behaviors, dtype=np.float64)  # EWMA of distinct agents per window
+        self._seen = np.zeros(max_behaviors, dtype=np.int32)  # Windows each row has been evaluated in
+        self._flagged_until = np.full(max_behaviors, -math.inf)
+
+        # Behavior -> [hash, row, sample agents]; row is -1 for candidates,
+        # untracked behaviors seen this pane
+        self._keys: Dict[str, list] = {}
+        self._behaviors: List[Optional[str]] = [None] * max_behaviors
+        self._free = list(range(max_behaviors - 1, -1, -1))
+        self._candidates: List[str] = []
+        self._next_candidate = 0
+        self._active: Dict[str, float] = {}  # Flagged behavior -> event time the flag lapses
+        self._hash = _HashCache()
+        self._cms_seeds = np.arange(1, cms_depth + 1, dtype=np.uint64)
+        self._cms_width = cms_width
+        self._pane = None  # Index of the newest pane
+        self._outbox: List[ThreatEvent] = []
+
+        # Buffered sketch updates: (slot, behavior hash) of untracked behaviors
+        # and (row * panes + slot, agent hash) of tracked ones
+        self._cms_slots: List[int] = []
+        self._cms_hashes: List[int] = []
+        self._cells: List[int] = []
+        self._agent_hashes: List[int] = []
+
+    def __len__(self) -> int:
+        """Tracked behaviors"""
+        return self.max_behaviors - len(self._free)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the sketches and per-behavior state"""
+        arrays = (self._cms, self._hll, self._counts, self._usual, self._seen, self._flagged_until)
+        return sum(array.nbytes for array in arrays)
+
+    def observe(self, agent_id: str, activity: Mapping, event_time: Optional[float] = None) -> Tuple[str, ...]:
+        """
+        Count an activity record towards its behaviors
+
+        Args:
+            agent_id: Agent the activity belongs to
+            activity: Activity fields
+            event_time: Event time in epoch seconds; read from the
+                activity's time field (or the wall clock) when omitted
+
+        Returns:
+            Fields of the record's behaviors currently flagged fleet-wide,
+            i.e. the part of it already covered by a fleet-scoped event;
+            empty when there are none
+        """
+        if event_time is None:
+            event_time = self._event_time(activity)
+        pane = int(event_time // self.pane_seconds)
+        if self._pane is None:
+            self._pane = pane
+        elif pane > self._pane:
+            self._advance(pane)
+        elif pane <= self._pane - self.panes:
+            self.stats["late"] += 1
+            return ()
+
+        self.stats["observed"] += 1
+        slot = pane % self.panes
+        keys = self._keys
+        active = self._active
+        agent_hash = None
+        covered = ()
+        for name in self.behavior_fields:
+            value = activity.get(name)
+            if value is None or value is False:
+                continue
+            if value is True:
+                behaviors = (name,)
+            elif isinstance(value, (list, tuple)):
+                behaviors = [f"{name}={item}" for item in value[:8]]
+            else:
+                behaviors = (f"{name}={value}",)
+            for behavior in behaviors:
+                key = keys.get(behavior) or self._key(behavior)
+                row = key[1]
+                if row >= 0:
+                    if agent_hash is None:
+                        agent_hash = self._hash(agent_id)
+                    self._cells.append(row * self.panes + slot)
+                    self._agent_hashes.append(agent_hash)
+                    samples = key[2]
+                    if len(samples) < self.max_samples and agent_id not in samples:
+                        samples.append(agent_id)
+                else:
+                    self._cms_slots.append(slot)
+                    self._cms_hashes.append(key[0])
+                if active and active.get(behavior, -math.inf) >= event_time and name not in covered:
+                    covered += (name,)
+        if len(self._cells) >= 8192 or len(self._cms_hashes) >= 8192:
+            self._apply()
+        return covered
+
+    def frequency(self, behavior: str) -> int:
+        """Events of a behavior in the current window; a count-min estimate unless tracked"""
+        self._apply()
+        key = self._keys.get(behavior)
+        if key is not None and key[1] >= 0:
+            return int(self._counts[key[1]].sum())
+        return int(self._frequencies([self._hash(behavior)])[0])
+
+    def distinct_agents(self, behavior: str) -> float:
+        """HyperLogLog estimate of distinct agents showing a tracked behavior in the current window"""
+        key = self._keys.get(behavior)
+        if key is None or key[1] < 0:
+            return 0.0
+        row = key[1]
+        self._apply()
+        return float(self._estimate(self._hll[row:row + 1].max(axis=1))[0])
+
+    def drain(self) -> List[ThreatEvent]:
+        """Fleet-scoped ThreatEvents emitted since the last drain"""
+        events, self._outbox = self._outbox, []
+        return events
+
+    def _event_time(self, activity: Mapping) -> float:
+        value = activity.get(self.time_field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if isinstance(value, datetime):
+            return value.timestamp()
+        if isinstance(value, str):
+            try:
+                return datetime.fromisoformat(value).timestamp()
+            except ValueError:
+                pass
+        return self.clock()
+
+    def _key(self, behavior: str) -> list:
+        """Key of a behavior not seen this pane, tracking it while rows are free"""
+        behavior_hash = self._hash(behavior)
+        if self._free:
+            return self._track(behavior, behavior_hash)
+        key = [behavior_hash, -1, None]
+        if len(self._candidates) < self.max_behaviors:
+            self._candidates.append(behavior)
+        else:
+            # Keep the most recently seen newcomers; frequent behaviors keep coming back
+            slot = self._next_candidate
+            self._next_candidate = (slot + 1) % self.max_behaviors
+            del self._keys[self._candidates[slot]]
+            self._candidates[slot] = behavior
+        self._keys[behavior] = key
+        return key
+
+    def _track(self, behavior: str, behavior_hash: int) -> list:
+        row = self._free.pop()
+        key = self._keys[behavior] = [behavior_hash, row, []]
+        self._behaviors[row] = behavior
+        return key
+
+    def _untrack(self, row: int):
+        behavior = self._behaviors[row]
+        del self._keys[behavior]
+        self._behaviors[row] = None
+        self._hll[row] = 0
+        self._counts[row] = 0
+        self._usual[row] = 0.0
+        self._seen[row] = 0
+        self._flagged_until[row] = -math.inf
+        self._free.append(row)
+
+    def _cms_columns(self, hashes: np.ndarray) -> np.ndarray:
+        """Count-min column of each hash in each row: (h1 + i * h2) mod width"""
+        with np.errstate(over="ignore"):
+            low = hashes & np.uint64(0xFFFFFFFF)
+            high = hashes >> np.uint64(32)
+            return ((low[None, :] + self._cms_seeds[:, None] * (high[None, :] | np.uint64(1)))
+                    % np.uint64(self._cms_width)).astype(np.intp)
+
+    def _apply(self):
+        """Apply buffered updates to the sketches"""
+        if self._cms_hashes:
+            slots = np.array(self._cms_slots, dtype=np.intp)
+            columns = self._cms_columns(np.array(self._cms_hashes, dtype=np.uint64))
+            depth = np.arange(columns.shape[0], dtype=np.intp)[:, None]
+            np.add.at(self._cms, (np.broadcast_to(slots, columns.shape), np.broadcast_to(depth, columns.shape), columns), 1)
+            self._cms_slots.clear()
+            self._cms_hashes.clear()
+        if self._agent_hashes:
+            cells = np.array(self._cells, dtype=np.intp)
+            self._counts.reshape(-1)[:] += np.bincount(cells, minlength=self._counts.size)
+            hashes = np.array(self._agent_hashes, dtype=np.uint64)
+            suffix_bits = 64 - self.precision
+            registers = (hashes >> np.uint64(suffix_bits)).astype(np.intp)
+            suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+            # Rank = position of the leftmost 1-bit of the suffix; frexp's exponent is its bit length
+            _, bit_length = np.frexp(suffix.astype(np.float64))
+            ranks = np.clip(suffix_bits - bit_length + 1, 1, suffix_bits + 1).astype(np.uint8)
+            np.maximum.at(self._hll.reshape(-1, self._registers), (cells, registers), ranks)
+            self._cells.clear()
+            self._agent_hashes.clear()
+
+    def _frequencies(self, hashes: List[int]) -> np.ndarray:
+        """Count-min estimates of events in the current window, one per behavior hash"""
+        window = self._cms.sum(axis=0)
+        depth = np.arange(window.shape[0])[:, None]
+        return window[depth, self._cms_columns(np.array(hashes, dtype=np.uint64))].min(axis=0)
+
+    def _estimate(self, registers: np.ndarray) -> np.ndarray:
+        """HyperLogLog cardinality per row of registers, with the small-range correction"""
+        m = self._registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.power(2.0, -registers.astype(np.float64)).sum(axis=1)
+        zeros = (registers == 0).sum(axis=1)
+        with np.errstate(divide="ignore"):
+            linear = m * np.log(m / np.maximum(zeros, 1))
+        return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+    def _advance(self, pane: int):
+        """Evaluate the window ending at the newest pane, then slide to pane"""
+        self._apply()
+        self._evaluate()
+        self._admit()
+        for skipped in range(self._pane + 1, min(pane, self._pane + self.panes) + 1):
+            slot = skipped % self.panes
+            self._cms[slot] = 0
+            self._hll[:, slot] = 0
+            self._counts[:, slot] = 0
+        self._pane = pane
+        for behavior in self._candidates:
+            if self._keys.get(behavior, (0, 0))[1] < 0:
+                del self._keys[behavior]
+        self._candidates.clear()
+        self._next_candidate = 0
+        for behavior in self._behaviors:
+            if behavior is not None:
+                self._keys[behavior][2].clear()
+
+    def _evaluate(self):
+        """Flag tracked behaviors whose distinct-agent count spiked over their usual count"""
+        rows = np.flatnonzero(np.array([behavior is not None for behavior in self._behaviors]))
+        if rows.size == 0:
+            return
+        self.stats["evaluations"] += 1
+        distinct = self._estimate(self._hll[rows].max(axis=1))
+        usual = self._usual[rows]
+        end = (self._pane + 1) * self.pane_seconds
+        spiking = (
+            (distinct >= self.min_agents)
+            & (distinct >= self.spike_factor * np.maximum(usual, 1.0))
+            & (self.stats["evaluations"] > self.warmup)
+        )
+        flagged = []
+        for index in np.flatnonzero(spiking).tolist():
+            row = int(rows[index])
+            if self._flagged_until[row] < end:
+                flagged.append((row, float(distinct[index]), float(usual[index])))
+            self._flagged_until[row] = end + self.window
+            self._active[self._behaviors[row]] = end + self.window
+        if flagged:
+            self._flag(flagged, end)
+
+        # Spikes are kept out of the usual counts so an attack never becomes the baseline
+        calm = ~spiking
+        first = calm & (self._seen[rows] == 0)
+        self._usual[rows] = np.where(
+            first, distinct, np.where(calm, usual + self.alpha * (distinct - usual), usual)
+        )
+        self._seen[rows] += calm
+        for behavior, until in list(self._active.items()):
+            if until < end:
+                del self._active[behavior]
+
+    def _admit(self):
+        """Replace the least frequent tracked behaviors with more frequent candidates"""
+        if not self._candidates:
+            return
+        candidates = [(behavior, self._keys[behavior][0]) for behavior in self._candidates]
+        counts = self._frequencies([behavior_hash for _, behavior_hash in candidates])
+        tracked = [row for row, behavior in enumerate(self._behaviors) if behavior is not None]
+        tracked_counts = self._counts[tracked].sum(axis=1)
+        order = np.argsort(tracked_counts, kind="stable")
+        replaced = 0
+        for index in np.argsort(-counts, kind="stable").tolist():
+            if replaced >= len(order) or counts[index] <= tracked_counts[order[replaced]]:
+                break
+            row = tracked[order[replaced]]
+            replaced += 1
+            if self._behaviors[row] in self._active:
+                continue  # Never drop a behavior under an active flag
+            behavior, behavior_hash = candidates[index]
+            del self._keys[behavior]
+            self._untrack(row)
+            self._track(behavior, behavior_hash)
+            # Event counts carry over from the count-min sketch; distinct agents start now
+            columns = self._cms_columns(np.array([behavior_hash], dtype=np.uint64))[:, 0]
+            self._counts[row] = self._cms[:, np.arange(len(columns)), columns].min(axis=1)
+            self.stats["evicted"] += 1
+
+    def _flag(self, flagged: List[Tuple[int, float, float]], end: float):
+        """Emit one fleet-scoped event for every behavior that spiked in this window"""
+        flagged.sort(key=lambda item: item[1], reverse=True)
+        frequencies = self._counts[[row for row, _, _ in flagged]].sum(axis=1).tolist()
+        behaviors = [
+            {
+                "behavior": self._behaviors[row],
+                "distinct_agents": int(round(distinct)),
+                "usual_agents": round(usual, 1),
+                "events": events,
+            }
+            for (row, distinct, usual), events in zip(flagged, frequencies)
+        ]
+        top_row, distinct, usual = flagged[0]
+        ratio = distinct / max(usual, 1.0)
+        risk_score = min(1.0, 0.7 + 0.3 * (1.0 - self.spike_factor / ratio))
+        self._outbox.append(ThreatEvent(
+            agent_id=FLEET_AGENT_ID,
+            threat_type="coordinated_anomaly",
+            risk_score=risk_score,
+            timestamp=datetime.fromtimestamp(end),
+            details={
+                "scope": "fleet",
+                **behaviors[0],
+                "behaviors": behaviors,
+                "window_start": datetime.fromtimestamp(end - self.window).isoformat(),
+                "window_end": datetime.fromtimestamp(end).isoformat(),
+                "sample_agents": list(self._keys[self._behaviors[top_row]][2]),
+            },
+            severity=ThreatDetector._determine_severity(risk_score)
+        ))
+        self.stats["flagged"] += len(flagged)
+        self.stats["emitted"] += 1
+        logger.warning(
+            f"Fleet-wide spike: {int(distinct)} agents showing {behaviors[0]['behavior']} (usually {usual:.0f})"
+            + (f" and {len(flagged) - 1} related behaviors" if len(flagged) > 1 else "")
+        )
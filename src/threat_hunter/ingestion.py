@@ -0,0 +1,528 @@
+"""
+Activity Ingestion Pipeline
+
+Streams agent activity from pluggable sources through a bounded queue,
+micro-batches it and drives detection, investigation and response.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import zlib
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # Standard library fallback, several times slower
+    _loads = json.loads
+
+from .detector import ThreatDetector, ThreatEvent
+from .investigator import ThreatInvestigator
+from .responder import ThreatResponder
+from .scheduler import InvestigationScheduler
+from .wal import INVESTIGATION_STAGE, EventLog, RESPONSE_STAGE, decode_event, encode_event, response_key
+
+if TYPE_CHECKING:
+    from .ratelimit import RateLimiter
+    from .sharding import ShardedDetector
+
+logger = logging.getLogger(__name__)
+
+Emit = Callable[[Dict], Awaitable[None]]
+
+# Queue marker used to wake an idle consumer on shutdown
+_STOP = object()
+
+
+def _decode_record(line: bytes) -> Optional[Dict]:
+    """Decode a single JSON-lines activity record, skipping malformed input"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = _loads(line)
+    except ValueError as e:
+        logger.warning(f"Skipping malformed activity record: {e}")
+        return None
+    if not isinstance(record, dict) or "agent_id" not in record:
+        logger.warning("Skipping activity record without agent_id")
+        return None
+    return record
+
+
+def decode_ndjson(payload: bytes) -> Tuple[List[Dict], int]:
+    """
+    Decode a newline-delimited JSON body of activity records
+
+    Returns:
+        The valid records and the number of lines rejected as malformed
+        or missing agent_id
+    """
+    records = []
+    rejected = 0
+    for line in payload.split(b"\n"):
+        if not line.strip():
+            continue
+        try:
+            record = _loads(line)
+        except ValueError:
+            rejected += 1
+            continue
+        if isinstance(record, dict) and "agent_id" in record:
+            records.append(record)
+        else:
+            rejected += 1
+    return records, rejected
+
+
+def gunzip(payload: bytes, max_size: int) -> bytes:
+    """
+    Decompress a (possibly multi-member) gzip body
+
+    Raises:
+        ValueError: The body is not valid gzip or inflates past max_size
+    """
+    chunks = []
+    size = 0
+    try:
+        while payload:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunk = decompressor.decompress(payload, max_size - size + 1)
+            size += len(chunk)
+            if size > max_size:
+                raise ValueError(f"Decompressed body exceeds {max_size} bytes")
+            chunks.append(chunk)
+            if not decompressor.eof:
+                raise ValueError("Truncated gzip body")
+            payload = decompressor.unused_data
+    except zlib.error as e:
+        raise ValueError(f"Invalid gzip body: {e}") from e
+    return b"".join(chunks)
+
+
+class ActivitySource:
+    """Base class for activity sources feeding the ingestion pipeline"""
+
+    async def run(self, emit: Emit):
+        """
+        Produce activity records until cancelled
+
+        Args:
+            emit: Coroutine that enqueues a record; it blocks while the
+                pipeline queue is full, which is how backpressure reaches
+                the source.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Release any resources held by the source"""
+
+
+class QueueSource(ActivitySource):
+    """In-process source reading records from an asyncio.Queue"""
+
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    async def run(self, emit: Emit):
+        while True:
+            record = await self.queue.get()
+            await emit(record)
+
+
+class JsonLinesTailSource(ActivitySource):
+    """Source that follows a JSON-lines file, like ``tail -F``"""
+
+    def __init__(self, path: str, from_start: bool = False, poll_interval: float = 0.1):
+        self.path = path
+        self.from_start = from_start
+        self.poll_interval = poll_interval
+
+    async def run(self, emit: Emit):
+        handle = await self._open(seek_end=not self.from_start)
+        pending = b""
+        try:
+            while True:
+                line = handle.readline()
+                if line:
+                    pending += line
+                    if not pending.endswith(b"\n"):
+                        continue  # Partial write, wait for the rest of the line
+                    record = _decode_record(pending)
+                    pending = b""
+                    if record is not None:
+                        await emit(record)
+                    continue
+
+                if self._rotated(handle):
+                    handle.close()
+                    handle = await self._open(seek_end=False)
+                    pending = b""
+                    continue
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            handle.close()
+
+    async def _open(self, seek_end: bool):
+        """Open the file, waiting for it to appear if necessary"""
+        while True:
+            try:
+                handle = open(self.path, "rb")
+            except FileNotFoundError:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if seek_end:
+                handle.seek(0, os.SEEK_END)
+            return handle
+
+    def _rotated(self, handle) -> bool:
+        """Check whether the file was truncated or replaced"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino != os.fstat(handle.fileno()).st_ino or stat.st_size < handle.tell()
+
+
+class UnixSocketSource(ActivitySource):
+    """Source accepting JSON-lines activity over a UNIX domain socket"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._server = None
+
+    async def run(self, emit: Emit):
+        async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                # Not reading while emit() blocks lets the socket buffer fill,
+                # pushing backpressure to the client.
+                async for line in reader:
+                    record = _decode_record(line)
+                    if record is not None:
+                        await emit(record)
+            finally:
+                writer.close()
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(handle_client, path=self.path)
+        logger.info(f"Listening for activity on {self.path}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class IngestionPipeline:
+    """
+    Bounded, micro-batching pipeline from activity sources to response
+
+    Threats are investigated and responded to in background tasks, so
+    detection keeps pulling batches while reports are slow and the
+    scheduler orders investigations across batches. At most
+    max_pending_threats are handled at once; past that the batch loop
+    waits, and backpressure reaches the sources through the queue.
+
+    With a ShardedDetector, batches are scored by its worker processes
+    instead of the local detector, and the threats they raise are handled
+    like local ones. The pipeline starts the workers when it runs and
+    stops them when it stops.
+    """
+
+    def __init__(
+        self,
+        detector: ThreatDetector,
+        investigator: ThreatInvestigator,
+        responder: ThreatResponder,
+        sources: List[ActivitySource],
+        max_queue_size: int = 10000,
+        batch_size: int = 256,
+        batch_timeout: float = 0.05,
+        scheduler: Optional[InvestigationScheduler] = None,
+        limiter: Optional["RateLimiter"] = None,
+        event_log: Optional[EventLog] = None,
+        forward: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+        max_pending_threats: int = 1024,
+        sharded: Optional["ShardedDetector"] = None,
+    ):
+        self.detector = detector
+        self.investigator = investigator
+        self.responder = responder
+        self.sources = sources
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.scheduler = scheduler
+        # Agents under RATE_LIMIT stay scored; only forwarding their records is throttled, so the limiter is
+        # consulted (and allowance spent) only when there is a forward consumer
+        self.limiter = limiter
+        self.event_log = event_log
+        self.forward = forward  # Optional downstream consumer of scored records within their agents' limits
+        self.max_pending_threats = max_pending_threats
+        self.sharded = sharded
+        self.running = False
+        self._stop_requested = False
+        self.stats = {"received": 0, "processed": 0, "threats": 0, "errors": 0, "rate_limited": 0, "replayed": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._handling: Set[asyncio.Task] = set()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of records waiting to be processed"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def pending_threats(self) -> int:
+        """Threats being investigated or responded to"""
+        return len(self._handling)
+
+    async def run(self):
+        """Run sources and the batch consumer until stop() is called"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.running = not self._stop_requested
+        if self.event_log is not None:
+            await self.recover()
+        sharded_task = None
+        if self.sharded is not None:
+            await asyncio.to_thread(self.sharded.start)
+            sharded_task = asyncio.create_task(self._handle_sharded())
+        source_tasks = [asyncio.create_task(self._run_source(source)) for source in self.sources]
+        try:
+            while self.running:
+                batch = await self._next_batch()
+                if batch:
+                    await self._process_batch(batch)
+        finally:
+            for task in source_tasks:
+                task.cancel()
+            await asyncio.gather(*source_tasks, return_exceptions=True)
+            for source in self.sources:
+                await source.close()
+            if sharded_task is not None:
+                # Stopping the workers ends their event stream once every threat they raised is delivered
+                await asyncio.to_thread(self.sharded.stop)
+                await sharded_task
+            await self.drain()
+            if self.queue_depth:
+                logger.info(f"Ingestion stopped with {self.queue_depth} records unprocessed")
+            self._stop_requested = False
+
+    async def recover(self):
+        """Handle the logged threats a previous run detected but did not finish responding to"""
+        batch = []
+        for lsn, payload in self.event_log.pending(RESPONSE_STAGE):
+            batch.append(self._handle_threat(decode_event(payload), lsn, response_key(lsn)))
+            if len(batch) >= self.batch_size:
+                await asyncio.gather(*batch)
+                self.stats["replayed"] += len(batch)
+                batch = []
+        if batch:
+            await asyncio.gather(*batch)
+            self.stats["replayed"] += len(batch)
+        if self.stats["replayed"]:
+            logger.info(f"Replayed {self.stats['replayed']} logged threats")
+            await self.event_log.checkpoint()
+
+    async def drain(self):
+        """Wait until every threat handed to background handling is done"""
+        while self._handling:
+            await asyncio.gather(*self._handling, return_exceptions=True)
+
+    async def stop(self):
+        """Stop the pipeline after the batch in flight and its threats complete"""
+        self.running = False
+        self._stop_requested = True
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait(_STOP)
+            except asyncio.QueueFull:
+                pass  # Consumer is busy and will observe running=False
+
+    def try_submit_many(self, records: List[Dict]) -> bool:
+        """
+        Enqueue records without waiting, all or none
+
+        Used by request handlers that answer HTTP 429 instead of holding
+        the request open while the pipeline is saturated.
+
+        Returns:
+            False when the queue lacks room for every record
+
+        Raises:
+            RuntimeError: The pipeline is not running
+        """
+        queue = self._require_queue()
+        if self.max_queue_size - queue.qsize() < len(records):
+            return False
+        for record in records:
+            queue.put_nowait(record)
+        self.stats["received"] += len(records)
+        return True
+
+    async def submit_many(self, records: List[Dict]):
+        """Enqueue records, waiting for room as the consumer drains the queue"""
+        queue = self._require_queue()
+        for record in records:
+            await queue.put(record)
+        self.stats["received"] += len(records)
+
+    def _require_queue(self) -> asyncio.Queue:
+        if self._queue is None or not self.running:
+            raise RuntimeError("Ingestion pipeline is not running")
+        return self._queue
+
+    async def _emit(self, record: Dict):
+        """Enqueue a record, waiting while the queue is full"""
+        await self._queue.put(record)
+        self.stats["received"] += 1
+
+    async def _run_source(self, source: ActivitySource):
+        try:
+            await source.run(self._emit)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Activity source {type(source).__name__} failed: {e}")
+
+    async def _next_batch(self) -> List[Dict]:
+        """Collect up to batch_size records, waiting at most batch_timeout after the first"""
+        queue = self._queue
+        item = await queue.get()
+        if item is _STOP:
+            return []
+
+        batch = [item]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_timeout
+        while len(batch) < self.batch_size:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if item is _STOP:
+                break
+            batch.append(item)
+        return batch
+
+    async def _process_batch(self, batch: List[Dict]):
+        """Run detection over a batch, forward the records within rate limits and handle the threats"""
+        admitted = batch
+        if self.forward is not None and self.limiter is not None and len(self.limiter):
+            # Agents over their RATE_LIMIT allowance stay monitored; only forwarding their records is throttled
+            allowed = self.limiter.allow_many([record["agent_id"] for record in batch])
+            admitted = [record for record, ok in zip(batch, allowed) if ok]
+            self.stats["rate_limited"] += len(batch) - len(admitted)
+        if self.sharded is not None:
+            # Threats come back through _handle_sharded; blocks while the workers' inboxes are full
+            await asyncio.to_thread(self.sharded.submit_many, batch)
+            threats = []
+        else:
+            threats = self._detect(batch)
+            if self.detector.correlator is not None:
+                # Composite events from windows that closed while scoring this batch
+                threats.extend(self.detector.correlator.drain())
+            if self.detector.fleet is not None:
+                threats.extend(self.detector.fleet.drain())
+        self.stats["processed"] += len(batch)
+        if self.forward is not None and admitted:
+            try:
+                await self.forward(admitted)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error forwarding {len(admitted)} records: {e}")
+
+        if threats:
+            await self._handle_threats(threats)
+
+    async def _handle_sharded(self):
+        """Handle the threats the sharded detector's workers raise until it stops"""
+        async for threat in self.sharded.events():
+            await self._handle_threats([threat])
+
+    async def _handle_threats(self, threats: List[ThreatEvent]):
+        """Hand detected threats to background handling, through the event log when there is one"""
+        self.stats["threats"] += len(threats)
+        if self.event_log is None:
+            for threat in threats:
+                await self._spawn(self._handle_threat(threat))
+            return
+        await self._handle_logged(threats)
+
+    async def _handle_logged(self, threats: List[ThreatEvent]):
+        """Make threats durable in the event log (one group commit), then hand them to background handling"""
+        payloads = [encode_event(threat) for threat in threats]
+        lsns = await self.event_log.append_durable(payloads)
+        for threat, lsn in zip(threats, lsns):
+            await self._spawn(self._handle_threat(threat, lsn, response_key(lsn)))
+
+    async def _spawn(self, handling: Awaitable[None]):
+        """Handle a threat in a tracked background task, first waiting for room if too many are in flight"""
+        while len(self._handling) >= self.max_pending_threats:
+            await asyncio.wait(self._handling, return_when=asyncio.FIRST_COMPLETED)
+        task = asyncio.ensure_future(handling)
+        self._handling.add(task)
+        task.add_done_callback(self._handling.discard)
+
+    def _detect(self, batch: List[Dict]) -> List[ThreatEvent]:
+        """
+        Score a batch from features extracted once, into a buffer reused by the next batch
+
+        Records that are not flagged are folded into their agents' baselines,
+        so baselines keep tracking normal activity.
+        """
+        try:
+            with self.detector.extract_features(batch) as features:
+                return self.detector.detect_features(features, learn=True)
+        except Exception as e:
+            logger.error(f"Error detecting anomalies for batch, scoring records one at a time: {e}")
+
+        threats = []
+        for record in batch:
+            try:
+                activity = {key: value for key, value in record.items() if key != "agent_id"}
+                threat = self.detector.detect_anomaly(record["agent_id"], activity)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error detecting anomaly for record: {e}")
+                continue
+            if threat is None:
+                self.detector.update_baseline(record["agent_id"], activity)
+            else:
+                threats.append(threat)
+        return threats
+
+    async def _handle_threat(self, threat: ThreatEvent, lsn: Optional[int] = None, key: Optional[str] = None):
+        """Investigate and respond to a threat, acknowledging each stage to the event log when it is logged"""
+        try:
+            if self.scheduler is None:
+                investigation = await self.investigator.investigate(threat)
+            else:
+                investigation = await self.scheduler.submit(threat)
+            if lsn is not None:
+                self.event_log.ack(INVESTIGATION_STAGE, lsn)
+            if investigation.threat_event is threat:  # Otherwise coalesced into an investigation that responds
+                if key is None:
+                    await self.responder.respond(threat, investigation)
+                else:
+                    await self.responder.respond(threat, investigation, key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Error handling threat for agent {threat.agent_id}: {e}")
+        if lsn is not None:
+            # Failed threats are acknowledged by both stages too: replaying them on every restart would not
+            # make them succeed, and an unacknowledged event would pin every segment after it
+            self.event_log.ack(INVESTIGATION_STAGE, lsn)
+            self.event_log.ack(RESPONSE_STAGE, lsn)
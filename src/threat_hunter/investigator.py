@@ -5,19 +5,67 @@ Self-directed investigation system that automatically investigates
 detected threats and determines root cause.
 """
 
+import asyncio
 import logging
-from typing import Dict, List, Optional
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 from dataclasses import dataclass
 
+from . import metrics
 from .detector import ThreatEvent
+from .enrichment import ACCESS_LOGS, MODEL_HISTORY, PERMISSIONS
+
+if TYPE_CHECKING:
+    from .enrichment import EnrichmentService
 
 logger = logging.getLogger(__name__)
 
 
+def cpu_bound(playbook: Callable) -> Callable:
+    """
+    Mark a playbook as CPU-bound
+
+    CPU-bound playbooks are plain (non-async) picklable functions taking a
+    ThreatEvent and returning (root_cause, evidence, timeline). They run in
+    a process pool so they never block the event loop.
+    """
+    playbook.cpu_bound = True
+    return playbook
+
+
+def is_cpu_bound(playbook: Callable) -> bool:
+    """Whether a playbook was declared with @cpu_bound"""
+    return getattr(playbook, "cpu_bound", False)
+
+
+def enriched_by(*kinds: str) -> Callable[[Callable], Callable]:
+    """
+    Declare the enrichment a playbook's evidence should include
+
+    The investigator looks the kinds up through the shared enrichment
+    service while the playbook runs and appends them to its evidence, so
+    playbooks (including CPU-bound ones) never fetch on their own.
+    """
+    def decorate(playbook: Callable) -> Callable:
+        playbook.enrichment = kinds
+        return playbook
+    return decorate
+
+
+def enrichment_of(playbook: Callable) -> Tuple[str, ...]:
+    """Enrichment kinds a playbook was declared with via @enriched_by"""
+    return getattr(playbook, "enrichment", ())
+
+
 @dataclass
 class InvestigationReport:
     """Investigation report with findings"""
+    __slots__ = (
+        "threat_event", "root_cause", "evidence", "timeline", "recommendations", "investigation_time"
+    )
+
     threat_event: ThreatEvent
     root_cause: str
     evidence: List[Dict]
@@ -29,9 +77,17 @@ class InvestigationReport:
 class ThreatInvestigator:
     """Autonomous threat investigation engine"""
     
-    def __init__(self, config: Optional[Dict] = None):
+    def __init__(
+        self,
+        config: Optional[Dict] = None,
+        enrichment: Optional["EnrichmentService"] = None,
+        clock: Callable[[], datetime] = datetime.now
+    ):
         self.config = config or {}
+        self.enrichment = enrichment
+        self.clock = clock
         self.playbooks = self._load_playbooks()
+        self._process_pool: Optional[ProcessPoolExecutor] = None
         
     def _load_playbooks(self) -> Dict:
         """Load investigation playbooks"""
@@ -40,6 +96,7 @@ class ThreatInvestigator:
             "privilege_escalation": self._investigate_privilege_escalation,
             "data_exfiltration": self._investigate_data_exfiltration,
             "model_poisoning": self._investigate_model_poisoning,
+            "coordinated_anomaly": self._investigate_coordinated_anomaly,
         }
         
     async def investigate(self, threat_event: ThreatEvent) -> InvestigationReport:
@@ -53,18 +110,43 @@ class ThreatInvestigator:
             InvestigationReport with findings
         """
         logger.info(f"Starting investigation for threat: {threat_event.threat_type}")
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
         # Select appropriate playbook
         playbook = self.playbooks.get(threat_event.threat_type, self._investigate_generic)
         
         # Execute investigation
-        root_cause, evidence, timeline = await playbook(threat_event)
+        playbook_name = threat_event.threat_type if threat_event.threat_type in self.playbooks else "generic"
+        latency = metrics.histogram(
+            "threat_hunter_investigation_seconds", "Investigation playbook latency", playbook=playbook_name
+        )
+        started = latency.start()
+        lookup = None
+        if self.enrichment is not None and enrichment_of(playbook):
+            # Fetched concurrently with the playbook, from the cache shared by all playbooks
+            lookup = asyncio.ensure_future(self.enrichment.lookup(threat_event.agent_id, enrichment_of(playbook)))
+        try:
+            if is_cpu_bound(playbook):
+                root_cause, evidence, timeline = await self._run_cpu_bound(playbook, threat_event)
+            else:
+                root_cause, evidence, timeline = await playbook(threat_event)
+        except BaseException:
+            if lookup is not None:
+                lookup.cancel()
+            raise
+        if lookup is not None:
+            for kind, data in (await lookup).items():
+                evidence.append({"type": kind, "data": data})
+        latency.observe_since(started)
+        metrics.counter("threat_hunter_investigations_total", "Investigations completed", playbook=playbook_name).inc()
+        if "correlation" in threat_event.details:
+            # Composite event from the correlation engine: keep the events behind it as evidence
+            evidence.append({"type": "correlated_events", "data": threat_event.details.get("events", [])})
         
         # Generate recommendations
         recommendations = self._generate_recommendations(threat_event, root_cause)
         
-        investigation_time = (datetime.now() - start_time).total_seconds()
+        investigation_time = time.perf_counter() - start_time
         
         return InvestigationReport(
             threat_event=threat_event,
@@ -75,6 +157,32 @@ class ThreatInvestigator:
             investigation_time=investigation_time
         )
         
+    async def investigate_many(self, threat_events: Iterable[ThreatEvent]) -> AsyncIterator[InvestigationReport]:
+        """
+        Investigate events concurrently, yielding reports as they complete
+
+        CPU-bound playbooks spread across the process pool, so throughput
+        grows with the number of cores while the loop stays responsive.
+        """
+        for next_report in asyncio.as_completed([self.investigate(event) for event in threat_events]):
+            yield await next_report
+
+    async def _run_cpu_bound(self, playbook: Callable, event: ThreatEvent) -> tuple:
+        """Run a CPU-bound playbook in the process pool"""
+        if not self.config.get("offload_cpu_bound", True):
+            return playbook(event)
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.config.get("process_workers"))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._process_pool, playbook, event)
+
+    def close(self):
+        """Shut down the process pool used by CPU-bound playbooks"""
+        if self._process_pool is not None:
+            self._process_pool.shutdown(cancel_futures=True)
+            self._process_pool = None
+        
+    @enriched_by(ACCESS_LOGS, MODEL_HISTORY)
     async def _investigate_behavioral_anomaly(self, event: ThreatEvent) -> tuple:
         """Investigate behavioral anomaly"""
         evidence = [
@@ -83,11 +191,12 @@ class ThreatInvestigator:
         ]
         timeline = [
             {"time": event.timestamp, "event": "Anomaly detected"},
-            {"time": datetime.now(), "event": "Investigation started"}
+            {"time": self.clock(), "event": "Investigation started"}
         ]
         root_cause = "Agent behavior deviated from established baseline"
         return root_cause, evidence, timeline
         
+    @enriched_by(PERMISSIONS, ACCESS_LOGS)
     async def _investigate_privilege_escalation(self, event: ThreatEvent) -> tuple:
         """Investigate privilege escalation attempt"""
         evidence = [
@@ -100,7 +209,10 @@ class ThreatInvestigator:
         root_cause = "Agent attempted to access resources beyond normal scope"
         return root_cause, evidence, timeline
         
-    async def _investigate_data_exfiltration(self, event: ThreatEvent) -> tuple:
+    @staticmethod
+    @cpu_bound
+    @enriched_by(ACCESS_LOGS)
+    def _investigate_data_exfiltration(event: ThreatEvent) -> tuple:
         """Investigate data exfiltration"""
         evidence = [
             {"type": "data_transfer_logs", "data": event.details.get("transfers", [])},
@@ -112,7 +224,10 @@ class ThreatInvestigator:
         root_cause = "Unusual data transfer patterns detected"
         return root_cause, evidence, timeline
         
-    async def _investigate_model_poisoning(self, event: ThreatEvent) -> tuple:
+    @staticmethod
+    @cpu_bound
+    @enriched_by(MODEL_HISTORY)
+    def _investigate_model_poisoning(event: ThreatEvent) -> tuple:
         """Investigate model poisoning"""
         evidence = [
             {"type": "model_changes", "data": event.details.get("model_updates", [])},
@@ -124,6 +239,22 @@ class ThreatInvestigator:
         root_cause = "Model behavior changed unexpectedly"
         return root_cause, evidence, timeline
         
+    async def _investigate_coordinated_anomaly(self, event: ThreatEvent) -> tuple:
+        """Investigate a behavior spiking across the fleet"""
+        evidence = [
+            {"type": "fleet_behavior", "data": {
+                key: event.details.get(key) for key in ("behavior", "distinct_agents", "usual_agents", "events")
+            }},
+            {"type": "sample_agents", "data": event.details.get("sample_agents", [])},
+        ]
+        timeline = [
+            {"time": event.details.get("window_start"), "event": "Fleet window opened"},
+            {"time": event.timestamp, "event": "Coordinated anomaly detected"},
+        ]
+        root_cause = "Many agents adopted the same behavior at once, pointing to a shared tool, dependency or input"
+        return root_cause, evidence, timeline
+
+    @enriched_by(ACCESS_LOGS)
     async def _investigate_generic(self, event: ThreatEvent) -> tuple:
         """Generic investigation playbook"""
         evidence = [{"type": "event_data", "data": event.details}]
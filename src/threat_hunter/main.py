@@ -4,34 +4,145 @@ Main application entry point for Autonomous Threat-Hunter
 
 import asyncio
 import logging
-from fastapi import FastAPI
+import os
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 
+from . import metrics
 from .detector import ThreatDetector
 from .investigator import ThreatInvestigator
 from .responder import ThreatResponder
+from .response_executor import LoggingAgentPlatform
+from .alerting import AlertAggregator
+from .ingestion import IngestionPipeline, JsonLinesTailSource, QueueSource, UnixSocketSource, decode_ndjson, gunzip
+from .scheduler import InvestigationScheduler
+from .models import ModelEngine
+from .correlation import CorrelationEngine
+from .fleet import FleetIndex
+from .enrichment import ACCESS_LOGS, MODEL_HISTORY, PERMISSIONS, EnrichmentService, HttpEnrichmentSource
+from .snapshot import SnapshotCheckpointer, load_snapshot
+from .ratelimit import RateLimiter
+from .wal import RESPONSE_STAGE, EventLog
+
+if TYPE_CHECKING:
+    from .store import ThreatStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Largest request body, and largest gzip body once decompressed
+MAX_INGEST_BYTES = int(os.getenv("THREAT_HUNTER_INGEST_MAX_BYTES", str(16 * 1024 * 1024)))
+# Bodies larger than this are decoded in a worker thread instead of on the event loop
+_INLINE_DECODE_BYTES = 256 * 1024
+
 # Global instances
 detector = None
 investigator = None
 responder = None
+pipeline = None
+activity_queue = None
+checkpointer = None
+scheduler = None
+alerts = None
+store = None
+event_log = None
+
+
+def _build_enrichment():
+    """Enrichment service from the environment, or None when no backend is configured"""
+    url = os.getenv("THREAT_HUNTER_ENRICHMENT_URL")
+    if not url:
+        return None
+    sources = {kind: HttpEnrichmentSource(f"{url.rstrip('/')}/{kind}") for kind in (ACCESS_LOGS, PERMISSIONS, MODEL_HISTORY)}
+    return EnrichmentService(sources, ttl=float(os.getenv("THREAT_HUNTER_ENRICHMENT_TTL", "60")))
+
+
+def _build_sources() -> list:
+    """Build activity sources from the environment"""
+    sources = [QueueSource(activity_queue)]
+    if os.getenv("THREAT_HUNTER_ACTIVITY_LOG"):
+        sources.append(JsonLinesTailSource(os.environ["THREAT_HUNTER_ACTIVITY_LOG"]))
+    if os.getenv("THREAT_HUNTER_ACTIVITY_SOCKET"):
+        sources.append(UnixSocketSource(os.environ["THREAT_HUNTER_ACTIVITY_SOCKET"]))
+    return sources
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
-    global detector, investigator, responder
+    global detector, investigator, responder, pipeline, activity_queue, checkpointer, scheduler, alerts, store, event_log
     
     # Initialize components
-    detector = ThreatDetector()
-    investigator = ThreatInvestigator()
-    responder = ThreatResponder()
+    model_dir = os.getenv("THREAT_HUNTER_MODEL_DIR")
+    rules_path = os.getenv("THREAT_HUNTER_RULES")
+    correlate = os.getenv("THREAT_HUNTER_CORRELATION", "1") != "0"
+    fleet_index = os.getenv("THREAT_HUNTER_FLEET_INDEX", "1") != "0"
+    detector = ThreatDetector(
+        {"rules_path": rules_path} if rules_path else None,
+        models=ModelEngine(model_dir) if model_dir else None,
+        correlator=CorrelationEngine() if correlate else None,
+        fleet=FleetIndex() if fleet_index else None
+    )
+    snapshot_path = os.getenv("THREAT_HUNTER_SNAPSHOT")
+    if snapshot_path and os.path.exists(snapshot_path):
+        # Warm start from the last checkpoint instead of rebuilding baselines
+        detector.baselines = load_snapshot(snapshot_path)
+    investigator = ThreatInvestigator(enrichment=_build_enrichment())
+    alerts = AlertAggregator(spill_path=os.getenv("THREAT_HUNTER_ALERT_SPILL"))
+    store_url = os.getenv("THREAT_HUNTER_STORE")
+    store = None
+    if store_url:
+        from .store import ThreatStore  # SQLAlchemy is only imported when the store is enabled
+        store = ThreatStore(store_url)
+    # RATE_LIMIT responses record limits here; they throttle records passed to a pipeline forward consumer
+    limiter = RateLimiter(
+        base_rate=float(os.getenv("THREAT_HUNTER_RATE_LIMIT_BASE_RATE", "10")),
+        baseline_of=lambda agent_id: detector.baselines.get(agent_id)
+    )
+    policies_path = os.getenv("THREAT_HUNTER_POLICIES")
+    responder = ThreatResponder(
+        {"policies_path": policies_path} if policies_path else None,
+        platform=LoggingAgentPlatform(),
+        alerts=alerts,
+        store=store,
+        limiter=limiter
+    )
+    scheduler = InvestigationScheduler(investigator, workers=int(os.getenv("THREAT_HUNTER_INVESTIGATION_WORKERS", "4")))
+    scheduler.start()
+    activity_queue = asyncio.Queue(maxsize=10000)
+    wal_dir = os.getenv("THREAT_HUNTER_WAL_DIR")
+    # Detected threats are logged before investigation, and replayed on restart until responded to
+    event_log = EventLog(wal_dir) if wal_dir else None
+    sharded = None
+    shards = int(os.getenv("THREAT_HUNTER_SHARDS", "0"))
+    if shards > 0:
+        from .sharding import ShardedDetector  # Worker processes are only spawned when sharding is enabled
+        # Batches are scored by the shard workers (rules, baselines, models) instead of the local detector
+        sharded = ShardedDetector(workers=shards, config={"rules_path": rules_path} if rules_path else None)
+    pipeline = IngestionPipeline(
+        detector, investigator, responder, _build_sources(), scheduler=scheduler, limiter=limiter, event_log=event_log,
+        sharded=sharded
+    )
     
     # Start monitoring
-    monitor_task = asyncio.create_task(detector.start_monitoring())
+    monitor_task = asyncio.create_task(detector.start_monitoring(pipeline))
+    alert_task = asyncio.create_task(alerts.run())
+    rules_task = None
+    if rules_path:
+        # Edits to the rule file take effect without a restart
+        rules_task = asyncio.create_task(detector.rules.watch(float(os.getenv("THREAT_HUNTER_RULES_POLL_INTERVAL", "2"))))
+    policies_task = None
+    if policies_path:
+        # Policy edits swap in atomically; responses in flight finish on the old table
+        interval = float(os.getenv("THREAT_HUNTER_POLICIES_POLL_INTERVAL", "2"))
+        policies_task = asyncio.create_task(responder.policies.watch(interval))
+    checkpoint_task = None
+    if snapshot_path:
+        interval = float(os.getenv("THREAT_HUNTER_SNAPSHOT_INTERVAL", "300"))
+        checkpointer = SnapshotCheckpointer(detector, snapshot_path, interval)
+        checkpoint_task = asyncio.create_task(checkpointer.run())
     
     logger.info("Autonomous Threat-Hunter started")
     
@@ -40,6 +151,25 @@ async def lifespan(app: FastAPI):
     # Cleanup
     await detector.stop_monitoring()
     monitor_task.cancel()
+    await scheduler.stop()
+    investigator.close()
+    if investigator.enrichment is not None:
+        await investigator.enrichment.close()
+    alert_task.cancel()
+    await alerts.stop()
+    if rules_task is not None:
+        detector.rules.stop()
+        rules_task.cancel()
+    if policies_task is not None:
+        responder.policies.stop()
+        policies_task.cancel()
+    if checkpoint_task is not None:
+        checkpoint_task.cancel()
+        await checkpointer.stop()
+    if event_log is not None:
+        await event_log.close()
+    if store is not None:
+        await asyncio.to_thread(store.close)
     logger.info("Autonomous Threat-Hunter stopped")
 
 
@@ -67,11 +197,138 @@ async def health():
     return {
         "status": "healthy",
         "detector": "running" if detector and detector.running else "stopped",
+        "ingestion_queue_depth": pipeline.queue_depth if pipeline else 0,
+        "investigation_queue_depth": scheduler.queue_depth if scheduler else 0,
+        "investigation_latency_seconds": scheduler.latency_percentiles() if scheduler else {},
+        "unresponded_logged_threats": event_log.lag(RESPONSE_STAGE) if event_log else 0,
         "investigator": "ready" if investigator else "not_ready",
         "responder": "ready" if responder else "not_ready"
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus metrics for the detect -> investigate -> respond pipeline"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def _read_body(request: Request) -> bytes:
+    """Read a request body, refusing bodies over MAX_INGEST_BYTES"""
+    if int(request.headers.get("content-length") or 0) > MAX_INGEST_BYTES:
+        raise HTTPException(status_code=413, detail=f"Body exceeds {MAX_INGEST_BYTES} bytes")
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_INGEST_BYTES:
+            raise HTTPException(status_code=413, detail=f"Body exceeds {MAX_INGEST_BYTES} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _inflate_and_decode(body: bytes, gzipped: bool) -> Tuple[List[Dict], int]:
+    if gzipped:
+        body = gunzip(body, MAX_INGEST_BYTES)
+    return decode_ndjson(body)
+
+
+async def _decode(body: bytes, gzipped: bool) -> Tuple[List[Dict], int]:
+    """Decode an NDJSON body, in a worker thread when it is large or compressed"""
+    try:
+        if not gzipped and len(body) <= _INLINE_DECODE_BYTES:
+            return decode_ndjson(body)
+        return await asyncio.to_thread(_inflate_and_decode, body, gzipped)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _enqueue(records: List[Dict], rejected: int) -> JSONResponse:
+    """Hand decoded records to the shared pipeline, or push back with 429"""
+    if pipeline is None or not pipeline.running:
+        raise HTTPException(status_code=503, detail="Ingestion pipeline is not running")
+    if len(records) > pipeline.max_queue_size:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {pipeline.max_queue_size} records")
+    if not pipeline.try_submit_many(records):
+        raise HTTPException(status_code=429, detail="Ingestion queue is full", headers={"Retry-After": "1"})
+    # Accepted for detection, which happens asynchronously in the pipeline
+    return JSONResponse({"accepted": len(records), "rejected": rejected}, status_code=202)
+
+
+@app.post("/ingest", status_code=202)
+async def ingest(request: Request):
+    """Submit a batch of NDJSON activity records; Content-Encoding: gzip is honoured"""
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    records, rejected = await _decode(await _read_body(request), gzipped)
+    return _enqueue(records, rejected)
+
+
+@app.post("/ingest/bulk", status_code=202)
+async def ingest_bulk(request: Request):
+    """Submit a gzip-compressed NDJSON bulk upload"""
+    records, rejected = await _decode(await _read_body(request), gzipped=True)
+    return _enqueue(records, rejected)
+
+
+@app.websocket("/ingest/ws")
+async def ingest_stream(websocket: WebSocket):
+    """Stream NDJSON activity; every message is acknowledged once it is queued"""
+    await websocket.accept()
+    if pipeline is None or not pipeline.running:
+        await websocket.close(code=1013, reason="Ingestion pipeline is not running")
+        return
+    sequence = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            payload = message.get("bytes") or (message.get("text") or "").encode()
+            records, rejected = decode_ndjson(payload)
+            # Not receiving the next message until these are queued is the flow control
+            await pipeline.submit_many(records)
+            sequence += 1
+            await websocket.send_json({"seq": sequence, "accepted": len(records), "rejected": rejected})
+    except WebSocketDisconnect:
+        pass
+
+
+def _require_store() -> "ThreatStore":
+    if store is None:
+        raise HTTPException(status_code=503, detail="Threat store is not configured (set THREAT_HUNTER_STORE)")
+    return store
+
+
+@app.get("/threats")
+async def list_threats(
+    agent_id: Optional[str] = None,
+    severity: Optional[str] = None,
+    threat_type: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
+):
+    """Handled threats, newest first, one page per request"""
+    threat_store = _require_store()
+    from .store import parse_time
+    try:
+        items, next_cursor = await asyncio.to_thread(
+            threat_store.query, agent_id, severity, threat_type, parse_time(since), parse_time(until), limit, cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get("/threats/{threat_id}")
+async def get_threat(threat_id: int):
+    """A handled threat with its investigation and response results"""
+    threat = await asyncio.to_thread(_require_store().get, threat_id)
+    if threat is None:
+        raise HTTPException(status_code=404, detail="Threat not found")
+    return threat
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
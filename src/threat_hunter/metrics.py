@@ -0,0 +1,184 @@
+"""
+Hot-Path Metrics
+
+Low-overhead counters and log-linear (HDR-style) latency histograms for
+the detect -> investigate -> respond pipeline, rendered in the Prometheus
+text exposition format.
+
+Histograms time only every Nth call (sample_every) so the per-event cost
+on hot paths is an integer decrement for unsampled calls and two
+perf_counter_ns() reads plus a bucket increment for sampled ones.
+"""
+
+import threading
+from time import perf_counter_ns
+from typing import Dict, List, Optional, Tuple
+
+# Sub-buckets per power of two: 2**4 = 16 gives ~6% relative error
+SUB_BITS = 4
+_SUB_COUNT = 1 << SUB_BITS
+_SUB_MASK = _SUB_COUNT - 1
+_MAX_INDEX = (64 - SUB_BITS) << SUB_BITS
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _bucket_index(value: int) -> int:
+    """Log-linear bucket for a non-negative integer value"""
+    if value < _SUB_COUNT:
+        return value
+    exponent = value.bit_length() - 1
+    mantissa = (value >> (exponent - SUB_BITS)) & _SUB_MASK
+    return ((exponent - SUB_BITS + 1) << SUB_BITS) + mantissa
+
+
+def _bucket_bounds(index: int) -> Tuple[int, int]:
+    """Inclusive lower and exclusive upper value of a bucket"""
+    if index < _SUB_COUNT:
+        return index, index + 1
+    magnitude, mantissa = index >> SUB_BITS, index & _SUB_MASK
+    lower = (_SUB_COUNT + mantissa) << (magnitude - 1)
+    return lower, lower + (1 << (magnitude - 1))
+
+
+class Counter:
+    """Monotonic counter"""
+
+    __slots__ = ("name", "labels", "value")
+
+    def __init__(self, name: str, labels: Labels = ()):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class LatencyHistogram:
+    """Sampled log-linear latency histogram recording nanoseconds"""
+
+    __slots__ = ("name", "labels", "sample_every", "counts", "count", "total_ns", "_countdown")
+
+    def __init__(self, name: str, labels: Labels = (), sample_every: int = 1):
+        self.name = name
+        self.labels = labels
+        self.sample_every = max(1, sample_every)
+        self.counts = [0] * (_MAX_INDEX + 1)
+        self.count = 0
+        self.total_ns = 0
+        self._countdown = 1
+
+    def start(self) -> int:
+        """
+        Begin timing a call
+
+        Returns:
+            Start timestamp for sampled calls, 0 for calls that are skipped
+        """
+        self._countdown -= 1
+        if self._countdown:
+            return 0
+        self._countdown = self.sample_every
+        return perf_counter_ns()
+
+    def observe_since(self, start: int):
+        """Record the time elapsed since a start() that was sampled"""
+        if start:
+            self.record(perf_counter_ns() - start)
+
+    def record(self, value_ns: int):
+        index = _bucket_index(value_ns) if value_ns > 0 else 0
+        self.counts[index if index < _MAX_INDEX else _MAX_INDEX] += 1
+        self.count += 1
+        self.total_ns += value_ns
+
+    def percentile(self, quantile: float) -> float:
+        """Approximate quantile (0.0 to 1.0) in seconds"""
+        if not self.count:
+            return 0.0
+        target = max(1, int(quantile * self.count + 0.5))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                lower, upper = _bucket_bounds(index)
+                return (lower + upper - 1) / 2 / 1e9
+        return self.total_ns / self.count / 1e9
+
+
+class MetricsRegistry:
+    """Named, labelled metrics rendered as Prometheus text"""
+
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, Labels], object] = {}
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str = "", **labels: str) -> Counter:
+        return self._get(Counter, "counter", name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str = "", sample_every: int = 1, **labels: str) -> LatencyHistogram:
+        return self._get(LatencyHistogram, "summary", name, help_text, labels, sample_every=sample_every)
+
+    def _get(self, kind, prometheus_type: str, name: str, help_text: str, labels: Dict[str, str], **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = kind(name, key[1], **kwargs)
+                    self._help.setdefault(name, (prometheus_type, help_text))
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        by_name: Dict[str, List] = {}
+        for (name, _), metric in sorted(self._metrics.items(), key=lambda item: item[0]):
+            by_name.setdefault(name, []).append(metric)
+
+        lines = []
+        for name, metrics in by_name.items():
+            prometheus_type, help_text = self._help[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {prometheus_type}")
+            for metric in metrics:
+                if isinstance(metric, Counter):
+                    lines.append(f"{name}{_format_labels(metric.labels)} {metric.value}")
+                    continue
+                for quantile in QUANTILES:
+                    labels = _format_labels(metric.labels + (("quantile", str(quantile)),))
+                    lines.append(f"{name}{labels} {metric.percentile(quantile):.9f}")
+                labels = _format_labels(metric.labels)
+                lines.append(f"{name}_sum{labels} {metric.total_ns / 1e9:.9f}")
+                lines.append(f"{name}_count{labels} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide registry used by the pipeline and served at /metrics
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str, help_text: str = "", **labels: str) -> Counter:
+    return REGISTRY.counter(name, help_text, **labels)
+
+
+def histogram(name: str, help_text: str = "", sample_every: int = 1, **labels: str) -> LatencyHistogram:
+    return REGISTRY.histogram(name, help_text, sample_every, **labels)
+
+
+def render(registry: Optional[MetricsRegistry] = None) -> str:
+    return (registry or REGISTRY).render()
@@ -0,0 +1,384 @@
+"""
+Anomaly Model Engine
+
+IsolationForest models scored against agent activity. Trained forests are
+compiled into flat NumPy node tables so inference walks every tree for a
+whole micro-batch at once instead of calling scikit-learn row by row.
+Models are stored as joblib artifacts, one per agent cluster, and loaded
+lazily into an LRU cache so only the models of active agents stay resident.
+"""
+
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from .baseline_store import BaselineStore
+from .features import model_value
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEATURES = ("unusual_api_calls", "data_access_spike", "privilege_escalation")
+GLOBAL_MODEL = "global"
+CLUSTERS_FILE = "clusters.json"  # Agent to model key assignments, next to the artifacts
+
+_LEAF = -1
+
+
+def _average_path_length(n_samples: np.ndarray) -> np.ndarray:
+    """Expected isolation depth of n samples (unsuccessful BST search length)"""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    lengths = np.zeros_like(n_samples)
+    lengths[n_samples == 2] = 1.0
+    many = n_samples > 2
+    lengths[many] = 2.0 * (np.log(n_samples[many] - 1.0) + np.euler_gamma) - 2.0 * (n_samples[many] - 1.0) / n_samples[many]
+    return lengths
+
+
+def feature_matrix(activities: Sequence[Mapping], features: Sequence[str]) -> np.ndarray:
+    """Fixed-schema float32 matrix from activity dicts; missing and non-numeric fields are 0, flags 0 or 1"""
+    matrix = np.zeros((len(activities), len(features)), dtype=np.float32)
+    for column, name in enumerate(features):
+        matrix[:, column] = [model_value(activity.get(name)) for activity in activities]
+    return matrix
+
+
+def column_matrix(columns: Mapping[str, np.ndarray], rows: int, features: Sequence[str]) -> np.ndarray:
+    """Fixed-schema float32 matrix from named columns; missing columns and non-numeric values are 0"""
+    matrix = np.zeros((rows, len(features)), dtype=np.float32)
+    for column, name in enumerate(features):
+        if name not in columns:
+            continue
+        values = columns[name]
+        if values.dtype.kind in "biuf":
+            matrix[:, column] = values
+        else:
+            matrix[:, column] = [model_value(value) for value in values.tolist()]
+    return matrix
+
+
+class AnomalyModel:
+    """IsolationForest compiled to flat node tables for vectorized scoring"""
+
+    def __init__(
+        self,
+        features: Sequence[str],
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        children: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        normalizer: float,
+        offset: float = 0.0,
+        scale: float = 0.1,
+    ):
+        self.features = tuple(features)
+        self.feature = feature  # Split column per node (0 for leaves)
+        self.threshold = threshold
+        self.children = children  # Left/right child of node i at 2i/2i+1; leaves point at themselves
+        self.value = value  # Path length credited when a row ends at the node
+        self.roots = roots
+        self.max_depth = max_depth
+        self.normalizer = normalizer
+        self.offset = offset
+        self.scale = scale
+
+    @classmethod
+    def from_forest(cls, forest, features: Sequence[str], training: np.ndarray, quantile: float = 0.99, scale: float = 0.1):
+        """
+        Compile a fitted sklearn IsolationForest
+
+        Args:
+            forest: Fitted IsolationForest
+            features: Feature names, in the column order the forest was fit on
+            training: Training matrix, used to place the risk offset at the
+                given quantile of normal anomaly scores
+            quantile: Anomaly scores above this training quantile add risk
+            scale: Score distance above the offset that maps to full risk
+        """
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        size = sum(tree.node_count for tree in trees)
+        feature = np.zeros(size, dtype=np.intp)
+        threshold = np.zeros(size, dtype=np.float64)
+        children = np.zeros(2 * size, dtype=np.intp)
+        value = np.zeros(size, dtype=np.float64)
+        roots = np.zeros(len(trees), dtype=np.intp)
+
+        base = 0
+        for index, (tree, subset) in enumerate(zip(trees, forest.estimators_features_)):
+            nodes = slice(base, base + tree.node_count)
+            own = np.arange(base, base + tree.node_count)
+            internal = tree.children_left != _LEAF
+            # Tree features index the estimator's feature subset; map them back to matrix columns
+            feature[nodes] = np.where(internal, np.asarray(subset)[np.maximum(tree.feature, 0)], 0)
+            threshold[nodes] = tree.threshold
+            children[2 * base:2 * (base + tree.node_count):2] = np.where(internal, tree.children_left + base, own)
+            children[2 * base + 1:2 * (base + tree.node_count):2] = np.where(internal, tree.children_right + base, own)
+            value[nodes] = tree.compute_node_depths() + _average_path_length(tree.n_node_samples) - 1.0
+            roots[index] = base
+            base += tree.node_count
+
+        normalizer = len(trees) * float(_average_path_length(np.array([forest.max_samples_]))[0])
+        max_depth = max(tree.max_depth for tree in trees)
+        model = cls(features, feature, threshold, children, value, roots, max_depth, normalizer, scale=scale)
+        model.offset = float(np.quantile(model.anomaly_scores(training), quantile))
+        return model
+
+    def anomaly_scores(self, matrix: np.ndarray) -> np.ndarray:
+        """Isolation anomaly score per row in (0, 1]; equals -IsolationForest.score_samples"""
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if not self.normalizer:
+            return np.ones(len(matrix))
+        values = matrix.ravel()
+        row_offsets = (np.arange(len(matrix)) * matrix.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (len(matrix), len(self.roots)))
+        # Every tree advances one level per step; rows that reached a leaf stay put
+        for _ in range(self.max_depth):
+            goes_right = values.take(row_offsets + self.feature.take(nodes)) > self.threshold.take(nodes)
+            nodes = self.children.take(2 * nodes + goes_right)
+        return 2.0 ** (-self.value.take(nodes).sum(axis=1) / self.normalizer)
+
+    def risk(self, matrix: np.ndarray) -> np.ndarray:
+        """Risk (0.0 to 1.0) per row from how far its anomaly score exceeds the offset"""
+        return np.clip((self.anomaly_scores(matrix) - self.offset) / self.scale, 0.0, 1.0)
+
+
+def train_model(
+    samples: np.ndarray,
+    features: Sequence[str] = DEFAULT_FEATURES,
+    n_estimators: int = 100,
+    max_samples: int = 256,
+    seed: int = 0,
+    quantile: float = 0.99,
+    scale: float = 0.1,
+) -> AnomalyModel:
+    """Fit an IsolationForest on normal activity and compile it"""
+    # Imported here: scikit-learn is only needed to train, never to score
+    from sklearn.ensemble import IsolationForest
+
+    samples = np.asarray(samples, dtype=np.float32)
+    forest = IsolationForest(
+        n_estimators=n_estimators,
+        max_samples=min(max_samples, len(samples)),
+        random_state=seed
+    ).fit(samples)
+    return AnomalyModel.from_forest(forest, features, samples, quantile, scale)
+
+
+def baseline_samples(
+    store: BaselineStore,
+    agent_ids: Iterable[str],
+    features: Sequence[str],
+    per_agent: int = 32,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Synthesize normal activity from agent baselines
+
+    Each metric feature is drawn from a normal distribution with the
+    agent's baseline mean and standard deviation (floored at zero, since
+    activity counts are non-negative). Features without a baseline metric,
+    such as boolean flags, are 0.
+    """
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for agent_id in agent_ids:
+        stats = store[agent_id].metrics
+        block = np.zeros((per_agent, len(features)), dtype=np.float32)
+        for column, name in enumerate(features):
+            stat = stats.get(name)
+            if stat is not None and stat.count:
+                block[:, column] = np.maximum(rng.normal(stat.mean, stat.std, per_agent), 0.0)
+        blocks.append(block)
+    if not blocks:
+        return np.zeros((0, len(features)), dtype=np.float32)
+    return np.concatenate(blocks)
+
+
+class ModelEngine:
+    """Lazily loaded, LRU-cached anomaly models keyed by agent cluster"""
+
+    def __init__(
+        self,
+        model_dir: Optional[str] = None,
+        features: Sequence[str] = DEFAULT_FEATURES,
+        cache_size: int = 64,
+        weight: float = 0.4,
+    ):
+        self.model_dir = model_dir
+        self.features = tuple(features)
+        self.cache_size = cache_size
+        self.weight = weight
+        self.stats = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0}
+        self._cache: "OrderedDict[str, Optional[AnomalyModel]]" = OrderedDict()
+        self._clusters: Dict[str, str] = self._load_clusters()
+
+    def assign(self, agent_id: str, key: str):
+        """Score an agent with the model stored under key (persisted by save_clusters)"""
+        self._clusters[agent_id] = key
+
+    def save_clusters(self):
+        """With a model_dir, write the agent cluster assignments next to the artifacts (temp file and rename)"""
+        if not self.model_dir:
+            return
+        os.makedirs(self.model_dir, exist_ok=True)
+        path = os.path.join(self.model_dir, CLUSTERS_FILE)
+        with open(f"{path}.tmp", "w") as handle:
+            json.dump(self._clusters, handle)
+        os.replace(f"{path}.tmp", path)
+
+    def model_key(self, agent_id: str) -> str:
+        return self._clusters.get(agent_id, GLOBAL_MODEL)
+
+    def get(self, key: str) -> Optional[AnomalyModel]:
+        """Model stored under key, loading its artifact on first use"""
+        if key in self._cache:
+            self.stats["hits"] += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.stats["misses"] += 1
+        model = self._load(key)
+        self._cache[key] = model  # Missing artifacts are cached too, as None
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+            self.stats["evictions"] += 1
+        return model
+
+    def put(self, key: str, model: AnomalyModel):
+        """Cache a model and, with a model_dir, persist it as a joblib artifact"""
+        if model.features != self.features:
+            raise ValueError(f"Model features {model.features} do not match engine features {self.features}")
+        if self.model_dir:
+            import joblib
+
+            os.makedirs(self.model_dir, exist_ok=True)
+            joblib.dump(model, self._artifact_path(key))
+        self._cache[key] = model
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def train_from_baselines(
+        self,
+        store: BaselineStore,
+        clusters: int = 1,
+        per_agent: int = 32,
+        seed: int = 0,
+        **params,
+    ) -> List[str]:
+        """
+        Train models from the baselines in store
+
+        With clusters > 1, agents are grouped by k-means on their baseline
+        metric means and each group gets its own model; a global model
+        trained on every agent is always kept as the fallback. The new
+        cluster assignments replace the previous ones and are saved with
+        the artifacts.
+
+        Returns:
+            Keys of the trained models
+        """
+        agent_ids = list(store)
+        if not agent_ids:
+            return []
+        self.put(GLOBAL_MODEL, train_model(
+            baseline_samples(store, agent_ids, self.features, per_agent, seed), self.features, seed=seed, **params
+        ))
+        keys = [GLOBAL_MODEL]
+        self._clusters = {}
+        if clusters <= 1 or len(agent_ids) < clusters:
+            self.save_clusters()
+            return keys
+
+        from sklearn.cluster import KMeans
+
+        means = np.array([
+            [getattr(store[agent_id].metrics.get(name), "mean", 0.0) for name in self.features]
+            for agent_id in agent_ids
+        ])
+        labels = KMeans(n_clusters=clusters, n_init=4, random_state=seed).fit_predict(means)
+        for cluster in range(clusters):
+            members = [agent_id for agent_id, label in zip(agent_ids, labels) if label == cluster]
+            if not members:
+                continue
+            key = f"cluster-{cluster}"
+            samples = baseline_samples(store, members, self.features, per_agent, seed)
+            self.put(key, train_model(samples, self.features, seed=seed, **params))
+            for agent_id in members:
+                self.assign(agent_id, key)
+            keys.append(key)
+        self.save_clusters()
+        logger.info(f"Trained {len(keys)} anomaly models from {len(agent_ids)} baselines")
+        return keys
+
+    def score(self, agent_id: str, activity: Mapping) -> float:
+        """Model risk contribution for one activity record"""
+        return float(self.score_matrix([agent_id], feature_matrix([activity], self.features))[0])
+
+    def score_records(self, agent_ids: Sequence[str], activities: Sequence[Mapping]) -> np.ndarray:
+        """Model risk contribution for a micro-batch of activity dicts"""
+        return self.score_matrix(agent_ids, feature_matrix(activities, self.features))
+
+    def score_columns(self, agent_ids: Sequence[str], columns: Mapping[str, np.ndarray]) -> np.ndarray:
+        """Model risk contribution for a columnar batch"""
+        return self.score_matrix(agent_ids, column_matrix(columns, len(agent_ids), self.features))
+
+    def score_matrix(self, agent_ids: Sequence[str], matrix: np.ndarray) -> np.ndarray:
+        """
+        Model risk contribution (0.0 to weight) for each row of a feature matrix
+
+        Rows are grouped by model so each model runs once per batch. Agents
+        whose cluster model is missing fall back to the global model, and
+        rows without any model score 0.
+        """
+        risk = np.zeros(len(agent_ids), dtype=np.float64)
+        if not self._clusters:
+            groups = {GLOBAL_MODEL: None}
+        else:
+            keys = np.array([self.model_key(agent_id) for agent_id in agent_ids])
+            groups = {key: np.flatnonzero(keys == key) for key in np.unique(keys)}
+
+        for key, rows in groups.items():
+            model = self.get(key)
+            if model is None and key != GLOBAL_MODEL:
+                model = self.get(GLOBAL_MODEL)
+            if model is None:
+                continue
+            if rows is None:
+                risk = model.risk(matrix)
+            else:
+                risk[rows] = model.risk(matrix[rows])
+        return self.weight * risk
+
+    def _artifact_path(self, key: str) -> str:
+        return os.path.join(self.model_dir, f"{key}.joblib")
+
+    def _load_clusters(self) -> Dict[str, str]:
+        if not self.model_dir:
+            return {}
+        path = os.path.join(self.model_dir, CLUSTERS_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as handle:
+            clusters = json.load(handle)
+        logger.info(f"Loaded {len(clusters)} agent cluster assignments from {path}")
+        return clusters
+
+    def _load(self, key: str) -> Optional[AnomalyModel]:
+        if not self.model_dir:
+            return None
+        path = self._artifact_path(key)
+        if not os.path.exists(path):
+            return None
+        import joblib
+
+        model = joblib.load(path)
+        self.stats["loads"] += 1
+        logger.info(f"Loaded anomaly model {key} from {path}")
+        return model
@@ -0,0 +1,359 @@
+"""
+Response Policies
+
+Declarative policies choosing the response actions for a threat, written
+in YAML or JSON. A policy matches on threat type, severity, agent tags and
+the investigation's root cause; the matching policy with the highest
+priority wins, then the most specific one, then the first in the file.
+
+Policies are compiled into a table keyed by (threat_type, severity). Each
+entry holds only the policies that can apply to that key, in precedence
+order and cut off after the first one without tag or root cause
+conditions, so choosing actions is one dict lookup and a short scan
+whatever the size of the policy set. Policy files can be hot-reloaded; a
+reload swaps the whole table at once.
+
+Example (YAML):
+
+    policies:
+      - name: exfiltration_in_production
+        priority: 10
+        when:
+          threat_type: [data_exfiltration]
+          severity: [high, critical]
+          tags: [production]
+        actions: [isolate, revoke_credentials, alert]
+"""
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+from .detector import ThreatEvent
+from .investigator import InvestigationReport
+from .responder import ResponseAction
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ("low", "medium", "high", "critical")
+
+# Actions when no policy matches
+FALLBACK_ACTIONS = (ResponseAction.MONITOR,)
+
+# The responder's original severity table
+DEFAULT_POLICIES = {
+    "policies": [
+        {"name": "critical", "when": {"severity": ["critical"]}, "actions": ["isolate", "revoke_credentials", "alert"]},
+        {"name": "high", "when": {"severity": ["high"]}, "actions": ["rate_limit", "alert"]},
+        {"name": "medium", "when": {"severity": ["medium"]}, "actions": ["monitor", "alert"]},
+        {"name": "low", "when": {"severity": ["low"]}, "actions": ["monitor"]},
+    ]
+}
+
+_CONDITIONS = ("threat_type", "severity", "tags", "root_cause")
+
+TagLookup = Callable[[ThreatEvent], Iterable[str]]
+
+
+class PolicyError(ValueError):
+    """Raised for malformed policy documents"""
+
+
+@dataclass(frozen=True)
+class Policy:
+    """Response actions for the threats matching every condition"""
+    name: str
+    actions: Tuple[ResponseAction, ...]
+    threat_types: Optional[FrozenSet[str]] = None  # None matches any
+    severities: Optional[FrozenSet[str]] = None
+    tags: FrozenSet[str] = frozenset()  # The agent must carry all of them
+    root_causes: Tuple[str, ...] = ()  # Lower-case substrings; any one must occur in the root cause
+    priority: int = 0
+    enabled: bool = True
+
+    @property
+    def specificity(self) -> int:
+        """Number of conditions the policy sets"""
+        return sum((
+            self.threat_types is not None, self.severities is not None, bool(self.tags), bool(self.root_causes)
+        ))
+
+    @property
+    def conditional(self) -> bool:
+        """Whether the policy has conditions beyond threat type and severity"""
+        return bool(self.tags or self.root_causes)
+
+
+def _strings(value: Any, policy: str, condition: str) -> List[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not value or not all(isinstance(item, str) for item in value):
+        raise PolicyError(f"Policy '{policy}' condition '{condition}' must be a string or a list of strings")
+    return value
+
+
+def parse_policies(document: Mapping) -> List[Policy]:
+    """
+    Parse a policy document
+
+    Args:
+        document: Mapping with a ``policies`` list; each policy has a name,
+            an ``actions`` list, an optional ``priority`` and an optional
+            ``when`` mapping of threat_type, severity, tags and root_cause
+
+    Returns:
+        Parsed policies in document order
+
+    Raises:
+        PolicyError: If the document is malformed
+    """
+    if not isinstance(document, Mapping) or not isinstance(document.get("policies"), list):
+        raise PolicyError("Policy document must be a mapping with a 'policies' list")
+
+    policies, names = [], set()
+    for index, entry in enumerate(document["policies"]):
+        if not isinstance(entry, Mapping):
+            raise PolicyError(f"Policy {index} must be a mapping")
+        name = entry.get("name") or f"policy-{index}"
+        if name in names:
+            raise PolicyError(f"Duplicate policy name '{name}'")
+        names.add(name)
+
+        actions = []
+        for value in _strings(entry.get("actions"), name, "actions"):
+            try:
+                actions.append(ResponseAction(value))
+            except ValueError:
+                raise PolicyError(f"Policy '{name}' uses unknown action '{value}'") from None
+
+        when = entry.get("when") or {}
+        if not isinstance(when, Mapping):
+            raise PolicyError(f"Policy '{name}' 'when' must be a mapping")
+        unknown = set(when) - set(_CONDITIONS)
+        if unknown:
+            raise PolicyError(f"Policy '{name}' has unknown conditions: {', '.join(sorted(unknown))}")
+        conditions = {key: _strings(value, name, key) for key, value in when.items()}
+        severities = None
+        if "severity" in conditions:
+            severities = frozenset(conditions["severity"])
+            if not severities <= set(SEVERITIES):
+                raise PolicyError(f"Policy '{name}' severity must be one of {', '.join(SEVERITIES)}")
+
+        policies.append(Policy(
+            name=name,
+            actions=tuple(actions),
+            threat_types=frozenset(conditions["threat_type"]) if "threat_type" in conditions else None,
+            severities=severities,
+            tags=frozenset(conditions.get("tags", ())),
+            root_causes=tuple(term.lower() for term in conditions.get("root_cause", ())),
+            priority=int(entry.get("priority", 0)),
+            enabled=bool(entry.get("enabled", True)),
+        ))
+    return policies
+
+
+def load_policies(path: str) -> List[Policy]:
+    """Load policies from a .yaml/.yml or .json file"""
+    with open(path, "r", encoding="utf-8") as handle:
+        if path.endswith((".yaml", ".yml")):
+            import yaml  # Only needed for YAML policy files
+
+            document = yaml.safe_load(handle)
+        else:
+            document = json.load(handle)
+    return parse_policies(document)
+
+
+# (tags, root cause substrings, actions, policy name) in precedence order
+Plan = Tuple[Tuple[FrozenSet[str], Tuple[str, ...], Tuple[ResponseAction, ...], str], ...]
+
+
+class CompiledPolicies:
+    """
+    Immutable (threat_type, severity) -> plan table for a policy set
+
+    A plan lists the policies that can match a key in precedence order,
+    ending at the first policy without tag or root cause conditions.
+    Threat types no policy names share the wildcard plans.
+    """
+
+    def __init__(self, policies: List[Policy]):
+        self.policies = [policy for policy in policies if policy.enabled]
+        order = {policy.name: index for index, policy in enumerate(self.policies)}
+        ranked = sorted(self.policies, key=lambda p: (-p.priority, -p.specificity, order[p.name]))
+
+        by_type: Dict[str, List[Policy]] = {}
+        wildcard: List[Policy] = []
+        for policy in ranked:
+            if policy.threat_types is None:
+                wildcard.append(policy)
+            else:
+                for threat_type in policy.threat_types:
+                    by_type.setdefault(threat_type, []).append(policy)
+
+        rank = {policy.name: index for index, policy in enumerate(ranked)}
+        self._wildcard: Dict[str, Plan] = {}
+        self._table: Dict[Tuple[str, str], Plan] = {}
+        for severity in SEVERITIES:
+            shared = self._reachable(policy for policy in wildcard if self._has_severity(policy, severity))
+            self._wildcard[severity] = self._plan(shared)
+            for threat_type, specific in by_type.items():
+                candidates = [policy for policy in specific if self._has_severity(policy, severity)]
+                if candidates:
+                    # Interleave with the (already cut off) wildcard policies by precedence
+                    merged = sorted(candidates + shared, key=lambda p: rank[p.name])
+                    self._table[(threat_type, severity)] = self._plan(self._reachable(merged))
+
+    @staticmethod
+    def _has_severity(policy: Policy, severity: str) -> bool:
+        return policy.severities is None or severity in policy.severities
+
+    @staticmethod
+    def _reachable(policies: Iterable[Policy]) -> List[Policy]:
+        """Policies up to and including the first unconditional one; later ones can never be chosen"""
+        reachable = []
+        for policy in policies:
+            reachable.append(policy)
+            if not policy.conditional:
+                break
+        return reachable
+
+    @staticmethod
+    def _plan(policies: List[Policy]) -> Plan:
+        return tuple((policy.tags, policy.root_causes, policy.actions, policy.name) for policy in policies)
+
+    def __len__(self) -> int:
+        return len(self.policies)
+
+    def select(
+        self,
+        threat_type: str,
+        severity: str,
+        tags: FrozenSet[str] = frozenset(),
+        root_cause: str = "",
+    ) -> Tuple[str, Tuple[ResponseAction, ...]]:
+        """
+        Choose the policy for a threat
+
+        Args:
+            threat_type: The threat's type
+            severity: The threat's severity
+            tags: Tags of the affected agent
+            root_cause: The investigation's root cause
+
+        Returns:
+            Name of the chosen policy ("fallback" if none matched) and its actions
+        """
+        plan = self._table.get((threat_type, severity))
+        if plan is None:
+            plan = self._wildcard.get(severity, ())
+        cause = None
+        for required, causes, actions, name in plan:
+            if required and not required <= tags:
+                continue
+            if causes:
+                if cause is None:
+                    cause = root_cause.lower()
+                if not any(term in cause for term in causes):
+                    continue
+            return name, actions
+        return "fallback", FALLBACK_ACTIONS
+
+
+def event_tags(event: ThreatEvent) -> Iterable[str]:
+    """Agent tags carried in the event's activity (``agent_tags``)"""
+    return event.details.get("agent_tags") or ()
+
+
+class PolicyEngine:
+    """Hot-reloadable compiled response policies"""
+
+    def __init__(
+        self,
+        policies: Optional[Iterable[Policy]] = None,
+        path: Optional[str] = None,
+        tags_of: TagLookup = event_tags,
+    ):
+        """
+        Args:
+            policies: Policies to compile; the default severity table if
+                neither policies nor path is given
+            path: Policy file to load and watch
+            tags_of: Returns the tags of the agent a threat concerns
+        """
+        self.path = path
+        self.tags_of = tags_of
+        self.running = False
+        self._mtime: Optional[float] = None
+        if path is not None:
+            policies = load_policies(path)
+            self._mtime = os.stat(path).st_mtime
+        elif policies is None:
+            policies = parse_policies(DEFAULT_POLICIES)
+        self.compiled = CompiledPolicies(list(policies))
+
+    @property
+    def policies(self) -> List[Policy]:
+        return self.compiled.policies
+
+    def select(
+        self,
+        event: ThreatEvent,
+        investigation: Optional[InvestigationReport] = None
+    ) -> Tuple[str, Tuple[ResponseAction, ...]]:
+        """Name and actions of the policy chosen for a threat"""
+        tags = self.tags_of(event)
+        return self.compiled.select(
+            event.threat_type,
+            event.severity,
+            tags if isinstance(tags, frozenset) else frozenset(tags),
+            investigation.root_cause if investigation is not None else "",
+        )
+
+    def actions_for(
+        self,
+        event: ThreatEvent,
+        investigation: Optional[InvestigationReport] = None
+    ) -> Tuple[ResponseAction, ...]:
+        """Response actions for a threat"""
+        return self.select(event, investigation)[1]
+
+    def update(self, policies: Iterable[Policy]):
+        """Swap in a new policy set; responses in progress finish on the old one"""
+        self.compiled = CompiledPolicies(list(policies))
+
+    def reload(self) -> bool:
+        """
+        Reload the policy file if it changed
+
+        Returns:
+            True if new policies were loaded. A file that fails to parse is
+            logged and the current policies stay in effect.
+        """
+        if self.path is None:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self._mtime:
+                return False
+            policies = load_policies(self.path)
+        except Exception as e:
+            logger.error(f"Failed to reload response policies from {self.path}: {e}")
+            return False
+        self._mtime = mtime
+        self.update(policies)
+        logger.info(f"Loaded {len(self.compiled)} response policies from {self.path}")
+        return True
+
+    async def watch(self, interval: float = 2.0):
+        """Poll the policy file and reload it on change until stopped"""
+        self.running = True
+        while self.running:
+            await asyncio.sleep(interval)
+            self.reload()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,231 @@
+"""
+Agent Rate Limiting
+
+In-process enforcement table behind ResponseAction.RATE_LIMIT. Each
+limited agent gets a GCRA (generic cell rate algorithm) limit: a single
+theoretical arrival time per agent, refilled lazily on each check, so
+there are no timers and no per-agent objects. Limit state lives in flat
+``array('d')`` columns indexed by an interned row, and agents that were
+never limited cost one dict miss per check.
+
+Limits adapt to the agent: the allowed rate shrinks with the event's
+risk score and with how far the agent's activity volume is above its
+baseline.
+
+Limits are enforced where activity leaves the detector: the ingestion
+pipeline keeps scoring every record and only holds back, from its
+``forward`` consumer, the records of agents over their allowance. A
+pipeline without a forward consumer records limits but throttles
+nothing.
+"""
+
+import logging
+import time
+from array import array
+from typing import Callable, Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+from .baseline import is_metric
+from .baseline_store import BaselineView
+
+logger = logging.getLogger(__name__)
+
+BaselineLookup = Callable[[str], Optional[BaselineView]]
+
+
+class RateLimiter:
+    """Per-agent GCRA rate limits with lazy refill and lazy expiry"""
+
+    def __init__(
+        self,
+        base_rate: float = 10.0,
+        min_rate: float = 0.1,
+        burst_seconds: float = 2.0,
+        duration: float = 900.0,
+        baseline_of: Optional[BaselineLookup] = None,
+        volume_metric: str = "api_calls",
+        sweep_every: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            base_rate: Events per second allowed for a zero-risk agent at its baseline volume
+            min_rate: Floor for the allowed rate, however risky the agent
+            burst_seconds: Seconds of the allowed rate that may arrive at once
+            duration: Seconds a limit lasts at risk 0.5; scaled by 0.5 + risk
+            baseline_of: Returns an agent's baseline, used to scale the rate
+                by baseline volume / observed volume
+            volume_metric: Activity field measuring the agent's volume
+            sweep_every: Limits applied between sweeps of expired entries
+            clock: Monotonic clock, injectable for tests
+        """
+        self.base_rate = base_rate
+        self.min_rate = min_rate
+        self.burst_seconds = burst_seconds
+        self.duration = duration
+        self.baseline_of = baseline_of
+        self.volume_metric = volume_metric
+        self.sweep_every = sweep_every
+        self.clock = clock
+        self.stats = {"limited": 0, "denied": 0, "expired": 0}
+
+        self._rows: Dict[str, int] = {}
+        self._agents: List[Optional[str]] = []
+        self._free: List[int] = []
+        # Theoretical arrival time, seconds per event, burst window and expiry, one slot per row
+        self._tat = array("d")
+        self._interval = array("d")
+        self._span = array("d")
+        self._expires = array("d")
+        self._since_sweep = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, agent_id: str) -> bool:
+        return agent_id in self._rows
+
+    def allow(self, agent_id: str, cost: float = 1.0) -> bool:
+        """
+        Check and consume one event (or cost events) of an agent's allowance
+
+        Returns:
+            True when the agent is unlimited or within its limit
+        """
+        row = self._rows.get(agent_id)
+        if row is None:
+            return True
+        now = self.clock()
+        if now >= self._expires[row]:
+            self._release_row(agent_id, row)
+            self.stats["expired"] += 1
+            return True
+        tat = self._tat[row]
+        if tat < now:
+            tat = now  # Idle time refills the allowance, up to the burst
+        tat += self._interval[row] * cost
+        if tat - now > self._span[row]:
+            self.stats["denied"] += 1
+            return False
+        self._tat[row] = tat
+        return True
+
+    def allow_many(self, agent_ids: Iterable[str]) -> List[bool]:
+        """allow() for each agent ID, in order"""
+        if not self._rows:
+            return [True for _ in agent_ids]
+        allow = self.allow
+        return [allow(agent_id) for agent_id in agent_ids]
+
+    def rate_for(self, agent_id: str, risk_score: float, activity: Optional[Mapping] = None) -> float:
+        """Events per second an agent is allowed after an event with this risk score"""
+        rate = self.base_rate * self._baseline_scale(agent_id, activity) * (1.0 - min(max(risk_score, 0.0), 1.0))
+        return max(self.min_rate, rate)
+
+    def limit(self, agent_id: str, risk_score: float, activity: Optional[Mapping] = None) -> float:
+        """
+        Limit an agent, or tighten and extend its existing limit
+
+        An active limit is never loosened by a lower-risk event.
+
+        Args:
+            agent_id: Agent to limit
+            risk_score: Risk score of the event that triggered the limit
+            activity: The event's activity, compared against the agent's baseline volume
+
+        Returns:
+            The allowed rate in events per second
+        """
+        rate = self.rate_for(agent_id, risk_score, activity)
+        now = self.clock()
+        expires = now + self.duration * (0.5 + risk_score)
+        interval = 1.0 / rate
+        row = self._rows.get(agent_id)
+        if row is not None and now < self._expires[row]:
+            if interval > self._interval[row]:
+                self._interval[row] = interval
+                self._span[row] = max(interval, self.burst_seconds)
+            self._expires[row] = max(self._expires[row], expires)
+            return 1.0 / self._interval[row]
+
+        if row is None:
+            row = self._allocate(agent_id)
+        self._tat[row] = now
+        self._interval[row] = interval
+        self._span[row] = max(interval, self.burst_seconds)  # Always allow at least one event
+        self._expires[row] = expires
+        self.stats["limited"] += 1
+
+        self._since_sweep += 1
+        if self._since_sweep >= self.sweep_every:
+            self.expire(now)
+        return rate
+
+    def release(self, agent_id: str):
+        """Lift an agent's limit, e.g. after remediation"""
+        row = self._rows.get(agent_id)
+        if row is not None:
+            self._release_row(agent_id, row)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """
+        Drop every limit that has lapsed
+
+        Lapsed limits are also dropped when their agent is next checked;
+        this sweep reclaims entries for agents that went quiet.
+
+        Returns:
+            Number of entries dropped
+        """
+        self._since_sweep = 0
+        if not self._rows:
+            return 0
+        now = self.clock() if now is None else now
+        expires = np.frombuffer(self._expires, dtype=np.float64)
+        lapsed = np.flatnonzero(expires <= now).tolist()
+        del expires  # The view must go before the columns can grow again
+        dropped = 0
+        for row in lapsed:
+            agent_id = self._agents[row]
+            if agent_id is not None:
+                self._release_row(agent_id, row)
+                dropped += 1
+        self.stats["expired"] += dropped
+        return dropped
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the limit columns"""
+        return sum(column.itemsize * len(column) for column in (self._tat, self._interval, self._span, self._expires))
+
+    def _baseline_scale(self, agent_id: str, activity: Optional[Mapping]) -> float:
+        """Baseline volume over observed volume, capped at 1; 1 when either is unknown"""
+        if self.baseline_of is None or not activity:
+            return 1.0
+        value = activity.get(self.volume_metric)
+        if not is_metric(value) or value <= 0:
+            return 1.0
+        baseline = self.baseline_of(agent_id)
+        stat = baseline.metrics.get(self.volume_metric) if baseline is not None else None
+        if stat is None or stat.count < 2 or stat.mean <= 0:
+            return 1.0
+        return min(1.0, stat.mean / float(value))
+
+    def _allocate(self, agent_id: str) -> int:
+        if self._free:
+            row = self._free.pop()
+            self._agents[row] = agent_id
+        else:
+            row = len(self._agents)
+            self._agents.append(agent_id)
+            for column in (self._tat, self._interval, self._span, self._expires):
+                column.append(0.0)
+        self._rows[agent_id] = row
+        return row
+
+    def _release_row(self, agent_id: str, row: int):
+        del self._rows[agent_id]
+        self._agents[row] = None
+        self._expires[row] = float("inf")  # Free rows never match a sweep
+        self._free.append(row)
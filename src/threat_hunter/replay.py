@@ -0,0 +1,471 @@
+"""
+Activity Replay
+
+Backtests detection changes against archived activity. Replays JSON-lines
+(plain or gzip) and Parquet archives through detect -> investigate ->
+respond as fast as the hardware allows, on a replay clock driven by the
+records' own timestamps, with responses recorded by a dry-run responder
+instead of executed.
+
+Detection is stateless given a baseline snapshot, so archives are split
+into chunks that worker processes read, decode and score in parallel:
+plain JSON-lines by newline-aligned byte range, Parquet by row group and
+gzip by file (a gzip stream cannot be entered mid-way). The parent
+consumes chunk results in archive order, so correlation windows,
+investigation and response see events in the order they happened.
+
+Usage:
+    python -m src.threat_hunter.replay logs/2024-05-*.jsonl.gz --snapshot baselines.snap --workers 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from .correlation import CorrelationEngine
+from .detector import ThreatDetector, ThreatEvent
+from .ingestion import decode_ndjson
+from .investigator import InvestigationReport, ThreatInvestigator
+from .responder import ResponseAction, ResponseResult, ThreatResponder
+
+logger = logging.getLogger(__name__)
+
+# (kind, path, start, end): byte range of a JSON-lines file, a whole gzip
+# file (start and end unused) or a Parquet row group (start is its index)
+ChunkTask = Tuple[str, str, int, int]
+
+_GZIP_BLOCK = 4 << 20
+
+
+class ReplayClock:
+    """Clock for replayed events; callable like datetime.now"""
+
+    def __init__(self, start: Optional[datetime] = None):
+        self.now = start or datetime.fromtimestamp(0)
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self, moment: datetime):
+        """Move the clock forward to moment; never moves it back"""
+        if moment > self.now:
+            self.now = moment
+
+
+class DryRunResponder(ThreatResponder):
+    """ThreatResponder that records the actions it would take instead of taking them"""
+
+    def __init__(self, config: Optional[Dict] = None, clock: Callable[[], datetime] = datetime.now):
+        # No platform, alerts, store or limiter: every action ends in _dispatch_action
+        super().__init__(config, clock=clock)
+        self.actions: Counter = Counter()
+
+    async def _dispatch_action(
+        self,
+        action: ResponseAction,
+        event: ThreatEvent,
+        investigation: Optional[InvestigationReport]
+    ) -> ResponseResult:
+        self.actions[action.value] += 1
+        return ResponseResult(action, True, f"Dry run: {action.value} {event.agent_id}", self.clock())
+
+
+@dataclass
+class ChunkResult:
+    """Detection output of one chunk, returned by a worker"""
+    records: int
+    rejected: int
+    threats: List[ThreatEvent]
+    candidates: List[Tuple[str, float, Dict]]  # (agent_id, risk, activity) for correlation
+    latest_time: Optional[float] = None  # Latest event time in the chunk, to advance the correlation watermark
+
+
+@dataclass
+class ReplayReport:
+    """Counts and throughput of a replay"""
+    files: int = 0
+    chunks: int = 0
+    records: int = 0
+    rejected: int = 0
+    threats: int = 0
+    composites: int = 0
+    by_severity: Dict[str, int] = field(default_factory=dict)
+    by_threat_type: Dict[str, int] = field(default_factory=dict)
+    actions: Dict[str, int] = field(default_factory=dict)
+    first_event: Optional[datetime] = None
+    last_event: Optional[datetime] = None
+    seconds: float = 0.0
+
+    @property
+    def records_per_sec(self) -> float:
+        return self.records / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "files": self.files,
+            "chunks": self.chunks,
+            "records": self.records,
+            "rejected": self.rejected,
+            "threats": self.threats,
+            "composites": self.composites,
+            "by_severity": dict(self.by_severity),
+            "by_threat_type": dict(self.by_threat_type),
+            "actions": dict(self.actions),
+            "first_event": self.first_event.isoformat() if self.first_event else None,
+            "last_event": self.last_event.isoformat() if self.last_event else None,
+            "seconds": round(self.seconds, 3),
+            "records_per_sec": round(self.records_per_sec, 1),
+        }
+
+
+def record_time(activity: Mapping, time_field: str = "timestamp") -> Optional[datetime]:
+    """
+    Event time of an activity record (epoch seconds or ISO 8601), if it has one
+
+    Returned as naive local time like datetime.now, so times with an offset
+    (``2024-05-01T00:00:00Z``) compare with the replay clock and with the
+    times of other records.
+    """
+    value = activity.get(time_field)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo is None else value.astimezone().replace(tzinfo=None)
+    return None
+
+
+def plan_chunks(paths: Sequence[str], chunk_bytes: int = 16 << 20) -> Iterator[ChunkTask]:
+    """Split archives into chunk tasks, in archive order"""
+    for path in paths:
+        if path.endswith(".parquet"):
+            for index in range(_parquet_file(path).num_row_groups):
+                yield ("parquet", path, index, 0)
+        elif path.endswith(".gz"):
+            yield ("gzip", path, 0, 0)
+        else:
+            size = os.path.getsize(path)
+            for start in range(0, max(size, 1), chunk_bytes):
+                yield ("jsonl", path, start, min(start + chunk_bytes, size))
+
+
+def read_range(path: str, start: int, end: int) -> bytes:
+    """
+    Lines of a JSON-lines file that start within [start, end)
+
+    A line straddling a boundary belongs to the chunk it starts in, so
+    adjacent ranges together read every line exactly once.
+    """
+    with open(path, "rb") as handle:
+        if start > 0:
+            handle.seek(start - 1)
+            handle.readline()  # Finish the line the previous range owns
+            start = handle.tell()
+        if start >= end:
+            return b""
+        data = handle.read(end - start)
+        if data and not data.endswith(b"\n"):
+            data += handle.readline()
+    return data
+
+
+def read_gzip_blocks(path: str, block_size: int = _GZIP_BLOCK) -> Iterator[bytes]:
+    """Decompress a (possibly multi-member) gzip file into blocks of whole lines"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    tail = b""
+    with open(path, "rb") as handle:
+        while True:
+            compressed = handle.read(block_size)
+            if not compressed:
+                break
+            while compressed:
+                data = decompressor.decompress(compressed)
+                compressed = b""
+                if decompressor.eof:  # Next member of a concatenated file
+                    compressed = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                cut = data.rfind(b"\n") + 1
+                if cut:
+                    yield tail + data[:cut]
+                    tail = data[cut:]
+                else:
+                    tail += data
+    if tail:
+        yield tail
+
+
+def _parquet_file(path: str):
+    try:
+        import pyarrow.parquet as pq  # Optional; only needed for Parquet archives
+    except ImportError as e:
+        raise RuntimeError("Replaying Parquet archives requires pyarrow") from e
+    return pq.ParquetFile(path)
+
+
+class _Collector:
+    """Stands in for the detector's correlator, keeping candidates for the parent's"""
+
+    def __init__(self, min_risk: float, time_field: str = "timestamp"):
+        self.min_risk = min_risk
+        self.time_field = time_field
+        self.candidates: List[Tuple[str, float, Dict]] = []
+        self.latest_time: Optional[float] = None
+
+    def observe(self, agent_id: str, risk_score: float, activity: Optional[Mapping] = None):
+        if risk_score >= self.min_risk:
+            self.candidates.append((agent_id, risk_score, activity))
+
+    def observe_times(self, activities: Iterable[Mapping]):
+        moments = [record_time(activity, self.time_field) for activity in activities]
+        times = [moment.timestamp() for moment in moments if moment is not None]
+        if times and (self.latest_time is None or max(times) > self.latest_time):
+            self.latest_time = max(times)
+
+    def take(self) -> Tuple[List[Tuple[str, float, Dict]], Optional[float]]:
+        """Candidates and the latest event time seen since the last take"""
+        candidates, self.candidates = self.candidates, []
+        latest_time, self.latest_time = self.latest_time, None
+        return candidates, latest_time
+
+
+class ChunkDetector:
+    """Reads, decodes and scores chunk tasks; one per worker process"""
+
+    def __init__(
+        self,
+        config: Optional[Dict] = None,
+        snapshot_path: Optional[str] = None,
+        model_dir: Optional[str] = None,
+        min_risk: Optional[float] = None,
+        batch_size: int = 512,
+        time_field: str = "timestamp",
+    ):
+        models = None
+        if model_dir:
+            from .models import ModelEngine
+            models = ModelEngine(model_dir)
+        self.collector = _Collector(min_risk, time_field) if min_risk is not None else None
+        self.detector = ThreatDetector(config, models=models, correlator=self.collector)
+        if snapshot_path:
+            from .snapshot import load_snapshot
+            self.detector.baselines = load_snapshot(snapshot_path)
+        self.batch_size = batch_size
+        self.time_field = time_field
+
+    def run(self, task: ChunkTask) -> ChunkResult:
+        kind, path, start, end = task
+        if kind == "parquet":
+            records = _parquet_file(path).read_row_group(start).to_pylist()
+            return self._detect(records, 0)
+        if kind == "gzip":
+            results = [self._detect(*decode_ndjson(block)) for block in read_gzip_blocks(path)]
+            return ChunkResult(
+                records=sum(result.records for result in results),
+                rejected=sum(result.rejected for result in results),
+                threats=[threat for result in results for threat in result.threats],
+                candidates=[candidate for result in results for candidate in result.candidates],
+                latest_time=max(
+                    (result.latest_time for result in results if result.latest_time is not None), default=None
+                ),
+            )
+        return self._detect(*decode_ndjson(read_range(path, start, end)))
+
+    def _detect(self, records: List[Dict], rejected: int) -> ChunkResult:
+        threats = []
+        for offset in range(0, len(records), self.batch_size):
+            with self.detector.extract_features(records[offset:offset + self.batch_size]) as features:
+                threats.extend(self.detector.detect_features(features))
+        for threat in threats:
+            # Stamp threats with when the activity happened, not when it was replayed
+            threat.timestamp = record_time(threat.details, self.time_field) or threat.timestamp
+        candidates, latest_time = self.collector.take() if self.collector is not None else ([], None)
+        return ChunkResult(len(records), rejected, threats, candidates, latest_time)
+
+
+_worker: Optional[ChunkDetector] = None
+
+
+def _init_worker(*args):
+    global _worker
+    _worker = ChunkDetector(*args)
+
+
+def _run_chunk(task: ChunkTask) -> ChunkResult:
+    return _worker.run(task)
+
+
+class ReplayEngine:
+    """Replays archived activity through detection, investigation and dry-run response"""
+
+    def __init__(
+        self,
+        config: Optional[Dict] = None,
+        snapshot_path: Optional[str] = None,
+        model_dir: Optional[str] = None,
+        workers: Optional[int] = None,
+        chunk_bytes: int = 16 << 20,
+        batch_size: int = 512,
+        correlate: bool = True,
+        start_method: str = "spawn",
+    ):
+        """
+        Args:
+            config: Detector configuration, as for ThreatDetector
+            snapshot_path: Baseline snapshot to score against
+            model_dir: Directory of anomaly models, if any
+            workers: Worker processes; 0 scores chunks in-process
+            chunk_bytes: Size of the byte ranges plain JSON-lines files are split into
+            batch_size: Records per feature-extracted detection batch
+            correlate: Run windowed correlation over the replayed events
+            start_method: multiprocessing start method for the workers
+        """
+        self.config = config or {}
+        self.snapshot_path = snapshot_path
+        self.model_dir = model_dir
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.chunk_bytes = chunk_bytes
+        self.batch_size = batch_size
+        self.start_method = start_method
+        self.clock = ReplayClock()
+        self.correlator = CorrelationEngine() if correlate else None
+        self.investigator = ThreatInvestigator({"offload_cpu_bound": False}, clock=self.clock)
+        self.responder = DryRunResponder(clock=self.clock)
+
+    def run(self, paths: Sequence[str]) -> ReplayReport:
+        """Synchronous wrapper around replay()"""
+        return asyncio.run(self.replay(paths))
+
+    async def replay(self, paths: Sequence[str]) -> ReplayReport:
+        """Replay archives, in the order given, and report what happened"""
+        report = ReplayReport(files=len(paths))
+        severities: Counter = Counter()
+        threat_types: Counter = Counter()
+        started = time.perf_counter()
+
+        async for result in self._results(plan_chunks(paths, self.chunk_bytes)):
+            report.chunks += 1
+            report.records += result.records
+            report.rejected += result.rejected
+            threats = list(result.threats)
+            if self.correlator is not None:
+                for agent_id, risk, activity in result.candidates:
+                    self.correlator.observe(agent_id, risk, activity)
+                if result.latest_time is not None:
+                    self.correlator.observe_time(result.latest_time)
+                composites = self.correlator.drain()
+                report.composites += len(composites)
+                threats.extend(composites)
+            for threat in threats:
+                await self._handle(threat, report)
+                severities[threat.severity] += 1
+                threat_types[threat.threat_type] += 1
+
+        if self.correlator is not None:
+            self.correlator.flush()
+            composites = self.correlator.drain()
+            report.composites += len(composites)
+            for threat in composites:
+                await self._handle(threat, report)
+                severities[threat.severity] += 1
+                threat_types[threat.threat_type] += 1
+
+        report.seconds = time.perf_counter() - started
+        report.by_severity = dict(severities)
+        report.by_threat_type = dict(threat_types)
+        report.actions = dict(self.responder.actions)
+        logger.info(
+            f"Replayed {report.records} records in {report.seconds:.1f}s "
+            f"({report.records_per_sec:.0f}/s): {report.threats} threats"
+        )
+        return report
+
+    async def _handle(self, threat: ThreatEvent, report: ReplayReport):
+        self.clock.advance(threat.timestamp)
+        investigation = await self.investigator.investigate(threat)
+        await self.responder.respond(threat, investigation)
+        report.threats += 1
+        if report.first_event is None or threat.timestamp < report.first_event:
+            report.first_event = threat.timestamp
+        if report.last_event is None or threat.timestamp > report.last_event:
+            report.last_event = threat.timestamp
+
+    async def _results(self, tasks: Iterator[ChunkTask]):
+        """Chunk results in task order, with a bounded number of chunks in flight"""
+        init_args = (
+            self.config,
+            self.snapshot_path,
+            self.model_dir,
+            self.correlator.min_risk if self.correlator is not None else None,
+            self.batch_size,
+            self.correlator.time_field if self.correlator is not None else "timestamp",
+        )
+        if self.workers == 0:
+            chunk_detector = ChunkDetector(*init_args)
+            for task in tasks:
+                yield chunk_detector.run(task)
+            return
+
+        executor: Executor = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_worker,
+            initargs=init_args,
+        )
+        pending: deque = deque()
+        try:
+            for task in tasks:
+                pending.append(asyncio.wrap_future(executor.submit(_run_chunk, task)))
+                if len(pending) >= 2 * self.workers:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay archived agent activity through threat detection")
+    parser.add_argument("paths", nargs="+", help="JSON-lines (.jsonl, .jsonl.gz) or Parquet archives, in time order")
+    parser.add_argument("--snapshot", help="Baseline snapshot to score against")
+    parser.add_argument("--rules", help="Detection rules file")
+    parser.add_argument("--model-dir", help="Directory of anomaly models")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-mb", type=int, default=16, help="Chunk size for plain JSON-lines files")
+    parser.add_argument("--no-correlation", action="store_true")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    engine = ReplayEngine(
+        {"rules_path": args.rules} if args.rules else None,
+        snapshot_path=args.snapshot,
+        model_dir=args.model_dir,
+        workers=args.workers,
+        chunk_bytes=args.chunk_mb << 20,
+        correlate=not args.no_correlation,
+    )
+    report = engine.run(args.paths).to_dict()
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
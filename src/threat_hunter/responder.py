@@ -5,14 +5,23 @@ Automated response system that takes action to contain and remediate threats.
 """
 
 import logging
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional
 from enum import Enum
 from dataclasses import dataclass
 from datetime import datetime
 
+from . import metrics
 from .detector import ThreatEvent
 from .investigator import InvestigationReport
 
+if TYPE_CHECKING:
+    from .alerting import AlertAggregator
+    from .policies import PolicyEngine
+    from .ratelimit import RateLimiter
+    from .response_executor import AgentPlatform
+    from .store import ThreatStore
+
 logger = logging.getLogger(__name__)
 
 
@@ -30,92 +39,183 @@ class ResponseAction(Enum):
 @dataclass
 class ResponseResult:
     """Result of a response action"""
+    __slots__ = ("action", "success", "message", "timestamp")
+
     action: ResponseAction
     success: bool
     message: str
     timestamp: datetime
 
 
+def action_latency(action: ResponseAction) -> metrics.LatencyHistogram:
+    """Latency histogram for a response action"""
+    return metrics.histogram("threat_hunter_response_action_seconds", "Response action latency", action=action.value)
+
+
+def count_action(result: ResponseResult):
+    """Count a response action by outcome"""
+    metrics.counter(
+        "threat_hunter_response_actions_total",
+        "Response actions executed",
+        action=result.action.value,
+        outcome="success" if result.success else "failure"
+    ).inc()
+
+
 class ThreatResponder:
     """Autonomous threat response engine"""
     
-    def __init__(self, config: Optional[Dict] = None):
+    def __init__(
+        self,
+        config: Optional[Dict] = None,
+        platform: Optional["AgentPlatform"] = None,
+        alerts: Optional["AlertAggregator"] = None,
+        store: Optional["ThreatStore"] = None,
+        limiter: Optional["RateLimiter"] = None,
+        clock: Callable[[], datetime] = datetime.now,
+        policies: Optional["PolicyEngine"] = None
+    ):
         self.config = config or {}
-        self.response_policies = self._load_policies()
+        self.clock = clock
+        if policies is None:
+            # Imported here: the policy module builds on this one
+            from .policies import PolicyEngine
+            policies = PolicyEngine(path=self.config.get("policies_path"))
+        self.policies = policies
+        # Keys of recent responses; a redelivered event with a known key is not acted on twice
+        self._responded: "OrderedDict[str, None]" = OrderedDict()
+        self.max_response_keys = self.config.get("max_response_keys", 100000)
+        self._handlers = self._dispatch_table()
+        self.alerts = alerts
+        self.store = store
+        self.limiter = limiter
+        self.executor = None
+        if platform is not None:
+            # Imported here: the executor module builds on this one
+            from .response_executor import ResponseExecutor
+            self.executor = ResponseExecutor(
+                platform,
+                self._execute_action,
+                batch_window=self.config.get("response_batch_window", 0.01),
+                max_batch=self.config.get("response_max_batch", 500),
+                clock=clock,
+                containment_ttl=self.config.get("response_containment_ttl", 3600.0),
+                max_contained=self.config.get("response_max_contained", 100000)
+            )
         
-    def _load_policies(self) -> Dict:
-        """Load response policies"""
+    def _dispatch_table(self) -> Dict[ResponseAction, Callable[..., Awaitable[ResponseResult]]]:
+        """Handler for each action, taking (event, investigation); resolved once, not per dispatch"""
         return {
-            "critical": [ResponseAction.ISOLATE, ResponseAction.REVOKE_CREDENTIALS, ResponseAction.ALERT],
-            "high": [ResponseAction.RATE_LIMIT, ResponseAction.ALERT],
-            "medium": [ResponseAction.MONITOR, ResponseAction.ALERT],
-            "low": [ResponseAction.MONITOR]
+            ResponseAction.ISOLATE: lambda event, investigation: self._isolate_agent(event.agent_id),
+            ResponseAction.REVOKE_CREDENTIALS: lambda event, investigation: self._revoke_credentials(event.agent_id),
+            ResponseAction.RATE_LIMIT: lambda event, investigation: self._rate_limit_agent(event.agent_id),
+            ResponseAction.ALERT: self._send_alert,
+            ResponseAction.MONITOR: lambda event, investigation: self._monitor_agent(event.agent_id),
         }
         
-    async def respond(self, threat_event: ThreatEvent, investigation: InvestigationReport) -> List[ResponseResult]:
+    async def respond(
+        self,
+        threat_event: ThreatEvent,
+        investigation: InvestigationReport,
+        key: Optional[str] = None
+    ) -> List[ResponseResult]:
         """
         Automatically respond to a threat
         
         Args:
             threat_event: The threat event
             investigation: Investigation report
+            key: Idempotency key; a threat delivered again with the key of
+                a response already made in this process is skipped, and the
+                key is handed to the agent platform so it can drop actions
+                it already applied before a restart
             
         Returns:
-            List of response results
+            List of response results (empty for a skipped redelivery)
         """
+        if key is not None:
+            if key in self._responded:
+                logger.info(f"Skipping redelivered threat for agent {threat_event.agent_id} (response key {key})")
+                return []
+            self._responded[key] = None
+            if len(self._responded) > self.max_response_keys:
+                self._responded.popitem(last=False)
         logger.info(f"Responding to {threat_event.severity} threat: {threat_event.threat_type}")
         
-        # Get appropriate response actions based on severity
-        actions = self.response_policies.get(threat_event.severity, [ResponseAction.MONITOR])
+        # Actions of the policy matching the threat, its agent and the root cause found
+        actions = self.policies.actions_for(threat_event, investigation)
+        if self.limiter is not None and ResponseAction.RATE_LIMIT in actions:
+            # Enforced in-process at once; the RATE_LIMIT action mirrors it to the agent platform
+            self.limiter.limit(threat_event.agent_id, threat_event.risk_score, threat_event.details)
         
-        results = []
-        for action in actions:
-            result = await self._execute_action(action, threat_event)
-            results.append(result)
-            
+        if self.executor is not None:
+            results = await self.executor.execute(threat_event, actions, investigation, key)
+        else:
+            results = []
+            for action in actions:
+                result = await self._execute_action(action, threat_event, investigation)
+                results.append(result)
+
+        if self.store is not None:
+            self.store.record(investigation, results)
         return results
         
-    async def _execute_action(self, action: ResponseAction, event: ThreatEvent) -> ResponseResult:
+    async def _execute_action(
+        self,
+        action: ResponseAction,
+        event: ThreatEvent,
+        investigation: Optional[InvestigationReport] = None
+    ) -> ResponseResult:
         """Execute a response action"""
+        latency = action_latency(action)
+        started = latency.start()
+        result = await self._dispatch_action(action, event, investigation)
+        latency.observe_since(started)
+        count_action(result)
+        return result
+
+    async def _dispatch_action(
+        self,
+        action: ResponseAction,
+        event: ThreatEvent,
+        investigation: Optional[InvestigationReport]
+    ) -> ResponseResult:
+        """Route an action to its handler"""
+        handler = self._handlers.get(action)
+        if handler is None:
+            return ResponseResult(action, False, f"Unknown action: {action}", self.clock())
         try:
-            if action == ResponseAction.ISOLATE:
-                return await self._isolate_agent(event.agent_id)
-            elif action == ResponseAction.REVOKE_CREDENTIALS:
-                return await self._revoke_credentials(event.agent_id)
-            elif action == ResponseAction.RATE_LIMIT:
-                return await self._rate_limit_agent(event.agent_id)
-            elif action == ResponseAction.ALERT:
-                return await self._send_alert(event)
-            elif action == ResponseAction.MONITOR:
-                return await self._monitor_agent(event.agent_id)
-            else:
-                return ResponseResult(action, False, f"Unknown action: {action}", datetime.now())
+            return await handler(event, investigation)
         except Exception as e:
             logger.error(f"Error executing action {action}: {e}")
-            return ResponseResult(action, False, str(e), datetime.now())
+            return ResponseResult(action, False, str(e), self.clock())
             
     async def _isolate_agent(self, agent_id: str) -> ResponseResult:
         """Isolate an agent from the network"""
         # Placeholder: Real implementation would call agent platform APIs
         logger.info(f"Isolating agent {agent_id}")
-        return ResponseResult(ResponseAction.ISOLATE, True, f"Agent {agent_id} isolated", datetime.now())
+        return ResponseResult(ResponseAction.ISOLATE, True, f"Agent {agent_id} isolated", self.clock())
         
     async def _revoke_credentials(self, agent_id: str) -> ResponseResult:
         """Revoke agent credentials"""
         logger.info(f"Revoking credentials for agent {agent_id}")
-        return ResponseResult(ResponseAction.REVOKE_CREDENTIALS, True, f"Credentials revoked for {agent_id}", datetime.now())
+        return ResponseResult(ResponseAction.REVOKE_CREDENTIALS, True, f"Credentials revoked for {agent_id}", self.clock())
         
     async def _rate_limit_agent(self, agent_id: str) -> ResponseResult:
         """Rate limit agent activity"""
         logger.info(f"Rate limiting agent {agent_id}")
-        return ResponseResult(ResponseAction.RATE_LIMIT, True, f"Rate limit applied to {agent_id}", datetime.now())
+        return ResponseResult(ResponseAction.RATE_LIMIT, True, f"Rate limit applied to {agent_id}", self.clock())
         
-    async def _send_alert(self, event: ThreatEvent) -> ResponseResult:
+    async def _send_alert(self, event: ThreatEvent, investigation: Optional[InvestigationReport] = None) -> ResponseResult:
         """Send alert to security team"""
+        if self.alerts is not None:
+            root_cause = investigation.root_cause if investigation is not None else ""
+            message = await self.alerts.submit(event, root_cause)
+            return ResponseResult(ResponseAction.ALERT, True, message, self.clock())
         logger.warning(f"ALERT: {event.severity} threat detected - {event.threat_type}")
-        return ResponseResult(ResponseAction.ALERT, True, "Alert sent to security team", datetime.now())
+        return ResponseResult(ResponseAction.ALERT, True, "Alert sent to security team", self.clock())
         
     async def _monitor_agent(self, agent_id: str) -> ResponseResult:
         """Monitor agent activity"""
         logger.info(f"Monitoring agent {agent_id}")
-        return ResponseResult(ResponseAction.MONITOR, True, f"Monitoring {agent_id}", datetime.now())
+        return ResponseResult(ResponseAction.MONITOR, True, f"Monitoring {agent_id}", self.clock())
@@ -0,0 +1,267 @@
+"""
+Response Executor
+
+Executes response actions concurrently, skips containment that is already
+in place and batches the same action across many agents into one bulk
+call against the agent platform. Threats carrying an idempotency key
+pass it to the platform, which applies an action at most once per key,
+so a threat redelivered after a restart is not acted on twice.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .detector import ThreatEvent
+from .investigator import InvestigationReport
+from .responder import ResponseAction, ResponseResult, action_latency, count_action
+
+logger = logging.getLogger(__name__)
+
+# Actions carried out on the agent platform; applying them twice is a no-op
+PLATFORM_ACTIONS = frozenset({
+    ResponseAction.ISOLATE,
+    ResponseAction.QUARANTINE,
+    ResponseAction.REVOKE_CREDENTIALS,
+    ResponseAction.ROLLBACK,
+    ResponseAction.RATE_LIMIT,
+    ResponseAction.MONITOR,
+})
+
+BulkResult = Dict[str, Tuple[bool, str]]
+Fallback = Callable[[ResponseAction, ThreatEvent, Optional[InvestigationReport]], Awaitable[ResponseResult]]
+
+
+class AgentPlatform:
+    """Backend applying response actions to agents in bulk"""
+
+    async def execute(
+        self,
+        action: ResponseAction,
+        agent_ids: List[str],
+        keys: Optional[Dict[str, List[str]]] = None
+    ) -> BulkResult:
+        """
+        Apply one action to many agents
+
+        Args:
+            action: Action to apply
+            agent_ids: Agents to apply it to
+            keys: Idempotency keys of the threats each agent is acted on
+                for, where they have them (several threats can share one
+                request). The action must be applied at most once per key:
+                a request carrying any key already applied is a no-op, and
+                otherwise every key it carries is recorded as applied
+
+        Returns:
+            (success, message) for each agent ID
+        """
+        raise NotImplementedError
+
+
+class LoggingAgentPlatform(AgentPlatform):
+    """Placeholder backend that only logs the bulk calls"""
+
+    async def execute(
+        self,
+        action: ResponseAction,
+        agent_ids: List[str],
+        keys: Optional[Dict[str, List[str]]] = None
+    ) -> BulkResult:
+        # Placeholder: Real implementation would call agent platform bulk APIs
+        logger.info(f"Applying {action.value} to {len(agent_ids)} agents")
+        return {agent_id: (True, f"{action.value} applied to {agent_id}") for agent_id in agent_ids}
+
+
+class FakeAgentPlatform(AgentPlatform):
+    """In-memory backend for tests that records every bulk call and the actions applied"""
+
+    def __init__(self, latency: float = 0.0, failing_agents: Optional[Set[str]] = None):
+        self.latency = latency
+        self.failing_agents = failing_agents or set()
+        self.calls: List[Tuple[ResponseAction, List[str]]] = []
+        self.applied: List[Tuple[ResponseAction, str]] = []
+        self._keys: Set[Tuple[ResponseAction, str]] = set()
+
+    async def execute(
+        self,
+        action: ResponseAction,
+        agent_ids: List[str],
+        keys: Optional[Dict[str, List[str]]] = None
+    ) -> BulkResult:
+        self.calls.append((action, list(agent_ids)))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        keys = keys or {}
+        results = {}
+        for agent_id in agent_ids:
+            agent_keys = keys.get(agent_id, [])
+            applied = next((key for key in agent_keys if (action, key) in self._keys), None)
+            if agent_id in self.failing_agents:
+                results[agent_id] = (False, f"{action.value} failed for {agent_id}")
+            elif applied is not None:
+                self._keys.update((action, key) for key in agent_keys)
+                results[agent_id] = (True, f"{action.value} already applied for {applied}")
+            else:
+                self._keys.update((action, key) for key in agent_keys)
+                self.applied.append((action, agent_id))
+                results[agent_id] = (True, f"{action.value} applied to {agent_id}")
+        return results
+
+
+class ResponseExecutor:
+    """
+    Concurrent, deduplicating, batching executor for response actions
+
+    Containment applied to an agent is remembered for containment_ttl
+    seconds, or until released after remediation, so repeated threats do
+    not re-apply it. At most max_contained agents are remembered; past
+    that the least recently contained are forgotten, which only means
+    their next containment is sent to the platform again.
+    """
+
+    def __init__(
+        self,
+        platform: AgentPlatform,
+        fallback: Fallback,
+        batch_window: float = 0.01,
+        max_batch: int = 500,
+        clock: Callable[[], datetime] = datetime.now,
+        containment_ttl: float = 3600.0,
+        max_contained: int = 100000,
+    ):
+        self.platform = platform
+        self.clock = clock
+        self.fallback = fallback
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.containment_ttl = timedelta(seconds=containment_ttl)
+        self.max_contained = max_contained
+        # Agent -> action -> when it was applied, least recently contained agent first
+        self.containment: "OrderedDict[str, Dict[ResponseAction, datetime]]" = OrderedDict()
+        self.stats = {"executed": 0, "skipped": 0, "bulk_calls": 0}
+        self._pending: Dict[ResponseAction, Dict[str, asyncio.Future]] = {}
+        self._pending_keys: Dict[ResponseAction, Dict[str, List[str]]] = {}
+        self._flushers: Dict[ResponseAction, asyncio.TimerHandle] = {}
+        self._in_flight: Set[asyncio.Task] = set()
+
+    async def execute(
+        self,
+        event: ThreatEvent,
+        actions: List[ResponseAction],
+        investigation: Optional[InvestigationReport] = None,
+        key: Optional[str] = None
+    ) -> List[ResponseResult]:
+        """Run the actions for an event concurrently, in policy order, under the event's idempotency key"""
+        return list(await asyncio.gather(
+            *(self._execute_action(action, event, investigation, key) for action in actions)
+        ))
+
+    def release(self, agent_id: str, action: Optional[ResponseAction] = None):
+        """Forget containment for an agent (all actions, or just one) after remediation"""
+        if action is None:
+            self.containment.pop(agent_id, None)
+            return
+        actions = self.containment.get(agent_id)
+        if actions is not None:
+            actions.pop(action, None)
+            if not actions:
+                del self.containment[agent_id]
+
+    def is_contained(self, agent_id: str, action: ResponseAction) -> bool:
+        """Whether action was applied to the agent within containment_ttl and not released since"""
+        applied = self.containment.get(agent_id, {}).get(action)
+        if applied is None:
+            return False
+        if self.clock() - applied > self.containment_ttl:
+            self.release(agent_id, action)
+            return False
+        return True
+
+    def _contain(self, agent_id: str, action: ResponseAction):
+        """Remember action as applied to the agent, forgetting the least recently contained agents past the bound"""
+        actions = self.containment.pop(agent_id, {})
+        actions[action] = self.clock()
+        self.containment[agent_id] = actions
+        while len(self.containment) > self.max_contained:
+            self.containment.popitem(last=False)
+
+    async def _execute_action(
+        self,
+        action: ResponseAction,
+        event: ThreatEvent,
+        investigation: Optional[InvestigationReport],
+        key: Optional[str] = None
+    ) -> ResponseResult:
+        if action not in PLATFORM_ACTIONS:
+            return await self.fallback(action, event, investigation)
+
+        agent_id = event.agent_id
+        if self.is_contained(agent_id, action):
+            self.stats["skipped"] += 1
+            return ResponseResult(action, True, f"{action.value} already in place for {agent_id}", self.clock())
+
+        latency = action_latency(action)
+        started = latency.start()
+        success, message = await self._submit(action, agent_id, key)
+        latency.observe_since(started)
+        if success:
+            self._contain(agent_id, action)
+        self.stats["executed"] += 1
+        result = ResponseResult(action, success, message, self.clock())
+        count_action(result)
+        return result
+
+    def _submit(
+        self,
+        action: ResponseAction,
+        agent_id: str,
+        key: Optional[str] = None
+    ) -> "asyncio.Future[Tuple[bool, str]]":
+        """
+        Add an agent to the next bulk call for action, sharing in-flight requests
+
+        Every threat joining a request adds its key to it, so the platform
+        records the action as applied under each of them and a redelivery
+        of any of those threats is a no-op.
+        """
+        if key is not None:
+            self._pending_keys.setdefault(action, {}).setdefault(agent_id, []).append(key)
+        pending = self._pending.setdefault(action, {})
+        future = pending.get(agent_id)
+        if future is not None:
+            return future
+
+        loop = asyncio.get_running_loop()
+        future = pending[agent_id] = loop.create_future()
+        if len(pending) >= self.max_batch:
+            self._dispatch(action)
+        elif action not in self._flushers:
+            self._flushers[action] = loop.call_later(self.batch_window, self._dispatch, action)
+        return future
+
+    def _dispatch(self, action: ResponseAction):
+        """Detach the pending batch for action and send it as one bulk call"""
+        handle = self._flushers.pop(action, None)
+        if handle is not None:
+            handle.cancel()
+        batch = self._pending.pop(action, None)
+        keys = self._pending_keys.pop(action, {})
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._flush(action, batch, keys))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _flush(self, action: ResponseAction, batch: Dict[str, asyncio.Future], keys: Dict[str, List[str]]):
+        self.stats["bulk_calls"] += 1
+        try:
+            results = await self.platform.execute(action, list(batch), keys)
+        except Exception as e:
+            logger.error(f"Error executing bulk {action.value} for {len(batch)} agents: {e}")
+            results = {agent_id: (False, str(e)) for agent_id in batch}
+
+        for agent_id, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(agent_id, (False, f"No result for {agent_id}")))
@@ -0,0 +1,412 @@
+"""
+Declarative Detection Rules
+
+Detection rules written in YAML or JSON as field predicates with a weight.
+Rules are compiled into an evaluator that shares identical predicates
+between rules, evaluates each rule's predicates from most to least
+selective so non-matching events fail fast, and dispatches on the fields
+an event actually carries so rules over absent fields are never visited.
+Rule files can be hot-reloaded while the service runs.
+
+Example (YAML):
+
+    rules:
+      - name: unusual_api_calls
+        weight: 0.4
+        when:
+          - {field: unusual_api_calls, op: gt, value: 10}
+"""
+
+import asyncio
+import json
+import logging
+import operator
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "lt": operator.lt,
+    "le": operator.le,
+    "in": lambda actual, expected: actual in expected,
+    "not_in": lambda actual, expected: actual not in expected,
+    "contains": lambda actual, expected: expected in actual,
+    "truthy": lambda actual, expected: bool(actual),
+    "exists": lambda actual, expected: True,
+}
+
+# Vectorized forms used for numeric and boolean columns
+_COLUMN_OPERATORS: Dict[str, Callable[[np.ndarray, Any], np.ndarray]] = {
+    "eq": lambda column, expected: column == expected,
+    "ne": lambda column, expected: column != expected,
+    "gt": lambda column, expected: column > expected,
+    "ge": lambda column, expected: column >= expected,
+    "lt": lambda column, expected: column < expected,
+    "le": lambda column, expected: column <= expected,
+    "in": lambda column, expected: np.isin(column, list(expected)),
+    "not_in": lambda column, expected: ~np.isin(column, list(expected)),
+    "truthy": lambda column, expected: column.astype(bool),
+    "exists": lambda column, expected: np.ones(len(column), dtype=bool),
+}
+
+# Estimated fraction of events matching each operator, used until calibrate()
+_DEFAULT_MATCH_RATES = {
+    "eq": 0.1, "truthy": 0.1, "in": 0.2, "contains": 0.2,
+    "gt": 0.3, "ge": 0.3, "lt": 0.3, "le": 0.3,
+    "not_in": 0.8, "ne": 0.9, "exists": 0.9,
+}
+
+# The detector's original hard-coded heuristics
+DEFAULT_RULES = {
+    "rules": [
+        {"name": "unusual_api_calls", "weight": 0.4, "when": [{"field": "unusual_api_calls", "op": "gt", "value": 10}]},
+        {"name": "data_access_spike", "weight": 0.4, "when": [{"field": "data_access_spike", "op": "truthy"}]},
+        {"name": "privilege_escalation", "weight": 0.5, "when": [{"field": "privilege_escalation", "op": "truthy"}]},
+    ]
+}
+
+
+class RuleError(ValueError):
+    """Raised for malformed rule documents"""
+
+
+@dataclass(frozen=True)
+class Predicate:
+    """Test of one activity field"""
+    field: str
+    op: str
+    value: Any = None
+    match_rate: Optional[float] = None  # Expected fraction of events matching, if known
+
+    @property
+    def key(self) -> Tuple[str, str, Any]:
+        return (self.field, self.op, self.value)
+
+
+@dataclass
+class Rule:
+    """Weighted conjunction of predicates"""
+    name: str
+    weight: float
+    predicates: List[Predicate] = field(default_factory=list)
+    enabled: bool = True
+
+
+def _freeze(value: Any) -> Any:
+    """Hashable form of a rule value, so identical predicates can be shared"""
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        raise RuleError("Predicate values cannot be mappings")
+    return value
+
+
+def parse_rules(document: Mapping) -> List[Rule]:
+    """
+    Parse a rule document
+
+    Args:
+        document: Mapping with a ``rules`` list; each rule has a name, a
+            weight and a ``when`` list of {field, op, value} predicates
+
+    Returns:
+        Parsed rules in document order
+
+    Raises:
+        RuleError: If the document is malformed
+    """
+    if not isinstance(document, Mapping) or not isinstance(document.get("rules"), list):
+        raise RuleError("Rule document must be a mapping with a 'rules' list")
+
+    rules, names = [], set()
+    for index, entry in enumerate(document["rules"]):
+        name = entry.get("name") or f"rule-{index}"
+        if name in names:
+            raise RuleError(f"Duplicate rule name '{name}'")
+        names.add(name)
+        conditions = entry.get("when")
+        if not conditions:
+            raise RuleError(f"Rule '{name}' has no 'when' predicates")
+
+        predicates = []
+        for condition in conditions:
+            op = condition.get("op", "eq")
+            if op not in OPERATORS:
+                raise RuleError(f"Rule '{name}' uses unknown operator '{op}'")
+            if "field" not in condition:
+                raise RuleError(f"Rule '{name}' has a predicate without a field")
+            if op not in ("truthy", "exists") and "value" not in condition:
+                raise RuleError(f"Rule '{name}' predicate on '{condition['field']}' needs a value")
+            value = _freeze(condition.get("value"))
+            if op in ("in", "not_in"):
+                value = frozenset(value)
+            predicates.append(Predicate(condition["field"], op, value, condition.get("match_rate")))
+        rules.append(Rule(name, float(entry.get("weight", 0.0)), predicates, bool(entry.get("enabled", True))))
+    return rules
+
+
+def load_rules(path: str) -> List[Rule]:
+    """Load rules from a .yaml/.yml or .json file"""
+    with open(path, "r", encoding="utf-8") as handle:
+        if path.endswith((".yaml", ".yml")):
+            import yaml  # Only needed for YAML rule files
+
+            document = yaml.safe_load(handle)
+        else:
+            document = json.load(handle)
+    return parse_rules(document)
+
+
+# Python expression for each operator applied to a field value `v` and rule constant `c`
+_EXPRESSIONS = {
+    "eq": "{v} == {c}", "ne": "{v} != {c}",
+    "gt": "{v} > {c}", "ge": "{v} >= {c}", "lt": "{v} < {c}", "le": "{v} <= {c}",
+    "in": "{v} in {c}", "not_in": "{v} not in {c}", "contains": "{c} in {v}",
+    "truthy": "{v}", "exists": "True",
+}
+
+
+class CompiledRules:
+    """
+    Immutable evaluator for a rule set
+
+    The rule set is compiled to one generated Python function. Rules are
+    grouped under the field of their most selective predicate and each
+    group is guarded by a single presence check on that field; within a
+    rule, predicates run least-likely-first and short-circuit. Predicates
+    used by several rules are evaluated at most once per event.
+    """
+
+    def __init__(self, rules: List[Rule], match_rates: Optional[Dict[Tuple, float]] = None):
+        self.rules = [rule for rule in rules if rule.enabled]
+        self.weights = [rule.weight for rule in self.rules]
+        match_rates = match_rates or {}
+
+        # Shared predicate index: identical predicates across rules get one id
+        self.predicates: List[Predicate] = []
+        index: Dict[Tuple, int] = {}
+        for rule in self.rules:
+            for predicate in rule.predicates:
+                if predicate.key not in index:
+                    index[predicate.key] = len(self.predicates)
+                    self.predicates.append(predicate)
+        self._tests = [self._compile(predicate) for predicate in self.predicates]
+        uses = Counter(index[p.key] for rule in self.rules for p in set(rule.predicates))
+
+        def rate(predicate_id: int) -> float:
+            predicate = self.predicates[predicate_id]
+            if predicate.key in match_rates:
+                return match_rates[predicate.key]
+            if predicate.match_rate is not None:
+                return predicate.match_rate
+            return _DEFAULT_MATCH_RATES[predicate.op]
+
+        # Each rule tests its least likely predicate first and is dispatched on that field
+        self._by_field: Dict[str, List[Tuple[int, Tuple[int, ...]]]] = {}
+        for rule_id, rule in enumerate(self.rules):
+            order = tuple(sorted({index[p.key] for p in rule.predicates}, key=rate))
+            self._by_field.setdefault(self.predicates[order[0]].field, []).append((rule_id, order))
+        # Matches are accumulated in this fixed order by every evaluation path
+        self._plans = [plan for plans in self._by_field.values() for plan in plans]
+
+        shared = {predicate_id for predicate_id, count in uses.items() if count > 1}
+        # score(activity) -> sum of matching rule weights; matched(activity) -> matching rule indices
+        self.score = self._generate("risk += w{rule}", "risk = 0.0", "return risk", shared)
+        self.matched = self._generate("matched.append({rule})", "matched = []", "return matched", shared)
+
+    def _generate(self, on_match: str, prologue: str, epilogue: str, shared: set) -> Callable[[Mapping], Any]:
+        """Build the evaluator function for the rule set"""
+        lines = ["def evaluate(activity):", f"    {prologue}"]
+        lines += [f"    s{predicate_id} = None" for predicate_id in sorted(shared)]
+        for name, plans in self._by_field.items():
+            lines.append(f"    if {name!r} in activity:")
+            lines.append(f"        v = activity[{name!r}]")
+            for rule_id, order in plans:
+                terms = []
+                for predicate_id in order:
+                    predicate = self.predicates[predicate_id]
+                    value = "v" if predicate.field == name else f"activity[{predicate.field!r}]"
+                    term = _EXPRESSIONS[predicate.op].format(v=value, c=f"c{predicate_id}")
+                    if predicate.field != name:
+                        term = f"{predicate.field!r} in activity and {term}"
+                    if predicate_id in shared:
+                        term = f"(s{predicate_id} if s{predicate_id} is not None else (s{predicate_id} := bool({term})))"
+                    else:
+                        term = f"({term})"
+                    terms.append(term)
+                # Incomparable values (TypeError) make the predicate, and so the rule, fail
+                lines += [
+                    "        try:",
+                    f"            if {' and '.join(terms)}:",
+                    f"                {on_match.format(rule=rule_id)}",
+                    "        except TypeError:",
+                    "            pass",
+                ]
+        lines.append(f"    {epilogue}")
+
+        namespace = {f"c{i}": predicate.value for i, predicate in enumerate(self.predicates)}
+        namespace.update({f"w{i}": weight for i, weight in enumerate(self.weights)})
+        exec(compile("\n".join(lines), "<detection rules>", "exec"), namespace)
+        return namespace["evaluate"]
+
+    @staticmethod
+    def _compile(predicate: Predicate) -> Callable[[Mapping], bool]:
+        """Standalone test for one predicate, used for calibration and non-numeric columns"""
+        test, name, expected = OPERATORS[predicate.op], predicate.field, predicate.value
+
+        def evaluate(activity: Mapping) -> bool:
+            actual = activity.get(name, _MISSING)
+            if actual is _MISSING:
+                return False
+            try:
+                return bool(test(actual, expected))
+            except TypeError:
+                return False
+        return evaluate
+
+    def score_columns(
+        self,
+        columns: Mapping[str, np.ndarray],
+        rows: int,
+        present: Optional[Mapping[str, np.ndarray]] = None
+    ) -> np.ndarray:
+        """
+        Vectorized counterpart of score over a columnar batch
+
+        Args:
+            columns: Activity fields as columns
+            rows: Rows in the batch
+            present: Per column, the rows that carry the field; every row
+                of a column does when omitted
+        """
+        masks: Dict[int, np.ndarray] = {}
+        risk = np.zeros(rows, dtype=np.float64)
+        for rule_id, order in self._plans:
+            if any(self.predicates[p].field not in columns for p in order):
+                continue
+            matched = None
+            for predicate_id in order:
+                mask = masks.get(predicate_id)
+                if mask is None:
+                    mask = masks[predicate_id] = self._column_mask(predicate_id, columns, present)
+                matched = mask if matched is None else matched & mask
+                if not matched.any():
+                    break
+            risk += np.where(matched, self.weights[rule_id], 0.0)
+        return risk
+
+    def _column_mask(
+        self,
+        predicate_id: int,
+        columns: Mapping[str, np.ndarray],
+        present: Optional[Mapping[str, np.ndarray]] = None
+    ) -> np.ndarray:
+        predicate = self.predicates[predicate_id]
+        column = columns[predicate.field]
+        mask = None
+        if column.dtype.kind in "biuf" and predicate.op in _COLUMN_OPERATORS:
+            try:
+                mask = np.asarray(_COLUMN_OPERATORS[predicate.op](column, predicate.value), dtype=bool)
+            except TypeError:
+                pass  # Incomparable rule value; the scalar test fails each row as score() does
+        if mask is None:
+            # Strings, lists and mixed columns fall back to the scalar test
+            test = self._tests[predicate_id]
+            mask = np.fromiter((test({predicate.field: value}) for value in column.tolist()), dtype=bool, count=len(column))
+        if present is not None and predicate.field in present:
+            mask = mask & present[predicate.field]  # Rows without the field never match, as in score()
+        return mask
+
+
+class RuleEngine:
+    """Hot-reloadable compiled rule set"""
+
+    def __init__(self, rules: Optional[Iterable[Rule]] = None, path: Optional[str] = None):
+        self.path = path
+        self.running = False
+        self._mtime: Optional[float] = None
+        self._match_rates: Dict[Tuple, float] = {}
+        if path is not None:
+            rules = load_rules(path)
+            self._mtime = os.stat(path).st_mtime
+        elif rules is None:
+            rules = parse_rules(DEFAULT_RULES)
+        self.compiled = CompiledRules(list(rules))
+
+    @property
+    def rules(self) -> List[Rule]:
+        return self.compiled.rules
+
+    def score(self, activity: Mapping) -> float:
+        return self.compiled.score(activity)
+
+    def score_columns(
+        self,
+        columns: Mapping[str, np.ndarray],
+        rows: int,
+        present: Optional[Mapping[str, np.ndarray]] = None
+    ) -> np.ndarray:
+        return self.compiled.score_columns(columns, rows, present)
+
+    def matches(self, activity: Mapping) -> List[str]:
+        """Names of the rules matching an activity record"""
+        compiled = self.compiled
+        return [compiled.rules[rule_id].name for rule_id in sorted(compiled.matched(activity))]
+
+    def update(self, rules: Iterable[Rule]):
+        """Swap in a new rule set; evaluations in progress finish on the old one"""
+        self.compiled = CompiledRules(list(rules), self._match_rates)
+
+    def calibrate(self, activities: Iterable[Mapping]):
+        """Measure predicate match rates on sample activity and reorder evaluation to match"""
+        compiled = self.compiled
+        sample = list(activities)
+        if not sample:
+            return
+        for predicate, test in zip(compiled.predicates, compiled._tests):
+            self._match_rates[predicate.key] = sum(map(test, sample)) / len(sample)
+        self.compiled = CompiledRules(compiled.rules, self._match_rates)
+
+    def reload(self) -> bool:
+        """
+        Reload the rule file if it changed
+
+        Returns:
+            True if new rules were loaded. A file that fails to parse is
+            logged and the current rules stay in effect.
+        """
+        if self.path is None:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self._mtime:
+                return False
+            rules = load_rules(self.path)
+        except Exception as e:
+            logger.error(f"Failed to reload rules from {self.path}: {e}")
+            return False
+        self._mtime = mtime
+        self.update(rules)
+        logger.info(f"Loaded {len(self.compiled.rules)} detection rules from {self.path}")
+        return True
+
+    async def watch(self, interval: float = 2.0):
+        """Poll the rule file and reload it on change until stopped"""
+        self.running = True
+        while self.running:
+            await asyncio.sleep(interval)
+            self.reload()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,183 @@
+"""
+Investigation Scheduler
+
+Runs investigations on a bounded pool of asyncio workers, most severe
+threats first, coalescing bursts from the same agent into a single
+investigation.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from .detector import ThreatEvent
+from .investigator import InvestigationReport, ThreatInvestigator
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_RANK = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+
+def priority_of(event: ThreatEvent) -> tuple:
+    """Sort key for an event: severity first, then risk score (lower runs first)"""
+    return (SEVERITY_RANK.get(event.severity, len(SEVERITY_RANK)), -event.risk_score)
+
+
+class _Job:
+    """Pending investigation for one agent, possibly covering several events"""
+
+    __slots__ = ("agent_id", "events", "futures", "priority", "submitted", "started")
+
+    def __init__(self, event: ThreatEvent):
+        self.agent_id = event.agent_id
+        self.events: List[ThreatEvent] = [event]
+        self.futures: List[asyncio.Future] = []
+        self.priority = priority_of(event)
+        self.submitted = time.perf_counter()
+        self.started = False
+
+    @property
+    def lead_event(self) -> ThreatEvent:
+        """The most severe event, which the investigation runs against"""
+        return min(self.events, key=priority_of)
+
+
+class InvestigationScheduler:
+    """Priority scheduler with bounded parallelism over ThreatInvestigator"""
+
+    def __init__(
+        self,
+        investigator: ThreatInvestigator,
+        workers: int = 4,
+        default_timeout: float = 30.0,
+        playbook_timeouts: Optional[Dict[str, float]] = None,
+        latency_window: int = 10000,
+    ):
+        self.investigator = investigator
+        self.workers = workers
+        self.default_timeout = default_timeout
+        self.playbook_timeouts = playbook_timeouts or {}
+        self.running = False
+        self.stats = {"submitted": 0, "coalesced": 0, "completed": 0, "timeouts": 0, "errors": 0}
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self._pending: Dict[str, _Job] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def queue_depth(self) -> int:
+        """Investigations waiting for a worker"""
+        return len(self._pending)
+
+    def start(self):
+        """Start the worker pool"""
+        self._queue = asyncio.PriorityQueue()
+        self.running = True
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers; running and waiting investigations are cancelled"""
+        self.running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        for job in self._pending.values():
+            for future in job.futures:
+                future.cancel()
+        self._pending.clear()
+
+    def submit(self, event: ThreatEvent) -> "asyncio.Future[InvestigationReport]":
+        """
+        Queue a threat event for investigation
+
+        Events for an agent that already has an investigation waiting are
+        folded into it, and every caller receives the same report.
+
+        Returns:
+            Future resolving to the InvestigationReport
+        """
+        if not self.running:
+            raise RuntimeError("Investigation scheduler is not running")
+        future = asyncio.get_running_loop().create_future()
+        self.stats["submitted"] += 1
+        job = self._pending.get(event.agent_id)
+        if job is None:
+            job = self._pending[event.agent_id] = _Job(event)
+            job.futures.append(future)
+            self._enqueue(job)
+            return future
+
+        self.stats["coalesced"] += 1
+        job.events.append(event)
+        job.futures.append(future)
+        priority = priority_of(event)
+        if priority < job.priority:
+            # Re-queue at the higher priority; the stale entry is skipped
+            job.priority = priority
+            self._enqueue(job)
+        return future
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)) -> Dict[str, float]:
+        """Submit-to-report latency percentiles in seconds over the recent window"""
+        if not self._latencies:
+            return {f"p{p}": 0.0 for p in percentiles}
+        ordered = sorted(self._latencies)
+        last = len(ordered) - 1
+        return {f"p{p}": ordered[min(last, round(p / 100 * last))] for p in percentiles}
+
+    def _enqueue(self, job: _Job):
+        self._queue.put_nowait((job.priority, next(self._sequence), job))
+
+    async def _worker(self):
+        while True:
+            priority, _, job = await self._queue.get()
+            if job.started or priority != job.priority:
+                continue  # Already taken or superseded by a higher-priority entry
+            job.started = True
+            del self._pending[job.agent_id]
+            try:
+                await self._run(job)
+            finally:
+                # Settled futures ignore this; callers of a job cancelled mid-run by stop() must not hang
+                for future in job.futures:
+                    future.cancel()
+
+    async def _run(self, job: _Job):
+        event = job.lead_event
+        timeout = self.playbook_timeouts.get(event.threat_type, self.default_timeout)
+        try:
+            report = await asyncio.wait_for(self.investigator.investigate(event), timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.error(f"Investigation of {event.threat_type} for agent {job.agent_id} timed out after {timeout}s")
+            self._settle(job, exception=asyncio.TimeoutError(f"Investigation timed out after {timeout}s"))
+            return
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Error investigating threat for agent {job.agent_id}: {e}")
+            self._settle(job, exception=e)
+            return
+
+        if len(job.events) > 1:
+            report.evidence.append({
+                "type": "coalesced_events",
+                "data": [{"time": e.timestamp, "severity": e.severity, "risk_score": e.risk_score} for e in job.events]
+            })
+        self.stats["completed"] += 1
+        self._latencies.append(time.perf_counter() - job.submitted)
+        self._settle(job, report=report)
+
+    def _settle(self, job: _Job, report: Optional[InvestigationReport] = None, exception: Optional[BaseException] = None):
+        for future in job.futures:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(report)
@@ -0,0 +1,332 @@
+"""
+Sharded Detection
+
+Partitions agent activity across detector worker processes with
+consistent hashing on agent_id. Each worker owns the baselines for its
+shard; adding or removing a worker migrates only the agents whose owner
+changes. A coordinator merges the workers' ThreatEvent streams back into
+investigation and response.
+
+Workers score activity with rules, baselines and models only. Windowed
+correlation and the fleet index are not run per shard: a shard sees only
+part of the fleet, so a per-shard fleet index would miss spikes spread
+across shards.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, AsyncIterator, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .detector import ThreatDetector, ThreatEvent
+
+if TYPE_CHECKING:
+    # Only the coordinator forwards events; spawned workers skip these imports
+    from .investigator import ThreatInvestigator
+    from .responder import ThreatResponder
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class ConsistentHashRing:
+    """Hash ring with virtual nodes mapping keys to node names"""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 128):
+        self.vnodes = vnodes
+        self.nodes: List[str] = []
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        self._rebuild()
+
+    def remove_node(self, node: str):
+        self.nodes.remove(node)
+        self._rebuild()
+
+    def node_for(self, key: str) -> str:
+        """Node owning key"""
+        if not self._points:
+            raise LookupError("Hash ring has no nodes")
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+
+    def _rebuild(self):
+        ring = sorted((_hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(self.vnodes))
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+
+
+def _worker_main(shard_id: str, config: Dict, inbox, events, control):
+    """Shard worker process: owns a ThreatDetector and its baselines"""
+    detector = ThreatDetector(config)
+    processed = 0
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        kind = message[0]
+        if kind == "activity":
+            threats = []
+            for agent_id, activity in message[1]:
+                threat = detector.detect_anomaly(agent_id, activity)
+                if threat is None:
+                    detector.update_baseline(agent_id, activity)  # Baselines keep tracking normal activity
+                else:
+                    threats.append(threat)
+            processed += len(message[1])
+            if threats:
+                events.put((shard_id, threats))
+        elif kind == "establish":
+            for agent_id, history in message[1]:
+                detector.establish_baseline(agent_id, history)
+        elif kind == "import":
+            for agent_id, baseline in message[1]:
+                detector.baselines[agent_id] = baseline
+        elif kind == "release":
+            _, token, nodes, vnodes = message
+            ring = ConsistentHashRing(nodes, vnodes)
+            leaving = [agent_id for agent_id in detector.baselines if ring.node_for(agent_id) != shard_id]
+            exported = [(agent_id, detector.baselines.export(agent_id)) for agent_id in leaving]
+            for agent_id in leaving:
+                detector.baselines.remove(agent_id)
+            control.put((token, exported))
+        elif kind == "sync":
+            control.put((message[1], {"agents": len(detector.baselines), "processed": processed}))
+
+
+class _Shard:
+    """Coordinator-side handle on a worker process"""
+
+    def __init__(self, shard_id: str, process, inbox):
+        self.shard_id = shard_id
+        self.process = process
+        self.inbox = inbox
+        self.buffer: List[Tuple[str, Dict]] = []
+
+
+class ShardedDetector:
+    """Coordinator for detector workers sharded by agent_id"""
+
+    def __init__(
+        self,
+        workers: int = 4,
+        config: Optional[Dict] = None,
+        batch_size: int = 512,
+        vnodes: int = 128,
+        start_method: str = "spawn",
+        queue_size: int = 64,
+        backlog_size: int = 1024,
+    ):
+        self.config = config or {}
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.ring = ConsistentHashRing(vnodes=vnodes)
+        self.shards: Dict[str, _Shard] = {}
+        self._context = multiprocessing.get_context(start_method)
+        self._events = self._context.Queue()
+        self._control = self._context.Queue()
+        self._tokens = itertools.count()
+        self._shard_ids = itertools.count()
+        self._initial_workers = workers
+        self._reader: Optional[threading.Thread] = None
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+        # Threat batches read before anyone subscribed to events(), handed to the first subscriber
+        self._backlog: Deque[Optional[List[ThreatEvent]]] = deque(maxlen=backlog_size)
+        self._subscribing = threading.Lock()
+
+    def start(self):
+        """Start the initial worker processes and the event reader"""
+        for _ in range(self._initial_workers):
+            self._spawn()
+        self._reader = threading.Thread(target=self._read_events, name="shard-event-reader", daemon=True)
+        self._reader.start()
+
+    def stop(self):
+        """Flush buffered activity and stop every worker"""
+        self.flush()
+        for shard in self.shards.values():
+            shard.inbox.put(None)
+        for shard in self.shards.values():
+            shard.process.join()
+        self.shards.clear()
+        self._events.put(None)
+        if self._reader is not None:
+            self._reader.join()
+
+    def submit(self, agent_id: str, activity: Dict):
+        """Route activity to the shard owning agent_id, sending full batches"""
+        shard = self.shards[self.ring.node_for(agent_id)]
+        shard.buffer.append((agent_id, activity))
+        if len(shard.buffer) >= self.batch_size:
+            self._send(shard)
+
+    def submit_many(self, records: Iterable[Dict]):
+        """Route records carrying an agent_id and flush the partial batches"""
+        for record in records:
+            self.submit(record["agent_id"], {k: v for k, v in record.items() if k != "agent_id"})
+        self.flush()
+
+    def flush(self):
+        """Send every partially filled batch"""
+        for shard in self.shards.values():
+            if shard.buffer:
+                self._send(shard)
+
+    def establish_baselines(self, histories: Iterable[Tuple[str, List[Dict]]]):
+        """Build baselines on the shards owning each agent"""
+        grouped: Dict[str, List] = {}
+        for agent_id, history in histories:
+            grouped.setdefault(self.ring.node_for(agent_id), []).append((agent_id, list(history)))
+        for shard_id, payload in grouped.items():
+            self.shards[shard_id].inbox.put(("establish", payload))
+
+    def add_worker(self) -> str:
+        """Start a worker and move the agents it now owns onto it"""
+        self.flush()
+        shard_id = self._spawn(join_ring=False)
+        self._rebalance([*self.ring.nodes, shard_id])
+        return shard_id
+
+    def remove_worker(self, shard_id: str):
+        """Move a worker's agents to the remaining shards and stop it"""
+        if len(self.shards) == 1:
+            raise ValueError("Cannot remove the last shard")
+        self.flush()
+        self._rebalance([node for node in self.ring.nodes if node != shard_id])
+        shard = self.shards.pop(shard_id)
+        shard.inbox.put(None)
+        shard.process.join()
+
+    def sync(self, timeout: float = 30.0) -> Dict[str, Dict]:
+        """Flush, wait until every shard has processed what it was sent, and return shard stats"""
+        self.flush()
+        return dict(self._request({shard_id: ("sync",) for shard_id in self.shards}, timeout))
+
+    async def events(self) -> AsyncIterator[ThreatEvent]:
+        """
+        Merged stream of ThreatEvents from every shard
+
+        Events read while nobody is subscribed are kept (up to
+        backlog_size batches) and delivered to the first subscriber.
+        """
+        loop = asyncio.get_running_loop()
+        subscriber = (loop, asyncio.Queue())
+        with self._subscribing:
+            self._subscribers.append(subscriber)
+            while self._backlog:
+                subscriber[1].put_nowait(self._backlog.popleft())
+        try:
+            while True:
+                threats = await subscriber[1].get()
+                if threats is None:
+                    return
+                for threat in threats:
+                    yield threat
+        finally:
+            with self._subscribing:
+                self._subscribers.remove(subscriber)
+
+    async def forward(self, investigator: "ThreatInvestigator", responder: "ThreatResponder", scheduler=None):
+        """Investigate and respond to the merged event stream until the coordinator stops"""
+        async def handle(threat: ThreatEvent):
+            try:
+                if scheduler is None:
+                    investigation = await investigator.investigate(threat)
+                else:
+                    investigation = await scheduler.submit(threat)
+                    if investigation.threat_event is not threat:
+                        return
+                await responder.respond(threat, investigation)
+            except Exception as e:
+                logger.error(f"Error handling sharded threat for agent {threat.agent_id}: {e}")
+
+        tasks = set()
+        async for threat in self.events():
+            task = asyncio.create_task(handle(threat))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+    def _spawn(self, join_ring: bool = True) -> str:
+        shard_id = f"shard-{next(self._shard_ids)}"
+        inbox = self._context.Queue(maxsize=self.queue_size)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(shard_id, self.config, inbox, self._events, self._control),
+            name=shard_id,
+            daemon=True
+        )
+        process.start()
+        self.shards[shard_id] = _Shard(shard_id, process, inbox)
+        if join_ring:
+            self.ring.add_node(shard_id)
+        return shard_id
+
+    def _send(self, shard: _Shard):
+        # Blocks when the worker's bounded inbox is full (backpressure)
+        shard.inbox.put(("activity", shard.buffer))
+        shard.buffer = []
+
+    def _rebalance(self, nodes: List[str]):
+        """Switch the ring to nodes, migrating baselines whose owner changes"""
+        old_nodes = list(self.ring.nodes)
+        released = self._request(
+            {shard_id: ("release", nodes, self.ring.vnodes) for shard_id in old_nodes if shard_id in self.shards}
+        )
+        self.ring = ConsistentHashRing(nodes, self.ring.vnodes)
+        moving: Dict[str, List] = {}
+        for exported in released:
+            for agent_id, baseline in exported:
+                moving.setdefault(self.ring.node_for(agent_id), []).append((agent_id, baseline))
+        for shard_id, payload in moving.items():
+            self.shards[shard_id].inbox.put(("import", payload))
+        logger.info(f"Rebalanced {sum(len(p) for p in moving.values())} agents across {len(nodes)} shards")
+
+    def _request(self, messages: Dict[str, tuple], timeout: float = 30.0) -> List:
+        """Send a control message to each shard and collect the replies"""
+        pending = {}
+        for shard_id, message in messages.items():
+            token = next(self._tokens)
+            pending[token] = shard_id
+            kind, *args = message
+            self.shards[shard_id].inbox.put((kind, token, *args))
+        replies = []
+        while pending:
+            token, payload = self._control.get(timeout=timeout)
+            shard_id = pending.pop(token, None)
+            if shard_id is not None:
+                replies.append((shard_id, payload) if messages[shard_id][0] == "sync" else payload)
+        return replies
+
+    def _read_events(self):
+        """Move worker events onto each subscriber's event loop"""
+        while True:
+            try:
+                item = self._events.get()
+            except (EOFError, OSError):
+                item = None
+            threats = None if item is None else item[1]
+            with self._subscribing:
+                if not self._subscribers:
+                    if threats is not None and len(self._backlog) == self._backlog.maxlen:
+                        logger.warning("No subscriber for sharded threat events, dropping the oldest batch")
+                    self._backlog.append(threats)
+                for loop, subscriber in self._subscribers:
+                    loop.call_soon_threadsafe(subscriber.put_nowait, threats)
+            if item is None:
+                return
@@ -0,0 +1,206 @@
+"""
+Baseline Snapshots
+
+Versioned binary snapshots of a BaselineStore. Columns are written raw
+and 64-byte aligned so a restore maps the file and wraps the columns in
+place instead of parsing or copying them.
+
+File layout:
+    <4s magic><u32 version><u64 header length>   prefix
+    JSON header                                   metadata and section table
+    64-byte aligned column and agent ID sections
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+
+from .baseline_store import BaselineStore
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"THBS"
+SNAPSHOT_VERSION = 1
+
+_PREFIX = struct.Struct("<4sIQ")
+_ALIGNMENT = 64
+_COLUMNS = ("events", "count", "mean", "m2", "ewma")
+_SKETCHES = ("actions", "data_access")
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def capture_snapshot(store: BaselineStore) -> Dict:
+    """
+    Capture the state of a store for writing
+
+    The statistic columns are referenced, not copied: rows updated while
+    the snapshot is being written may land in either state (a fuzzy
+    checkpoint), which is acceptable for statistical baselines. The sketch
+    id and count columns are copied here together with the interned items,
+    because ids freed and reused after the capture would otherwise point
+    at the wrong items in the written snapshot.
+    """
+    size = len(store)
+    columns = {name: getattr(store, name)[:size] for name in _COLUMNS}
+    for sketch_name in _SKETCHES:
+        sketch = getattr(store, sketch_name)
+        columns[f"{sketch_name}.ids"] = sketch.ids[:size].copy()
+        columns[f"{sketch_name}.counts"] = sketch.counts[:size].copy()
+    return {
+        "size": size,
+        "alpha": store.alpha,
+        "top_k": store.actions.k,
+        "max_metrics": store.max_metrics,
+        "time_field": store.time_field,
+        "metrics": sorted(store.metric_index, key=store.metric_index.get),
+        "items": {name: list(getattr(store, name).items) for name in _SKETCHES},
+        "agent_ids": store.agent_ids[:size],
+        "columns": columns,
+    }
+
+
+def write_snapshot(snapshot: Dict, path: str):
+    """Write a captured snapshot atomically (temp file, fsync, rename)"""
+    agent_ids = snapshot["agent_ids"]
+    if any("\0" in agent_id for agent_id in agent_ids):
+        raise ValueError("Agent IDs containing NUL cannot be snapshotted")
+    agent_blob = "\0".join(agent_ids).encode("utf-8")
+
+    sections = {}
+    offset = 0
+    for name, column in snapshot["columns"].items():
+        sections[name] = {"offset": offset, "dtype": column.dtype.str, "shape": list(column.shape)}
+        offset = _aligned(offset + column.nbytes)
+    sections["agent_ids"] = {"offset": offset, "length": len(agent_blob)}
+
+    header = json.dumps({
+        "created": datetime.now().isoformat(),
+        "size": snapshot["size"],
+        "alpha": snapshot["alpha"],
+        "top_k": snapshot["top_k"],
+        "max_metrics": snapshot["max_metrics"],
+        "time_field": snapshot["time_field"],
+        "metrics": snapshot["metrics"],
+        "items": snapshot["items"],
+        "sections": sections,
+    }).encode("utf-8")
+    data_start = _aligned(_PREFIX.size + len(header))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as handle:
+        handle.write(_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header)))
+        handle.write(header)
+        for name, column in snapshot["columns"].items():
+            handle.seek(data_start + sections[name]["offset"])
+            handle.write(np.ascontiguousarray(column).data)
+        handle.seek(data_start + sections["agent_ids"]["offset"])
+        handle.write(agent_blob)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def save_snapshot(store: BaselineStore, path: str):
+    """Capture and write a snapshot of store to path"""
+    write_snapshot(capture_snapshot(store), path)
+
+
+def load_snapshot(path: str) -> BaselineStore:
+    """
+    Restore a BaselineStore from a snapshot file
+
+    The file is memory-mapped copy-on-write and the columns are NumPy views
+    of the mapping: pages are faulted in on first access, and updates after
+    the restore stay private to the process.
+    """
+    with open(path, "rb") as handle:
+        mapping = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    magic, version, header_length = _PREFIX.unpack_from(mapping, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a baseline snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version} (expected {SNAPSHOT_VERSION})")
+    header = json.loads(mapping[_PREFIX.size:_PREFIX.size + header_length])
+    data_start = _aligned(_PREFIX.size + header_length)
+    sections = header["sections"]
+
+    def column(name: str) -> np.ndarray:
+        section = sections[name]
+        dtype = np.dtype(section["dtype"])
+        shape = tuple(section["shape"])
+        count = int(np.prod(shape))
+        if count == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.frombuffer(mapping, dtype=dtype, count=count, offset=data_start + section["offset"]).reshape(shape)
+
+    store = BaselineStore(
+        alpha=header["alpha"],
+        top_k=header["top_k"],
+        max_metrics=header["max_metrics"],
+        capacity=0,
+        time_field=header.get("time_field", "timestamp")
+    )
+    for name in _COLUMNS:
+        setattr(store, name, column(name))
+    for sketch_name in _SKETCHES:
+        sketch = getattr(store, sketch_name)
+        sketch.ids = column(f"{sketch_name}.ids")
+        sketch.counts = column(f"{sketch_name}.counts")
+        sketch.load_items(header["items"][sketch_name])
+    store.metric_index = {name: col for col, name in enumerate(header["metrics"])}
+
+    blob = sections["agent_ids"]
+    start = data_start + blob["offset"]
+    agent_ids = mapping[start:start + blob["length"]].decode("utf-8").split("\0") if header["size"] else []
+    store.load_agent_ids(agent_ids)
+
+    logger.info(f"Restored {len(store)} baselines from {path}")
+    return store
+
+
+class SnapshotCheckpointer:
+    """Periodically checkpoints a detector's baselines without blocking the loop"""
+
+    def __init__(self, detector, path: str, interval: float = 300.0):
+        self.detector = detector
+        self.path = path
+        self.interval = interval
+        self.running = False
+        self.last_checkpoint: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+
+    async def run(self):
+        """Write a checkpoint every interval seconds until stopped"""
+        self.running = True
+        while self.running:
+            await asyncio.sleep(self.interval)
+            if self.running:
+                await self.checkpoint()
+
+    async def checkpoint(self):
+        """Capture on the loop, then write the snapshot in a worker thread"""
+        async with self._lock:
+            snapshot = capture_snapshot(self.detector.baselines)
+            try:
+                await asyncio.to_thread(write_snapshot, snapshot, self.path)
+            except Exception as e:
+                logger.error(f"Error writing baseline checkpoint: {e}")
+                return
+            self.last_checkpoint = datetime.now()
+            logger.info(f"Checkpointed {snapshot['size']} baselines to {self.path}")
+
+    async def stop(self):
+        """Stop periodic checkpoints and write a final one"""
+        self.running = False
+        await self.checkpoint()
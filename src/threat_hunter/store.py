@@ -0,0 +1,320 @@
+"""
+Threat Store
+
+Embedded SQLite store for investigation reports and response results, so
+threats can be queried after they have been handled. Writes are buffered
+and committed in groups by a background thread, keeping the event loop
+free; queries use keyset (cursor) pagination over indexed columns.
+"""
+
+import base64
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    Boolean, Column, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    and_, create_engine, event, func, or_, select,
+)
+
+from .investigator import InvestigationReport
+from .responder import ResponseResult
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+threats = Table(
+    "threats", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("agent_id", String(255), nullable=False),
+    Column("threat_type", String(64), nullable=False),
+    Column("severity", String(16), nullable=False),
+    Column("risk_score", Float, nullable=False),
+    Column("timestamp", Float, nullable=False),  # Epoch seconds, for cheap range scans
+    Column("details", Text, nullable=False),
+    Column("root_cause", Text, nullable=False),
+    Column("evidence", Text, nullable=False),
+    Column("timeline", Text, nullable=False),
+    Column("recommendations", Text, nullable=False),
+    Column("investigation_time", Float, nullable=False),
+    Index("ix_threats_agent_time", "agent_id", "timestamp"),
+    Index("ix_threats_severity_time", "severity", "timestamp"),
+    Index("ix_threats_type_time", "threat_type", "timestamp"),
+    Index("ix_threats_time", "timestamp"),
+)
+
+responses = Table(
+    "responses", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("threat_id", Integer, ForeignKey("threats.id"), nullable=False, index=True),
+    Column("action", String(32), nullable=False),
+    Column("success", Boolean, nullable=False),
+    Column("message", Text, nullable=False),
+    Column("timestamp", Float, nullable=False),
+)
+
+_SUMMARY_COLUMNS = (
+    threats.c.id, threats.c.agent_id, threats.c.threat_type, threats.c.severity, threats.c.risk_score,
+    threats.c.timestamp, threats.c.details, threats.c.root_cause, threats.c.recommendations,
+    threats.c.investigation_time,
+)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=str, separators=(",", ":"))
+
+
+def encode_cursor(timestamp: float, threat_id: int) -> str:
+    """Opaque cursor for the row after which the next page starts"""
+    return base64.urlsafe_b64encode(f"{timestamp!r}:{threat_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """Inverse of encode_cursor; raises ValueError on malformed cursors"""
+    try:
+        timestamp, threat_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return float(timestamp), int(threat_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+class ThreatStore:
+    """SQLite-backed store of handled threats with group-commit writes"""
+
+    def __init__(
+        self,
+        url: str = "sqlite:///threat_hunter.db",
+        max_batch: int = 5000,
+        max_pending: int = 100000,
+    ):
+        """
+        Args:
+            url: SQLAlchemy database URL; SQLite files get WAL journaling
+            max_batch: Most reports written in one transaction
+            max_pending: Buffered reports before new ones are dropped
+        """
+        self.url = url
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.engine = create_engine(url)
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", self._configure_sqlite)
+        metadata.create_all(self.engine)
+        with self.engine.connect() as connection:
+            self._next_id = (connection.execute(select(func.max(threats.c.id))).scalar() or 0) + 1
+
+        self.stats = {"written": 0, "dropped": 0, "batches": 0, "errors": 0}
+        self._pending: Deque[Tuple[InvestigationReport, Sequence[ResponseResult]]] = deque()
+        self._enqueued = 0
+        self._settled = 0
+        self._closing = False
+        self._condition = threading.Condition()
+        self._writer = threading.Thread(target=self._write_loop, name="threat-store-writer", daemon=True)
+        self._writer.start()
+
+    @staticmethod
+    def _configure_sqlite(connection, _record):
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints; a crash loses at most the last group commits
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    def record(self, investigation: InvestigationReport, results: Sequence[ResponseResult] = ()):
+        """
+        Queue a handled threat for writing
+
+        Never blocks: the write happens on the store's writer thread, in a
+        transaction shared with every other report queued meanwhile.
+
+        Args:
+            investigation: Investigation report, including its threat event
+            results: Response results for the threat
+        """
+        with self._condition:
+            if self._closing:
+                raise RuntimeError("ThreatStore is closed")
+            if len(self._pending) >= self.max_pending:
+                self.stats["dropped"] += 1
+                return
+            self._pending.append((investigation, results))
+            self._enqueued += 1
+            self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every report queued so far is written; False on timeout"""
+        with self._condition:
+            target = self._enqueued
+            return self._condition.wait_for(lambda: self._settled >= target, timeout)
+
+    def close(self):
+        """Write the remaining reports and stop the writer thread"""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._writer.join()
+        self.engine.dispose()
+
+    def query(
+        self,
+        agent_id: Optional[str] = None,
+        severity: Optional[str] = None,
+        threat_type: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Page through stored threats, newest first
+
+        Args:
+            agent_id: Only threats for this agent
+            severity: Only threats of this severity
+            threat_type: Only threats of this type
+            since: Earliest timestamp (epoch seconds, inclusive)
+            until: Latest timestamp (epoch seconds, exclusive)
+            limit: Page size
+            cursor: Cursor returned with the previous page
+
+        Returns:
+            The page of threats and the cursor for the next page, or None
+            on the last page
+        """
+        conditions = []
+        if agent_id is not None:
+            conditions.append(threats.c.agent_id == agent_id)
+        if severity is not None:
+            conditions.append(threats.c.severity == severity)
+        if threat_type is not None:
+            conditions.append(threats.c.threat_type == threat_type)
+        if since is not None:
+            conditions.append(threats.c.timestamp >= since)
+        if until is not None:
+            conditions.append(threats.c.timestamp < until)
+        if cursor is not None:
+            after_time, after_id = decode_cursor(cursor)
+            conditions.append(or_(
+                threats.c.timestamp < after_time,
+                and_(threats.c.timestamp == after_time, threats.c.id < after_id),
+            ))
+
+        statement = (
+            select(*_SUMMARY_COLUMNS)
+            .where(*conditions)
+            .order_by(threats.c.timestamp.desc(), threats.c.id.desc())
+            .limit(limit + 1)
+        )
+        with self.engine.connect() as connection:
+            rows = connection.execute(statement).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+        return [self._summary(row) for row in rows], next_cursor
+
+    def get(self, threat_id: int) -> Optional[Dict]:
+        """A stored threat with its full investigation and response results"""
+        with self.engine.connect() as connection:
+            row = connection.execute(select(threats).where(threats.c.id == threat_id)).first()
+            if row is None:
+                return None
+            actions = connection.execute(
+                select(responses).where(responses.c.threat_id == threat_id).order_by(responses.c.id)
+            ).all()
+        threat = self._summary(row)
+        threat["evidence"] = json.loads(row.evidence)
+        threat["timeline"] = json.loads(row.timeline)
+        threat["responses"] = [
+            {
+                "action": action.action,
+                "success": action.success,
+                "message": action.message,
+                "timestamp": datetime.fromtimestamp(action.timestamp).isoformat(),
+            }
+            for action in actions
+        ]
+        return threat
+
+    def _summary(self, row) -> Dict:
+        return {
+            "id": row.id,
+            "agent_id": row.agent_id,
+            "threat_type": row.threat_type,
+            "severity": row.severity,
+            "risk_score": row.risk_score,
+            "timestamp": datetime.fromtimestamp(row.timestamp).isoformat(),
+            "details": json.loads(row.details),
+            "root_cause": row.root_cause,
+            "recommendations": json.loads(row.recommendations),
+            "investigation_time": row.investigation_time,
+        }
+
+    def _write_loop(self):
+        """Drain the buffer in batches until closed"""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closing)
+                if not self._pending:
+                    return  # Closing with nothing left to write
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            try:
+                self._write(batch)
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Failed to write {len(batch)} threat reports: {e}")
+            with self._condition:
+                self._settled += len(batch)
+                self._condition.notify_all()
+
+    def _write(self, batch: List[Tuple[InvestigationReport, Sequence[ResponseResult]]]):
+        """Insert a batch of reports and their response results in one transaction"""
+        threat_rows = []
+        response_rows = []
+        for investigation, results in batch:
+            threat = investigation.threat_event
+            threat_id = self._next_id
+            self._next_id += 1
+            threat_rows.append({
+                "id": threat_id,
+                "agent_id": threat.agent_id,
+                "threat_type": threat.threat_type,
+                "severity": threat.severity,
+                "risk_score": float(threat.risk_score),
+                "timestamp": threat.timestamp.timestamp(),
+                "details": _dumps(threat.details),
+                "root_cause": investigation.root_cause,
+                "evidence": _dumps(investigation.evidence),
+                "timeline": _dumps(investigation.timeline),
+                "recommendations": _dumps(investigation.recommendations),
+                "investigation_time": float(investigation.investigation_time),
+            })
+            for result in results:
+                response_rows.append({
+                    "threat_id": threat_id,
+                    "action": result.action.value,
+                    "success": result.success,
+                    "message": result.message,
+                    "timestamp": result.timestamp.timestamp(),
+                })
+        with self.engine.begin() as connection:
+            connection.execute(threats.insert(), threat_rows)
+            if response_rows:
+                connection.execute(responses.insert(), response_rows)
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Parse an epoch-seconds or ISO 8601 query parameter"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
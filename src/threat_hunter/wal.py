@@ -0,0 +1,367 @@
+"""
+Threat Event Log
+
+Append-only, segmented write-ahead log for threat events between
+detection and response, so a crash loses no detected threat. Appends are
+made durable by group commit: every append waiting at the same time
+shares one fsync. Each pipeline stage acknowledges the events it has
+finished, and the acknowledgements are checkpointed with the commits;
+on startup the events a stage has not acknowledged are replayed.
+Delivery is at least once: an event handled after the last checkpoint
+is delivered again, under the same response key.
+
+Segment layout (``<first lsn>.log``), one record after another:
+    <u32 payload length><u32 crc32 of payload><u64 lsn>   header
+    payload                                               encoded event
+
+Stage offsets live in ``offsets.json`` next to the segments, replaced
+atomically at each checkpoint.
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .detector import ThreatEvent
+
+logger = logging.getLogger(__name__)
+
+# Stages of the ingestion pipeline that acknowledge logged events
+INVESTIGATION_STAGE = "investigation"
+RESPONSE_STAGE = "response"
+PIPELINE_STAGES = (INVESTIGATION_STAGE, RESPONSE_STAGE)
+
+_HEADER = struct.Struct("<IIQ")
+_SUFFIX = ".log"
+_OFFSETS = "offsets.json"
+
+
+def encode_event(event: ThreatEvent) -> bytes:
+    """Serialize a threat event for the log"""
+    return json.dumps({
+        "agent_id": event.agent_id,
+        "threat_type": event.threat_type,
+        "risk_score": float(event.risk_score),
+        "timestamp": event.timestamp.isoformat(),
+        "details": event.details,
+        "severity": event.severity,
+    }, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def decode_event(payload: bytes) -> ThreatEvent:
+    """Inverse of encode_event"""
+    data = json.loads(payload)
+    return ThreatEvent(
+        data["agent_id"], data["threat_type"], data["risk_score"],
+        datetime.fromisoformat(data["timestamp"]), data["details"], data["severity"]
+    )
+
+
+def response_key(lsn: int) -> str:
+    """
+    Idempotency key of a logged event
+
+    Derived from its LSN, so every delivery of the event, before and
+    after a restart, carries the same key, while distinct detections with
+    identical content get distinct keys.
+    """
+    return f"threat-{lsn}"
+
+
+def _scan(mapping, size: int) -> Iterator[Tuple[int, int, int]]:
+    """(lsn, payload start, payload end) of each intact record, stopping at a torn tail"""
+    position = 0
+    while position + _HEADER.size <= size:
+        length, crc, lsn = _HEADER.unpack_from(mapping, position)
+        start = position + _HEADER.size
+        end = start + length
+        if end > size or zlib.crc32(mapping[start:end]) != crc:
+            return
+        yield lsn, start, end
+        position = end
+
+
+class _Segment:
+    __slots__ = ("first_lsn", "path", "last_lsn")
+
+    def __init__(self, first_lsn: int, path: str, last_lsn: int):
+        self.first_lsn = first_lsn
+        self.path = path
+        self.last_lsn = last_lsn  # first_lsn - 1 while empty
+
+
+class _Stage:
+    """Contiguous acknowledged offset plus the acknowledgements beyond it"""
+    __slots__ = ("offset", "acked")
+
+    def __init__(self, offset: int = 0, acked: Iterable[int] = ()):
+        self.offset = offset
+        self.acked: Set[int] = set(acked)
+
+    def ack(self, lsn: int):
+        if lsn <= self.offset:
+            return
+        self.acked.add(lsn)
+        while self.offset + 1 in self.acked:
+            self.offset += 1
+            self.acked.remove(self.offset)
+
+    def done(self, lsn: int) -> bool:
+        return lsn <= self.offset or lsn in self.acked
+
+
+class EventLog:
+    """Segmented write-ahead log with group commit and per-stage offsets"""
+
+    def __init__(
+        self,
+        directory: str,
+        stages: Iterable[str] = PIPELINE_STAGES,
+        segment_bytes: int = 64 * 1024 * 1024,
+        commit_delay: float = 0.001,
+    ):
+        """
+        Args:
+            directory: Directory holding the segments and stage offsets
+            stages: Names of the stages acknowledging events
+            segment_bytes: Size after which appends roll to a new segment
+            commit_delay: Seconds a commit waits for more appends to join it
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.commit_delay = commit_delay
+        self.stats = {"appended": 0, "commits": 0, "checkpoints": 0, "segments_deleted": 0, "truncated_bytes": 0}
+        os.makedirs(directory, exist_ok=True)
+
+        self._stages = {name: _Stage() for name in stages}
+        if not self._stages:
+            raise ValueError("EventLog needs at least one stage")
+        self._load_offsets()
+        self._segments: List[_Segment] = []
+        self._recover()
+
+        self._durable = self._next_lsn - 1
+        self._dirty = False
+        self._unsynced: List[int] = []  # Descriptors of rolled segments awaiting their final fsync
+        self._commit: Optional[asyncio.Future] = None
+        self._closed = False
+
+    def _load_offsets(self):
+        path = os.path.join(self.directory, _OFFSETS)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as handle:
+            saved = json.load(handle)["stages"]
+        for name, stage in self._stages.items():
+            if name in saved:
+                stage.offset = saved[name]["offset"]
+                stage.acked = set(saved[name]["acked"])
+
+    def _recover(self):
+        """Find the segments, truncate a torn tail and open the last segment for appends"""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(_SUFFIX))
+        for name in names:
+            first_lsn = int(name[:-len(_SUFFIX)])
+            self._segments.append(_Segment(first_lsn, os.path.join(self.directory, name), first_lsn - 1))
+
+        if self._segments:
+            tail = self._segments[-1]
+            size = os.path.getsize(tail.path)
+            end = 0
+            if size:
+                with open(tail.path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                    for lsn, _, end in _scan(mapping, size):
+                        tail.last_lsn = lsn
+            if end < size:
+                # A record cut short by the crash was never acknowledged to its writer
+                logger.warning(f"Truncating {size - end} bytes of torn writes from {tail.path}")
+                os.truncate(tail.path, end)
+                self.stats["truncated_bytes"] += size - end
+            for segment, following in zip(self._segments, self._segments[1:]):
+                segment.last_lsn = following.first_lsn - 1
+            self._next_lsn = tail.last_lsn + 1
+        else:
+            # Every segment was deleted once acknowledged; continue after the stage offsets
+            self._next_lsn = max(max(stage.offset, max(stage.acked, default=0)) for stage in self._stages.values()) + 1
+
+        if not self._segments or os.path.getsize(self._segments[-1].path) >= self.segment_bytes:
+            self._new_segment()
+        self._fd = os.open(self._segments[-1].path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = os.path.getsize(self._segments[-1].path)
+
+    def _new_segment(self):
+        path = os.path.join(self.directory, f"{self._next_lsn:020d}{_SUFFIX}")
+        self._segments.append(_Segment(self._next_lsn, path, self._next_lsn - 1))
+
+    @property
+    def last_lsn(self) -> int:
+        """LSN of the newest appended event"""
+        return self._next_lsn - 1
+
+    @property
+    def durable_lsn(self) -> int:
+        """LSN up to which appends have been fsynced"""
+        return self._durable
+
+    def append(self, payloads: List[bytes]) -> List[int]:
+        """
+        Write events to the log, without waiting for them to be durable
+
+        Returns:
+            The LSN of each payload; await sync() before acting on them
+        """
+        if self._closed:
+            raise RuntimeError("EventLog is closed")
+        if self._size >= self.segment_bytes:
+            self._roll()
+        lsns = list(range(self._next_lsn, self._next_lsn + len(payloads)))
+        records = []
+        for lsn, payload in zip(lsns, payloads):
+            records.append(_HEADER.pack(len(payload), zlib.crc32(payload), lsn))
+            records.append(payload)
+        blob = b"".join(records)
+        os.write(self._fd, blob)  # One write per batch; O_APPEND keeps records whole
+        self._size += len(blob)
+        self._next_lsn += len(payloads)
+        self._segments[-1].last_lsn = self._next_lsn - 1
+        self.stats["appended"] += len(payloads)
+        return lsns
+
+    async def append_durable(self, payloads: List[bytes]) -> List[int]:
+        """Write events and wait for the group commit that makes them durable"""
+        lsns = self.append(payloads)
+        if lsns:
+            await self.sync(lsns[-1])
+        return lsns
+
+    def _roll(self):
+        """Start a new segment; the old one is fsynced and closed by the next commit"""
+        self._unsynced.append(self._fd)
+        self._new_segment()
+        self._fd = os.open(self._segments[-1].path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = 0
+
+    async def sync(self, lsn: Optional[int] = None):
+        """
+        Wait until every event up to lsn (default: all appended) is durable
+
+        Callers waiting together share one commit, and the commit also
+        checkpoints the stage offsets.
+        """
+        target = self.last_lsn if lsn is None else lsn
+        while self._durable < target:
+            await self._join_commit()
+
+    async def checkpoint(self):
+        """Commit pending appends and write the stage offsets now"""
+        if self._commit is not None:
+            await asyncio.shield(self._commit)  # Took its snapshot of the offsets already
+        self._dirty = True
+        await self._join_commit()
+
+    async def _join_commit(self):
+        if self._commit is None:
+            self._commit = asyncio.ensure_future(self._group_commit())
+        await asyncio.shield(self._commit)
+
+    async def _group_commit(self):
+        try:
+            if self.commit_delay:
+                await asyncio.sleep(self.commit_delay)  # Let concurrent appenders join this fsync
+            upto = self.last_lsn
+            rolled, self._unsynced = self._unsynced, []
+            offsets = self._offsets() if self._dirty else None
+            self._dirty = False
+            await asyncio.to_thread(self._commit_files, self._fd, rolled, offsets)
+            self._durable = max(self._durable, upto)
+            self.stats["commits"] += 1
+            if offsets is not None:
+                self.stats["checkpoints"] += 1
+                self._delete_acknowledged()
+        finally:
+            self._commit = None
+
+    def _commit_files(self, fd: int, rolled: List[int], offsets: Optional[Dict]):
+        """Runs in a worker thread: fsync segments, then replace the offsets file"""
+        for old in rolled:
+            os.fsync(old)
+            os.close(old)
+        os.fsync(fd)
+        if offsets is not None:
+            path = os.path.join(self.directory, _OFFSETS)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(offsets, handle)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp_path, path)
+
+    def ack(self, stage: str, lsn: int):
+        """Record that a stage has finished an event; checkpointed with the next commit"""
+        self._stages[stage].ack(lsn)
+        self._dirty = True
+
+    def offset(self, stage: str) -> int:
+        """LSN up to which a stage has acknowledged every event"""
+        return self._stages[stage].offset
+
+    def lag(self, stage: str) -> int:
+        """Appended events a stage has not acknowledged"""
+        state = self._stages[stage]
+        return self.last_lsn - state.offset - len(state.acked)
+
+    def _offsets(self) -> Dict:
+        return {"stages": {
+            name: {"offset": stage.offset, "acked": sorted(stage.acked)} for name, stage in self._stages.items()
+        }}
+
+    def _delete_acknowledged(self):
+        """Delete the closed segments every stage has acknowledged completely"""
+        floor = min(stage.offset for stage in self._stages.values())
+        while len(self._segments) > 1 and self._segments[0].last_lsn <= floor:
+            segment = self._segments.pop(0)
+            try:
+                os.remove(segment.path)
+                self.stats["segments_deleted"] += 1
+            except OSError as e:
+                logger.error(f"Failed to delete event log segment {segment.path}: {e}")
+
+    def pending(self, stage: str) -> Iterator[Tuple[int, bytes]]:
+        """
+        Events a stage has not acknowledged, oldest first
+
+        Segments are memory-mapped and records sliced out of the mapping,
+        so recovery reads only the pages holding unacknowledged events.
+        """
+        state = self._stages[stage]
+        for segment in list(self._segments):
+            if segment.last_lsn <= state.offset:
+                continue
+            try:
+                handle = open(segment.path, "rb")
+            except FileNotFoundError:
+                continue
+            with handle:
+                size = os.fstat(handle.fileno()).st_size
+                if not size:
+                    continue
+                with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                    for lsn, start, end in _scan(mapping, size):
+                        if lsn > self.last_lsn:
+                            break
+                        if not state.done(lsn):
+                            yield lsn, mapping[start:end]
+
+    async def close(self):
+        """Commit, checkpoint the stage offsets and close the segment files"""
+        if self._closed:
+            return
+        await self.checkpoint()
+        self._closed = True
+        os.close(self._fd)
@@ -0,0 +1,196 @@
+"""
+Tests for alert aggregation
+"""
+
+import asyncio
+import threading
+from datetime import datetime
+
+from src.threat_hunter.alerting import AlertAggregator, AlertChannel, TokenBucket
+from src.threat_hunter.detector import ThreatEvent
+from src.threat_hunter.investigator import ThreatInvestigator
+from src.threat_hunter.responder import ThreatResponder
+
+
+class RecordingChannel(AlertChannel):
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, alert):
+        self.sent.append(alert)
+
+
+def _event(agent_id, severity="high", threat_type="behavioral_anomaly"):
+    return ThreatEvent(agent_id, threat_type, 0.8, datetime.now(), {}, severity)
+
+
+def test_identical_alerts_become_one_digest():
+    """Test a fleet-wide storm produces one digest per group"""
+    channel = RecordingChannel()
+    aggregator = AlertAggregator(channel, window=60.0)
+
+    async def scenario():
+        for i in range(1000):
+            await aggregator.submit(_event(f"agent-{i}"), "baseline deviation")
+        await aggregator.submit(_event("agent-x", "medium"), "baseline deviation")
+        assert channel.sent == []
+        await aggregator.flush(close_all=True)
+
+    asyncio.run(scenario())
+    assert len(channel.sent) == 2
+    digest = next(d for d in channel.sent if d["severity"] == "high")
+    assert digest["count"] == 1000
+    assert digest["agent_count"] == 100 and digest["agents_truncated"]
+
+
+def test_digests_summarize_a_sliding_window():
+    """Test a group sends at most one digest per slide, each covering the trailing window"""
+    channel = RecordingChannel()
+    now = [0.0]
+    aggregator = AlertAggregator(channel, window=60.0, slide=15.0, clock=lambda: now[0])
+
+    async def scenario():
+        async def alerts(count, at):
+            now[0] = at
+            for i in range(count):
+                await aggregator.submit(_event(f"agent-{i}"), "cause")
+
+        async def flush(at):
+            now[0] = at
+            await aggregator.flush()
+
+        await alerts(10, 1.0)
+        await flush(10.0)
+        assert channel.sent == []  # Not due before one slide
+        await flush(16.0)
+        await alerts(5, 20.0)
+        await flush(30.0)
+        assert len(channel.sent) == 1
+        await flush(36.0)
+        await alerts(3, 100.0)  # The first two bursts have left the window
+        await flush(116.0)
+
+    asyncio.run(scenario())
+    assert [(d["count"], d["new_count"]) for d in channel.sent] == [(10, 10), (15, 5), (3, 3)]
+
+
+def test_spill_file_is_written_off_the_event_loop(tmp_path):
+    """Test spilling and reading back digests run in worker threads"""
+    threads = set()
+
+    class ThreadRecordingAggregator(AlertAggregator):
+        def _write_spill(self, digests):
+            threads.add(threading.get_ident())
+            super()._write_spill(digests)
+
+        def _read_spill(self, offset, limit):
+            threads.add(threading.get_ident())
+            return super()._read_spill(offset, limit)
+
+    aggregator = ThreadRecordingAggregator(
+        RecordingChannel(), window=0.0, rate=0.0, burst=0, buffer_size=1, spill_path=str(tmp_path / "alerts.jsonl")
+    )
+
+    async def scenario():
+        for i in range(3):
+            await aggregator.submit(_event("agent-1", threat_type=f"threat-{i}"), "cause")
+        await aggregator.flush()
+        aggregator.limiter = TokenBucket(rate=0.0, capacity=10)
+        await aggregator.flush()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert aggregator.stats["spilled"] == 2 and aggregator.pending == 0
+    assert threads and loop_thread not in threads
+
+
+def test_critical_alerts_are_immediate():
+    """Test critical alerts bypass aggregation"""
+    channel = RecordingChannel()
+    aggregator = AlertAggregator(channel, window=60.0, rate=0.0, burst=0)
+    message = asyncio.run(aggregator.submit(_event("agent-1", "critical"), "escalation"))
+    assert message == "Alert sent to security team"
+    assert channel.sent[0]["severity"] == "critical"
+
+
+def test_rate_limit_and_disk_overflow(tmp_path):
+    """Test digests beyond the rate limit wait, overflowing to disk when the buffer is full"""
+    channel = RecordingChannel()
+    spill = tmp_path / "alerts.jsonl"
+    aggregator = AlertAggregator(channel, window=0.0, rate=0.0, burst=2, buffer_size=3, spill_path=str(spill))
+
+    async def scenario():
+        for i in range(10):
+            await aggregator.submit(_event("agent-1", threat_type=f"threat-{i}"), "cause")
+        await aggregator.flush()
+
+    asyncio.run(scenario())
+    assert [d["threat_type"] for d in channel.sent] == ["threat-0", "threat-1"]
+    assert aggregator.stats["spilled"] == 7
+    assert aggregator.pending == 8
+
+    aggregator.limiter = TokenBucket(rate=0.0, capacity=100)
+    asyncio.run(aggregator.flush())
+    assert [d["threat_type"] for d in channel.sent] == [f"threat-{i}" for i in range(10)]
+    assert aggregator.pending == 0
+    assert not spill.exists()
+
+
+def test_responder_routes_alerts_through_aggregator():
+    """Test the responder hands alerts and root causes to the aggregator"""
+    channel = RecordingChannel()
+    aggregator = AlertAggregator(channel)
+    responder = ThreatResponder(alerts=aggregator)
+
+    async def scenario():
+        event = _event("agent-1")
+        investigation = await ThreatInvestigator().investigate(event)
+        results = await responder.respond(event, investigation)
+        await aggregator.flush(close_all=True)
+        return results, investigation
+
+    results, investigation = asyncio.run(scenario())
+    assert results[-1].message == "Alert queued for digest"
+    assert channel.sent[0]["root_cause"] == investigation.root_cause
+
+
+def test_missing_spill_file_counts_as_empty(tmp_path):
+    """Test a spill file removed behind the aggregator's back drops its digests instead of failing every flush"""
+    channel = RecordingChannel()
+    spill = tmp_path / "alerts.jsonl"
+    aggregator = AlertAggregator(channel, window=0.0, rate=0.0, burst=1, buffer_size=1, spill_path=str(spill))
+
+    async def scenario():
+        for i in range(4):
+            await aggregator.submit(_event("agent-1", threat_type=f"threat-{i}"), "cause")
+        await aggregator.flush()
+        spill.unlink()
+        aggregator.limiter = TokenBucket(rate=0.0, capacity=100)
+        await aggregator.flush()
+
+    asyncio.run(scenario())
+    assert [d["threat_type"] for d in channel.sent] == ["threat-0", "threat-1"]
+    assert aggregator.pending == 0
+    assert aggregator.stats["dropped"] == 2
+
+
+def test_run_survives_flush_errors():
+    """Test the flush loop logs a failing pass and keeps going"""
+    aggregator = AlertAggregator(RecordingChannel(), window=0.0)
+    passes = []
+
+    async def flaky_flush(close_all=False):
+        passes.append(close_all)
+        if len(passes) == 1:
+            raise OSError("disk full")
+
+    async def scenario():
+        aggregator.flush = flaky_flush
+        task = asyncio.create_task(aggregator.run(interval=0.01))
+        while len(passes) < 3 and not task.done():
+            await asyncio.sleep(0.01)
+        aggregator.running = False
+        await asyncio.wait_for(task, 1)
+
+    asyncio.run(scenario())
+    assert len(passes) >= 3
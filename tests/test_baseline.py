@@ -0,0 +1,79 @@
+"""
+Tests for online behavioral baselines
+"""
+
+import statistics
+
+import numpy as np
+import pytest
+
+from src.threat_hunter.baseline import OnlineBaseline, RunningStat, TopKSketch
+from src.threat_hunter.detector import ThreatDetector
+
+
+def test_running_stat_matches_batch_statistics():
+    """Test Welford updates match mean/variance computed from scratch"""
+    values = [10, 12, 11, 9, 50, 13, 10]
+    stat = RunningStat()
+    for value in values:
+        stat.update(value, alpha=0.5)
+    assert stat.count == len(values)
+    assert stat.mean == pytest.approx(statistics.mean(values))
+    assert stat.variance == pytest.approx(statistics.variance(values))
+
+
+def test_top_k_sketch_is_bounded():
+    """Test the action sketch keeps at most k entries and the heavy hitters"""
+    sketch = TopKSketch(k=3)
+    for i in range(1000):
+        sketch.add("process_request")
+        sketch.add(f"rare-{i}")
+    assert len(sketch.counts) == 3
+    assert sketch.top(1)[0][0] == "process_request"
+
+
+def test_baseline_memory_is_constant():
+    """Test the baseline does not grow with history"""
+    baseline = OnlineBaseline(top_k=5)
+    for i in range(10000):
+        baseline.update({"api_calls": i % 7, "action": f"action-{i}", "data_access": [f"table-{i}"]})
+    assert baseline.events == 10000
+    assert len(baseline.actions.counts) == 5
+    assert len(baseline.data_access.counts) == 5
+    assert list(baseline.metrics) == ["api_calls"]
+
+
+def test_establish_baseline_streams_history():
+    """Test establish_baseline consumes a generator of records"""
+    detector = ThreatDetector()
+    detector.establish_baseline("agent-1", ({"api_calls": 10 + i % 3} for i in range(1000)))
+    assert detector.baselines["agent-1"].metrics["api_calls"].count == 1000
+
+
+def test_z_score_deviation_raises_risk():
+    """Test deviations from the baseline contribute to the risk score"""
+    detector = ThreatDetector()
+    detector.establish_baseline("agent-1", [{"api_calls": 10}, {"api_calls": 12}, {"api_calls": 11}])
+    assert detector._calculate_risk_score("agent-1", {"api_calls": 11}) == 0.0
+    assert detector._calculate_risk_score("agent-1", {"api_calls": 500}) == pytest.approx(0.4)
+    assert detector._calculate_risk_score("agent-2", {"api_calls": 500}) == 0.0
+
+    threat = detector.detect_anomaly("agent-1", {"api_calls": 500, "data_access_spike": True})
+    assert threat is not None
+    assert threat.risk_score == pytest.approx(0.8)
+
+
+def test_batch_z_scores_match_scalar_path():
+    """Test batch scoring applies the same baseline deviations"""
+    detector = ThreatDetector()
+    detector.establish_baseline("agent-1", [{"api_calls": v} for v in (10, 12, 11, 14, 9)])
+    detector.establish_baseline("agent-2", [{"api_calls": 100}])
+    batch = {
+        "agent_id": np.array(["agent-1", "agent-1", "agent-2", "agent-3"]),
+        "api_calls": np.array([11, 40, 400, 400]),
+        "data_access_spike": np.array([True, True, True, True]),
+    }
+    scores = detector._calculate_risk_scores(batch["agent_id"], batch)
+    for row, agent_id in enumerate(batch["agent_id"].tolist()):
+        activity = {"api_calls": int(batch["api_calls"][row]), "data_access_spike": True}
+        assert scores[row] == detector._calculate_risk_score(agent_id, activity)
@@ -0,0 +1,134 @@
+"""
+Tests for the compact baseline store
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from src.threat_hunter.baseline import OnlineBaseline
+from src.threat_hunter.baseline_store import BaselineStore
+from src.threat_hunter.detector import ThreatEvent
+from src.threat_hunter.investigator import InvestigationReport
+from src.threat_hunter.responder import ResponseAction, ResponseResult
+
+HISTORY = [
+    {"api_calls": 10, "action": "read", "data_access": ["users"]},
+    {"api_calls": 14, "action": "read", "data_access": ["users", "orders"]},
+    {"api_calls": 9, "action": "write", "data_access": ["orders"]},
+]
+
+
+def test_store_updates_match_online_baseline():
+    """Test row updates produce the same statistics as OnlineBaseline"""
+    store = BaselineStore(capacity=1)
+    reference = OnlineBaseline()
+    for activity in HISTORY:
+        store.update("agent-1", activity)
+        reference.update(activity)
+
+    view = store["agent-1"]
+    assert view.events == reference.events
+    stat, expected = view.metrics["api_calls"], reference.metrics["api_calls"]
+    assert (stat.count, stat.mean, stat.m2, stat.ewma) == (expected.count, expected.mean, expected.m2, expected.ewma)
+    assert view.actions == reference.actions.top()
+    assert dict(view.data_access) == dict(reference.data_access.top())
+    assert view.max_z_score({"api_calls": 40}) == reference.max_z_score({"api_calls": 40})
+
+
+def test_store_interns_and_grows():
+    """Test agent IDs map to stable rows across capacity growth"""
+    store = BaselineStore(capacity=2)
+    for i in range(100):
+        store.update(f"agent-{i}", {"api_calls": i})
+    assert len(store) == 100
+    assert store.capacity >= 100
+    assert store.intern("agent-42") == 42
+    assert "agent-99" in store and "agent-100" not in store
+    assert store.get("agent-100") is None
+    assert store["agent-42"].metrics["api_calls"].mean == 42.0
+
+
+def test_assign_online_baseline():
+    """Test assigning an OnlineBaseline replaces the agent's row"""
+    store = BaselineStore()
+    store.update("agent-1", {"api_calls": 1000})
+    baseline = OnlineBaseline()
+    for activity in HISTORY:
+        baseline.update(activity)
+    store["agent-1"] = baseline
+    assert store["agent-1"].metrics["api_calls"].mean == pytest.approx(11.0)
+    assert store["agent-1"].actions[0] == ("read", 2)
+
+
+def test_vectorized_z_scores():
+    """Test vectorized z-scores match the per-agent view"""
+    store = BaselineStore()
+    for activity in HISTORY:
+        store.update("agent-1", activity)
+    store.update("agent-2", {"api_calls": 5})
+    rows = store.rows(["agent-1", "agent-2", "agent-3"])
+    z_scores = store.z_scores(rows, "api_calls", np.array([30.0, 30.0, 30.0]))
+    assert z_scores[0] == store["agent-1"].z_score("api_calls", 30.0)
+    assert np.isnan(z_scores[1:]).all()
+
+
+def test_records_are_slotted():
+    """Test hot-path records carry no per-instance __dict__"""
+    event = ThreatEvent("agent-1", "behavioral_anomaly", 0.8, datetime.now(), {}, "high")
+    report = InvestigationReport(event, "cause", [], [], [], 0.0)
+    result = ResponseResult(ResponseAction.ALERT, True, "sent", datetime.now())
+    for record in (event, report, result):
+        assert not hasattr(record, "__dict__")
+
+
+def test_export_and_remove():
+    """Test agents can be exported and removed while other rows stay intact"""
+    store = BaselineStore()
+    for i in range(5):
+        for activity in HISTORY:
+            store.update(f"agent-{i}", dict(activity, api_calls=activity["api_calls"] + i))
+
+    exported = store.export("agent-1")
+    assert exported.metrics["api_calls"].mean == store["agent-1"].metrics["api_calls"].mean
+    assert exported.actions.top() == store["agent-1"].actions
+
+    expected = store.export("agent-4").metrics["api_calls"].mean
+    store.remove("agent-1")
+    assert len(store) == 4 and "agent-1" not in store
+    assert store["agent-4"].metrics["api_calls"].mean == expected
+    assert store.intern("agent-4") == 1
+
+    copy = BaselineStore()
+    copy["agent-1"] = exported
+    assert copy["agent-1"].events == 3
+
+
+def test_evicted_items_leave_the_intern_table():
+    """Test items dropped by every sketch are freed, keeping the intern table bounded by the slots in use"""
+    store = BaselineStore(top_k=4)
+    for i in range(100000):
+        store.update(f"agent-{i % 10}", {"action": f"action-{i}"})
+    assert store.actions.interned <= 10 * 4
+    assert len(store.actions.items) <= 10 * 4 + 1
+    assert {item for item, _ in store["agent-3"].actions} <= set(store.actions.items)
+
+    store.update("agent-0", {"action": "shared"})
+    store.update("agent-1", {"action": "shared"})
+    store.remove("agent-0")
+    assert "shared" in dict(store["agent-1"].actions)  # Still held by agent-1
+    store.remove("agent-1")
+    assert "shared" not in store.actions.items
+
+
+def test_time_field_is_never_a_metric():
+    """Test epoch timestamps are not learned as metrics, under the configured time field"""
+    store = BaselineStore(time_field="ts")
+    store.update("agent-1", {"ts": 1714521600.0, "timestamp": 3, "requests": 10})
+    assert set(store.metric_index) == {"timestamp", "requests"}
+    assert set(store.export("agent-1").metrics) == {"timestamp", "requests"}
+
+    baseline = OnlineBaseline()
+    baseline.update({"timestamp": 1714521600.0, "requests": 10})
+    assert set(baseline.metrics) == {"requests"}
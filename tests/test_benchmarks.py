@@ -0,0 +1,24 @@
+"""
+Tests for the benchmark tooling
+"""
+
+from benchmarks.suite import compare
+from benchmarks.workload import ActivityGenerator
+
+
+def test_workload_is_reproducible():
+    """Test the generator yields the same records for the same seed"""
+    first = ActivityGenerator(agents=100, anomaly_rate=0.1, seed=3).records(500)
+    second = ActivityGenerator(agents=100, anomaly_rate=0.1, seed=3).records(500)
+    assert first == second
+    assert 10 < sum(r["unusual_api_calls"] > 10 for r in first) < 100
+
+
+def test_compare_flags_regressions_by_direction():
+    """Test throughput drops and latency increases are both regressions"""
+    baseline = {"detect_events_per_sec": 1000.0, "e2e_p99_seconds": 0.010, "startup_import_seconds": 0.1}
+    results = {"detect_events_per_sec": 700.0, "e2e_p99_seconds": 0.020, "startup_import_seconds": 0.05}
+    regressions = compare(results, baseline, tolerance=0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("detect_events_per_sec")
+    assert regressions[1].startswith("e2e_p99_seconds")
@@ -0,0 +1,156 @@
+"""
+Tests for the event-time correlation engine
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from src.threat_hunter.correlation import CorrelationEngine, WindowSpec
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.investigator import ThreatInvestigator
+
+
+def _engine(*windows, **kwargs):
+    kwargs.setdefault("allowed_lateness", 0.0)
+    return CorrelationEngine(list(windows), **kwargs)
+
+
+def test_tumbling_window_emits_on_close():
+    """Test a window emits once the watermark passes its end"""
+    engine = _engine(WindowSpec("burst", "tumbling", 60.0, "behavioral_anomaly", min_events=3, min_total_risk=1.2))
+    for second in (1, 10, 20):
+        engine.observe("agent-1", 0.5, {"n": second}, event_time=second)
+    assert engine.drain() == []
+
+    engine.observe("agent-1", 0.5, event_time=61)
+    events = engine.drain()
+    assert len(events) == 1
+    assert events[0].threat_type == "behavioral_anomaly"
+    assert events[0].details["event_count"] == 3
+    assert events[0].details["events"] == [{"n": 1}, {"n": 10}, {"n": 20}]
+    assert events[0].risk_score == pytest.approx(0.7 + 0.1 * (1.5 - 1.2))
+
+
+def test_sliding_window_catches_slow_exfiltration():
+    """Test sub-threshold events spread across tumbling boundaries still correlate"""
+    spec = WindowSpec("slow_exfil", "sliding", 300.0, "data_exfiltration", min_events=5, min_total_risk=2.0, slide=60.0)
+    engine = _engine(spec)
+    for minute in range(5):
+        engine.observe("agent-1", 0.45, {"bytes_out": 10_000}, event_time=minute * 60 + 30)
+    engine.observe("agent-2", 0.3, event_time=1000)
+
+    events = engine.drain()
+    assert len(events) == 1
+    assert events[0].agent_id == "agent-1"
+    assert events[0].threat_type == "data_exfiltration"
+    assert events[0].details["event_count"] == 5
+
+
+def test_sliding_window_suppresses_overlapping_emissions():
+    """Test one burst produces one composite event, not one per overlapping window"""
+    spec = WindowSpec("slow_exfil", "sliding", 300.0, "data_exfiltration", min_events=3, min_total_risk=1.0, slide=60.0)
+    engine = _engine(spec)
+    for second in (10, 20, 30):
+        engine.observe("agent-1", 0.5, event_time=second)
+    engine.observe("agent-9", 0.5, event_time=2000)
+    assert len(engine.drain()) == 1
+
+
+def test_session_window_closes_after_gap():
+    """Test a session stays open while events keep coming and closes after the gap"""
+    spec = WindowSpec("sustained", "session", 100.0, "behavioral_anomaly", min_events=4, min_total_risk=1.0,
+                      key_by="agent_threat_type")
+    engine = _engine(spec)
+    for second in (0, 90, 180, 270):
+        engine.observe("agent-1", 0.3, event_time=second, threat_type="probe")
+    engine.observe("agent-2", 0.3, event_time=360)
+    assert engine.drain() == []
+
+    engine.observe("agent-2", 0.3, event_time=371)
+    events = engine.drain()
+    assert len(events) == 1
+    assert events[0].details["source_threat_type"] == "probe"
+    assert events[0].details["event_count"] == 4
+
+
+def test_late_events_are_dropped():
+    """Test events behind the watermark are counted as late and ignored"""
+    engine = _engine(WindowSpec("burst", "tumbling", 60.0, "behavioral_anomaly", min_events=1, min_total_risk=0.1),
+                     allowed_lateness=30.0)
+    engine.observe("agent-1", 0.5, event_time=100)
+    engine.observe("agent-1", 0.5, event_time=75)  # Within lateness
+    engine.observe("agent-1", 0.5, event_time=50)
+    assert engine.stats["late"] == 1
+    assert engine.stats["observed"] == 2
+
+
+def test_state_is_bounded_by_max_keys():
+    """Test the least recently active keys are evicted, emitting what they hold"""
+    engine = _engine(WindowSpec("burst", "tumbling", 600.0, "behavioral_anomaly", min_events=2, min_total_risk=0.5),
+                     max_keys=10)
+    engine.observe("agent-0", 0.5, event_time=1)
+    engine.observe("agent-0", 0.5, event_time=2)
+    for index in range(1, 50):
+        engine.observe(f"agent-{index}", 0.3, event_time=3)
+    assert engine.open_keys == 10
+    assert engine.stats["evicted"] == 40
+    assert [event.agent_id for event in engine.drain()] == ["agent-0"]
+
+
+def test_min_risk_filters_noise_and_flush_closes_windows():
+    """Test low-risk records are ignored and flush emits open windows"""
+    engine = _engine(WindowSpec("burst", "tumbling", 60.0, "behavioral_anomaly", min_events=2, min_total_risk=0.5),
+                     min_risk=0.2)
+    engine.observe("agent-1", 0.1, event_time=1)
+    engine.observe("agent-1", 0.4, event_time=2)
+    engine.observe("agent-1", 0.4, event_time=3)
+    engine.flush()
+    events = engine.drain()
+    assert len(events) == 1
+    assert events[0].details["event_count"] == 2
+    assert engine.open_keys == 0
+
+
+def test_invalid_sliding_spec():
+    """Test sliding windows must be a whole number of slides"""
+    with pytest.raises(ValueError):
+        WindowSpec("bad", "sliding", 100.0, "behavioral_anomaly", slide=30.0)
+
+
+def test_detector_feeds_composite_events_to_playbooks():
+    """Test sub-threshold detections correlate into an event the exfiltration playbook investigates"""
+    spec = WindowSpec("slow_exfil", "sliding", 300.0, "data_exfiltration", min_events=4, min_total_risk=1.6, slide=60.0)
+    detector = ThreatDetector(correlator=_engine(spec))
+    for minute in range(4):
+        assert detector.detect_anomaly("agent-1", {"data_access_spike": True, "timestamp": minute * 60.0}) is None
+    columns = {"agent_id": np.array(["agent-2"]), "timestamp": np.array([900.0])}
+    assert detector.detect_anomalies_batch(columns) == []
+
+    events = detector.correlator.drain()
+    assert len(events) == 1
+    investigator = ThreatInvestigator({"offload_cpu_bound": False})
+    report = asyncio.run(investigator.investigate(events[0]))
+    assert report.root_cause == "Unusual data transfer patterns detected"
+    assert report.evidence[-1]["type"] == "correlated_events"
+    assert len(report.evidence[-1]["data"]) == 4
+
+
+def test_low_risk_activity_advances_the_watermark():
+    """Test quiet records close windows on the per-record and feature-batch paths alike"""
+    spec = WindowSpec("burst", "tumbling", 60.0, "behavioral_anomaly", min_events=2, min_total_risk=0.5)
+    risky = {"unusual_api_calls": 50}
+    for batched in (False, True):
+        detector = ThreatDetector(correlator=_engine(spec, min_risk=0.2))
+        for second in (1.0, 2.0):
+            detector.detect_anomaly("agent-1", {**risky, "timestamp": second})
+        quiet = [{"agent_id": f"agent-{i}", "timestamp": 61.0 + i} for i in range(3)]
+        if batched:
+            with detector.extract_features(quiet) as batch:
+                assert detector.detect_features(batch) == []
+        else:
+            for record in quiet:
+                assert detector.detect_anomaly(record["agent_id"], {"timestamp": record["timestamp"]}) is None
+        assert detector.correlator.watermark == 63.0
+        assert [event.details["event_count"] for event in detector.correlator.drain()] == [2]
@@ -2,6 +2,7 @@
 Tests for ThreatDetector
 """
 
+import numpy as np
 import pytest
 from datetime import datetime
 from src.threat_hunter.detector import ThreatDetector, ThreatEvent
@@ -49,3 +50,48 @@ def test_severity_determination():
     assert detector._determine_severity(0.75) == "high"
     assert detector._determine_severity(0.55) == "medium"
     assert detector._determine_severity(0.3) == "low"
+
+
+def test_batch_detection_matches_scalar_path():
+    """Test batch detection gives the same results as detect_anomaly"""
+    detector = ThreatDetector()
+    batch = {
+        "agent_id": np.array(["a1", "a2", "a3", "a4"]),
+        "unusual_api_calls": np.array([0, 50, 50, 5]),
+        "data_access_spike": np.array([False, True, True, False]),
+        "privilege_escalation": np.array([False, False, True, True]),
+    }
+    events = detector.detect_anomalies_batch(batch)
+
+    expected = []
+    for row, agent_id in enumerate(batch["agent_id"].tolist()):
+        activity = {name: column[row].item() for name, column in batch.items() if name != "agent_id"}
+        event = detector.detect_anomaly(agent_id, activity)
+        if event is not None:
+            expected.append(event)
+
+    assert [e.agent_id for e in events] == [e.agent_id for e in expected] == ["a2", "a3"]
+    assert [e.risk_score for e in events] == [e.risk_score for e in expected]
+    assert [e.severity for e in events] == [e.severity for e in expected]
+    assert [e.details for e in events] == [e.details for e in expected]
+
+
+def test_batch_detection_structured_array():
+    """Test batch detection accepts a NumPy structured array"""
+    detector = ThreatDetector()
+    batch = np.array(
+        [("a1", 20, True, False), ("a2", 0, False, False)],
+        dtype=[("agent_id", "U16"), ("unusual_api_calls", "i4"),
+               ("data_access_spike", "?"), ("privilege_escalation", "?")]
+    )
+    events = detector.detect_anomalies_batch(batch)
+    assert len(events) == 1
+    assert events[0].agent_id == "a1"
+    assert events[0].severity == "high"
+
+
+def test_batch_detection_requires_agent_id():
+    """Test batch detection rejects batches without agent_id"""
+    detector = ThreatDetector()
+    with pytest.raises(ValueError):
+        detector.detect_anomalies_batch({"unusual_api_calls": np.array([1])})
@@ -0,0 +1,124 @@
+"""
+Tests for shared investigation enrichment
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from src.threat_hunter.detector import ThreatEvent
+from src.threat_hunter.enrichment import EnrichmentService, FakeEnrichmentSource, TTLCache
+from src.threat_hunter.investigator import ThreatInvestigator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FailingSource(FakeEnrichmentSource):
+    async def fetch(self, agent_ids):
+        self.calls.append(list(agent_ids))
+        raise ConnectionError("backend down")
+
+
+def _event(agent_id, threat_type="behavioral_anomaly"):
+    return ThreatEvent(agent_id, threat_type, 0.8, datetime.now(), {}, "high")
+
+
+def test_ttl_cache_expires_and_evicts_lru():
+    """Test entries expire after the TTL and the least recently used goes first"""
+    clock = FakeClock()
+    cache = TTLCache(max_size=2, ttl=10.0, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # Evicts b, the least recently used
+    assert cache.get("b") is None
+    clock.now = 11.0
+    assert cache.get("a") is None
+    assert cache.stats == {"hits": 1, "misses": 2, "expired": 1, "evicted": 1}
+
+
+def test_concurrent_lookups_share_one_batched_fetch():
+    """Test many agents batch into one call and duplicate agents fetch once"""
+    source = FakeEnrichmentSource({f"agent-{i}": [f"log-{i}"] for i in range(10)}, latency=0.01)
+    service = EnrichmentService({"access_logs": source})
+
+    async def scenario():
+        return await asyncio.gather(*(service.get("access_logs", f"agent-{i % 10}") for i in range(50)))
+
+    values = asyncio.run(scenario())
+    assert values[13] == ["log-3"]
+    assert len(source.calls) == 1
+    assert sorted(source.calls[0]) == sorted(f"agent-{i}" for i in range(10))
+    assert service.stats["access_logs"]["coalesced"] == 40
+
+
+def test_cached_values_are_reused_until_they_expire():
+    """Test closely spaced lookups hit the cache and later ones refetch"""
+    clock = FakeClock()
+    source = FakeEnrichmentSource({"agent-1": {"role": "reader"}})
+    service = EnrichmentService({"permissions": source}, ttl=30.0, batch_window=0.0, clock=clock)
+
+    async def scenario():
+        first = await service.get("permissions", "agent-1")
+        missing = await service.get("permissions", "agent-2")
+        await service.get("permissions", "agent-1")
+        await service.get("permissions", "agent-2")  # Empty results are cached too
+        clock.now = 31.0
+        await service.get("permissions", "agent-1")
+        return first, missing
+
+    assert asyncio.run(scenario()) == ({"role": "reader"}, None)
+    assert source.calls == [["agent-1"], ["agent-2"], ["agent-1"]]
+    assert service.stats["permissions"]["hits"] == 2
+
+
+def test_failures_propagate_and_are_not_cached():
+    """Test a failed fetch raises for every waiter and the next lookup retries"""
+    source = FailingSource()
+    service = EnrichmentService({"permissions": source}, batch_window=0.0)
+
+    async def scenario():
+        results = await asyncio.gather(
+            service.get("permissions", "agent-1"), service.get("permissions", "agent-1"), return_exceptions=True
+        )
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert await service.lookup("agent-1", ["permissions", "model_history"]) == {}
+
+    asyncio.run(scenario())
+    assert source.calls == [["agent-1"], ["agent-1"]]
+
+
+def test_unknown_kind_raises():
+    """Test asking for a kind without a source is an error"""
+    service = EnrichmentService({})
+    with pytest.raises(KeyError):
+        asyncio.run(service.get("permissions", "agent-1"))
+
+
+def test_playbooks_share_enrichment():
+    """Test different playbooks for one agent reuse each other's lookups"""
+    access_logs = FakeEnrichmentSource({"agent-1": ["GET /secrets"]})
+    permissions = FakeEnrichmentSource({"agent-1": ["admin"]})
+    service = EnrichmentService({"access_logs": access_logs, "permissions": permissions})
+    investigator = ThreatInvestigator({"offload_cpu_bound": False}, enrichment=service)
+
+    async def scenario():
+        return await asyncio.gather(
+            investigator.investigate(_event("agent-1", "behavioral_anomaly")),
+            investigator.investigate(_event("agent-1", "privilege_escalation")),
+            investigator.investigate(_event("agent-1", "data_exfiltration")),
+        )
+
+    behavioral, escalation, exfiltration = asyncio.run(scenario())
+    assert {"type": "access_logs", "data": ["GET /secrets"]} in behavioral.evidence
+    assert {"type": "permissions", "data": ["admin"]} in escalation.evidence
+    assert {"type": "access_logs", "data": ["GET /secrets"]} in exfiltration.evidence
+    assert access_logs.calls == [["agent-1"]]
+    assert permissions.calls == [["agent-1"]]
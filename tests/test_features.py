@@ -0,0 +1,164 @@
+"""
+Tests for feature-extracted detection
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from src.threat_hunter.correlation import CorrelationEngine
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.features import FeaturePool, FeatureSchema
+from src.threat_hunter.models import ModelEngine, train_model
+from src.threat_hunter.rules import RuleEngine, parse_rules
+
+RULES = {"rules": [
+    {"name": "api", "weight": 0.4, "when": [{"field": "unusual_api_calls", "op": "gt", "value": 10}]},
+    {"name": "spike", "weight": 0.4, "when": [{"field": "data_access_spike", "op": "truthy"}]},
+    {"name": "escalation", "weight": 0.5, "when": [{"field": "privilege_escalation", "op": "truthy"}]},
+    {"name": "quiet", "weight": 0.3, "when": [{"field": "requests", "op": "lt", "value": 5}]},
+    {"name": "shady", "weight": 0.3, "when": [{"field": "tool", "op": "eq", "value": "shady_plugin"}]},
+    {"name": "tagged", "weight": 0.2, "when": [{"field": "note", "op": "exists"}]},
+]}
+
+
+def _records(count=400, seed=5):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        record = {"agent_id": f"agent-{i % 10}", "timestamp": 1714521600.0 + i}
+        if rng.random() < 0.7:
+            record["requests"] = rng.choice([rng.randint(80, 120), rng.randint(0, 4), 500])
+        if rng.random() < 0.5:
+            record["unusual_api_calls"] = rng.choice([0, 3, 50])
+        if rng.random() < 0.3:
+            record["data_access_spike"] = rng.random() < 0.5
+        if rng.random() < 0.1:
+            record["privilege_escalation"] = True
+        if rng.random() < 0.3:
+            record["tool"] = rng.choice(["search", "shady_plugin", 7])
+        if rng.random() < 0.05:
+            record["note"] = None
+        records.append(record)
+    return records
+
+
+def _detector(**kwargs):
+    detector = ThreatDetector(rules=RuleEngine(parse_rules(RULES)), **kwargs)
+    for agent in range(10):
+        detector.establish_baseline(f"agent-{agent}", [{"requests": 100 + (i % 7)} for i in range(20)])
+    return detector
+
+
+def _row_by_row(detector, records):
+    threats = []
+    for record in records:
+        threat = detector.detect_anomaly(record["agent_id"], {k: v for k, v in record.items() if k != "agent_id"})
+        if threat is not None:
+            threats.append(threat)
+    return threats
+
+
+def _summary(threats):
+    return [(t.agent_id, round(t.risk_score, 9), t.severity, t.details) for t in threats]
+
+
+def test_detect_features_matches_detect_anomaly():
+    """Test scoring extracted features gives the same threats as scoring each record"""
+    records = _records()
+    expected = _row_by_row(_detector(), records)
+    detector = _detector()
+    with detector.extract_features(records) as batch:
+        threats = detector.detect_features(batch)
+    assert len(expected) > 20
+    assert _summary(threats) == _summary(expected)
+
+
+def test_null_and_mixed_values_only_drop_their_own_rows():
+    """Test a null or string from another agent does not blind baseline deviation for the whole column"""
+    def detector():
+        detector = ThreatDetector()
+        for agent in ("a0", "a1"):
+            detector.establish_baseline(agent, [{"api_calls": 100 + i % 5} for i in range(20)])
+        return detector
+
+    record = {"agent_id": "a0", "unusual_api_calls": 12, "api_calls": 200}
+    alone = detector()
+    with alone.extract_features([record]) as batch:
+        assert [t.risk_score for t in alone.detect_features(batch)] == [pytest.approx(0.8)]
+    for other in (None, "n/a", True):
+        mixed = detector()
+        with mixed.extract_features([record, {"agent_id": "a1", "api_calls": other}]) as batch:
+            assert [t.risk_score for t in mixed.detect_features(batch)] == [pytest.approx(0.8)]
+
+
+def test_detect_features_matches_detect_anomaly_on_mixed_values():
+    """Test parity on fuzzed batches mixing numbers, flags, nulls and strings in the same columns"""
+    rng = random.Random(11)
+    choices = [lambda: rng.randint(0, 300), lambda: rng.random() * 300, lambda: None,
+               lambda: rng.random() < 0.5, lambda: "n/a", lambda: 12, lambda: 200]
+    for _ in range(300):
+        records = []
+        for _ in range(rng.randint(1, 12)):
+            record = {"agent_id": f"agent-{rng.randrange(10)}"}
+            for name in ("unusual_api_calls", "requests", "data_access_spike", "privilege_escalation"):
+                if rng.random() < 0.6:
+                    record[name] = rng.choice(choices)()
+            records.append(record)
+        expected = _row_by_row(_detector(), records)
+        detector = _detector()
+        with detector.extract_features(records) as batch:
+            assert _summary(detector.detect_features(batch)) == _summary(expected)
+
+
+def test_detect_features_feeds_correlation_like_detect_anomaly():
+    """Test the correlator sees the same rows and samples on both paths"""
+    records = _records(seed=9)
+    expected = _detector(correlator=CorrelationEngine())
+    _row_by_row(expected, records)
+    detector = _detector(correlator=CorrelationEngine())
+    with detector.extract_features(records) as batch:
+        detector.detect_features(batch)
+    expected.correlator.flush()
+    detector.correlator.flush()
+    assert detector.correlator.stats == expected.correlator.stats
+    assert _summary(detector.correlator.drain()) == _summary(expected.correlator.drain())
+
+
+def test_models_score_a_view_of_the_feature_matrix():
+    """Test model features lead the schema, so models read the pooled matrix without copying it"""
+    rng = np.random.default_rng(0)
+    samples = np.column_stack([rng.normal(100, 10, 1000), rng.poisson(2, 1000)]).astype(np.float32)
+    engine = ModelEngine(features=("requests", "unusual_api_calls"))
+    engine.put("global", train_model(samples, engine.features, n_estimators=20))
+    records = _records(seed=3)
+
+    expected = _row_by_row(_detector(models=engine), records)
+    detector = _detector(models=engine)
+    assert detector.feature_schema().fields[:2] == engine.features
+    with detector.extract_features(records) as batch:
+        assert np.shares_memory(batch.matrix(engine.features), batch.values)
+        threats = detector.detect_features(batch)
+    assert [(t.agent_id, t.risk_score) for t in threats] == pytest.approx([(t.agent_id, t.risk_score) for t in expected])
+
+
+def test_pool_reuses_buffers():
+    """Test released buffers are reused and grow once for larger batches or schemas"""
+    pool = FeaturePool(rows=8, width=2, buffers=2)
+    schema = FeatureSchema(["requests", "tool", "requests"])
+    assert schema.fields == ("requests", "tool")
+    records = [{"agent_id": "a", "requests": 3}, {"agent_id": "b", "tool": "search"}]
+    for _ in range(5):
+        with pool.extract(records, schema) as batch:
+            assert batch.columns["requests"].tolist() == [3.0, 0.0]
+            assert batch.masks["requests"].tolist() == [True, False]
+            assert batch.columns["tool"].tolist() == [None, "search"]
+    assert pool.stats == {"batches": 5, "reused": 4, "allocated": 1}
+
+    with pool.extract(records * 8, FeatureSchema(["requests", "tool", "extra"])):
+        pass
+    with pool.extract(records, schema):
+        pass
+    assert pool.stats["allocated"] == 2
+    assert (pool.rows, pool.width) == (16, 3)
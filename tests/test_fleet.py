@@ -0,0 +1,117 @@
+"""
+Tests for the fleet-level anomaly index
+"""
+
+import asyncio
+import random
+
+import pytest
+
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.fleet import FLEET_AGENT_ID, FleetIndex
+from src.threat_hunter.ingestion import IngestionPipeline
+from src.threat_hunter.investigator import ThreatInvestigator
+from src.threat_hunter.responder import ThreatResponder
+
+START = 1714521600.0
+ACTIONS = ["process_request", "read_file", "call_tool", "query_db"]
+
+
+def _normal_pane(index, pane, rng, records=400, agents=5000):
+    """A pane of everyday activity spread over the fleet"""
+    for i in range(records):
+        index.observe(f"agent-{rng.randrange(agents)}", {
+            "timestamp": START + pane * 60 + i * 0.1, "action": rng.choice(ACTIONS)
+        })
+
+
+def test_sketch_estimates():
+    """Test distinct-agent and event estimates are close to the truth"""
+    index = FleetIndex(window=60.0, panes=1)
+    for i in range(20000):
+        index.observe(f"agent-{i % 5000}", {"timestamp": START, "action": "read_file"})
+    assert index.distinct_agents("action=read_file") == pytest.approx(5000, rel=0.1)
+    assert index.frequency("action=read_file") == 20000
+    assert index.distinct_agents("action=send_email") == 0.0
+
+
+def test_spike_emits_one_fleet_event():
+    """Test thousands of agents adopting a behavior at once yield one fleet-scoped event"""
+    rng = random.Random(3)
+    index = FleetIndex(window=300.0, panes=5)
+    for pane in range(8):
+        _normal_pane(index, pane, rng)
+    assert index.drain() == []
+
+    for i in range(2000):
+        index.observe(f"agent-{i}", {"timestamp": START + 8 * 60 + 1, "tool": "shady_plugin", "data_access_spike": True})
+    _normal_pane(index, 9, rng)
+    events = index.drain()
+
+    assert len(events) == 1
+    event = events[0]
+    assert event.agent_id == FLEET_AGENT_ID
+    assert event.threat_type == "coordinated_anomaly"
+    assert event.details["behavior"] in ("tool=shady_plugin", "data_access_spike")
+    assert {item["behavior"] for item in event.details["behaviors"]} == {"tool=shady_plugin", "data_access_spike"}
+    assert event.details["distinct_agents"] == pytest.approx(2000, rel=0.1)
+    assert event.details["events"] == 2000
+    assert len(event.details["sample_agents"]) == 10
+    assert index.stats["flagged"] == 2
+
+
+def test_detector_folds_covered_threats_into_fleet_event():
+    """Test per-agent threats for a flagged behavior are suppressed while the flag holds"""
+    index = FleetIndex(window=60.0, panes=1, min_agents=20, warmup=0)
+    detector = ThreatDetector(fleet=index)
+    attack = {"unusual_api_calls": 50, "data_access_spike": True, "tool": "shady_plugin"}
+    first = [detector.detect_anomaly(f"agent-{i}", {**attack, "timestamp": START + 1}) for i in range(50)]
+    assert all(threat is not None for threat in first)
+
+    pipeline = IngestionPipeline(detector, ThreatInvestigator(), ThreatResponder(), [])
+    batch = [{"agent_id": f"agent-{i}", **attack, "timestamp": START + 61} for i in range(50, 100)]
+    asyncio.run(pipeline._process_batch(batch))
+    assert pipeline.stats["threats"] == 1  # The fleet event, not 50 per-agent ones
+    assert index.stats["suppressed"] == 50
+
+
+def test_unrelated_threats_are_not_hidden_by_a_fleet_flag():
+    """Test a flagged behavior only suppresses threats it explains on its own, and never critical ones"""
+    index = FleetIndex(window=60.0, panes=1, min_agents=20, warmup=0)
+    detector = ThreatDetector(fleet=index)
+    for i in range(50):
+        detector.detect_anomaly(f"agent-{i}", {"action": "read_file", "timestamp": START + 1})
+    detector.detect_anomaly("agent-0", {"action": "read_file", "timestamp": START + 61})
+    assert index.drain()[0].details["behavior"] == "action=read_file"
+
+    critical = {"action": "read_file", "privilege_escalation": True, "data_access_spike": True, "timestamp": START + 62}
+    unrelated = {"action": "read_file", "unusual_api_calls": 50, "data_access_spike": True, "timestamp": START + 62}
+    assert detector.detect_anomaly("outsider", critical).severity == "critical"
+    assert detector.detect_anomaly("outsider", unrelated).risk_score == pytest.approx(0.8)
+    with detector.extract_features([{"agent_id": "outsider", **critical}, {"agent_id": "outsider", **unrelated}]) as batch:
+        assert len(detector.detect_features(batch)) == 2
+    assert index.stats["suppressed"] == 0
+
+
+def test_memory_is_bounded_and_frequent_behaviors_take_over():
+    """Test sketch memory ignores fleet size and cardinality, and newcomers displace rare behaviors"""
+    index = FleetIndex(window=60.0, panes=2, max_behaviors=8, behavior_fields=("action",))
+    size = index.nbytes
+    for i in range(50000):
+        index.observe(f"agent-{i}", {"timestamp": START, "action": f"rare-{i % 1000}"})
+    for i in range(5000):
+        index.observe(f"agent-{i}", {"timestamp": START + 10, "action": "hot"})
+    index.observe("agent-0", {"timestamp": START + 31})  # Next pane: admission runs
+    assert index.nbytes == size
+    assert len(index) == 8
+    assert index.stats["evicted"] >= 1
+    assert index.frequency("action=hot") == 5000
+
+
+def test_late_events_are_dropped():
+    """Test events older than the window are counted as late and ignored"""
+    index = FleetIndex(window=60.0, panes=2)
+    index.observe("agent-1", {"timestamp": START + 600, "action": "read_file"})
+    index.observe("agent-2", {"timestamp": START, "action": "read_file"})
+    assert index.stats["late"] == 1
+    assert index.frequency("action=read_file") == 1
@@ -0,0 +1,31 @@
+"""
+Tests for the lazy package import path
+"""
+
+import pytest
+
+import src.threat_hunter as threat_hunter
+from benchmarks.import_time import check, measure
+
+
+def test_public_names_resolve_lazily():
+    """Test public classes are importable from the package root"""
+    from src.threat_hunter.detector import ThreatDetector
+
+    assert threat_hunter.ThreatDetector is ThreatDetector
+    assert "ThreatResponder" in dir(threat_hunter)
+    with pytest.raises(AttributeError):
+        threat_hunter.NotAThing
+
+
+def test_package_import_loads_no_heavy_dependencies():
+    """Test a cold import of the package stays within budget and skips the heavy stack"""
+    results = {"package": measure("import src.threat_hunter", runs=1)}
+    assert results["package"]["modules"] == []
+    assert check(results, budget=1.0) == []
+
+
+def test_check_reports_heavy_modules_and_overruns():
+    """Test the budget check flags both slow imports and heavy dependencies"""
+    problems = check({"package": {"seconds": 0.2, "modules": ["sklearn"]}}, budget=0.05)
+    assert len(problems) == 2
@@ -0,0 +1,277 @@
+"""
+Tests for the activity ingestion pipeline
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.threat_hunter import main
+
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.investigator import ThreatInvestigator
+from src.threat_hunter.responder import ThreatResponder
+from src.threat_hunter.scheduler import InvestigationScheduler
+from src.threat_hunter.ingestion import (
+    IngestionPipeline, JsonLinesTailSource, QueueSource, UnixSocketSource, decode_ndjson, gunzip
+)
+
+SUSPICIOUS = {"agent_id": "agent-1", "unusual_api_calls": 50, "data_access_spike": True}
+NORMAL = {"agent_id": "agent-2", "unusual_api_calls": 0}
+
+
+def _pipeline(sources, **kwargs):
+    return IngestionPipeline(ThreatDetector(), ThreatInvestigator(), ThreatResponder(), sources, **kwargs)
+
+
+def _ndjson(records) -> bytes:
+    return b"".join(json.dumps(record).encode() + b"\n" for record in records)
+
+
+def _ready_pipeline(max_queue_size=100):
+    """A pipeline accepting submissions, without a consumer draining it"""
+    pipeline = _pipeline([], max_queue_size=max_queue_size)
+    pipeline._queue = asyncio.Queue(maxsize=max_queue_size)
+    pipeline.running = True
+    return pipeline
+
+
+async def _wait_for(condition, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def test_queue_source_flows_through_pipeline():
+    """Test records are detected, investigated and responded to"""
+    async def scenario():
+        queue = asyncio.Queue()
+        pipeline = _pipeline([QueueSource(queue)], batch_size=4, batch_timeout=0.01)
+        monitor = asyncio.create_task(pipeline.detector.start_monitoring(pipeline))
+        for _ in range(3):
+            await queue.put(dict(SUSPICIOUS))
+            await queue.put(dict(NORMAL))
+        await _wait_for(lambda: pipeline.stats["processed"] == 6)
+        await pipeline.detector.stop_monitoring()
+        await asyncio.wait_for(monitor, 1)
+        return pipeline
+
+    pipeline = asyncio.run(scenario())
+    assert pipeline.stats["threats"] == 3
+    assert pipeline.stats["errors"] == 0
+    assert pipeline.detector.running is False
+
+
+def test_bounded_queue_applies_backpressure():
+    """Test sources block instead of growing the queue past its bound"""
+    async def scenario():
+        source_queue = asyncio.Queue()
+        for _ in range(50):
+            source_queue.put_nowait(dict(NORMAL))
+        pipeline = _pipeline([QueueSource(source_queue)], max_queue_size=5)
+        pipeline._queue = asyncio.Queue(maxsize=pipeline.max_queue_size)
+        producer = asyncio.create_task(pipeline.sources[0].run(pipeline._emit))
+        await asyncio.sleep(0.05)
+        depth = pipeline.queue_depth
+        producer.cancel()
+        return depth, source_queue.qsize()
+
+    depth, remaining = asyncio.run(scenario())
+    assert depth == 5
+    assert remaining > 0
+
+
+def test_jsonl_tail_source(tmp_path):
+    """Test the JSON-lines source follows appended records"""
+    path = tmp_path / "activity.jsonl"
+    path.write_text(json.dumps(NORMAL) + "\n")
+
+    async def scenario():
+        records = []
+
+        async def emit(record):
+            records.append(record)
+
+        source = JsonLinesTailSource(str(path), from_start=True, poll_interval=0.01)
+        task = asyncio.create_task(source.run(emit))
+        await _wait_for(lambda: len(records) == 1)
+        with open(path, "a") as handle:
+            handle.write("not json\n")
+            handle.write(json.dumps(SUSPICIOUS) + "\n")
+        await _wait_for(lambda: len(records) == 2)
+        task.cancel()
+        return records
+
+    records = asyncio.run(scenario())
+    assert [r["agent_id"] for r in records] == ["agent-2", "agent-1"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="UNIX sockets not available")
+def test_unix_socket_source(tmp_path):
+    """Test the UNIX socket source decodes JSON lines from clients"""
+    socket_path = str(tmp_path / "activity.sock")
+
+    async def scenario():
+        records = []
+
+        async def emit(record):
+            records.append(record)
+
+        source = UnixSocketSource(socket_path)
+        task = asyncio.create_task(source.run(emit))
+        await _wait_for(lambda: os.path.exists(socket_path))
+        _, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write((json.dumps(SUSPICIOUS) + "\n" + json.dumps(NORMAL) + "\n").encode())
+        await writer.drain()
+        writer.close()
+        await _wait_for(lambda: len(records) == 2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await source.close()
+        return records
+
+    records = asyncio.run(scenario())
+    assert records == [SUSPICIOUS, NORMAL]
+
+
+def test_pipeline_with_scheduler_responds_once_per_investigation():
+    """Test coalesced threats share one investigation and one response"""
+    async def scenario():
+        queue = asyncio.Queue()
+        pipeline = _pipeline([QueueSource(queue)], batch_size=8, batch_timeout=0.01)
+        responses = []
+
+        async def respond(threat, investigation):
+            responses.append(threat)
+            return []
+
+        pipeline.responder.respond = respond
+        pipeline.scheduler = InvestigationScheduler(pipeline.investigator, workers=1)
+        pipeline.scheduler.start()
+        monitor = asyncio.create_task(pipeline.detector.start_monitoring(pipeline))
+        for _ in range(4):
+            await queue.put(dict(SUSPICIOUS))
+        await _wait_for(lambda: pipeline.stats["processed"] == 4 and responses)
+        await pipeline.detector.stop_monitoring()
+        await asyncio.wait_for(monitor, 1)
+        await pipeline.scheduler.stop()
+        return responses
+
+    responses = asyncio.run(scenario())
+    assert len(responses) == 1
+
+
+def test_slow_investigations_do_not_stall_detection():
+    """Test batches keep being scored while threats wait on investigations, up to the in-flight bound"""
+    class BlockedInvestigator(ThreatInvestigator):
+        def __init__(self):
+            super().__init__()
+            self.release = asyncio.Event()
+
+        async def investigate(self, threat_event):
+            await self.release.wait()
+            return await super().investigate(threat_event)
+
+    async def scenario():
+        pipeline = IngestionPipeline(
+            ThreatDetector(), BlockedInvestigator(), ThreatResponder(), [], max_pending_threats=3
+        )
+        for i in range(3):
+            await asyncio.wait_for(pipeline._process_batch([{**SUSPICIOUS, "agent_id": f"agent-{i}"}, NORMAL]), 1)
+        assert pipeline.stats["processed"] == 6
+        assert pipeline.pending_threats == 3
+
+        blocked = asyncio.create_task(pipeline._process_batch([{**SUSPICIOUS, "agent_id": "agent-3"}]))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()  # Waits for room rather than growing the in-flight set
+        pipeline.investigator.release.set()
+        await asyncio.wait_for(blocked, 1)
+        await pipeline.drain()
+        assert pipeline.pending_threats == 0
+        return pipeline
+
+    pipeline = asyncio.run(scenario())
+    assert pipeline.stats["threats"] == 4
+    assert pipeline.stats["errors"] == 0
+
+
+def test_decode_ndjson_counts_rejected_lines():
+    """Test malformed lines and records without agent_id are rejected, not fatal"""
+    body = _ndjson([SUSPICIOUS, {"no": "agent"}]) + b"{not json\n\n" + _ndjson([NORMAL])
+    assert decode_ndjson(body) == ([SUSPICIOUS, NORMAL], 2)
+
+
+def test_gunzip_multi_member_and_size_limit():
+    """Test concatenated gzip members inflate and oversized bodies are refused"""
+    body = gzip.compress(_ndjson([SUSPICIOUS])) + gzip.compress(_ndjson([NORMAL]))
+    assert decode_ndjson(gunzip(body, 1024)) == ([SUSPICIOUS, NORMAL], 0)
+    with pytest.raises(ValueError):
+        gunzip(gzip.compress(b"x" * 10_000), 1024)
+    with pytest.raises(ValueError):
+        gunzip(b"not gzip", 1024)
+
+
+def test_try_submit_many_is_all_or_none():
+    """Test a batch that does not fit is refused whole"""
+    pipeline = _ready_pipeline(max_queue_size=3)
+    assert pipeline.try_submit_many([NORMAL, NORMAL]) is True
+    assert pipeline.try_submit_many([NORMAL, NORMAL]) is False
+    assert pipeline.queue_depth == 2
+    assert pipeline.stats["received"] == 2
+
+
+def test_ingest_endpoints_accept_and_push_back(monkeypatch):
+    """Test NDJSON and gzip bulk posts are queued and a full queue answers 429"""
+    pipeline = _ready_pipeline(max_queue_size=4)
+    monkeypatch.setattr(main, "pipeline", pipeline)
+    client = TestClient(main.app)
+
+    response = client.post("/ingest", content=_ndjson([SUSPICIOUS, NORMAL]) + b"garbage\n")
+    assert response.status_code == 202
+    assert response.json() == {"accepted": 2, "rejected": 1}
+    response = client.post("/ingest/bulk", content=gzip.compress(_ndjson([NORMAL])))
+    assert response.status_code == 202
+    response = client.post("/ingest", content=gzip.compress(_ndjson([NORMAL, NORMAL])),
+                           headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    assert client.post("/ingest", content=_ndjson([NORMAL] * 5)).status_code == 413
+    assert client.post("/ingest/bulk", content=b"plain text").status_code == 400
+    assert pipeline.queue_depth == 3
+
+
+def test_ingest_websocket_acknowledges_each_message(monkeypatch):
+    """Test streamed messages are queued and acknowledged in order"""
+    pipeline = _ready_pipeline()
+    monkeypatch.setattr(main, "pipeline", pipeline)
+    with TestClient(main.app).websocket_connect("/ingest/ws") as websocket:
+        websocket.send_text(json.dumps(SUSPICIOUS))
+        assert websocket.receive_json() == {"seq": 1, "accepted": 1, "rejected": 0}
+        websocket.send_bytes(_ndjson([NORMAL, NORMAL]))
+        assert websocket.receive_json() == {"seq": 2, "accepted": 2, "rejected": 0}
+    assert pipeline.queue_depth == 3
+
+
+def test_ingest_endpoints_without_pipeline(monkeypatch):
+    """Test submissions are refused while the pipeline is not running"""
+    monkeypatch.setattr(main, "pipeline", None)
+    assert TestClient(main.app).post("/ingest", content=_ndjson([NORMAL])).status_code == 503
+
+
+def test_pipeline_learns_baselines_from_unflagged_records():
+    """Test normal records are folded into baselines while flagged ones and event times are not"""
+    pipeline = _pipeline([])
+    batch = [{**NORMAL, "requests": 10 + i, "timestamp": 1714521600.0 + i} for i in range(5)]
+    asyncio.run(pipeline._process_batch(batch + [dict(SUSPICIOUS, requests=900)]))
+    baselines = pipeline.detector.baselines
+    assert baselines["agent-2"].events == 5
+    assert baselines["agent-2"].metrics["requests"].mean == 12.0
+    assert "timestamp" not in baselines.metric_index
+    assert "agent-1" not in baselines
@@ -0,0 +1,67 @@
+"""
+Tests for ThreatInvestigator
+"""
+
+import asyncio
+import os
+import pickle
+from datetime import datetime
+
+from src.threat_hunter.detector import ThreatEvent
+from src.threat_hunter.investigator import ThreatInvestigator, cpu_bound, is_cpu_bound
+
+
+@cpu_bound
+def report_worker_pid(event):
+    """CPU-bound playbook recording which process ran it"""
+    return "checked", [{"type": "pid", "data": os.getpid()}], [{"time": event.timestamp, "event": "checked"}]
+
+
+def _event(threat_type, agent_id="agent-1"):
+    return ThreatEvent(agent_id, threat_type, 0.8, datetime.now(), {"transfers": ["s3://bucket"]}, "high")
+
+
+def test_threat_event_pickles():
+    """Test events survive the process pool transport"""
+    event = _event("data_exfiltration")
+    assert pickle.loads(pickle.dumps(event)) == event
+
+
+def test_cpu_bound_playbooks_declared():
+    """Test heavy playbooks are marked CPU-bound"""
+    investigator = ThreatInvestigator()
+    assert is_cpu_bound(investigator.playbooks["data_exfiltration"])
+    assert is_cpu_bound(investigator.playbooks["model_poisoning"])
+    assert not is_cpu_bound(investigator.playbooks["behavioral_anomaly"])
+
+
+def test_cpu_bound_playbook_runs_in_process_pool():
+    """Test CPU-bound playbooks run outside the event loop process"""
+    investigator = ThreatInvestigator({"process_workers": 2})
+    investigator.playbooks["pid_check"] = report_worker_pid
+    try:
+        report = asyncio.run(investigator.investigate(_event("pid_check")))
+        exfiltration = asyncio.run(investigator.investigate(_event("data_exfiltration")))
+    finally:
+        investigator.close()
+    assert report.evidence[0]["data"] != os.getpid()
+    assert exfiltration.evidence[0]["data"] == ["s3://bucket"]
+
+
+def test_cpu_bound_playbook_inline_when_offload_disabled():
+    """Test offloading can be disabled for single-process deployments"""
+    investigator = ThreatInvestigator({"offload_cpu_bound": False})
+    investigator.playbooks["pid_check"] = report_worker_pid
+    report = asyncio.run(investigator.investigate(_event("pid_check")))
+    assert report.evidence[0]["data"] == os.getpid()
+
+
+def test_investigate_many_streams_reports():
+    """Test reports stream back for every event"""
+    async def scenario():
+        investigator = ThreatInvestigator({"offload_cpu_bound": False})
+        events = [_event(t, f"agent-{i}") for i, t in enumerate(["behavioral_anomaly", "model_poisoning", "unknown"])]
+        return [report async for report in investigator.investigate_many(events)]
+
+    reports = asyncio.run(scenario())
+    assert sorted(r.threat_event.agent_id for r in reports) == ["agent-0", "agent-1", "agent-2"]
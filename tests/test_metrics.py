@@ -0,0 +1,66 @@
+"""
+Tests for hot-path metrics
+"""
+
+from fastapi.testclient import TestClient
+
+from src.threat_hunter import metrics
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.main import app
+from src.threat_hunter.metrics import LatencyHistogram, MetricsRegistry, _bucket_bounds, _bucket_index
+
+
+def test_bucket_bounds_contain_value():
+    """Test every value lands in a bucket within ~6% of it"""
+    for value in [0, 1, 15, 16, 17, 100, 1000, 123456, 10 ** 9, 2 ** 40 + 7]:
+        lower, upper = _bucket_bounds(_bucket_index(value))
+        assert lower <= value < upper
+        assert (upper - lower) <= max(1, value / 16)
+
+
+def test_histogram_percentiles():
+    """Test percentiles track the recorded distribution"""
+    histogram = LatencyHistogram("latency")
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+    assert abs(histogram.percentile(0.5) - 500e-6) / 500e-6 < 0.07
+    assert abs(histogram.percentile(0.99) - 990e-6) / 990e-6 < 0.07
+    assert histogram.count == 1000
+
+
+def test_histogram_sampling():
+    """Test only every Nth call is timed"""
+    histogram = LatencyHistogram("latency", sample_every=10)
+    for _ in range(100):
+        histogram.observe_since(histogram.start())
+    assert histogram.count == 10
+
+
+def test_prometheus_rendering():
+    """Test counters and histograms render in the exposition format"""
+    registry = MetricsRegistry()
+    registry.counter("events_total", "Events", source="queue").inc(3)
+    registry.histogram("latency_seconds", "Latency", action="isolate").record(2000)
+    text = registry.render()
+    assert "# TYPE events_total counter" in text
+    assert 'events_total{source="queue"} 3' in text
+    assert "# TYPE latency_seconds summary" in text
+    assert 'latency_seconds{action="isolate",quantile="0.5"}' in text
+    assert 'latency_seconds_count{action="isolate"} 1' in text
+
+
+def test_detector_is_instrumented():
+    """Test detect_anomaly updates the pipeline counters"""
+    events = metrics.counter("threat_hunter_detect_events_total")
+    threats = metrics.counter("threat_hunter_detect_threats_total")
+    before = events.value, threats.value
+    ThreatDetector().detect_anomaly("agent-1", {"unusual_api_calls": 50, "data_access_spike": True})
+    assert (events.value, threats.value) == (before[0] + 1, before[1] + 1)
+
+
+def test_metrics_endpoint():
+    """Test /metrics serves Prometheus text"""
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "threat_hunter_detect_events_total" in response.text
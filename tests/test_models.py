@@ -0,0 +1,129 @@
+"""
+Tests for the anomaly model engine
+"""
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.models import AnomalyModel, ModelEngine, column_matrix, feature_matrix, train_model
+
+FEATURES = ("requests", "unusual_api_calls")
+
+
+def _normal(rows=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.normal(100, 10, rows), rng.poisson(2, rows)]).astype(np.float32)
+
+
+def test_compiled_forest_matches_sklearn():
+    """Compiled inference reproduces IsolationForest.score_samples"""
+    samples = _normal()
+    forest = IsolationForest(random_state=0, max_features=1).fit(samples)
+    model = AnomalyModel.from_forest(forest, FEATURES, samples)
+    probe = np.vstack([samples[:200], _normal(200, seed=1) * 3])
+    np.testing.assert_allclose(model.anomaly_scores(probe), -forest.score_samples(probe), rtol=0, atol=1e-12)
+
+
+def test_model_risk_separates_outliers():
+    """Normal rows carry almost no risk, far outliers carry full risk"""
+    model = train_model(_normal(), FEATURES)
+    assert model.risk(_normal(500, seed=2)).mean() < 0.05
+    assert model.risk(np.array([[1000, 90], [0, 60]], dtype=np.float32)).min() == 1.0
+
+
+def test_engine_lazy_loads_and_evicts(tmp_path):
+    """Artifacts load on first use and the LRU keeps only cache_size models"""
+    writer = ModelEngine(str(tmp_path), FEATURES)
+    writer.put("global", train_model(_normal(), FEATURES, n_estimators=10))
+    writer.put("cluster-1", train_model(_normal() * 2, FEATURES, n_estimators=10))
+
+    engine = ModelEngine(str(tmp_path), FEATURES, cache_size=1)
+    engine.assign("agent-b", "cluster-1")
+    engine.assign("agent-c", "cluster-missing")
+    outlier = {"requests": 5000, "unusual_api_calls": 300}
+    assert engine.score("agent-a", outlier) == engine.weight
+    assert engine.stats["loads"] == 1
+    assert engine.score("agent-b", outlier) == engine.weight
+    assert engine.stats == {"hits": 0, "misses": 2, "loads": 2, "evictions": 1}
+    # A missing cluster model falls back to the global model
+    assert engine.score("agent-c", outlier) == engine.weight
+    assert engine.score("agent-a", {"requests": 100, "unusual_api_calls": 2}) == 0.0
+
+
+def test_batched_scores_match_scalar():
+    """Micro-batch and columnar scoring give the scalar results"""
+    detector = ThreatDetector(models=ModelEngine(features=FEATURES))
+    for agent_id in ("agent-1", "agent-2", "agent-3"):
+        detector.establish_baseline(agent_id, [{"requests": 100 + i % 7, "unusual_api_calls": i % 3} for i in range(50)])
+    keys = detector.models.train_from_baselines(detector.baselines, n_estimators=20)
+    assert keys == ["global"]
+
+    records = [
+        ("agent-1", {"requests": 103, "unusual_api_calls": 1}),
+        ("agent-2", {"requests": 900, "unusual_api_calls": 40, "data_access_spike": True}),
+        ("agent-3", {"requests": 50, "unusual_api_calls": 0}),
+        ("agent-9", {"requests": 900, "unusual_api_calls": 40, "data_access_spike": True}),
+    ]
+    scalar = [detector.detect_anomaly(agent_id, activity) for agent_id, activity in records]
+    expected = [(t.agent_id, t.risk_score) for t in scalar if t is not None]
+    assert [(t.agent_id, t.risk_score) for t in detector.detect_anomalies(records)] == expected
+
+    columns = {
+        "agent_id": np.array([agent_id for agent_id, _ in records]),
+        "requests": np.array([a["requests"] for _, a in records]),
+        "unusual_api_calls": np.array([a["unusual_api_calls"] for _, a in records]),
+        "data_access_spike": np.array([a.get("data_access_spike", False) for _, a in records]),
+    }
+    assert [(t.agent_id, t.risk_score) for t in detector.detect_anomalies_batch(columns)] == expected
+    assert ("agent-2", 1.0) in expected
+
+
+def test_train_per_cluster_models():
+    """Agents are grouped by baseline and scored with their cluster's model"""
+    engine = ModelEngine(features=FEATURES)
+    detector = ThreatDetector(models=engine)
+    for index in range(20):
+        scale = 10 if index % 2 else 1000
+        detector.establish_baseline(f"agent-{index}", [{"requests": scale + i % 5, "unusual_api_calls": 1} for i in range(20)])
+    keys = engine.train_from_baselines(detector.baselines, clusters=2, n_estimators=20)
+    assert sorted(keys) == ["cluster-0", "cluster-1", "global"]
+    assert engine.model_key("agent-0") != engine.model_key("agent-1")
+    assert engine.model_key("agent-0") == engine.model_key("agent-2")
+
+
+def test_cluster_assignments_survive_restart(tmp_path):
+    """Cluster assignments are saved with the artifacts and loaded by a new engine"""
+    engine = ModelEngine(str(tmp_path), FEATURES)
+    detector = ThreatDetector(models=engine)
+    for index in range(20):
+        scale = 10 if index % 2 else 1000
+        detector.establish_baseline(f"agent-{index}", [{"requests": scale + i % 5, "unusual_api_calls": 1} for i in range(20)])
+    engine.train_from_baselines(detector.baselines, clusters=2, n_estimators=20)
+
+    restarted = ModelEngine(str(tmp_path), FEATURES)
+    assert {restarted.model_key(f"agent-{index}") for index in range(20)} == {"cluster-0", "cluster-1"}
+    assert all(restarted.model_key(f"agent-{index}") == engine.model_key(f"agent-{index}") for index in range(20))
+    outlier = {"requests": 5000, "unusual_api_calls": 300}
+    assert restarted.score("agent-0", outlier) == engine.score("agent-0", outlier)
+
+    engine.train_from_baselines(detector.baselines, n_estimators=20)
+    assert ModelEngine(str(tmp_path), FEATURES).model_key("agent-0") == "global"
+
+
+def test_feature_matrix_defaults_missing_fields():
+    """Missing and boolean fields become numeric columns"""
+    matrix = feature_matrix([{"requests": 3}, {"unusual_api_calls": True}], FEATURES)
+    assert matrix.tolist() == [[3.0, 0.0], [0.0, 1.0]]
+
+
+def test_non_numeric_fields_score_as_zero():
+    """Strings and nulls are 0 in the dict, columnar and feature-batch matrices alike"""
+    activities = [{"requests": "many", "unusual_api_calls": None}, {"requests": 7, "unusual_api_calls": False}]
+    assert feature_matrix(activities, FEATURES).tolist() == [[0.0, 0.0], [7.0, 0.0]]
+    columns = {name: np.array([activity[name] for activity in activities], dtype=object) for name in FEATURES}
+    assert column_matrix(columns, 2, FEATURES).tolist() == [[0.0, 0.0], [7.0, 0.0]]
+
+    detector = ThreatDetector(models=ModelEngine(features=FEATURES))
+    with detector.extract_features([{"agent_id": "agent-1", **activity} for activity in activities]) as batch:
+        assert batch.matrix(FEATURES).tolist() == [[0.0, 0.0], [7.0, 0.0]]
@@ -0,0 +1,121 @@
+"""
+Tests for compiled response policies
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from src.threat_hunter.detector import ThreatEvent
+from src.threat_hunter.investigator import InvestigationReport
+from src.threat_hunter.policies import CompiledPolicies, PolicyEngine, PolicyError, parse_policies
+from src.threat_hunter.responder import ResponseAction, ThreatResponder
+
+A = ResponseAction
+
+
+def _event(threat_type="anomalous_behavior", severity="high", tags=None):
+    details = {"agent_tags": tags} if tags is not None else {}
+    return ThreatEvent("agent-1", threat_type, 0.8, datetime(2024, 5, 1), details, severity)
+
+
+def _report(event, root_cause=""):
+    return InvestigationReport(event, root_cause, [], [], [], 0.0)
+
+
+def _policies(*entries):
+    return parse_policies({"policies": list(entries)})
+
+
+def test_default_policies_match_severity_table():
+    """Test the default policies reproduce the original severity table"""
+    engine = PolicyEngine()
+    assert engine.actions_for(_event(severity="critical")) == (A.ISOLATE, A.REVOKE_CREDENTIALS, A.ALERT)
+    assert engine.actions_for(_event(severity="high")) == (A.RATE_LIMIT, A.ALERT)
+    assert engine.actions_for(_event(severity="medium")) == (A.MONITOR, A.ALERT)
+    assert engine.actions_for(_event(severity="low")) == (A.MONITOR,)
+    assert engine.select(_event(severity="unknown")) == ("fallback", (A.MONITOR,))
+
+
+def test_conditions_and_precedence():
+    """Test threat type, tag and root cause conditions, priority and specificity"""
+    engine = PolicyEngine(_policies(
+        {"name": "high", "when": {"severity": "high"}, "actions": ["rate_limit"]},
+        {"name": "exfil", "when": {"threat_type": "data_exfiltration"}, "actions": ["alert"]},
+        {"name": "exfil_high", "when": {"threat_type": "data_exfiltration", "severity": "high"}, "actions": ["isolate"]},
+        {"name": "prod", "priority": 5, "when": {"tags": ["production", "pci"]}, "actions": ["quarantine"]},
+        {"name": "creds", "when": {"severity": "high", "root_cause": ["Credential"]}, "actions": ["revoke_credentials"]},
+    ))
+    exfil = _event("data_exfiltration")
+    assert engine.select(exfil)[0] == "exfil_high"  # More specific than "exfil" and "high"
+    assert engine.select(_event("data_exfiltration", "low"))[0] == "exfil"
+    assert engine.select(_event())[0] == "high"
+    assert engine.select(_event(), _report(exfil, "Stolen credential reuse"))[0] == "creds"
+    assert engine.select(_event(tags=["production"]))[0] == "high"  # Needs both tags
+    assert engine.select(_event("data_exfiltration", tags=["pci", "production"]))[0] == "prod"
+    assert engine.select(_event(severity="medium")) == ("fallback", (A.MONITOR,))
+
+
+def test_compiled_plans_stop_at_first_unconditional_policy():
+    """Test policies shadowed by an unconditional one are compiled away"""
+    compiled = CompiledPolicies(_policies(
+        {"name": "tagged", "priority": 2, "when": {"tags": "production"}, "actions": ["isolate"]},
+        {"name": "any", "priority": 1, "actions": ["alert"]},
+        *({"name": f"p{i}", "when": {"threat_type": f"type-{i}"}, "actions": ["monitor"]} for i in range(100)),
+    ))
+    assert [name for *_, name in compiled._table[("type-7", "high")]] == ["tagged", "any"]
+    assert compiled.select("type-7", "high") == ("any", (A.ALERT,))
+    assert compiled.select("type-7", "high", frozenset({"production"})) == ("tagged", (A.ISOLATE,))
+
+
+@pytest.mark.parametrize("document, message", [
+    ({"rules": []}, "'policies' list"),
+    ({"policies": [{"name": "a", "actions": ["nuke"]}]}, "unknown action"),
+    ({"policies": [{"name": "a", "actions": []}]}, "'actions'"),
+    ({"policies": [{"name": "a", "actions": ["alert"], "when": {"region": "eu"}}]}, "unknown conditions"),
+    ({"policies": [{"name": "a", "actions": ["alert"], "when": {"severity": "severe"}}]}, "severity"),
+    ({"policies": [{"name": "a", "actions": ["alert"]}, {"name": "a", "actions": ["alert"]}]}, "Duplicate"),
+])
+def test_malformed_policies_are_rejected(document, message):
+    """Test malformed documents raise PolicyError"""
+    with pytest.raises(PolicyError, match=message):
+        parse_policies(document)
+
+
+def test_hot_reload_swaps_policies(tmp_path):
+    """Test a changed policy file is swapped in and a broken one is ignored"""
+    path = tmp_path / "policies.json"
+    path.write_text(json.dumps({"policies": [{"name": "old", "actions": ["alert"]}]}))
+    engine = PolicyEngine(path=str(path))
+    assert engine.select(_event())[0] == "old"
+    assert not engine.reload()
+
+    path.write_text(json.dumps({"policies": [{"name": "new", "actions": ["isolate"]}]}))
+    os.utime(path, (1, 1))
+    assert engine.reload()
+    assert engine.select(_event()) == ("new", (A.ISOLATE,))
+
+    path.write_text("{broken")
+    os.utime(path, (2, 2))
+    assert not engine.reload()
+    assert engine.select(_event())[0] == "new"
+
+
+def test_responder_applies_policies():
+    """Test the responder runs the chosen policy's actions through its dispatch table"""
+    engine = PolicyEngine(_policies(
+        {"name": "prod", "when": {"tags": "production"}, "actions": ["isolate", "quarantine"]},
+        {"name": "any", "actions": ["monitor"]},
+    ))
+    responder = ThreatResponder(policies=engine)
+    event = _event(tags=["production"])
+    results = asyncio.run(responder.respond(event, _report(event)))
+    assert [result.action for result in results] == [A.ISOLATE, A.QUARANTINE]
+    assert results[0].success
+    assert not results[1].success and "Unknown action" in results[1].message  # No quarantine handler
+
+    results = asyncio.run(responder.respond(_event(), _report(_event())))
+    assert [result.action for result in results] == [A.MONITOR]
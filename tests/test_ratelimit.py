@@ -0,0 +1,126 @@
+"""
+Tests for per-agent rate limiting
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from src.threat_hunter.detector import ThreatDetector, ThreatEvent
+from src.threat_hunter.ingestion import IngestionPipeline
+from src.threat_hunter.investigator import InvestigationReport, ThreatInvestigator
+from src.threat_hunter.ratelimit import RateLimiter
+from src.threat_hunter.responder import ThreatResponder
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _limiter(**kwargs):
+    clock = FakeClock()
+    return RateLimiter(clock=clock, **kwargs), clock
+
+
+def test_unlimited_agents_are_always_allowed():
+    """Test agents without a limit pass without creating state"""
+    limiter, _ = _limiter()
+    assert all(limiter.allow("agent-1") for _ in range(1000))
+    assert len(limiter) == 0
+
+
+def test_gcra_allows_burst_then_refills_lazily():
+    """Test a limited agent gets its burst, is denied, then refills with time"""
+    limiter, clock = _limiter(base_rate=4.0, burst_seconds=1.0)
+    assert limiter.limit("agent-1", risk_score=0.5) == 2.0
+    assert [limiter.allow("agent-1") for _ in range(3)] == [True, True, False]
+    clock.now += 0.5
+    assert limiter.allow("agent-1") is True
+    assert limiter.allow("agent-1") is False
+    clock.now += 10.0  # Idle time refills only up to the burst
+    assert [limiter.allow("agent-1") for _ in range(3)] == [True, True, False]
+    assert limiter.stats["denied"] == 3
+
+
+def test_limit_adapts_to_risk_and_baseline_volume():
+    """Test riskier events and volume above baseline both shrink the rate"""
+    detector = ThreatDetector()
+    detector.establish_baseline("agent-1", [{"api_calls": 10}, {"api_calls": 10}, {"api_calls": 10}])
+    limiter, _ = _limiter(base_rate=10.0, min_rate=0.5, baseline_of=detector.baselines.get)
+    assert limiter.rate_for("agent-1", 0.2) == pytest.approx(8.0)
+    assert limiter.rate_for("agent-1", 0.2, {"api_calls": 40}) == pytest.approx(2.0)
+    assert limiter.rate_for("agent-1", 0.2, {"api_calls": 5}) == pytest.approx(8.0)
+    assert limiter.rate_for("agent-2", 0.2, {"api_calls": 40}) == pytest.approx(8.0)
+    assert limiter.rate_for("agent-1", 1.0) == 0.5
+
+
+def test_active_limits_only_tighten():
+    """Test a lower-risk event neither loosens nor shortens a limit"""
+    limiter, clock = _limiter(base_rate=10.0, duration=100.0)
+    limiter.limit("agent-1", 0.9)
+    assert limiter.limit("agent-1", 0.1) == pytest.approx(1.0)
+    clock.now += 130.0  # 0.9-risk limit lasts 140s
+    assert "agent-1" in limiter
+    clock.now += 20.0
+    assert limiter.allow("agent-1") is True
+    assert "agent-1" not in limiter
+
+
+def test_expired_entries_are_swept_and_rows_reused():
+    """Test lapsed limits of quiet agents are reclaimed without background timers"""
+    limiter, clock = _limiter(duration=10.0, sweep_every=1000)
+    for i in range(100):
+        limiter.limit(f"agent-{i}", 0.5)
+    clock.now += 11.0
+    assert limiter.expire() == 100
+    assert len(limiter) == 0
+    size = limiter.nbytes
+    for i in range(100):
+        limiter.limit(f"other-{i}", 0.5)
+    assert limiter.nbytes == size
+
+
+def test_responder_applies_rate_limit():
+    """Test a high-severity response limits the agent in-process"""
+    limiter, _ = _limiter()
+    responder = ThreatResponder(limiter=limiter)
+    event = ThreatEvent("agent-1", "behavioral_anomaly", 0.7, datetime.now(), {}, "high")
+    asyncio.run(responder.respond(event, InvestigationReport(event, "", [], [], [], 0.0)))
+    assert "agent-1" in limiter
+
+
+def test_ingestion_scores_limited_agents_but_holds_back_their_records():
+    """Test records over the limit are still scored and only kept from being forwarded"""
+    limiter, _ = _limiter(base_rate=2.0, burst_seconds=1.0)
+    limiter.limit("agent-1", 0.0)
+    forwarded = []
+
+    async def forward(records):
+        forwarded.extend(records)
+
+    pipeline = IngestionPipeline(
+        ThreatDetector(), ThreatInvestigator(), ThreatResponder(), [], limiter=limiter, forward=forward
+    )
+    risky = {"agent_id": "agent-1", "unusual_api_calls": 50, "data_access_spike": True}
+    batch = [dict(risky) for _ in range(5)] + [{"agent_id": "agent-2"}]
+    asyncio.run(pipeline._process_batch(batch))
+    assert pipeline.stats["rate_limited"] == 3
+    assert pipeline.stats["processed"] == 6
+    assert pipeline.stats["threats"] == 5  # The limited agent is still monitored
+    assert [record["agent_id"] for record in forwarded] == ["agent-1", "agent-1", "agent-2"]
+
+
+def test_ingestion_without_forward_spends_no_allowance():
+    """Test a pipeline with nothing to forward to leaves limited agents' allowance untouched"""
+    limiter, _ = _limiter(base_rate=2.0, burst_seconds=1.0)
+    limiter.limit("agent-1", 0.0)
+    pipeline = IngestionPipeline(ThreatDetector(), ThreatInvestigator(), ThreatResponder(), [], limiter=limiter)
+    asyncio.run(pipeline._process_batch([{"agent_id": "agent-1"} for _ in range(5)]))
+    assert pipeline.stats["rate_limited"] == 0
+    assert pipeline.stats["processed"] == 5
+    assert limiter.allow_many(["agent-1"] * 3) == [True, True, False]
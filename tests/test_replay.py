@@ -0,0 +1,123 @@
+"""
+Tests for archived activity replay
+"""
+
+import gzip
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.replay import ReplayClock, ReplayEngine, read_gzip_blocks, read_range
+
+START = 1714521600.0  # 2024-05-01T00:00:00Z
+
+
+def _records():
+    records = []
+    for i in range(300):
+        records.append({"agent_id": f"agent-{i % 20}", "timestamp": START + i, "unusual_api_calls": 0})
+        if i % 25 == 0:  # 12 moderate events for one agent, 25s apart
+            records.append({"agent_id": "agent-slow", "timestamp": START + i, "unusual_api_calls": 50})
+    for offset in (100, 200, 250):
+        records.append({
+            "agent_id": "agent-bad", "timestamp": START + offset, "unusual_api_calls": 50, "data_access_spike": True
+        })
+    return sorted(records, key=lambda record: record["timestamp"])
+
+
+def _lines(records):
+    return b"".join(json.dumps(record).encode() + b"\n" for record in records)
+
+
+def test_byte_ranges_read_every_line_once(tmp_path):
+    """Test newline-aligned ranges cover a file exactly, whatever the chunk size"""
+    path = tmp_path / "activity.jsonl"
+    payload = _lines(_records()) + b'{"agent_id": "last"}'  # No trailing newline
+    path.write_bytes(payload)
+    for chunk in (1, 7, 100, 4096, len(payload)):
+        data = b"".join(read_range(str(path), start, min(start + chunk, len(payload)))
+                        for start in range(0, len(payload), chunk))
+        assert data == payload
+
+
+def test_gzip_blocks_span_members(tmp_path):
+    """Test concatenated gzip members decompress into whole-line blocks"""
+    payload = _lines(_records())
+    path = tmp_path / "activity.jsonl.gz"
+    path.write_bytes(gzip.compress(payload[:5000]) + gzip.compress(payload[5000:]))
+    blocks = list(read_gzip_blocks(str(path), block_size=512))
+    assert len(blocks) > 1
+    assert all(block.endswith(b"\n") for block in blocks)
+    assert b"".join(blocks) == payload
+
+
+def test_replay_clock_only_moves_forward():
+    """Test the replay clock follows event time and ignores stragglers"""
+    clock = ReplayClock()
+    clock.advance(datetime(2024, 5, 1, 12))
+    clock.advance(datetime(2024, 5, 1, 11))
+    assert clock() == datetime(2024, 5, 1, 12)
+    detector = ThreatDetector(clock=clock)
+    threat = detector.detect_anomaly("agent-1", {"unusual_api_calls": 50, "data_access_spike": True})
+    assert threat.timestamp == datetime(2024, 5, 1, 12)
+
+
+def test_replay_detects_investigates_and_dry_runs_responses(tmp_path):
+    """Test a replay reports threats at event time and records actions without taking them"""
+    path = tmp_path / "activity.jsonl"
+    path.write_bytes(_lines(_records()) + b"not json\n")
+    report = ReplayEngine(workers=0, chunk_bytes=1024).run([str(path)])
+
+    assert report.records == 315
+    assert report.rejected == 1
+    assert report.chunks > 10
+    assert report.threats - report.composites == 3  # agent-bad's records
+    assert report.by_threat_type["data_exfiltration"] >= 1  # agent-slow's sliding window
+    assert report.by_severity == {"high": report.threats}
+    assert report.actions == {"rate_limit": report.threats, "alert": report.threats}
+    assert report.first_event == datetime.fromtimestamp(START + 100)
+    assert report.records_per_sec > 0
+
+
+def test_replay_reads_rfc3339_timestamps(tmp_path):
+    """Test archives with Z-suffixed timestamps replay on the naive clock"""
+    records = []
+    for record in _records():
+        moment = datetime.fromtimestamp(record["timestamp"], timezone.utc)
+        records.append({**record, "timestamp": moment.isoformat().replace("+00:00", "Z")})
+    path = tmp_path / "activity.jsonl"
+    path.write_bytes(_lines(records))
+    report = ReplayEngine(workers=0, chunk_bytes=1024).run([str(path)])
+
+    assert report.records == 315
+    assert report.threats - report.composites == 3
+    assert report.first_event == datetime.fromtimestamp(START + 100)
+
+
+def test_parallel_gzip_replay_matches_in_process(tmp_path):
+    """Test worker processes over gzip files give the same report as one process"""
+    records = _records()
+    paths = []
+    for index, part in enumerate((records[:150], records[150:])):
+        path = tmp_path / f"activity-{index}.jsonl.gz"
+        path.write_bytes(gzip.compress(_lines(part)))
+        paths.append(str(path))
+
+    serial = ReplayEngine(workers=0).run(paths)
+    parallel = ReplayEngine(workers=2).run(paths)
+    assert parallel.chunks == 2
+    for name in ("records", "threats", "composites", "by_severity", "by_threat_type", "actions", "last_event"):
+        assert getattr(parallel, name) == getattr(serial, name)
+
+
+def test_parquet_requires_pyarrow(tmp_path):
+    """Test Parquet archives fail clearly when pyarrow is missing"""
+    try:
+        import pyarrow  # noqa: F401
+        pytest.skip("pyarrow is installed")
+    except ImportError:
+        pass
+    with pytest.raises(RuntimeError, match="pyarrow"):
+        ReplayEngine(workers=0).run([str(tmp_path / "activity.parquet")])
@@ -0,0 +1,121 @@
+"""
+Tests for the batched response executor
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from src.threat_hunter.detector import ThreatEvent
+from src.threat_hunter.investigator import ThreatInvestigator
+from src.threat_hunter.responder import ResponseAction, ThreatResponder
+from src.threat_hunter.response_executor import FakeAgentPlatform
+
+
+def _event(agent_id, severity="critical"):
+    return ThreatEvent(agent_id, "behavioral_anomaly", 0.95, datetime.now(), {}, severity)
+
+
+async def _respond(responder, event):
+    investigation = await ThreatInvestigator().investigate(event)
+    return await responder.respond(event, investigation)
+
+
+def test_actions_batched_across_agents():
+    """Test one bulk platform call per action type during an incident storm"""
+    platform = FakeAgentPlatform(latency=0.01)
+    responder = ThreatResponder(platform=platform)
+
+    async def scenario():
+        events = [_event(f"agent-{i}") for i in range(50)]
+        return await asyncio.gather(*(_respond(responder, e) for e in events))
+
+    results = asyncio.run(scenario())
+    assert all(r.success for batch in results for r in batch)
+    assert [r.action for r in results[0]] == [
+        ResponseAction.ISOLATE, ResponseAction.REVOKE_CREDENTIALS, ResponseAction.ALERT
+    ]
+    assert sorted(action.value for action, _ in platform.calls) == ["isolate", "revoke_credentials"]
+    assert all(len(agent_ids) == 50 for _, agent_ids in platform.calls)
+
+
+def test_contained_agents_are_skipped():
+    """Test repeated containment of the same agent is not re-applied"""
+    platform = FakeAgentPlatform()
+    responder = ThreatResponder(platform=platform)
+
+    async def scenario():
+        await _respond(responder, _event("agent-1"))
+        return await _respond(responder, _event("agent-1"))
+
+    second = asyncio.run(scenario())
+    assert len(platform.calls) == 2
+    assert all(r.success for r in second)
+    assert responder.executor.stats["skipped"] == 2
+
+    responder.executor.release("agent-1")
+    asyncio.run(_respond(responder, _event("agent-1")))
+    assert len(platform.calls) == 4
+
+
+def test_failed_actions_are_retried():
+    """Test failed containment is not remembered as applied"""
+    platform = FakeAgentPlatform(failing_agents={"agent-1"})
+    responder = ThreatResponder(platform=platform)
+    results = asyncio.run(_respond(responder, _event("agent-1", "high")))
+    assert results[0].action == ResponseAction.RATE_LIMIT and not results[0].success
+    assert not responder.executor.is_contained("agent-1", ResponseAction.RATE_LIMIT)
+
+
+def test_max_batch_flushes_early():
+    """Test batches are split at max_batch"""
+    platform = FakeAgentPlatform()
+    responder = ThreatResponder({"response_max_batch": 10, "response_batch_window": 1.0}, platform=platform)
+
+    async def scenario():
+        await asyncio.gather(*(_respond(responder, _event(f"agent-{i}", "medium")) for i in range(30)))
+
+    asyncio.run(scenario())
+    assert [len(agent_ids) for _, agent_ids in platform.calls] == [10, 10, 10]
+
+
+def test_containment_expires_and_is_bounded():
+    """Test remembered containment lapses after its TTL and only the most recent agents are kept"""
+    now = [datetime(2024, 5, 1)]
+    platform = FakeAgentPlatform()
+    responder = ThreatResponder(
+        {"response_containment_ttl": 60.0, "response_max_contained": 3}, platform=platform, clock=lambda: now[0]
+    )
+    executor = responder.executor
+
+    asyncio.run(_respond(responder, _event("agent-1", "high")))
+    assert executor.is_contained("agent-1", ResponseAction.RATE_LIMIT)
+    now[0] += timedelta(seconds=61)
+    assert not executor.is_contained("agent-1", ResponseAction.RATE_LIMIT)
+    assert "agent-1" not in executor.containment
+
+    async def scenario():
+        for i in range(5):
+            await _respond(responder, _event(f"agent-{i}", "high"))
+
+    asyncio.run(scenario())
+    assert list(executor.containment) == ["agent-2", "agent-3", "agent-4"]
+
+
+def test_threats_sharing_a_request_all_keep_their_keys():
+    """Test a threat joining another's pending request is not acted on again when redelivered"""
+    platform = FakeAgentPlatform()
+
+    async def respond_all(events_and_keys):
+        responder = ThreatResponder(platform=platform)
+        investigations = [await ThreatInvestigator().investigate(event) for event, _ in events_and_keys]
+        return await asyncio.gather(*(
+            responder.respond(event, investigation, key)
+            for (event, key), investigation in zip(events_and_keys, investigations)
+        ))
+
+    asyncio.run(respond_all([(_event("agent-1", "high"), "threat-1"), (_event("agent-1", "high"), "threat-2")]))
+    assert platform.applied == [(ResponseAction.RATE_LIMIT, "agent-1")]
+    # After a restart only the second threat is redelivered
+    asyncio.run(respond_all([(_event("agent-1", "high"), "threat-2")]))
+    assert len(platform.calls) == 2
+    assert platform.applied == [(ResponseAction.RATE_LIMIT, "agent-1")]
@@ -0,0 +1,132 @@
+"""
+Tests for declarative detection rules
+"""
+
+import asyncio
+import json
+import os
+
+import numpy as np
+import pytest
+
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.rules import CompiledRules, RuleEngine, RuleError, load_rules, parse_rules
+
+EXAMPLE_RULES = os.path.join(os.path.dirname(__file__), "..", "examples", "rules.yaml")
+
+
+def _write(path, rules):
+    path.write_text(json.dumps({"rules": rules}))
+    return str(path)
+
+
+def test_default_rules_match_original_heuristics():
+    """Test the built-in rule set scores like the old hard-coded checks"""
+    engine = RuleEngine()
+    assert engine.score({"unusual_api_calls": 50, "data_access_spike": True}) == 0.8
+    assert engine.score({"unusual_api_calls": 5, "privilege_escalation": True}) == 0.5
+    assert engine.score({"unrelated": 1}) == 0.0
+    assert engine.matches({"data_access_spike": True, "privilege_escalation": True}) == [
+        "data_access_spike", "privilege_escalation"
+    ]
+
+
+def test_example_yaml_rules():
+    """Test the example rule file loads and multi-predicate rules need every predicate"""
+    engine = RuleEngine(path=EXAMPLE_RULES)
+    assert len(engine.rules) == 4
+    assert engine.matches({"action": "export_data", "data_access": ["payments", "logs"]}) == ["payments_export"]
+    assert engine.matches({"action": "export_data", "data_access": ["logs"]}) == []
+    assert engine.matches({"data_access": ["payments"]}) == []
+
+
+def test_shared_predicates_and_selectivity_order():
+    """Test identical predicates are compiled once and rare predicates run first"""
+    rules = parse_rules({"rules": [
+        {"name": "a", "weight": 0.1, "when": [
+            {"field": "tool", "op": "ne", "value": "search"},
+            {"field": "requests", "op": "gt", "value": 100, "match_rate": 0.001},
+        ]},
+        {"name": "b", "weight": 0.2, "when": [{"field": "requests", "op": "gt", "value": 100}]},
+    ]})
+    compiled = CompiledRules(rules)
+    assert len(compiled.predicates) == 2
+    first_field = compiled.predicates[compiled._plans[0][1][0]].field
+    assert first_field == "requests"
+    assert set(compiled._by_field) == {"requests"}
+    assert compiled.score({"requests": 500, "tool": "shell"}) == 0.30000000000000004
+    assert compiled.score({"requests": 500, "tool": "search"}) == 0.2
+
+
+def test_calibrate_reorders_by_observed_match_rate():
+    """Test calibration moves the predicate that rarely matches to the front"""
+    engine = RuleEngine(parse_rules({"rules": [{"name": "r", "weight": 1.0, "when": [
+        {"field": "flag", "op": "truthy"},
+        {"field": "count", "op": "gt", "value": 0},
+    ]}]}))
+    engine.calibrate([{"flag": True, "count": i % 50 == 0} for i in range(100)])
+    compiled = engine.compiled
+    assert compiled.predicates[compiled._plans[0][1][0]].field == "count"
+
+
+def test_invalid_rules_are_rejected():
+    """Test malformed documents raise RuleError"""
+    with pytest.raises(RuleError):
+        parse_rules({"rules": [{"name": "x", "when": [{"field": "a", "op": "matches", "value": 1}]}]})
+    with pytest.raises(RuleError):
+        parse_rules({"rules": [{"name": "x", "when": [{"field": "a", "op": "gt"}]}]})
+    with pytest.raises(RuleError):
+        parse_rules({"rules": [{"name": "x", "when": []}]})
+
+
+def test_columnar_scores_match_scalar():
+    """Test the vectorized evaluator agrees with per-record scoring"""
+    engine = RuleEngine(path=EXAMPLE_RULES)
+    records = [
+        {"unusual_api_calls": 20, "privilege_escalation": False, "action": "export_data", "data_access": ["payments"]},
+        {"unusual_api_calls": 2, "privilege_escalation": True, "action": "read_file", "data_access": ["logs"]},
+        {"unusual_api_calls": 11, "privilege_escalation": True, "action": "bulk_download", "data_access": ["payments"]},
+    ]
+    columns = {name: np.array([record[name] for record in records], dtype=object if name == "data_access" else None)
+               for name in records[0]}
+    expected = [engine.score(record) for record in records]
+    assert engine.score_columns(columns, len(records)).tolist() == expected
+
+
+def test_reload_swaps_rules_and_keeps_old_on_error(tmp_path):
+    """Test rule file edits are picked up and broken files are ignored"""
+    path = _write(tmp_path / "rules.json", [{"name": "r", "weight": 0.9, "when": [{"field": "x", "op": "eq", "value": 1}]}])
+    engine = RuleEngine(path=path)
+    assert engine.score({"x": 1}) == 0.9
+
+    _write(tmp_path / "rules.json", [{"name": "r", "weight": 0.2, "when": [{"field": "x", "op": "eq", "value": 1}]}])
+    os.utime(path, (1, 1))
+    assert engine.reload() is True
+    assert engine.score({"x": 1}) == 0.2
+
+    (tmp_path / "rules.json").write_text("{not json")
+    os.utime(path, (2, 2))
+    assert engine.reload() is False
+    assert engine.score({"x": 1}) == 0.2
+
+
+def test_detector_hot_reloads_rules(tmp_path):
+    """Test the watch loop changes detection without rebuilding the detector"""
+    path = _write(tmp_path / "rules.json", [{"name": "r", "weight": 0.1, "when": [{"field": "x", "op": "truthy"}]}])
+    detector = ThreatDetector({"rules_path": path})
+    assert detector.detect_anomaly("agent-1", {"x": True}) is None
+
+    async def main():
+        watcher = asyncio.create_task(detector.rules.watch(interval=0.01))
+        _write(tmp_path / "rules.json", [{"name": "r", "weight": 0.95, "when": [{"field": "x", "op": "truthy"}]}])
+        os.utime(path, (5, 5))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if detector.rules.score({"x": True}) == 0.95:
+                break
+        detector.rules.stop()
+        await watcher
+
+    asyncio.run(main())
+    assert detector.detect_anomaly("agent-1", {"x": True}).severity == "critical"
+    assert load_rules(path)[0].weight == 0.95
@@ -0,0 +1,112 @@
+"""
+Tests for the investigation scheduler
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from src.threat_hunter.detector import ThreatEvent
+from src.threat_hunter.investigator import ThreatInvestigator
+from src.threat_hunter.scheduler import InvestigationScheduler
+
+
+def _event(agent_id, severity="high", risk_score=0.8, threat_type="behavioral_anomaly"):
+    return ThreatEvent(agent_id, threat_type, risk_score, datetime.now(), {}, severity)
+
+
+class RecordingInvestigator(ThreatInvestigator):
+    """Investigator that records the order in which events are investigated"""
+
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.delay = delay
+        self.order = []
+
+    async def investigate(self, threat_event):
+        self.order.append(threat_event.agent_id)
+        await asyncio.sleep(self.delay)
+        return await super().investigate(threat_event)
+
+
+def test_critical_events_run_first():
+    """Test a critical event overtakes queued low-severity events"""
+    async def scenario():
+        investigator = RecordingInvestigator()
+        scheduler = InvestigationScheduler(investigator, workers=1)
+        scheduler.start()
+        futures = [scheduler.submit(_event(f"low-{i}", "low", 0.3)) for i in range(5)]
+        futures.append(scheduler.submit(_event("critical", "critical", 0.95)))
+        await asyncio.gather(*futures)
+        await scheduler.stop()
+        return investigator.order
+
+    order = asyncio.run(scenario())
+    assert order[0] == "critical"
+
+
+def test_bursts_are_coalesced_per_agent():
+    """Test a burst from one agent runs as one investigation of its worst event"""
+    async def scenario():
+        investigator = RecordingInvestigator()
+        scheduler = InvestigationScheduler(investigator, workers=2)
+        scheduler.start()
+        events = [_event("agent-1", "high", 0.7 + i / 100) for i in range(10)]
+        events.append(_event("agent-1", "critical", 0.95))
+        reports = await asyncio.gather(*(scheduler.submit(e) for e in events))
+        await scheduler.stop()
+        return investigator, scheduler, events, reports
+
+    investigator, scheduler, events, reports = asyncio.run(scenario())
+    assert investigator.order == ["agent-1"]
+    assert all(report is reports[0] for report in reports)
+    assert reports[0].threat_event is events[-1]
+    assert reports[0].evidence[-1]["type"] == "coalesced_events"
+    assert scheduler.stats["coalesced"] == 10
+    assert scheduler.queue_depth == 0
+
+
+def test_playbook_timeouts():
+    """Test investigations exceeding their playbook timeout fail"""
+    async def scenario():
+        scheduler = InvestigationScheduler(
+            RecordingInvestigator(delay=1.0), workers=1, playbook_timeouts={"behavioral_anomaly": 0.01}
+        )
+        scheduler.start()
+        with pytest.raises(asyncio.TimeoutError):
+            await scheduler.submit(_event("agent-1"))
+        await scheduler.stop()
+        return scheduler
+
+    assert asyncio.run(scenario()).stats["timeouts"] == 1
+
+
+def test_latency_percentiles():
+    """Test latency percentiles are reported for completed investigations"""
+    async def scenario():
+        scheduler = InvestigationScheduler(RecordingInvestigator(), workers=4)
+        assert scheduler.latency_percentiles() == {"p50": 0.0, "p90": 0.0, "p99": 0.0}
+        scheduler.start()
+        await asyncio.gather(*(scheduler.submit(_event(f"agent-{i}")) for i in range(20)))
+        await scheduler.stop()
+        return scheduler.latency_percentiles()
+
+    percentiles = asyncio.run(scenario())
+    assert 0 < percentiles["p50"] <= percentiles["p90"] <= percentiles["p99"]
+
+
+def test_stop_cancels_running_investigations():
+    """Test callers awaiting an investigation that stop() cancels mid-run are released, not left hanging"""
+    async def scenario():
+        scheduler = InvestigationScheduler(RecordingInvestigator(delay=60.0), workers=1)
+        scheduler.start()
+        running = scheduler.submit(_event("agent-1"))
+        waiting = scheduler.submit(_event("agent-2"))
+        await asyncio.sleep(0.01)  # agent-1 is now being investigated
+        await scheduler.stop()
+        for future in (running, waiting):
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(future, 1.0)
+
+    asyncio.run(scenario())
@@ -0,0 +1,160 @@
+"""
+Tests for sharded detection
+"""
+
+import asyncio
+import time
+from collections import Counter
+
+import pytest
+
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.ingestion import IngestionPipeline, QueueSource
+from src.threat_hunter.investigator import ThreatInvestigator
+from src.threat_hunter.responder import ThreatResponder
+from src.threat_hunter.sharding import ConsistentHashRing, ShardedDetector
+
+
+def _history():
+    return [{"requests": 10 + i % 3, "tool": "search"} for i in range(20)]
+
+
+def test_ring_spreads_keys_and_moves_few_on_resize():
+    """Adding a node only moves keys onto the new node"""
+    ring = ConsistentHashRing(["a", "b", "c"])
+    keys = [f"agent-{i}" for i in range(3000)]
+    before = {key: ring.node_for(key) for key in keys}
+    assert all(count > 600 for count in Counter(before.values()).values())
+
+    ring.add_node("d")
+    after = {key: ring.node_for(key) for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+    assert all(after[key] == "d" for key in moved)
+    assert 0.1 < len(moved) / len(keys) < 0.4
+
+
+def test_empty_ring_raises():
+    """Routing needs at least one node"""
+    with pytest.raises(LookupError):
+        ConsistentHashRing().node_for("agent-1")
+
+
+def test_sharded_detection_and_rebalance():
+    """Baselines follow their agents when workers join and leave"""
+    detector = ShardedDetector(workers=2, batch_size=4)
+    detector.start()
+    try:
+        agents = [f"agent-{i}" for i in range(40)]
+        detector.establish_baselines((agent_id, _history()) for agent_id in agents)
+        assert sum(stats["agents"] for stats in detector.sync().values()) == 40
+
+        added = detector.add_worker()
+        stats = detector.sync()
+        assert len(stats) == 3
+        assert sum(s["agents"] for s in stats.values()) == 40
+        assert stats[added]["agents"] > 0
+
+        detector.remove_worker("shard-0")
+        stats = detector.sync()
+        assert set(stats) == {"shard-1", added}
+        assert sum(s["agents"] for s in stats.values()) == 40
+
+        async def collect():
+            stream = detector.events()
+            first = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0)
+            detector.submit_many([
+                {"agent_id": "agent-3", "requests": 500, "data_access_spike": True},
+                {"agent_id": "agent-7", "requests": 11, "data_access_spike": True},
+            ])
+            threat = await asyncio.wait_for(first, timeout=30)
+            await stream.aclose()
+            return threat
+
+        threat = asyncio.run(collect())
+        assert threat.agent_id == "agent-3"
+    finally:
+        detector.stop()
+
+
+def test_forward_investigates_and_responds():
+    """Merged events reach the investigator and responder"""
+    detector = ShardedDetector(workers=2)
+    detector.start()
+
+    class RecordingResponder(ThreatResponder):
+        def __init__(self):
+            super().__init__()
+            self.responded = []
+
+        async def respond(self, threat_event, investigation):
+            self.responded.append(threat_event.agent_id)
+            return []
+
+    responder = RecordingResponder()
+
+    async def main():
+        forwarding = asyncio.create_task(detector.forward(ThreatInvestigator(), responder))
+        await asyncio.sleep(0)
+        detector.submit_many([{"agent_id": f"agent-{i}", "unusual_api_calls": 20, "privilege_escalation": True}
+                              for i in range(5)])
+        detector.sync()
+        await asyncio.to_thread(detector.stop)
+        await asyncio.wait_for(forwarding, timeout=30)
+
+    asyncio.run(main())
+    assert sorted(responder.responded) == [f"agent-{i}" for i in range(5)]
+
+
+def test_events_raised_before_subscribing_are_kept():
+    """Threats read while nobody listens reach the first subscriber"""
+    detector = ShardedDetector(workers=1)
+    detector.start()
+    try:
+        detector.submit_many([{"agent_id": "agent-1", "unusual_api_calls": 20, "privilege_escalation": True}])
+        detector.sync()
+        time.sleep(0.2)  # Let the reader thread pick the events up with no subscriber
+
+        async def first():
+            stream = detector.events()
+            threat = await asyncio.wait_for(stream.__anext__(), timeout=30)
+            await stream.aclose()
+            return threat
+
+        assert asyncio.run(first()).agent_id == "agent-1"
+    finally:
+        detector.stop()
+
+
+def test_pipeline_scores_batches_on_shards():
+    """An ingestion pipeline with a sharded detector routes batches to the workers and handles their threats"""
+    responded = []
+
+    class RecordingResponder(ThreatResponder):
+        async def respond(self, threat_event, investigation, key=None):
+            responded.append(threat_event.agent_id)
+            return []
+
+    async def main():
+        queue = asyncio.Queue()
+        detector = ThreatDetector()
+        pipeline = IngestionPipeline(
+            detector, ThreatInvestigator(), RecordingResponder(), [QueueSource(queue)],
+            batch_timeout=0.01, sharded=ShardedDetector(workers=2)
+        )
+        monitor = asyncio.create_task(detector.start_monitoring(pipeline))
+        for i in range(4):
+            await queue.put({"agent_id": f"agent-{i}", "unusual_api_calls": 20, "privilege_escalation": True})
+        await queue.put({"agent_id": "agent-9"})
+        deadline = asyncio.get_running_loop().time() + 30
+        while len(responded) < 4 and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+        await detector.stop_monitoring()
+        await asyncio.wait_for(monitor, 30)
+        return pipeline
+
+    pipeline = asyncio.run(main())
+    assert sorted(responded) == [f"agent-{i}" for i in range(4)]
+    assert pipeline.stats["processed"] == 5
+    assert pipeline.stats["threats"] == 4
+    assert pipeline.sharded.shards == {}
@@ -0,0 +1,128 @@
+"""
+Tests for baseline snapshots
+"""
+
+import asyncio
+import struct
+
+import pytest
+
+from src.threat_hunter.baseline_store import BaselineStore
+from src.threat_hunter.detector import ThreatDetector
+from src.threat_hunter.snapshot import (
+    SnapshotCheckpointer, capture_snapshot, load_snapshot, save_snapshot, write_snapshot
+)
+
+
+def _populated_detector() -> ThreatDetector:
+    detector = ThreatDetector()
+    for i in range(50):
+        detector.establish_baseline(f"agent-{i}", [
+            {"api_calls": 10 + i, "action": "read", "data_access": ["users"]},
+            {"api_calls": 14 + i, "action": "write", "data_access": ["orders"]},
+            {"api_calls": 12 + i, "latency_ms": 3.5, "action": "read"},
+        ])
+    return detector
+
+
+def test_snapshot_round_trip(tmp_path):
+    """Test a restored store matches the original"""
+    detector = _populated_detector()
+    path = str(tmp_path / "baselines.snap")
+    save_snapshot(detector.baselines, path)
+    restored = load_snapshot(path)
+
+    assert list(restored) == list(detector.baselines)
+    assert restored.metric_index == detector.baselines.metric_index
+    for agent_id in ("agent-0", "agent-49"):
+        original, copy = detector.baselines[agent_id], restored[agent_id]
+        assert copy.events == original.events
+        assert copy.actions == original.actions
+        assert copy.data_access == original.data_access
+        assert copy.z_score("api_calls", 100.0) == original.z_score("api_calls", 100.0)
+
+
+def test_snapshot_keeps_only_held_items(tmp_path):
+    """Test the snapshot header holds the items in use and a restored store keeps freeing and reusing ids"""
+    store = BaselineStore(top_k=2)
+    for i in range(1000):
+        store.update(f"agent-{i % 5}", {"action": f"action-{i}"})
+    path = str(tmp_path / "baselines.snap")
+    save_snapshot(store, path)
+    restored = load_snapshot(path)
+    assert len(restored.actions.items) <= 5 * 2 + 1
+    assert restored.actions.interned == store.actions.interned
+    assert restored["agent-2"].actions == store["agent-2"].actions
+
+    for i in range(1000, 2000):
+        restored.update(f"agent-{i % 5}", {"action": f"action-{i}"})
+    assert len(restored.actions.items) <= 5 * 2 + 1
+
+
+def test_snapshot_is_consistent_with_updates_between_capture_and_write(tmp_path):
+    """Test sketch ids freed and reused after the capture still name the captured items once written"""
+    store = BaselineStore(top_k=2)
+    for i in range(100):
+        store.update(f"agent-{i % 5}", {"action": f"action-{i}"})
+    expected = {agent_id: store[agent_id].actions for agent_id in store}
+    snapshot = capture_snapshot(store)
+
+    for i in range(100, 200):  # Evicts every captured item, freeing its id for a new one
+        store.update(f"agent-{i % 5}", {"action": f"action-{i}"})
+    path = str(tmp_path / "baselines.snap")
+    write_snapshot(snapshot, path)
+    restored = load_snapshot(path)
+    assert {agent_id: restored[agent_id].actions for agent_id in restored} == expected
+
+
+def test_restore_is_zero_copy_and_writable(tmp_path):
+    """Test restored columns are views of the mapping that can still be updated"""
+    path = str(tmp_path / "baselines.snap")
+    save_snapshot(_populated_detector().baselines, path)
+    restored = load_snapshot(path)
+    assert not restored.mean.flags.owndata
+
+    restored.update("agent-0", {"api_calls": 1000})
+    restored.update("agent-new", {"api_calls": 1})
+    assert restored["agent-0"].events == 4
+    assert "agent-new" in restored
+    assert load_snapshot(path)["agent-0"].events == 3
+
+
+def test_empty_snapshot(tmp_path):
+    """Test a store without agents round-trips"""
+    path = str(tmp_path / "empty.snap")
+    save_snapshot(ThreatDetector().baselines, path)
+    restored = load_snapshot(path)
+    assert len(restored) == 0
+    restored.update("agent-1", {"api_calls": 1})
+    assert len(restored) == 1
+
+
+def test_rejects_unknown_version(tmp_path):
+    """Test snapshots from other format versions are refused"""
+    path = tmp_path / "baselines.snap"
+    save_snapshot(_populated_detector().baselines, str(path))
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<I", data, 4, 99)
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        load_snapshot(str(path))
+
+
+def test_background_checkpoint(tmp_path):
+    """Test the checkpointer writes snapshots while the loop keeps running"""
+    detector = _populated_detector()
+    path = str(tmp_path / "baselines.snap")
+
+    async def scenario():
+        checkpointer = SnapshotCheckpointer(detector, path, interval=0.01)
+        task = asyncio.create_task(checkpointer.run())
+        while checkpointer.last_checkpoint is None:
+            detector.update_baseline("agent-0", {"api_calls": 11})
+            await asyncio.sleep(0.001)
+        task.cancel()
+        await checkpointer.stop()
+
+    asyncio.run(scenario())
+    assert len(load_snapshot(path)) == 50
@@ -0,0 +1,127 @@
+"""
+Tests for the persistent threat store
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.threat_hunter import main
+from src.threat_hunter.detector import ThreatEvent
+from src.threat_hunter.investigator import InvestigationReport
+from src.threat_hunter.responder import ResponseAction, ResponseResult, ThreatResponder
+from src.threat_hunter.store import ThreatStore, decode_cursor, encode_cursor
+
+
+def _report(agent_id, timestamp, severity="high", threat_type="behavioral_anomaly"):
+    event = ThreatEvent(agent_id, threat_type, 0.8, datetime.fromtimestamp(timestamp), {"api_calls": 40}, severity)
+    return InvestigationReport(event, "baseline deviation", [{"type": "x"}], [], ["Monitor agent"], 0.01)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ThreatStore(f"sqlite:///{tmp_path / 'threats.db'}")
+    yield store
+    store.close()
+
+
+def test_record_and_get_with_responses(store):
+    """Test a report round-trips with its response results"""
+    result = ResponseResult(ResponseAction.ALERT, True, "Alert sent", datetime.fromtimestamp(1_000_001))
+    store.record(_report("agent-1", 1_000_000), [result])
+    assert store.flush(timeout=5)
+
+    items, cursor = store.query()
+    assert cursor is None
+    assert items[0]["agent_id"] == "agent-1"
+    assert items[0]["details"] == {"api_calls": 40}
+    threat = store.get(items[0]["id"])
+    assert threat["evidence"] == [{"type": "x"}]
+    assert threat["responses"][0]["action"] == "alert"
+    assert store.get(999) is None
+
+
+def test_filters_and_cursor_pagination(store):
+    """Test pages walk every matching row once, newest first"""
+    for i in range(25):
+        store.record(_report(f"agent-{i % 2}", 1000 + i // 2, "critical" if i % 5 == 0 else "high"))
+    store.flush(timeout=5)
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = store.query(agent_id="agent-0", limit=4, cursor=cursor)
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert len(seen) == 13
+    assert len({item["id"] for item in seen}) == 13
+    times = [item["timestamp"] for item in seen]
+    assert times == sorted(times, reverse=True)
+
+    critical, _ = store.query(severity="critical", since=1002, until=1010)
+    assert [datetime.fromisoformat(item["timestamp"]).timestamp() for item in critical] == [1007.0, 1005.0, 1002.0]
+
+
+def test_ids_continue_after_reopen(tmp_path):
+    """Test a reopened store appends after existing rows"""
+    url = f"sqlite:///{tmp_path / 'threats.db'}"
+    first = ThreatStore(url)
+    first.record(_report("agent-1", 1000))
+    first.close()
+    second = ThreatStore(url)
+    second.record(_report("agent-1", 1001))
+    second.flush(timeout=5)
+    assert [item["id"] for item in second.query()[0]] == [2, 1]
+    second.close()
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    """Test cursors decode to what was encoded and malformed ones raise"""
+    assert decode_cursor(encode_cursor(1700000000.123, 42)) == (1700000000.123, 42)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_group_commit_batches_writes(store):
+    """Test ingest is written in group commits rather than one transaction per report"""
+    for i in range(20000):
+        store.record(_report(f"agent-{i % 100}", 1000 + i))
+    assert store.flush(timeout=30)
+    assert store.stats["written"] == 20000
+    assert store.stats["batches"] < 200
+
+
+def test_responder_records_to_store(store):
+    """Test responding to a threat persists it without awaiting the write"""
+    responder = ThreatResponder(store=store)
+    report = _report("agent-7", 1000, severity="medium")
+    results = asyncio.run(responder.respond(report.threat_event, report))
+    store.flush(timeout=5)
+    threat = store.get(store.query(agent_id="agent-7")[0][0]["id"])
+    assert [r["action"] for r in threat["responses"]] == [r.action.value for r in results]
+
+
+def test_query_endpoints(store, monkeypatch):
+    """Test the HTTP endpoints page through the store"""
+    for i in range(3):
+        store.record(_report("agent-1", 1000 + i))
+    store.flush(timeout=5)
+    monkeypatch.setattr(main, "store", store)
+    client = TestClient(main.app)
+
+    page = client.get("/threats", params={"agent_id": "agent-1", "limit": 2}).json()
+    assert len(page["items"]) == 2
+    rest = client.get("/threats", params={"agent_id": "agent-1", "cursor": page["next_cursor"]}).json()
+    assert len(rest["items"]) == 1 and rest["next_cursor"] is None
+    assert client.get(f"/threats/{rest['items'][0]['id']}").json()["root_cause"] == "baseline deviation"
+    assert client.get("/threats/999").status_code == 404
+    assert client.get("/threats", params={"cursor": "garbage"}).status_code == 400
+
+
+def test_query_endpoints_without_store(monkeypatch):
+    """Test the endpoints report the store is not configured"""
+    monkeypatch.setattr(main, "store", None)
+    assert TestClient(main.app).get("/threats").status_code == 503
@@ -0,0 +1,240 @@
+"""
+Tests for the durable threat event log
+"""
+
+import asyncio
+import os
+from datetime import datetime
+
+from src.threat_hunter.detector import ThreatDetector, ThreatEvent
+from src.threat_hunter.ingestion import IngestionPipeline
+from src.threat_hunter.investigator import ThreatInvestigator
+from src.threat_hunter.responder import ThreatResponder
+from src.threat_hunter.response_executor import FakeAgentPlatform
+from src.threat_hunter.wal import (
+    INVESTIGATION_STAGE, RESPONSE_STAGE, EventLog, decode_event, encode_event, response_key
+)
+
+
+def _event(i):
+    return ThreatEvent(f"agent-{i}", "data_exfiltration", 0.8, datetime(2024, 5, 1, 12), {"n": i}, "high")
+
+
+def _segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".log"))
+
+
+def test_unacknowledged_events_are_replayed_after_reopen(tmp_path):
+    """Test a reopened log replays exactly the events a stage did not acknowledge, in order"""
+    async def write():
+        log = EventLog(str(tmp_path))
+        lsns = await log.append_durable([encode_event(_event(i)) for i in range(10)])
+        for lsn in (lsns[0], lsns[1], lsns[2], lsns[5], lsns[9]):  # Out of order, with gaps
+            log.ack(RESPONSE_STAGE, lsn)
+        await log.close()
+        return lsns
+
+    lsns = asyncio.run(write())
+    log = EventLog(str(tmp_path))
+    assert log.offset(RESPONSE_STAGE) == lsns[2]
+    assert log.lag(RESPONSE_STAGE) == 5
+    assert log.lag(INVESTIGATION_STAGE) == 10
+    replayed = [(lsn, decode_event(payload)) for lsn, payload in log.pending(RESPONSE_STAGE)]
+    assert [lsn for lsn, _ in replayed] == [lsns[i] for i in (3, 4, 6, 7, 8)]
+    assert replayed[0][1].agent_id == "agent-3"
+    assert replayed[0][1].timestamp == datetime(2024, 5, 1, 12)
+    assert log.append([b"next"]) == [lsns[-1] + 1]
+
+
+def test_concurrent_appends_share_commits(tmp_path):
+    """Test appenders waiting together are made durable by one fsync"""
+    async def run():
+        log = EventLog(str(tmp_path), commit_delay=0.005)
+        await asyncio.gather(*(log.append_durable([b"event-%d" % i]) for i in range(200)))
+        assert log.durable_lsn == 200
+        await log.close()
+        return log.stats
+
+    stats = asyncio.run(run())
+    assert stats["appended"] == 200
+    assert stats["commits"] <= 3
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    """Test a record cut short by a crash is dropped and appends continue after the last intact one"""
+    async def write():
+        log = EventLog(str(tmp_path))
+        await log.append_durable([b"first", b"second"])
+        await log.close()
+
+    asyncio.run(write())
+    path = tmp_path / _segments(tmp_path)[-1]
+    with open(path, "ab") as handle:
+        handle.write(b"\x40\x00\x00\x00partial")
+    log = EventLog(str(tmp_path))
+    assert log.stats["truncated_bytes"] == 11
+    assert [payload for _, payload in log.pending(RESPONSE_STAGE)] == [b"first", b"second"]
+    assert log.append([b"third"]) == [3]
+
+
+def test_segments_roll_and_are_deleted_once_acknowledged(tmp_path):
+    """Test full segments roll over and disappear when every stage is past them"""
+    async def run():
+        log = EventLog(str(tmp_path), segment_bytes=256, commit_delay=0)
+        lsns = []
+        for i in range(20):
+            lsns += await log.append_durable([b"x" * 50])
+        assert len(_segments(tmp_path)) > 3
+        for lsn in lsns[:15]:
+            log.ack(RESPONSE_STAGE, lsn)
+        await log.checkpoint()
+        assert log.stats["segments_deleted"] == 0  # The investigation stage still needs them
+        for lsn in lsns[:15]:
+            log.ack(INVESTIGATION_STAGE, lsn)
+        await log.checkpoint()
+        assert log.stats["segments_deleted"] > 0
+        await log.close()
+        return lsns
+
+    lsns = asyncio.run(run())
+    log = EventLog(str(tmp_path))
+    assert [lsn for lsn, _ in log.pending(RESPONSE_STAGE)] == lsns[15:]
+
+
+def test_pipeline_replays_threats_lost_in_a_crash(tmp_path):
+    """Test threats logged but never responded to are handled once on startup"""
+    async def crashed_run():
+        log = EventLog(str(tmp_path))
+        lsns = await log.append_durable([encode_event(_event(i)) for i in range(5)])
+        log.ack(INVESTIGATION_STAGE, lsns[0])
+        log.ack(RESPONSE_STAGE, lsns[0])
+        await log.checkpoint()  # The process dies here, before the other four are handled
+        return lsns
+
+    class CountingResponder(ThreatResponder):
+        def __init__(self):
+            super().__init__()
+            self.keys = []
+
+        async def respond(self, threat_event, investigation, key=None):
+            self.keys.append(key)
+            return await super().respond(threat_event, investigation, key)
+
+    async def restart():
+        responder = CountingResponder()
+        log = EventLog(str(tmp_path))
+        pipeline = IngestionPipeline(ThreatDetector(), ThreatInvestigator(), responder, [], event_log=log)
+        await pipeline.recover()
+        assert pipeline.stats["replayed"] == 4
+        assert log.lag(RESPONSE_STAGE) == 0
+        # A second delivery of the same event under its key is not acted on again
+        assert await responder.respond(_event(1), None, responder.keys[0]) == []
+        await log.close()
+        return responder.keys
+
+    lsns = asyncio.run(crashed_run())
+    keys = asyncio.run(restart())
+    assert keys == [response_key(lsn) for lsn in lsns[1:]] + [response_key(lsns[1])]
+    assert list(EventLog(str(tmp_path)).pending(RESPONSE_STAGE)) == []
+
+
+def test_identical_detections_get_distinct_response_keys(tmp_path):
+    """Test two identical records in one batch are both responded to"""
+    class RecordingResponder(ThreatResponder):
+        def __init__(self):
+            super().__init__()
+            self.responses = []
+
+        async def respond(self, threat_event, investigation, key=None):
+            results = await super().respond(threat_event, investigation, key)
+            self.responses.append((key, len(results)))
+            return results
+
+    async def run():
+        responder = RecordingResponder()
+        log = EventLog(str(tmp_path))
+        pipeline = IngestionPipeline(ThreatDetector(), ThreatInvestigator(), responder, [], event_log=log)
+        record = {"agent_id": "agent-1", "unusual_api_calls": 50, "data_access_spike": True}
+        await pipeline._process_batch([record, dict(record)])
+        await pipeline.drain()
+        await log.close()
+        return responder.responses
+
+    responses = asyncio.run(run())
+    assert [key for key, _ in responses] == [response_key(1), response_key(2)]
+    assert all(actions > 0 for _, actions in responses)
+
+
+def test_redelivery_after_restart_is_not_applied_twice(tmp_path):
+    """Test a fresh responder replaying a logged threat hands the platform the key it already applied"""
+    platform = FakeAgentPlatform()  # External state: it outlives the crashed process
+    record = {"agent_id": "agent-1", "unusual_api_calls": 50, "data_access_spike": True, "privilege_escalation": True}
+
+    async def crashed_run():
+        log = EventLog(str(tmp_path))
+        pipeline = IngestionPipeline(
+            ThreatDetector(), ThreatInvestigator(), ThreatResponder(platform=platform), [], event_log=log
+        )
+        await pipeline._process_batch([record])
+        await pipeline.drain()
+        # The process dies before the response acknowledgement is checkpointed
+
+    async def restart():
+        log = EventLog(str(tmp_path))
+        assert log.lag(RESPONSE_STAGE) == 1
+        pipeline = IngestionPipeline(
+            ThreatDetector(), ThreatInvestigator(), ThreatResponder(platform=platform), [], event_log=log
+        )
+        await pipeline.recover()
+        assert pipeline.stats["replayed"] == 1
+        await log.close()
+
+    asyncio.run(crashed_run())
+    applied = list(platform.applied)
+    assert applied
+    asyncio.run(restart())
+    assert len(platform.calls) == 2 * len(applied)  # Redelivered to the platform under the same key...
+    assert platform.applied == applied  # ...which does not apply the actions again
+    assert list(EventLog(str(tmp_path)).pending(RESPONSE_STAGE)) == []
+
+
+def test_pipeline_logs_threats_before_handling_them(tmp_path):
+    """Test detected threats are appended durably and acknowledged by both stages"""
+    async def run():
+        log = EventLog(str(tmp_path))
+        pipeline = IngestionPipeline(ThreatDetector(), ThreatInvestigator(), ThreatResponder(), [], event_log=log)
+        await pipeline._process_batch([
+            {"agent_id": f"agent-{i}", "unusual_api_calls": 50, "data_access_spike": True} for i in range(3)
+        ])
+        await pipeline.drain()
+        assert pipeline.stats["threats"] == 3
+        assert log.last_lsn == 3 and log.durable_lsn == 3
+        assert log.offset(INVESTIGATION_STAGE) == 3
+        assert log.offset(RESPONSE_STAGE) == 3
+        await log.close()
+
+    asyncio.run(run())
+
+
+def test_failed_investigations_do_not_pin_segments(tmp_path):
+    """Test a threat whose investigation fails is acknowledged by both stages, so segments are still deleted"""
+    class FlakyInvestigator(ThreatInvestigator):
+        async def investigate(self, threat_event):
+            if threat_event.agent_id == "agent-2":
+                raise RuntimeError("investigation backend down")
+            return await super().investigate(threat_event)
+
+    async def run():
+        log = EventLog(str(tmp_path), segment_bytes=256, commit_delay=0)
+        pipeline = IngestionPipeline(ThreatDetector(), FlakyInvestigator(), ThreatResponder(), [], event_log=log)
+        for i in range(50):
+            await pipeline._process_batch([{"agent_id": f"agent-{i}", "unusual_api_calls": 50, "data_access_spike": True}])
+        await pipeline.drain()
+        await log.checkpoint()
+        assert pipeline.stats["errors"] == 1
+        assert log.offset(INVESTIGATION_STAGE) == log.offset(RESPONSE_STAGE) == 50
+        assert log.stats["segments_deleted"] > 0
+        await log.close()
+
+    asyncio.run(run())
+    assert len(_segments(tmp_path)) == 1